@@ -0,0 +1,191 @@
+"""
+变更日志 - 知识库修订号与增量同步
+
+libraries.revision 是单调递增的修订号：crud 中的写操作在同一事务内调用 record()，
+修订号加一，并把受影响的知识点 / 链接记入 library_changes。同一事务内多次调用
+只加一次，客户端看到的每个修订号都对应一次完整提交；提交后经 events 推送给订阅者。
+
+日志中每个实体只保留一行（最后一次变更的修订号、是否已删除），新增和修改
+合并为 upsert，体积不超过“现存实体 + 删除记录（墓碑）”。
+GET /api/libraries/{id}/changes?since=<rev> 取出该修订号之后的变更：
+upsert 的实体返回当前完整数据，删除的只返回 ID。
+
+墓碑由 compact() 限量保留：超过 MAX_TOMBSTONES 条时删除较旧的一批，
+并把 libraries.changes_floor 提高到被删除的最大修订号。since 低于 changes_floor
+（可能漏掉删除）、大于当前修订号或变更数超过 MAX_CHANGES 时返回 reset，
+客户端应整库重新加载。修订号启用前已有的数据视为修订号 0 时的状态。
+
+global_state 单行表中的全局修订号在任一写事务中加一（每个事务一次，含创建、
+删除和导入知识库），作为知识库列表与全局统计的版本戳；instance 是建表时生成的
+随机值，区分不同的数据库文件。
+"""
+import json
+from typing import Iterable, Optional, Union
+
+from sqlalchemy import Connection, text
+from sqlalchemy.orm import Session
+
+from . import events
+from .database import transaction_info
+
+Executor = Union[Session, Connection]
+
+POINT, LINK, LIBRARY = "point", "link", "library"
+
+# 每个知识库保留的墓碑上限
+MAX_TOMBSTONES = 10000
+# 每隔多少个修订号检查一次是否需要压缩
+COMPACT_INTERVAL = 100
+# 单次增量返回的变更上限，超过时要求客户端整库重新加载
+MAX_CHANGES = 5000
+
+CREATE_STATEMENTS = [
+    "CREATE TABLE IF NOT EXISTS library_changes ("
+    " library_id TEXT NOT NULL,"
+    " kind TEXT NOT NULL,"
+    " entity_id TEXT NOT NULL,"
+    " revision INTEGER NOT NULL,"
+    " deleted INTEGER NOT NULL DEFAULT 0,"
+    " PRIMARY KEY (library_id, kind, entity_id)) WITHOUT ROWID",
+    "CREATE INDEX IF NOT EXISTS ix_library_changes_revision ON library_changes (library_id, revision)",
+    "CREATE INDEX IF NOT EXISTS ix_library_changes_tombstones ON library_changes (library_id, revision) WHERE deleted",
+]
+
+GLOBAL_STATEMENTS = [
+    "CREATE TABLE IF NOT EXISTS global_state ("
+    " id INTEGER PRIMARY KEY CHECK (id = 1),"
+    " revision INTEGER NOT NULL DEFAULT 0,"
+    " instance TEXT NOT NULL)",
+    "INSERT OR IGNORE INTO global_state (id, revision, instance) VALUES (1, 0, lower(hex(randomblob(8))))",
+]
+
+_BUMP_SQL = text("UPDATE libraries SET revision = revision + 1 WHERE id = :library_id RETURNING revision")
+_GLOBAL_BUMP_SQL = text("UPDATE global_state SET revision = revision + 1 WHERE id = 1")
+
+# upsert 只记录确实存在的实体（例如布局回写时不属于该库的 ID 会被忽略）
+_EXISTS = {
+    POINT: "value IN (SELECT id FROM points WHERE library_id = :library_id)",
+    LINK: "value IN (SELECT id FROM links)",
+    LIBRARY: "true",
+}
+
+
+def _upsert_sql(kind: str, deleted: bool):
+    # SELECT 带 WHERE 才能接 ON CONFLICT（SQLite 的语法歧义）
+    return text(
+        "INSERT INTO library_changes (library_id, kind, entity_id, revision, deleted)"
+        f" SELECT :library_id, '{kind}', value, :revision, {int(deleted)} FROM json_each(:ids)"
+        f" WHERE {'true' if deleted else _EXISTS[kind]}"
+        " ON CONFLICT (library_id, kind, entity_id)"
+        " DO UPDATE SET revision = excluded.revision, deleted = excluded.deleted"
+        " RETURNING entity_id"
+    )
+
+
+_UPSERT_SQL = {(kind, deleted): _upsert_sql(kind, deleted) for kind in _EXISTS for deleted in (False, True)}
+
+
+def touch(db: Session):
+    """在当前事务中将全局修订号加一（同一事务内只加一次）"""
+    info = transaction_info(db)
+    if not info.get("global"):
+        db.execute(_GLOBAL_BUMP_SQL)
+        info["global"] = True
+
+
+def record(db: Session, library_id: Optional[str], points: Iterable[str] = (), links: Iterable[str] = (),
+           deleted_points: Iterable[str] = (), deleted_links: Iterable[str] = (),
+           library: bool = False) -> Optional[int]:
+    """在当前事务中记录变更，返回本事务的修订号；知识库不存在时返回 None
+
+    library=True 表示知识库自身（名称、标签、出处）有变化。
+    """
+    if library_id is None:
+        return None
+    db.flush()
+    pending = transaction_info(db).setdefault("changes", {})
+    change = pending.get(library_id)
+    if change is None:
+        revision = db.execute(_BUMP_SQL, {"library_id": library_id}).scalar()
+        if revision is None:
+            return None
+        change = pending[library_id] = {"revision": revision, "library": False, "points": [], "links": [],
+                                        "deleted_points": [], "deleted_links": []}
+        events.changed(db, library_id, change)
+        touch(db)
+    revision = change["revision"]
+
+    entries = [("points", POINT, points, False), ("links", LINK, links, False),
+               ("deleted_points", POINT, deleted_points, True), ("deleted_links", LINK, deleted_links, True)]
+    for key, kind, ids, deleted in entries:
+        ids = list(ids)
+        if ids:
+            # 推送的事件只包含实际写入日志的 ID（_EXISTS 过滤掉的不属于该库）
+            logged = db.execute(_UPSERT_SQL[kind, deleted],
+                                {"library_id": library_id, "revision": revision, "ids": json.dumps(ids)})
+            change[key].extend(logged.scalars().all())
+    if library:
+        db.execute(_UPSERT_SQL[LIBRARY, False],
+                   {"library_id": library_id, "revision": revision, "ids": json.dumps([library_id])}).all()
+        change["library"] = True
+
+    if revision % COMPACT_INTERVAL == 0:
+        compact(db, library_id)
+    return revision
+
+
+def compact(db: Executor, library_id: str, keep: Optional[int] = None) -> int:
+    """只保留最新的 keep 条墓碑（默认 MAX_TOMBSTONES），并相应提高 changes_floor；返回删除的条数"""
+    keep = MAX_TOMBSTONES if keep is None else keep
+    cutoff = db.execute(text(
+        "SELECT revision FROM library_changes WHERE library_id = :library_id AND deleted"
+        " ORDER BY revision DESC LIMIT 1 OFFSET :keep"
+    ), {"library_id": library_id, "keep": keep}).scalar()
+    if cutoff is None:
+        return 0
+    removed = db.execute(text(
+        "DELETE FROM library_changes WHERE library_id = :library_id AND deleted AND revision <= :cutoff"
+    ), {"library_id": library_id, "cutoff": cutoff}).rowcount
+    db.execute(text(
+        "UPDATE libraries SET changes_floor = MAX(changes_floor, :cutoff) WHERE id = :library_id"
+    ), {"library_id": library_id, "cutoff": cutoff})
+    return removed
+
+
+def remove_library(db: Executor, library_id: str):
+    """删除知识库时清除其变更日志"""
+    db.execute(text("DELETE FROM library_changes WHERE library_id = :library_id"), {"library_id": library_id})
+
+
+def changes_since(db: Executor, library_id: str, since: int) -> Optional[dict]:
+    """since 之后的变更（只含 ID）；知识库不存在时返回 None
+
+    返回 {revision, since, reset, library, points, links, deleted_points, deleted_links}，
+    points / links 为新增或修改的 ID。
+    """
+    row = db.execute(text("SELECT revision, changes_floor FROM libraries WHERE id = :library_id"),
+                     {"library_id": library_id}).first()
+    if row is None:
+        return None
+    revision, floor = row
+    changes = {"revision": revision, "since": since, "reset": False, "library": False,
+               "points": [], "links": [], "deleted_points": [], "deleted_links": []}
+    if since == revision:
+        return changes
+    if since > revision or since < floor:
+        changes["reset"] = True
+        return changes
+
+    rows = db.execute(text(
+        "SELECT kind, entity_id, deleted FROM library_changes"
+        " WHERE library_id = :library_id AND revision > :since LIMIT :limit"
+    ), {"library_id": library_id, "since": since, "limit": MAX_CHANGES + 1}).all()
+    if len(rows) > MAX_CHANGES:
+        changes["reset"] = True
+        return changes
+    for kind, entity_id, deleted in rows:
+        if kind == LIBRARY:
+            changes["library"] = True
+        else:
+            changes[("deleted_" if deleted else "") + kind + "s"].append(entity_id)
+    return changes
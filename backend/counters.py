@@ -0,0 +1,128 @@
+"""
+计数冗余 - 知识库的知识点 / 链接 / 快照数与全局统计由触发器增量维护
+
+libraries.point_count / link_count / snapshot_count 与 global_state 中的全局计数
+由 points / links / snapshots / libraries 上的触发器在同一事务中维护，首页的知识库列表
+和全局统计只需读取这些列，不再对每个知识库执行 COUNT 子查询。
+
+链接计入起点所在的知识库（与变更日志一致）。删除知识点时其出链可能在知识点之后才删除，
+此时 links 触发器已找不到起点，因此 points 的删除触发器在删除前先扣减该知识点的出链数；
+两种删除顺序下每条链接都只扣减一次。
+
+计数与实际不一致时（例如绕过 SQLite 直接修改了数据库文件），rebuild() 重新统计并修正，
+可以通过 POST /api/maintenance/recount 或 python -m backend.counters 执行。
+"""
+from typing import Union
+
+from sqlalchemy import Connection, text
+from sqlalchemy.orm import Session
+
+Executor = Union[Session, Connection]
+
+# 知识库上的计数列，以及 global_state 中对应的全局计数列
+LIBRARY_COLUMNS = ("point_count", "link_count", "snapshot_count")
+GLOBAL_COLUMNS = ("library_count", "point_count", "link_count", "snapshot_count")
+
+_LINK_LIBRARY = "(SELECT library_id FROM points WHERE id = {row}.from_id)"
+
+
+def _library(column: str, library: str, delta: str) -> str:
+    return f"UPDATE libraries SET {column} = {column} {delta} WHERE id = {library};"
+
+
+def _global(column: str, delta: str) -> str:
+    return f"UPDATE global_state SET {column} = {column} {delta} WHERE id = 1;"
+
+
+def _trigger(name: str, event: str, statements: list[str]) -> str:
+    timing = "" if event.startswith("BEFORE") else "AFTER "
+    return f"CREATE TRIGGER IF NOT EXISTS {name} {timing}{event} BEGIN " + " ".join(statements) + " END"
+
+
+CREATE_STATEMENTS = [
+    _trigger("trg_libraries_count_insert", "INSERT ON libraries", [_global("library_count", "+ 1")]),
+    _trigger("trg_libraries_count_delete", "DELETE ON libraries", [_global("library_count", "- 1")]),
+    _trigger("trg_points_count_insert", "INSERT ON points", [
+        _library("point_count", "new.library_id", "+ 1"),
+        _global("point_count", "+ 1"),
+    ]),
+    _trigger("trg_points_count_delete", "BEFORE DELETE ON points", [
+        "UPDATE libraries SET point_count = point_count - 1,"
+        " link_count = link_count - (SELECT COUNT(*) FROM links WHERE from_id = old.id)"
+        " WHERE id = old.library_id;",
+        _global("point_count", "- 1"),
+    ]),
+    _trigger("trg_links_count_insert", "INSERT ON links", [
+        _library("link_count", _LINK_LIBRARY.format(row="new"), "+ 1"),
+        _global("link_count", "+ 1"),
+    ]),
+    _trigger("trg_links_count_delete", "DELETE ON links", [
+        _library("link_count", _LINK_LIBRARY.format(row="old"), "- 1"),
+        _global("link_count", "- 1"),
+    ]),
+    _trigger("trg_snapshots_count_insert", "INSERT ON snapshots", [
+        _library("snapshot_count", "new.library_id", "+ 1"),
+        _global("snapshot_count", "+ 1"),
+    ]),
+    _trigger("trg_snapshots_count_delete", "DELETE ON snapshots", [
+        _library("snapshot_count", "old.library_id", "- 1"),
+        _global("snapshot_count", "- 1"),
+    ]),
+]
+
+# 按知识库分组的实际计数（分别走 points / snapshots 的 library_id 前缀索引）
+_ACTUAL_SQL = text(
+    "SELECT l.id, l.point_count, l.link_count, l.snapshot_count,"
+    " COALESCE(p.n, 0), COALESCE(k.n, 0), COALESCE(s.n, 0) FROM libraries l"
+    " LEFT JOIN (SELECT library_id, COUNT(*) AS n FROM points GROUP BY library_id) p ON p.library_id = l.id"
+    " LEFT JOIN (SELECT points.library_id, COUNT(*) AS n FROM links JOIN points ON points.id = links.from_id"
+    "  GROUP BY points.library_id) k ON k.library_id = l.id"
+    " LEFT JOIN (SELECT library_id, COUNT(*) AS n FROM snapshots GROUP BY library_id) s ON s.library_id = l.id"
+)
+_GLOBAL_ACTUAL_SQL = text(
+    "SELECT (SELECT COUNT(*) FROM libraries), (SELECT COUNT(*) FROM points),"
+    " (SELECT COUNT(*) FROM links), (SELECT COUNT(*) FROM snapshots)"
+)
+_GLOBAL_SQL = text(f"SELECT {', '.join(GLOBAL_COLUMNS)} FROM global_state WHERE id = 1")
+
+
+def global_counts(db: Executor) -> dict:
+    """全局计数 {library_count, point_count, link_count, snapshot_count}"""
+    row = db.execute(_GLOBAL_SQL).first()
+    return dict(zip(GLOBAL_COLUMNS, row or (0,) * len(GLOBAL_COLUMNS)))
+
+
+def rebuild(conn: Executor) -> dict:
+    """重新统计并修正所有计数，返回 {"libraries": [修正后的知识库计数], "global_counts": 修正后的全局计数或 None}"""
+    repaired = []
+    for row in conn.execute(_ACTUAL_SQL).all():
+        stored, actual = tuple(row[1:4]), tuple(row[4:7])
+        if stored != actual:
+            repaired.append({"id": row[0], **dict(zip(LIBRARY_COLUMNS, actual))})
+    if repaired:
+        conn.execute(
+            text("UPDATE libraries SET point_count = :point_count, link_count = :link_count,"
+                 " snapshot_count = :snapshot_count WHERE id = :id"),
+            repaired
+        )
+
+    actual = dict(zip(GLOBAL_COLUMNS, conn.execute(_GLOBAL_ACTUAL_SQL).one()))
+    fixed_global = None
+    if actual != global_counts(conn):
+        conn.execute(
+            text(f"UPDATE global_state SET {', '.join(f'{c} = :{c}' for c in GLOBAL_COLUMNS)} WHERE id = 1"),
+            actual
+        )
+        fixed_global = actual
+    return {"libraries": repaired, "global_counts": fixed_global}
+
+
+if __name__ == "__main__":
+    from .crud import repair_counters
+    from .database import SessionLocal, init_db
+
+    init_db()
+    with SessionLocal() as db:
+        result = repair_counters(db)
+    print(f"repaired {len(result['libraries'])} libraries, global counts "
+          f"{'repaired' if result['global_counts'] else 'consistent'}")
@@ -1,80 +1,42 @@
 """
 CRUD 操作 - 数据库增删改查
 """
+import json
 from datetime import datetime, timezone, timedelta
+from types import SimpleNamespace
 from typing import Optional
-from sqlalchemy import select, delete, func
-from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import select, delete, func, insert, update, bindparam, text
+from sqlalchemy.orm import Session, aliased, selectinload
 
-from .models import Library, Tag, Source, Point, Link, Snapshot, point_tag_table, generate_id
+from .models import Library, Tag, Source, Point, Link, Snapshot, point_tag_table, generate_id, generate_ids, utc_now
+from . import (changelog, counters, events, graph_cache, graph_payload, importer, layout, pagination, search_index,
+               snapshot_store, spatial_index, term_index, traversal)
 
+# 批量操作中 IN 列表的分块大小（低于 SQLite 绑定参数上限）
+_BATCH_CHUNK = 500
 
-# ==================== 知识库 ====================
-
-def get_libraries(db: Session) -> list[dict]:
-    """获取所有知识库（含统计数据）"""
-    # 子查询：统计知识点数量
-    point_count_subq = (
-        select(func.count(Point.id))
-        .where(Point.library_id == Library.id)
-        .correlate(Library)
-        .scalar_subquery()
-    )
-    
-    # 子查询：统计链接数量 (通过 from_id 关联到 Point 再关联到 Library)
-    link_count_subq = (
-        select(func.count(Link.id))
-        .join(Point, Link.from_id == Point.id)
-        .where(Point.library_id == Library.id)
-        .correlate(Library)
-        .scalar_subquery()
-    )
 
-    query = select(Library, point_count_subq, link_count_subq).order_by(Library.created_at.desc())
-    results = db.execute(query).all()
+# ==================== 知识库 ====================
 
-    # 构造响应字典 (因为 Pydantic from_attributes=True 可以从 dict 读取)
-    libraries = []
-    for lib, p_count, l_count in results:
-        lib_dict = lib.__dict__.copy()
-        lib_dict['point_count'] = p_count or 0
-        lib_dict['link_count'] = l_count or 0
-        libraries.append(lib_dict)
-    
-    return libraries
+def get_libraries(db: Session) -> list[Library]:
+    """获取所有知识库（含统计数据；计数列由触发器维护，按 ix_libraries_created 顺序读取）"""
+    return list(db.scalars(select(Library).order_by(Library.created_at.desc())).all())
 
 
-def get_library(db: Session, library_id: str) -> Optional[dict]:
+def get_library(db: Session, library_id: str) -> Optional[Library]:
     """获取单个知识库（含标签、出处和统计数据）"""
-    library = db.scalar(
+    return db.scalar(
         select(Library)
         .options(selectinload(Library.tags), selectinload(Library.sources))
         .where(Library.id == library_id)
     )
-    if not library:
-        return None
-
-    # 另外查询统计（单个查询开销不大）
-    point_count = db.scalar(select(func.count(Point.id)).where(Point.library_id == library_id))
-    link_count = db.scalar(
-        select(func.count(Link.id))
-        .join(Point, Link.from_id == Point.id)
-        .where(Point.library_id == library_id)
-    )
-
-    lib_dict = library.__dict__.copy()
-    lib_dict['tags'] = library.tags
-    lib_dict['sources'] = library.sources
-    lib_dict['point_count'] = point_count or 0
-    lib_dict['link_count'] = link_count or 0
-    
-    return lib_dict
 
 
 def create_library(db: Session, name: str, description: Optional[str] = None,
-                   tags: list[dict] = None, sources: list[dict] = None) -> Library:
+                   tags: list[dict] = None, sources: list[dict] = None,
+                   snapshot_retention_days: Optional[int] = None) -> Library:
     """创建知识库"""
-    library = Library(name=name, description=description)
+    library = Library(name=name, description=description, snapshot_retention_days=snapshot_retention_days)
     db.add(library)
     db.flush()  # 获取 ID
 
@@ -90,6 +52,8 @@ def create_library(db: Session, name: str, description: Optional[str] = None,
             source = Source(library_id=library.id, name=source_data["name"])
             db.add(source)
 
+    search_index.index_library(db, library)
+    changelog.touch(db)
     db.commit()
     db.refresh(library)
     return library
@@ -97,9 +61,15 @@ def create_library(db: Session, name: str, description: Optional[str] = None,
 
 def update_library(db: Session, library_id: str, name: Optional[str] = None,
                    description: Optional[str] = None, tags: list[dict] = None,
-                   sources: list[dict] = None) -> Optional[Library]:
-    """更新知识库"""
-    library = get_library(db, library_id)
+                   sources: list[dict] = None,
+                   snapshot_retention_days: Optional[int] = None,
+                   reset_snapshot_retention: bool = False) -> Optional[Library]:
+    """更新知识库
+
+    snapshot_retention_days 为空时不修改；reset_snapshot_retention=True 时写入该值，
+    为空即清除单独设置、恢复使用全局默认值。
+    """
+    library = db.get(Library, library_id)
     if not library:
         return None
 
@@ -107,6 +77,8 @@ def update_library(db: Session, library_id: str, name: Optional[str] = None,
         library.name = name
     if description is not None:
         library.description = description
+    if snapshot_retention_days is not None or reset_snapshot_retention:
+        library.snapshot_retention_days = snapshot_retention_days
 
     # 更新标签（删除旧的，添加新的）
     if tags is not None:
@@ -133,6 +105,10 @@ def update_library(db: Session, library_id: str, name: Optional[str] = None,
             )
             db.add(source)
 
+    if name is not None or description is not None:
+        search_index.index_library(db, library)
+
+    changelog.record(db, library_id, library=True)
     db.commit()
     db.refresh(library)
     return library
@@ -143,7 +119,13 @@ def delete_library(db: Session, library_id: str) -> bool:
     library = db.get(Library, library_id)
     if not library:
         return False
+    search_index.remove_library(db, library_id)
+    term_index.remove_library(db, library_id)
+    changelog.remove_library(db, library_id)
+    changelog.touch(db)
+    events.library_deleted(db, library_id)
     db.delete(library)
+    graph_cache.invalidate(db, library_id)
     db.commit()
     return True
 
@@ -159,6 +141,52 @@ def get_points(db: Session, library_id: str) -> list[Point]:
     ).all())
 
 
+# 分页列表可选的输出字段（与 PointResponse 的字段名一致）
+POINT_FIELDS = ("id", "library_id", "title", "content", "source", "page", "x", "y", "tags", "created_at", "updated_at")
+
+
+def get_points_page(db: Session, library_id: str, limit: Optional[int] = None, cursor: Optional[str] = None,
+                    fields: Optional[list[str]] = None) -> tuple[list[dict], Optional[str]]:
+    """按 (created_at, id) 游标分页获取知识点，只查询 fields 中的列；返回 (记录, 下一页游标)"""
+    fields = fields or list(POINT_FIELDS)
+    columns = [getattr(Point, name) for name in fields if name != "tags"]
+    if "created_at" not in fields:
+        columns.append(Point.created_at)  # 生成游标用
+    stmt = pagination.paginate(
+        select(*columns).where(Point.library_id == library_id), Point.created_at, Point.id, limit, cursor
+    )
+    rows, next_cursor = pagination.split_page(db.execute(stmt).all(), limit, "created_at")
+
+    tags = None
+    if "tags" in fields:
+        whole_library = limit is None and cursor is None
+        tags = _tag_records(db, library_id, None if whole_library else [row.id for row in rows])
+    items = []
+    for row in rows:
+        item = {name: getattr(row, name) for name in fields if name != "tags"}
+        if tags is not None:
+            item["tags"] = tags.get(row.id, [])
+        items.append(item)
+    return items, next_cursor
+
+
+def _tag_records(db: Session, library_id: str, point_ids: Optional[list[str]]) -> dict[str, list[dict]]:
+    """知识点的标签记录 {point_id: [{id, name, color}]}；point_ids 为 None 时取整个库"""
+    stmt = (
+        select(point_tag_table.c.point_id, Tag.id, Tag.name, Tag.color)
+        .join(Tag, Tag.id == point_tag_table.c.tag_id)
+        .where(Tag.library_id == library_id)
+    )
+    if point_ids is not None:
+        # ID 列表以一个 JSON 参数传入，不受绑定参数个数限制
+        ids = func.json_each(json.dumps(point_ids)).table_valued("value")
+        stmt = stmt.where(point_tag_table.c.point_id.in_(select(ids.c.value)))
+    records: dict[str, list[dict]] = {}
+    for point_id, tag_id, name, color in db.execute(stmt):
+        records.setdefault(point_id, []).append({"id": tag_id, "name": name, "color": color})
+    return records
+
+
 def get_point(db: Session, point_id: str) -> Optional[Point]:
     """获取单个知识点"""
     return db.scalar(
@@ -191,12 +219,13 @@ def create_point(db: Session, library_id: str, title: str, content: str,
         ).all()
         point.tags = list(tags)
 
+    _index_point_text(db, [point])
+    graph_cache.point_added(db, library_id, point.id)
+    # 初始快照与知识点在同一事务中写入（快照数随修订号一起变化）
+    _create_snapshot(db, point)
+    changelog.record(db, library_id, points=[point.id])
     db.commit()
     db.refresh(point)
-
-    # 创建初始快照
-    _create_snapshot(db, point)
-
     return point
 
 
@@ -233,13 +262,15 @@ def update_point(db: Session, point_id: str, title: Optional[str] = None,
         ).all()
         point.tags = list(tags)
 
-    db.commit()
-    db.refresh(point)
-
-    # 如果内容或标题发生变化，创建快照
-    if old_content != point.content or old_title != point.title:
+    # 如果内容或标题发生变化，重建索引并在同一事务中创建快照
+    text_changed = old_content != point.content or old_title != point.title
+    if text_changed:
+        _index_point_text(db, [point])
         _create_snapshot(db, point)
 
+    changelog.record(db, point.library_id, points=[point_id])
+    db.commit()
+    db.refresh(point)
     return point
 
 
@@ -248,7 +279,10 @@ def delete_point(db: Session, point_id: str) -> bool:
     point = db.get(Point, point_id)
     if not point:
         return False
+    _unindex_points(db, [point_id])
+    _record_point_deletions(db, [point_id])
     db.delete(point)
+    graph_cache.points_removed(db, [point_id])
     db.commit()
     return True
 
@@ -266,42 +300,293 @@ def count_points_by_tag(db: Session, library_id: str, tag_name: str) -> int:
 
 def delete_points_by_tag(db: Session, library_id: str, tag_name: str) -> int:
     """删除某标签下的所有知识点"""
-    # 先获取要删除的知识点
-    points = db.scalars(
-        select(Point)
+    point_ids = list(db.scalars(
+        select(Point.id)
         .join(point_tag_table)
         .join(Tag)
         .where(Point.library_id == library_id, Tag.name == tag_name)
-    ).all()
+    ).all())
+    _delete_points_bulk(db, point_ids)
+    db.commit()
+    return len(point_ids)
+
+
+def _index_point_text(db: Session, points: list[Point]):
+    """同步知识点标题/内容到全文索引和词频索引（需在提交前调用，与写入同一事务）"""
+    search_index.index_points(db, points)
+    term_index.index_points(db, points)
+
+
+def _unindex_points(db: Session, point_ids: list[str]):
+    """从全文索引和词频索引中移除知识点"""
+    search_index.remove_points(db, point_ids)
+    term_index.remove_points(db, point_ids)
+
+
+def _chunks(items: list, size: int = _BATCH_CHUNK):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _delete_points_bulk(db: Session, point_ids: list[str]):
+    """按 ID 删除知识点及其快照、链接、标签关联（集合化 SQL，不逐个加载对象）"""
+    _unindex_points(db, point_ids)
+    _record_point_deletions(db, point_ids)
+    for chunk in _chunks(point_ids):
+        db.execute(delete(Snapshot).where(Snapshot.point_id.in_(chunk)))
+        db.execute(delete(Link).where(Link.from_id.in_(chunk) | Link.to_id.in_(chunk)))
+        db.execute(delete(point_tag_table).where(point_tag_table.c.point_id.in_(chunk)))
+        db.execute(delete(Point).where(Point.id.in_(chunk)))
+    graph_cache.points_removed(db, point_ids)
+
+
+def _record_point_deletions(db: Session, point_ids: list[str]):
+    """在变更日志中记录知识点及其链接的删除（需在删除前调用，链接归入起点所在的库）"""
+    points: dict[str, list[str]] = {}
+    links: dict[str, list[str]] = {}
+    for chunk in _chunks(point_ids):
+        for point_id, library_id in db.execute(select(Point.id, Point.library_id).where(Point.id.in_(chunk))):
+            points.setdefault(library_id, []).append(point_id)
+        for link_id, library_id in db.execute(
+            select(Link.id, Point.library_id)
+            .join(Point, Point.id == Link.from_id)
+            .where(Link.from_id.in_(chunk) | Link.to_id.in_(chunk))
+        ):
+            links.setdefault(library_id, []).append(link_id)
+    for library_id in points.keys() | links.keys():
+        changelog.record(db, library_id, deleted_points=points.get(library_id, ()),
+                         deleted_links=links.get(library_id, ()))
+
+
+def _link_data_bulk(db: Session, point_ids: list[str]) -> dict[str, dict]:
+    """批量获取知识点的链接数据（与 _create_snapshot 中的结构相同）"""
+    data = {point_id: {"outgoing": [], "incoming": []} for point_id in point_ids}
+    for chunk in _chunks(point_ids):
+        for from_id, to_id in db.execute(select(Link.from_id, Link.to_id).where(Link.from_id.in_(chunk))):
+            data[from_id]["outgoing"].append(to_id)
+        for from_id, to_id in db.execute(select(Link.from_id, Link.to_id).where(Link.to_id.in_(chunk))):
+            data[to_id]["incoming"].append(from_id)
+    return data
+
+
+def batch_points(db: Session, operations: list[dict]) -> dict:
+    """批量创建 / 更新 / 删除知识点（一个事务）
+
+    operations 为 {"op", "id", "library_id", "title", "content", ...} 列表，未提供的字段为 None。
+    涉及的知识点、知识库和标签各只查询一次，写入使用集合化 SQL，快照批量生成。
+    单项失败（知识点 / 知识库不存在、缺少字段）只记录在该项结果中，其余各项照常提交。
+    """
+    results = [
+        {"index": i, "op": op["op"], "id": op.get("id"), "ok": False, "error": None}
+        for i, op in enumerate(operations)
+    ]
+
+    # 一次读取涉及的知识点、知识库和标签
+    current: dict[str, dict] = {}
+    ref_ids = list({op["id"] for op in operations if op["op"] != "create" and op.get("id")})
+    for chunk in _chunks(ref_ids):
+        for row in db.execute(
+            select(Point.id, Point.library_id, Point.title, Point.content,
+                   Point.source, Point.page, Point.x, Point.y).where(Point.id.in_(chunk))
+        ):
+            current[row.id] = row._asdict()
+    original_text = {point_id: (p["title"], p["content"]) for point_id, p in current.items()}
+
+    create_libraries = list({op["library_id"] for op in operations if op["op"] == "create" and op.get("library_id")})
+    libraries = set(db.scalars(select(Library.id).where(Library.id.in_(create_libraries))).all())
+    tag_libraries = libraries | {p["library_id"] for p in current.values()}
+    tag_ids = {
+        (row.library_id, row.name): row.id
+        for row in db.execute(select(Tag.id, Tag.library_id, Tag.name).where(Tag.library_id.in_(tag_libraries)))
+    }
 
-    count = len(list(points))
-    for point in points:
-        db.delete(point)
+    def resolve_tags(library_id: str, names: list[str]) -> list[str]:
+        # 与 create_point / update_point 一致：库中不存在的标签名忽略
+        return list(dict.fromkeys(tag_ids[(library_id, n)] for n in names if (library_id, n) in tag_ids))
+
+    # 按顺序在内存中应用，得到每个知识点的最终状态
+    now = utc_now()
+    new_ids = iter(generate_ids(sum(op["op"] == "create" for op in operations)))
+    created: list[dict] = []
+    updated: dict[str, dict] = {}
+    deleted: list[str] = []
+    point_tags: dict[str, list[str]] = {}  # 需要重写标签关联的知识点
+    for op, result in zip(operations, results):
+        if op["op"] == "create":
+            if op.get("library_id") not in libraries:
+                result["error"] = "Library not found"
+                continue
+            if op.get("title") is None or op.get("content") is None:
+                result["error"] = "title and content are required"
+                continue
+            point = {
+                "id": next(new_ids), "library_id": op["library_id"],
+                "title": op["title"], "content": op["content"],
+                "source": op.get("source"), "page": op.get("page"),
+                "x": op.get("x") or 0.0, "y": op.get("y") or 0.0,
+                "created_at": now, "updated_at": now,
+            }
+            created.append(point)
+            point_tags[point["id"]] = resolve_tags(point["library_id"], op.get("tags") or [])
+            result.update(id=point["id"], ok=True)
+            continue
 
+        point = current.get(op.get("id"))
+        if point is None:
+            result["error"] = "Point not found"
+            continue
+        if op["op"] == "delete":
+            del current[point["id"]]
+            updated.pop(point["id"], None)
+            point_tags.pop(point["id"], None)
+            deleted.append(point["id"])
+        else:
+            for field in ("title", "content", "source", "page", "x", "y"):
+                if op.get(field) is not None:
+                    point[field] = op[field]
+            if op.get("tags") is not None:
+                point_tags[point["id"]] = resolve_tags(point["library_id"], op["tags"])
+            updated[point["id"]] = point
+        result["ok"] = True
+
+    # 写入
+    if deleted:
+        _delete_points_bulk(db, deleted)
+    if created:
+        db.execute(insert(Point.__table__), created)
+        for p in created:
+            graph_cache.point_added(db, p["library_id"], p["id"])
+    if updated:
+        points_table = Point.__table__
+        db.execute(
+            update(points_table).where(points_table.c.id == bindparam("point_id")),
+            [
+                {"point_id": p["id"], "title": p["title"], "content": p["content"], "source": p["source"],
+                 "page": p["page"], "x": p["x"], "y": p["y"], "updated_at": now}
+                for p in updated.values()
+            ]
+        )
+    retagged = [point_id for point_id in point_tags if point_id in updated]
+    for chunk in _chunks(retagged):
+        db.execute(delete(point_tag_table).where(point_tag_table.c.point_id.in_(chunk)))
+    tag_rows = [{"point_id": point_id, "tag_id": tag_id} for point_id, tags in point_tags.items() for tag_id in tags]
+    if tag_rows:
+        db.execute(insert(point_tag_table), tag_rows)
+
+    # 标题或内容变化的知识点重新索引并生成快照（新建的知识点生成初始快照）
+    changed = [p for point_id, p in updated.items() if original_text[point_id] != (p["title"], p["content"])]
+    _index_point_text(db, [SimpleNamespace(**p) for p in created + changed])
+    link_data = _link_data_bulk(db, [p["id"] for p in changed])
+    snapshots = [
+        {"id": snapshot_id, "point_id": p["id"], "library_id": p["library_id"], "title": p["title"],
+         "content": p["content"], "source": p["source"], "page": p["page"], "timestamp": now,
+         "links": link_data.get(p["id"], {"outgoing": [], "incoming": []})}
+        for p, snapshot_id in zip(created + changed, generate_ids(len(created) + len(changed)))
+    ]
+    snapshot_store.add(db, snapshots)
+    touched: dict[str, list[str]] = {}
+    for p in created + list(updated.values()):
+        touched.setdefault(p["library_id"], []).append(p["id"])
+    for library_id, point_ids in touched.items():
+        changelog.record(db, library_id, points=point_ids)
     db.commit()
-    return count
 
+    # 返回新建 / 更新后的知识点（含标签）
+    returned_ids = [p["id"] for p in created] + list(updated)
+    points = {}
+    for chunk in _chunks(returned_ids):
+        points.update((p.id, p) for p in db.scalars(
+            select(Point).options(selectinload(Point.tags)).where(Point.id.in_(chunk))
+        ))
+    for result in results:
+        if result["ok"] and result["op"] != "delete":
+            result["point"] = points.get(result["id"])
+    return {"results": results, "created": len(created), "updated": len(updated), "deleted": len(deleted)}
 
-# ==================== 链接 ====================
 
-def get_links(db: Session, library_id: str) -> list[Link]:
-    """获取知识库中的所有链接"""
-    # 获取该库所有知识点的 ID
-    point_ids = db.scalars(
-        select(Point.id).where(Point.library_id == library_id)
-    ).all()
+# ==================== 布局 ====================
+
+def update_layout(db: Session, library_id: str, positions: list[tuple[str, float, float]]) -> Optional[int]:
+    """批量保存节点坐标：一次 executemany UPDATE，不改 updated_at、不生成快照、不重建索引
+
+    返回实际更新的知识点数（不属于该知识库的 ID 会被忽略）；知识库不存在时返回 None。
+    """
+    if db.get(Library, library_id) is None:
+        return None
+    # 同一 ID 出现多次时以最后一次为准
+    latest = {point_id: (x, y) for point_id, x, y in positions}
+    if not latest:
+        return 0
+    result = db.execute(
+        text("UPDATE points SET x = :x, y = :y WHERE id = :id AND library_id = :library_id"),
+        [{"id": point_id, "x": x, "y": y, "library_id": library_id} for point_id, (x, y) in latest.items()]
+    )
+    changelog.record(db, library_id, points=list(latest))
+    db.commit()
+    return result.rowcount
+
+
+def compute_layout(read_db: Session, db: Session, library_id: str, iterations: int = 100,
+                   temperature: Optional[float] = None, incremental: bool = False) -> Optional[dict]:
+    """服务端计算力导向布局并批量写回坐标
 
-    if not point_ids:
-        return []
+    读取和计算在 read_db 上进行，计算期间不占用唯一的写连接；知识库不存在时返回 None。
+    """
+    if read_db.get(Library, library_id) is None:
+        return None
+    result = layout.compute_library_layout(read_db, library_id, iterations, temperature, incremental)
+    read_db.rollback()  # 结束读事务
+    result["updated"] = update_layout(db, library_id, result["positions"]) or 0
+    return result
+
+
+# ==================== 链接 ====================
+
+def get_links(db: Session, library_id: str) -> list:
+    """获取知识库中的所有链接（两端都属于该库）"""
+    graph = graph_cache.get(library_id)
+    if graph is not None:
+        return graph.links()
 
+    # 缓存关闭时直接查询：按库取起点、经索引连接链接和终点，不再拼接两个巨大的 IN 列表
+    from_point, to_point = aliased(Point), aliased(Point)
     return list(db.scalars(
-        select(Link).where(
-            Link.from_id.in_(point_ids),
-            Link.to_id.in_(point_ids)
-        )
+        select(Link)
+        .join(from_point, Link.from_id == from_point.id)
+        .join(to_point, Link.to_id == to_point.id)
+        .where(from_point.library_id == library_id, to_point.library_id == library_id)
     ).all())
 
 
+# 分页列表可选的输出字段 -> Link 列名
+LINK_FIELDS = {"id": "id", "fromId": "from_id", "toId": "to_id", "type": "type", "created_at": "created_at"}
+
+
+def get_links_page(db: Session, library_id: str, limit: Optional[int] = None, cursor: Optional[str] = None,
+                   fields: Optional[list[str]] = None) -> tuple[list[dict], Optional[str]]:
+    """按 (created_at, id) 游标分页获取链接，只返回 fields 中的字段；返回 (记录, 下一页游标)"""
+    fields = fields or list(LINK_FIELDS)
+    if limit is None and cursor is None:
+        # 不分页时整库链接可直接取自图缓存
+        graph = graph_cache.get(library_id)
+        if graph is not None:
+            return [{name: link[LINK_FIELDS[name]] for name in fields} for link in graph.links()], None
+
+    columns = [getattr(Link, LINK_FIELDS[name]).label(name) for name in fields]
+    if "created_at" not in fields:
+        columns.append(Link.created_at)
+    from_point, to_point = aliased(Point), aliased(Point)
+    stmt = pagination.paginate(
+        select(*columns)
+        .join(from_point, Link.from_id == from_point.id)
+        .join(to_point, Link.to_id == to_point.id)
+        .where(from_point.library_id == library_id, to_point.library_id == library_id),
+        Link.created_at, Link.id, limit, cursor
+    )
+    rows, next_cursor = pagination.split_page(db.execute(stmt).all(), limit, "created_at")
+    return [{name: getattr(row, name) for name in fields} for row in rows], next_cursor
+
+
 def create_link(db: Session, from_id: str, to_id: str, link_type: str = "related") -> Optional[Link]:
     """创建链接
     
@@ -313,7 +598,10 @@ def create_link(db: Session, from_id: str, to_id: str, link_type: str = "related
     # 新规则：互斥性 (Mutually Exclusive)
     # 无论原先是什么关系 (parent/child/related)，只要建立了新关系，旧关系一律清除。
     # 这意味着两个节点之间永远只能存在一条边（无论方向）。
-    
+    replaced = list(db.scalars(select(Link.id).where(
+        ((Link.from_id == from_id) & (Link.to_id == to_id)) | ((Link.from_id == to_id) & (Link.to_id == from_id))
+    )).all())
+
     # 1. 删除 A->B 的所有现有链接
     db.query(Link).filter(
         Link.from_id == from_id, 
@@ -329,6 +617,9 @@ def create_link(db: Session, from_id: str, to_id: str, link_type: str = "related
     # 3. 创建新链接
     link = Link(from_id=from_id, to_id=to_id, type=link_type)
     db.add(link)
+    db.flush()
+    graph_cache.link_added(db, link.id, from_id, to_id, link.type, link.created_at, replace=True)
+    changelog.record(db, _point_library(db, from_id), links=[link.id], deleted_links=replaced)
     db.commit()
     db.refresh(link)
     return link
@@ -339,15 +630,127 @@ def delete_link(db: Session, link_id: str) -> bool:
     link = db.get(Link, link_id)
     if not link:
         return False
+    changelog.record(db, _point_library(db, link.from_id), deleted_links=[link_id])
     db.delete(link)
+    graph_cache.link_removed(db, link_id)
     db.commit()
     return True
 
 
+# ==================== 图遍历 ====================
+# 优先使用进程内图缓存（graph_cache），缓存关闭时退回递归 CTE（traversal）
+
+def _point_library(db: Session, point_id: str) -> Optional[str]:
+    return db.scalar(select(Point.library_id).where(Point.id == point_id))
+
+
+def _reachable(db: Session, point_id: str, max_depth: int, direction: str) -> Optional[list[dict]]:
+    library_id = _point_library(db, point_id)
+    if library_id is None:
+        return None
+    graph = graph_cache.get(library_id)
+    if graph is None:
+        query = {"down": traversal.descendants, "up": traversal.ancestors}[direction]
+        return query(db, point_id, max_depth)
+    return traversal.with_titles(db, graph.reachable(point_id, max_depth, direction))
+
+
+def get_descendants(db: Session, point_id: str, max_depth: int = 10) -> Optional[list[dict]]:
+    """获取子孙节点，知识点不存在时返回 None"""
+    return _reachable(db, point_id, max_depth, "down")
+
+
+def get_ancestors(db: Session, point_id: str, max_depth: int = 10) -> Optional[list[dict]]:
+    """获取祖先节点，知识点不存在时返回 None"""
+    return _reachable(db, point_id, max_depth, "up")
+
+
+def get_neighborhood(db: Session, point_id: str, hops: int = 1) -> Optional[dict]:
+    """获取无向 k 跳邻域（节点与其间的链接），知识点不存在时返回 None"""
+    library_id = _point_library(db, point_id)
+    if library_id is None:
+        return None
+    graph = graph_cache.get(library_id)
+    if graph is None:
+        return traversal.neighborhood(db, point_id, hops)
+    found = graph.reachable(point_id, hops, "any")
+    return {
+        "nodes": traversal.with_titles(db, found),
+        "links": graph.links_among([point_id] + [node_id for node_id, _ in found]),
+    }
+
+
+def get_shortest_path(db: Session, from_id: str, to_id: str, max_depth: int = 12) -> Optional[dict]:
+    """获取两点间的无向最短路径，任一知识点不存在时返回 None"""
+    library_id = _point_library(db, from_id)
+    if library_id is None or _point_library(db, to_id) is None:
+        return None
+    graph = graph_cache.get(library_id)
+    if graph is None:
+        path = traversal.shortest_path(db, from_id, to_id, max_depth)
+    else:
+        nodes = graph.shortest_path(from_id, to_id, max_depth)
+        path = nodes and traversal.path_result(db, nodes, graph.links_among(nodes))
+    if not path:
+        return {"found": False, "length": None, "nodes": [], "links": []}
+    return {"found": True, "length": len(path["nodes"]) - 1, **path}
+
+
+def get_related_point_ids(db: Session, point_id: str, depth: int = 1,
+                          types: Optional[list[str]] = None) -> Optional[list[str]]:
+    """k 跳内的相关知识点 ID（起点在前，其余按层级、标题排序），知识点不存在时返回 None
+
+    types 限定只沿这些类型的链接扩展，None 表示全部类型。
+    """
+    library_id = _point_library(db, point_id)
+    if library_id is None:
+        return None
+    graph = graph_cache.get(library_id)
+    if graph is None:
+        nodes = traversal.neighborhood_nodes(db, point_id, depth, types)
+    else:
+        nodes = traversal.with_titles(db, graph.reachable(point_id, depth, "any", types))
+    return [point_id] + [node["id"] for node in nodes]
+
+
+def get_graph_cache_stats() -> dict:
+    """图缓存的命中 / 载入 / 重建计数"""
+    return graph_cache.stats()
+
+
+# ==================== 视口查询 ====================
+
+def get_points_in_bbox(db: Session, library_id: str, min_x: float, min_y: float, max_x: float, max_y: float,
+                       zoom: float) -> Optional[dict]:
+    """视口查询：放大时返回视口内的知识点及其关联链接，缩小或节点过多时返回网格聚合
+
+    视口外的链接端点也一并返回，前端才能画出穿出视口的连线。
+    """
+    if not db.get(Library, library_id):
+        return None
+    bbox = (min_x, min_y, max_x, max_y)
+    if zoom >= spatial_index.CLUSTER_ZOOM:
+        rows = spatial_index.points_in_bbox(db, library_id, bbox, spatial_index.MAX_VIEWPORT_POINTS + 1)
+        if len(rows) <= spatial_index.MAX_VIEWPORT_POINTS:
+            inside = {row.id for row in rows}
+            links = [dict(row._mapping) for row in spatial_index.incident_links(db, list(inside))]
+            outside = {link[end] for link in links for end in ("from_id", "to_id")} - inside
+            rows += spatial_index.points_by_ids(db, list(outside))
+            tags = _tag_records(db, library_id, [row.id for row in rows])
+            points = [
+                {"id": row.id, "title": row.title, "x": row.x, "y": row.y, "tags": tags.get(row.id, [])}
+                for row in rows
+            ]
+            return {"mode": "points", "points": points, "links": links, "clusters": []}
+
+    clusters = spatial_index.clusters(db, library_id, bbox, spatial_index.cluster_cell(zoom))
+    return {"mode": "clusters", "points": [], "links": [], "clusters": clusters}
+
+
 # ==================== 快照 ====================
 
-def _create_snapshot(db: Session, point: Point) -> Snapshot:
-    """内部方法：创建快照"""
+def _create_snapshot(db: Session, point: Point) -> str:
+    """内部方法：在当前事务中创建快照（由调用方提交），返回快照 ID"""
     # 获取相关链接
     links = db.scalars(
         select(Link).where(
@@ -359,221 +762,381 @@ def _create_snapshot(db: Session, point: Point) -> Snapshot:
         "incoming": [l.from_id for l in links if l.to_id == point.id]
     }
 
-    snapshot = Snapshot(
-        point_id=point.id,
-        title=point.title,
-        content=point.content,
-        source=point.source,
-        page=point.page,
-        links=link_data
-    )
-    db.add(snapshot)
-    db.commit()
-    return snapshot
+    snapshot_id = generate_id()
+    snapshot_store.add(db, [{
+        "id": snapshot_id,
+        "point_id": point.id,
+        "library_id": point.library_id,
+        "title": point.title,
+        "content": point.content,
+        "source": point.source,
+        "page": point.page,
+        "links": link_data,
+        "timestamp": utc_now()
+    }])
+    return snapshot_id
+
+
+# 快照行中重建文档所需的列（文档字段见 snapshot_store.DOC_FIELDS）
+_SNAPSHOT_STORAGE = (Snapshot.kind, Snapshot.base_id, Snapshot.payload)
 
 
-def get_snapshots(db: Session, point_id: str, days: int = 300) -> list[Snapshot]:
+def _decode_snapshots(db: Session, rows, fields) -> list[dict]:
+    """把快照行转换为输出字段；请求了文档字段时才解码"""
+    docs = snapshot_store.documents(db, rows) if set(fields) & set(snapshot_store.DOC_FIELDS) else {}
+    return [
+        {name: docs[row.id][name] if name in snapshot_store.DOC_FIELDS else getattr(row, name) for name in fields}
+        for row in rows
+    ]
+
+
+def get_snapshots(db: Session, point_id: str, days: int = 300) -> list[dict]:
     """获取知识点的快照历史（默认 300 天内）"""
     cutoff = datetime.now(timezone.utc) - timedelta(days=days)
-    return list(db.scalars(
-        select(Snapshot)
+    rows = db.execute(
+        select(Snapshot.id, Snapshot.point_id, Snapshot.title, Snapshot.timestamp, *_SNAPSHOT_STORAGE)
         .where(Snapshot.point_id == point_id, Snapshot.timestamp >= cutoff)
         .order_by(Snapshot.timestamp.desc())
-    ).all())
+    ).all()
+    return _decode_snapshots(db, rows, SNAPSHOT_FIELDS)
+
+
+# 分页列表可选的输出字段（与 SnapshotResponse 的字段名一致）
+SNAPSHOT_FIELDS = ("id", "point_id", "title", "content", "source", "page", "links", "timestamp")
+
+
+def get_snapshots_page(db: Session, point_id: str, days: int = 300, limit: Optional[int] = None,
+                       cursor: Optional[str] = None,
+                       fields: Optional[list[str]] = None) -> tuple[list[dict], Optional[str]]:
+    """按 (timestamp, id) 倒序游标分页获取快照（默认 300 天内）；返回 (记录, 下一页游标)"""
+    fields = fields or list(SNAPSHOT_FIELDS)
+    columns = [Snapshot.id, Snapshot.timestamp] + [
+        getattr(Snapshot, name) for name in fields if name not in ("id", "timestamp", *snapshot_store.DOC_FIELDS)
+    ]
+    if set(fields) & set(snapshot_store.DOC_FIELDS):
+        columns.extend(_SNAPSHOT_STORAGE)
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+    stmt = pagination.paginate(
+        select(*columns).where(Snapshot.point_id == point_id, Snapshot.timestamp >= cutoff),
+        Snapshot.timestamp, Snapshot.id, limit, cursor, descending=True
+    )
+    rows, next_cursor = pagination.split_page(db.execute(stmt).all(), limit, "timestamp")
+    return _decode_snapshots(db, rows, fields), next_cursor
+
+
+# 整库历史可选的输出字段（point_title 为知识点当前的标题）
+LIBRARY_SNAPSHOT_FIELDS = SNAPSHOT_FIELDS + ("point_title",)
+
+
+def _as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # 快照时间按 UTC 存储；不带时区的参数视为 UTC
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc)
+
+
+def get_library_snapshots(db: Session, library_id: str, limit: int, cursor: Optional[str] = None,
+                          since: Optional[datetime] = None, until: Optional[datetime] = None,
+                          point_id: Optional[str] = None, tag: Optional[str] = None,
+                          fields: Optional[list[str]] = None) -> tuple[list[dict], Optional[str]]:
+    """整库的版本历史：所有知识点的快照按 (timestamp, id) 倒序合并，游标分页
+
+    按 snapshots(library_id, timestamp, id) 索引顺序读取，只解码本页用到的文档；
+    可按时间范围 [since, until)、知识点或标签名过滤。返回 (记录, 下一页游标)。
+    """
+    fields = fields or list(LIBRARY_SNAPSHOT_FIELDS)
+    columns = [Snapshot.id, Snapshot.timestamp, Snapshot.point_id, Snapshot.title,
+               Point.title.label("point_title")]
+    if set(fields) & set(snapshot_store.DOC_FIELDS):
+        columns.extend(_SNAPSHOT_STORAGE)
+    stmt = select(*columns).join(Point, Point.id == Snapshot.point_id).where(Snapshot.library_id == library_id)
+    if since is not None:
+        stmt = stmt.where(Snapshot.timestamp >= _as_utc(since))
+    if until is not None:
+        stmt = stmt.where(Snapshot.timestamp < _as_utc(until))
+    if point_id:
+        stmt = stmt.where(Snapshot.point_id == point_id)
+    if tag:
+        stmt = stmt.where(Snapshot.point_id.in_(
+            select(point_tag_table.c.point_id)
+            .join(Tag, Tag.id == point_tag_table.c.tag_id)
+            .where(Tag.library_id == library_id, Tag.name == tag)
+        ))
+    stmt = pagination.paginate(stmt, Snapshot.timestamp, Snapshot.id, limit, cursor, descending=True)
+    rows, next_cursor = pagination.split_page(db.execute(stmt).all(), limit, "timestamp")
+    return _decode_snapshots(db, rows, fields), next_cursor
 
 
 def restore_snapshot(db: Session, point_id: str, snapshot_id: str) -> Optional[Point]:
     """从快照恢复知识点"""
-    snapshot = db.get(Snapshot, snapshot_id)
-    if not snapshot or snapshot.point_id != point_id:
+    snapshot = snapshot_store.load(db, snapshot_id)
+    if not snapshot or snapshot["point_id"] != point_id:
         return None
 
     point = db.get(Point, point_id)
     if not point:
         return None
 
-    point.title = snapshot.title
-    point.content = snapshot.content
-    point.source = snapshot.source
-    point.page = snapshot.page
+    point.title = snapshot["title"]
+    point.content = snapshot["content"]
+    point.source = snapshot["source"]
+    point.page = snapshot["page"]
 
+    _index_point_text(db, [point])
+    changelog.record(db, point.library_id, points=[point_id])
     db.commit()
     db.refresh(point)
     return point
 
 
+# 整库恢复时比较 / 写回的知识点字段（坐标与标签不在快照中）
+_RESTORE_FIELDS = ("title", "content", "source", "page")
+
+
+def _snapshots_as_of(db: Session, library_id: str, at: datetime):
+    """每个知识点在 at 时刻（含）之前的最新快照及其当前数据，按 _BATCH_CHUNK 分批产出
+
+    ROW_NUMBER() 窗口沿 snapshots(library_id, timestamp, id) 索引范围扫描，只取每组第一行。
+    """
+    rank = func.row_number().over(
+        partition_by=Snapshot.point_id, order_by=(Snapshot.timestamp.desc(), Snapshot.id.desc())
+    ).label("rank")
+    latest = (
+        select(Snapshot.id, rank)
+        .where(Snapshot.library_id == library_id, Snapshot.timestamp <= at)
+        .subquery()
+    )
+    result = db.execute(
+        select(Snapshot.id, Snapshot.point_id, Snapshot.title, Snapshot.timestamp, *_SNAPSHOT_STORAGE,
+               Point.title.label("current_title"), Point.content, Point.source, Point.page)
+        .join(latest, (latest.c.id == Snapshot.id) & (latest.c.rank == 1))
+        .join(Point, Point.id == Snapshot.point_id)
+        .execution_options(yield_per=_BATCH_CHUNK)
+    )
+    for rows in result.partitions():
+        yield rows, snapshot_store.documents(db, rows)
+
+
+def _restored_links(as_of: dict[str, tuple], alive: set[str]) -> list[tuple[str, str]]:
+    """由快照中记录的链接推出 at 时刻存在的 (from_id, to_id)
+
+    同一对知识点以两端快照中较新的一份为准：较新的快照没有记录这条链接，说明它在那之前已被删除。
+    """
+    def recorded(point_id: str, from_id: str, to_id: str) -> bool:
+        _, links = as_of[point_id]
+        return to_id in links["outgoing"] if point_id == from_id else from_id in links["incoming"]
+
+    pairs = {}
+    for point_id, (_, links) in as_of.items():
+        candidates = [(point_id, to_id) for to_id in links["outgoing"]]
+        candidates += [(from_id, point_id) for from_id in links["incoming"]]
+        for from_id, to_id in candidates:
+            if from_id == to_id or from_id not in alive or to_id not in alive:
+                continue
+            witnesses = [p for p in (from_id, to_id) if p in as_of]
+            newest = max(witnesses, key=lambda p: as_of[p][0])
+            if recorded(newest, from_id, to_id):
+                pairs.setdefault(frozenset((from_id, to_id)), (from_id, to_id))
+    return list(pairs.values())
+
+
+def restore_library(db: Session, library_id: str, at: datetime, dry_run: bool = False) -> Optional[dict]:
+    """把整个知识库恢复到 at 时刻的状态；dry_run=True 时只返回差异不写入。知识库不存在时返回 None
+
+    - 每个知识点取 at 之前最新的快照，恢复标题、内容、出处、页码；
+    - at 之后创建（且没有更早快照）的知识点删除；at 之前已存在但快照已被清理的知识点保持不变；
+    - at 之后创建的链接删除，快照中记录而现在缺失的链接重建。快照不记录链接类型，
+      两点之间已有链接时保留现有链接，否则新建 related 链接；
+    - 已删除的知识点无法恢复（其快照随之删除）。
+    所有写入在一个事务中完成，恢复的知识点各生成一个新快照（恢复本身也可以撤销）。
+    """
+    if not db.get(Library, library_id):
+        return None
+    at = _as_utc(at)
+
+    as_of: dict[str, tuple] = {}
+    updated, changed_rows = [], []
+    unchanged = 0
+    for rows, docs in _snapshots_as_of(db, library_id, at):
+        for row in rows:
+            doc = docs[row.id]
+            as_of[row.point_id] = (row.timestamp, doc["links"] or {"outgoing": [], "incoming": []})
+            target = {"title": row.title, "content": doc["content"], "source": doc["source"], "page": doc["page"]}
+            current = {"title": row.current_title, "content": row.content, "source": row.source, "page": row.page}
+            fields = [name for name in _RESTORE_FIELDS if target[name] != current[name]]
+            if not fields:
+                unchanged += 1
+                continue
+            updated.append({"id": row.point_id, "title": row.title, "fields": fields, "snapshot_id": row.id})
+            changed_rows.append({"id": row.point_id, "library_id": library_id, **target})
+
+    # 时间比较放在 SQL 中进行（与快照时间戳的存储格式一致）
+    point_rows = db.execute(
+        select(Point.id, Point.title, (Point.created_at > at).label("later")).where(Point.library_id == library_id)
+    ).all()
+    deleted = [{"id": p.id, "title": p.title} for p in point_rows if p.later and p.id not in as_of]
+    deleted_ids = {p["id"] for p in deleted}
+    alive = {p.id for p in point_rows} - deleted_ids
+    untracked = len(alive) - len(as_of)
+
+    # 链接：起点在本库的链接归本库（与变更日志一致）
+    link_rows = db.execute(
+        select(Link.id, Link.from_id, Link.to_id, Link.type, (Link.created_at > at).label("later"))
+        .join(Point, Point.id == Link.from_id)
+        .where(Point.library_id == library_id)
+    ).all()
+    restored = {frozenset(pair): pair for pair in _restored_links(as_of, alive)}
+    # at 之后创建、但快照表明 at 时刻两点之间有链接的，保留现有链接（含其类型）
+    removed = [link for link in link_rows if link.later and frozenset((link.from_id, link.to_id)) not in restored]
+    existing = {frozenset((link.from_id, link.to_id)) for link in link_rows}
+    added = [
+        {"from_id": from_id, "to_id": to_id, "type": "related"}
+        for key, (from_id, to_id) in restored.items() if key not in existing
+    ]
+
+    result = {
+        "at": at, "dry_run": dry_run, "revision": None,
+        "updated": updated, "deleted": deleted, "unchanged": unchanged, "untracked": untracked,
+        "links_added": added,
+        "links_removed": [{"id": link.id, "from_id": link.from_id, "to_id": link.to_id, "type": link.type}
+                          for link in removed],
+    }
+    if dry_run or not (updated or deleted or added or removed):
+        return result
+
+    # 写入（同一事务）
+    now = utc_now()
+    if deleted_ids:
+        _delete_points_bulk(db, list(deleted_ids))
+    removed_ids = [link.id for link in removed if link.from_id not in deleted_ids and link.to_id not in deleted_ids]
+    for chunk in _chunks(removed_ids):
+        db.execute(delete(Link).where(Link.id.in_(chunk)))
+    new_links = [{**link, "id": link_id, "created_at": now} for link, link_id in zip(added, generate_ids(len(added)))]
+    if new_links:
+        db.execute(insert(Link.__table__), new_links)
+    if changed_rows:
+        points_table = Point.__table__
+        db.execute(
+            update(points_table).where(points_table.c.id == bindparam("point_id")),
+            [{"point_id": p["id"], "title": p["title"], "content": p["content"], "source": p["source"],
+              "page": p["page"], "updated_at": now} for p in changed_rows]
+        )
+        # 只有出处 / 页码变化的知识点不需要重新分词
+        text_changed = {u["id"] for u in updated if {"title", "content"} & set(u["fields"])}
+        _index_point_text(db, [SimpleNamespace(**p) for p in changed_rows if p["id"] in text_changed])
+        link_data = _link_data_bulk(db, [p["id"] for p in changed_rows])
+        snapshot_store.add(db, [
+            {**p, "id": snapshot_id, "point_id": p["id"], "timestamp": now, "links": link_data[p["id"]]}
+            for p, snapshot_id in zip(changed_rows, generate_ids(len(changed_rows)))
+        ])
+    result["revision"] = changelog.record(db, library_id, points=[p["id"] for p in changed_rows],
+                                          links=[link["id"] for link in new_links], deleted_links=removed_ids)
+    graph_cache.invalidate(db, library_id)
+    db.commit()
+    return result
+
+
 # ==================== 词频统计 ====================
 
 def get_word_frequency(db: Session, library_id: str, mode: str = "content") -> list[tuple[str, int]]:
-    """获取词频统计"""
-    import jieba
+    """获取词频统计（前 100 个）
+
+    内容模式读取增量维护的 library_terms 汇总；标签模式直接对 point_tags 做聚合。
+    """
+    if mode == "content":
+        return term_index.top_terms(db, library_id, limit=100)
+
+    tag_count = func.count().label("count")
+    rows = db.execute(
+        select(Tag.name, tag_count)
+        .select_from(point_tag_table)
+        .join(Tag, Tag.id == point_tag_table.c.tag_id)
+        .where(Tag.library_id == library_id)
+        .group_by(Tag.name)
+        .order_by(tag_count.desc())
+        .limit(100)
+    ).all()
+    return [(name, count) for name, count in rows]
 
-    points = get_points(db, library_id)
 
-    word_count: dict[str, int] = {}
+def reindex_library(db: Session, library_id: str) -> bool:
+    """重建知识库的全文索引与词频统计（词典或停用词变更后使用）"""
+    if not db.get(Library, library_id):
+        return False
+    search_index.rebuild(db, library_id)
+    term_index.rebuild(db, library_id)
+    changelog.record(db, library_id)  # 词频可能变化，使其 ETag 失效
+    db.commit()
+    return True
 
-    if mode == "content":
-        for point in points:
-            words = jieba.cut(point.content)
-            for word in words:
-                word = word.strip()
-                if len(word) > 1:  # 过滤单字
-                    word_count[word] = word_count.get(word, 0) + 1
-    else:  # tag mode
-        for point in points:
-            for tag in point.tags:
-                word_count[tag.name] = word_count.get(tag.name, 0) + 1
-
-    # 按频率排序
-    sorted_words = sorted(word_count.items(), key=lambda x: x[1], reverse=True)
-    return sorted_words[:100]  # 返回前 100 个
+
+# ==================== 画布图数据 ====================
+
+def get_library_graph(db: Session, library_id: str) -> Optional[dict]:
+    """画布用的整库图数据（列式，见 graph_payload）；知识库不存在时返回 None"""
+    return graph_payload.build(db, library_id)
+
+
+# ==================== 增量同步 ====================
+
+def get_library_revision(db: Session, library_id: str) -> Optional[int]:
+    """知识库当前修订号；不存在时返回 None"""
+    return db.scalar(select(Library.revision).where(Library.id == library_id))
+
+
+def get_library_changes(db: Session, library_id: str, since: int) -> Optional[dict]:
+    """since 修订号之后新增 / 修改的知识点和链接（完整数据）以及删除的 ID；知识库不存在时返回 None"""
+    changes = changelog.changes_since(db, library_id, since)
+    if changes is None or changes["reset"]:
+        return changes
+    if changes["points"]:
+        ids = func.json_each(json.dumps(changes["points"])).table_valued("value")
+        changes["points"] = list(db.scalars(
+            select(Point)
+            .options(selectinload(Point.tags))
+            .where(Point.id.in_(select(ids.c.value)), Point.library_id == library_id)
+        ).all())
+    if changes["links"]:
+        ids = func.json_each(json.dumps(changes["links"])).table_valued("value")
+        changes["links"] = list(db.scalars(select(Link).where(Link.id.in_(select(ids.c.value)))).all())
+    return changes
 
 
 # ==================== 导入 ====================
 
 def import_libraries_from_data(db: Session, data: list[dict]) -> int:
-    """从 JSON 数据导入库
-    
+    """从 JSON 数据导入库（批量写入，见 importer）
+
     返回导入成功的库数量
     """
-    count = 0
-    for lib_data in data:
-        meta = lib_data.get("meta")
-        if not meta:
-            continue
-            
-        # 1. 创建新 Library (即使 ID 一样也创建新的，避免冲突)
-        # 为区别导入，可以在名字后加 (Imported) 或者保留原名让用户自己改
-        # 这里保留原名 (UUID 会变)
-        new_lib = Library(
-            name=meta["name"],
-            description=meta.get("description")
-        )
-        db.add(new_lib)
-        db.flush()
-        
-        # 2. 导入 Tags
-        # 建立 tag_name -> tag_obj 映射
-        tag_map = {}
-        if "tags" in meta:
-            for t in meta["tags"]:
-                new_tag = Tag(
-                    library_id=new_lib.id,
-                    name=t["name"],
-                    color=t.get("color", "#3F51B5")
-                )
-                db.add(new_tag)
-                tag_map[t["name"]] = new_tag
-        db.flush()
-        
-        # 3. 导入 Sources
-        # 建立 source_name -> source_id (其实 Point 用的是 name 还是 id? Point 模型里 source 是 str(256), page 是 str. Point.source 存的是名字.)
-        # 确实 Point.source 是 Mapped[str]. 而 Source 表是 Mapped[str].
-        # 逻辑上 Point.source 应该是 Source 表的 ID 或者是 Name? 
-        # 查看 create_point: source=source. 
-        # Source 表存在主要是为了下拉菜单配置.
-        # 所以导入 Source 表即可.
-        if "sources" in meta:
-            for s in meta["sources"]:
-                new_source = Source(
-                    library_id=new_lib.id,
-                    name=s["name"]
-                )
-                db.add(new_source)
-        
-        # 4. 导入 Points
-        # 建立 old_id -> new_id 映射
-        id_map = {}
-        for p in lib_data.get("points", []):
-            new_point = Point(
-                library_id=new_lib.id,
-                title=p["title"],
-                content=p["content"],
-                source=p.get("source"),
-                page=p.get("page"),
-                x=p.get("x", 0.0),
-                y=p.get("y", 0.0)
-            )
-            
-            # 关联标签
-            if "tags" in p:
-                p_tags = []
-                for t_name in p["tags"]:
-                    if t_name in tag_map:
-                        p_tags.append(tag_map[t_name])
-                    # 如果 export data 里的 tag 在 meta 里没定义? (数据不一致). 忽略或创建? 忽略稳妥.
-                new_point.tags = p_tags
-                
-            db.add(new_point)
-            db.flush()
-            id_map[p["id"]] = new_point.id
-            
-            # 创建初始快照
-            _create_snapshot(db, new_point)
-
-        # 5. 导入 Links
-        for l in lib_data.get("links", []):
-            from_id = l.get("fromId")
-            to_id = l.get("toId")
-            
-            # 只有当起点和终点都在本次导入中，才创建链接 (不支持跨库链接其实)
-            if from_id in id_map and to_id in id_map:
-                new_link = Link(
-                    from_id=id_map[from_id],
-                    to_id=id_map[to_id],
-                    type=l.get("type", "related")
-                )
-                db.add(new_link)
-        
-        count += 1
-        
-    db.commit()
-    return count
+    return importer.import_sources(db, importer.data_sources(data))["count"]
 
 
 # ==================== 全局统计与搜索 ====================
 
 def get_global_stats(db: Session) -> dict:
-    """获取全局聚合统计数据"""
-    total_libraries = db.scalar(select(func.count(Library.id)))
-    total_points = db.scalar(select(func.count(Point.id)))
-    total_links = db.scalar(select(func.count(Link.id)))
-    
+    """获取全局聚合统计数据（读取 global_state 中由触发器维护的计数）"""
+    counts = counters.global_counts(db)
     return {
-        "total_libraries": total_libraries or 0,
-        "total_points": total_points or 0,
-        "total_links": total_links or 0
+        "total_libraries": counts["library_count"],
+        "total_points": counts["point_count"],
+        "total_links": counts["link_count"],
+        "total_snapshots": counts["snapshot_count"],
     }
 
 
-def search_global(db: Session, query: str) -> dict:
-    """全局跨库搜索"""
-    # 1. 搜索知识库
-    libraries = db.scalars(
-        select(Library)
-        .where(Library.name.ilike(f"%{query}%") | Library.description.ilike(f"%{query}%"))
-        .limit(10)
-    ).all()
-    
-    # 2. 搜索知识点
-    points = db.scalars(
-        select(Point)
-        .where(Point.title.ilike(f"%{query}%") | Point.content.ilike(f"%{query}%"))
-        .limit(20)
-    ).all()
-    
-    return {
-        "libraries": [
-            {"id": lib.id, "name": lib.name, "description": lib.description} 
-            for lib in libraries
-        ],
-        "points": [
-            {
-                "id": p.id, 
-                "title": p.title, 
-                "library_id": p.library_id,
-                "library_name": p.library.name if p.library else "Unknown"
-            }
-            for p in points
-        ]
-    }
+def repair_counters(db: Session) -> dict:
+    """重新统计知识库与全局计数并修正偏差；返回修正的内容（见 counters.rebuild）"""
+    result = counters.rebuild(db)
+    for item in result["libraries"]:
+        changelog.record(db, item["id"])
+    if result["global_counts"]:
+        changelog.touch(db)
+    db.commit()
+    return result
+
+
+def search_global(db: Session, query: str, limit: int = 20, offset: int = 0,
+                  library_id: Optional[str] = None) -> dict:
+    """全局跨库搜索（FTS5 全文索引，BM25 排序）；指定 library_id 时只搜索该知识库"""
+    return search_index.search(db, query, limit=limit, offset=offset, library_id=library_id)
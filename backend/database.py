@@ -1,23 +1,117 @@
 """
 SQLAlchemy 数据库配置
 """
+import os
 from pathlib import Path
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker, DeclarativeBase
 
-# 数据库文件路径
-DATABASE_PATH = Path(__file__).parent / "knowledge.db"
+# 数据库文件路径（可通过环境变量 KNOWLEDGE_DB_PATH 覆盖）
+DATABASE_PATH = Path(os.environ.get("KNOWLEDGE_DB_PATH", Path(__file__).parent / "knowledge.db"))
 DATABASE_URL = f"sqlite:///{DATABASE_PATH}"
 
-# 创建引擎
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False},  # SQLite 需要此配置
-    echo=False  # 生产环境设为 False
-)
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+# SQLite 连接参数配置（每个新连接都会执行）
+# 可通过 KNOWLEDGE_SQLITE_<NAME> 环境变量覆盖，例如 KNOWLEDGE_SQLITE_CACHE_SIZE=-131072
+ENGINE_PROFILE = {
+    "journal_mode": os.environ.get("KNOWLEDGE_SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.environ.get("KNOWLEDGE_SQLITE_SYNCHRONOUS", "NORMAL"),  # WAL 下 NORMAL 足够安全
+    "cache_size": _env_int("KNOWLEDGE_SQLITE_CACHE_SIZE", -65536),  # 负数单位为 KiB，即 64 MiB
+    "mmap_size": _env_int("KNOWLEDGE_SQLITE_MMAP_SIZE", 256 * 1024 * 1024),
+    "temp_store": os.environ.get("KNOWLEDGE_SQLITE_TEMP_STORE", "MEMORY"),
+    "busy_timeout": _env_int("KNOWLEDGE_SQLITE_BUSY_TIMEOUT", 5000),  # 毫秒
+    # 新建的数据库文件才会生效；已有数据库在下一次完整 VACUUM 时切换（见 maintenance）
+    "auto_vacuum": os.environ.get("KNOWLEDGE_SQLITE_AUTO_VACUUM", "INCREMENTAL"),
+}
+
+
+def _apply_pragmas(dbapi_connection, read_only: bool):
+    """为新建立的 SQLite 连接设置 PRAGMA"""
+    cursor = dbapi_connection.cursor()
+    try:
+        # journal_mode / auto_vacuum 是持久化到数据库文件的设置，只需由写连接设置
+        if not read_only:
+            cursor.execute(f"PRAGMA auto_vacuum={ENGINE_PROFILE['auto_vacuum']}")
+            cursor.execute(f"PRAGMA journal_mode={ENGINE_PROFILE['journal_mode']}")
+        cursor.execute(f"PRAGMA synchronous={ENGINE_PROFILE['synchronous']}")
+        cursor.execute(f"PRAGMA cache_size={ENGINE_PROFILE['cache_size']}")
+        cursor.execute(f"PRAGMA mmap_size={ENGINE_PROFILE['mmap_size']}")
+        cursor.execute(f"PRAGMA temp_store={ENGINE_PROFILE['temp_store']}")
+        cursor.execute(f"PRAGMA busy_timeout={ENGINE_PROFILE['busy_timeout']}")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+    finally:
+        cursor.close()
+
+
+def _create_engine(read_only: bool):
+    connect_args = {
+        "check_same_thread": False,  # SQLite 需要此配置
+        "timeout": ENGINE_PROFILE["busy_timeout"] / 1000,
+    }
+    if read_only:
+        # 读连接可并发：WAL 模式下读不会阻塞写，也不会被写阻塞
+        new_engine = create_engine(DATABASE_URL, connect_args=connect_args, echo=False)
+    else:
+        # 写连接只保留一个：SQLite 同时只允许一个写事务，
+        # 在连接池层排队比在数据库层争抢锁（database is locked）更可控
+        new_engine = create_engine(
+            DATABASE_URL,
+            connect_args=connect_args,
+            pool_size=1,
+            max_overflow=0,
+            pool_timeout=30,
+            echo=False  # 生产环境设为 False
+        )
+
+    @event.listens_for(new_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        _apply_pragmas(dbapi_connection, read_only)
+
+    return new_engine
+
+
+# 创建引擎：单写引擎 + 只读引擎
+engine = _create_engine(read_only=False)
+read_engine = _create_engine(read_only=True)
 
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+
+# ==================== 提交后回调 ====================
+
+def after_commit(session: Session, callback):
+    """登记一个在当前事务提交成功后执行的回调，事务回滚时丢弃
+
+    用于维护进程内的派生状态（如图缓存），保证只反映已经落盘的数据。
+    回调执行时会话已不能再发出 SQL，所需的值应在登记时捕获。
+    """
+    session.info.setdefault("after_commit", []).append(callback)
+
+
+def transaction_info(session: Session) -> dict:
+    """当前事务内有效的临时状态，提交或回滚后清空（如本事务已分配的修订号）"""
+    return session.info.setdefault("transaction", {})
+
+
+@event.listens_for(Session, "after_commit")
+def _run_after_commit(session: Session):
+    session.info.pop("transaction", None)
+    for callback in session.info.pop("after_commit", []):
+        callback()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_commit(session: Session):
+    session.info.pop("transaction", None)
+    session.info.pop("after_commit", None)
 
 
 class Base(DeclarativeBase):
@@ -26,7 +120,7 @@ class Base(DeclarativeBase):
 
 
 def get_db():
-    """依赖注入：获取数据库会话"""
+    """依赖注入：获取数据库会话（写）"""
     db = SessionLocal()
     try:
         yield db
@@ -34,7 +128,18 @@ def get_db():
         db.close()
 
 
+def get_read_db():
+    """依赖注入：获取只读数据库会话（供 GET 路由使用）"""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
 def init_db():
-    """初始化数据库（创建所有表）"""
+    """初始化数据库（创建所有表并执行未应用的迁移）"""
     from . import models  # noqa: F401 - 导入模型以注册
+    from .migrations import run_migrations
     Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
@@ -0,0 +1,194 @@
+"""
+实时事件 - 进程内发布 / 订阅，经 SSE（GET /api/libraries/{id}/events）推送给客户端
+
+changelog.record() 通过 database.after_commit 在事务提交后发布 change 事件，
+每个事务每个知识库一条：修订号、新增 / 修改与删除的知识点和链接 ID、知识库自身
+（名称、标签、出处）是否变化。事件只携带 ID，客户端收到后用 /changes?since= 取数据；
+ID 总数超过 MAX_EVENT_IDS 时省略 ID 并标记 truncated。删除知识库时发布 deleted 并断开。
+
+发布可能发生在任意线程（同步路由运行在线程池中）：事件只编码一次，每个事件循环
+只投递一次回调（call_soon_threadsafe），在循环线程中分发给各订阅者。
+每个订阅者只有一个有界队列和一个 asyncio.Event，空闲连接几乎不占资源。
+队列满（消费者跟不上）时丢弃积压，只留一条 reset 事件并结束该连接，
+客户端重连后用 /changes 补齐。空闲连接每 HEARTBEAT_SECONDS 秒发送一行注释保活。
+
+与图缓存一样只在本进程内有效，多进程部署时各进程只推送自己处理的写操作。
+"""
+import asyncio
+import json
+import threading
+from collections import deque
+from typing import AsyncIterator, Callable, Optional
+
+from sqlalchemy.orm import Session
+
+from .database import after_commit
+
+# 每个订阅者最多积压的事件数
+MAX_QUEUE = 64
+# 单个事件携带的 ID 上限
+MAX_EVENT_IDS = 1000
+# 空闲连接的保活间隔（秒）
+HEARTBEAT_SECONDS = 15.0
+# 一次事件循环迭代中最多唤醒的订阅者数
+DELIVER_BATCH = 32
+# 断线后浏览器 EventSource 的重连间隔（毫秒）
+RETRY_MS = 3000
+
+HEARTBEAT_FRAME = ": keepalive\n\n"
+
+_subscribers: dict[str, set["Subscriber"]] = {}
+_lock = threading.Lock()
+
+
+def encode(event: str, data: dict, event_id: Optional[int] = None) -> str:
+    """编码一条 SSE 消息"""
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+
+RESET_FRAME = encode("reset", {"reason": "slow consumer"})
+
+
+class Subscriber:
+    """一个 SSE 连接的有界事件队列（只在所属事件循环的线程中读写）"""
+    __slots__ = ("library_id", "loop", "pending", "ready", "closed")
+
+    def __init__(self, library_id: str):
+        self.library_id = library_id
+        self.loop = asyncio.get_running_loop()
+        self.pending: deque[str] = deque()
+        self.ready = asyncio.Event()
+        self.closed = False
+
+    def offer(self, frame: str):
+        if self.closed:
+            return
+        if len(self.pending) >= MAX_QUEUE:
+            # 消费者跟不上：丢弃积压，通知其重新同步后断开
+            self.pending.clear()
+            self.pending.append(RESET_FRAME)
+            self.closed = True
+        else:
+            self.pending.append(frame)
+        self.ready.set()
+
+    def close(self):
+        self.closed = True
+        self.ready.set()
+
+    async def frames(self) -> AsyncIterator[str]:
+        """依次产出事件，空闲时产出保活注释；连接被关闭且队列取空后结束"""
+        while True:
+            if self.pending:
+                yield self.pending.popleft()
+                continue
+            if self.closed:
+                return
+            self.ready.clear()
+            try:
+                # wait_for 兼容 Python 3.9 / 3.10（asyncio.timeout 需要 3.11）
+                await asyncio.wait_for(self.ready.wait(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield HEARTBEAT_FRAME
+
+
+def subscribe(library_id: str) -> Subscriber:
+    """在当前事件循环中订阅知识库的事件"""
+    subscriber = Subscriber(library_id)
+    with _lock:
+        _subscribers.setdefault(library_id, set()).add(subscriber)
+    return subscriber
+
+
+def unsubscribe(subscriber: Subscriber):
+    with _lock:
+        group = _subscribers.get(subscriber.library_id)
+        if group is not None:
+            group.discard(subscriber)
+            if not group:
+                del _subscribers[subscriber.library_id]
+
+
+def subscriber_count(library_id: Optional[str] = None) -> int:
+    with _lock:
+        if library_id is not None:
+            return len(_subscribers.get(library_id, ()))
+        return sum(len(group) for group in _subscribers.values())
+
+
+def _deliver(subscribers: list[Subscriber], frame: str, close: bool, start: int = 0):
+    # 分批唤醒：每批之后让出事件循环，发起写入的请求不必等全部订阅者发送完才得到响应
+    for subscriber in subscribers[start:start + DELIVER_BATCH]:
+        subscriber.offer(frame)
+        if close:
+            subscriber.close()
+    if start + DELIVER_BATCH < len(subscribers):
+        subscriber.loop.call_soon(_deliver, subscribers, frame, close, start + DELIVER_BATCH)
+
+
+def publish(library_id: str, event: str, data: dict, event_id: Optional[int] = None, close: bool = False):
+    """向知识库的所有订阅者发布事件（线程安全）；close=True 时发布后断开这些连接"""
+    with _lock:
+        subscribers = list(_subscribers.get(library_id, ()))
+    if not subscribers:
+        return
+    frame = encode(event, data, event_id)
+    by_loop: dict[asyncio.AbstractEventLoop, list[Subscriber]] = {}
+    for subscriber in subscribers:
+        by_loop.setdefault(subscriber.loop, []).append(subscriber)
+    for loop, group in by_loop.items():
+        try:
+            loop.call_soon_threadsafe(_deliver, group, frame, close)
+        except RuntimeError:
+            pass  # 事件循环已关闭
+
+
+def _change_event(change: dict) -> dict:
+    deleted_points = list(dict.fromkeys(change["deleted_points"]))
+    deleted_links = list(dict.fromkeys(change["deleted_links"]))
+    removed = set(deleted_points) | set(deleted_links)
+    event = {
+        "revision": change["revision"],
+        "library": change["library"],
+        "points": [i for i in dict.fromkeys(change["points"]) if i not in removed],
+        "links": [i for i in dict.fromkeys(change["links"]) if i not in removed],
+        "deleted_points": deleted_points,
+        "deleted_links": deleted_links,
+        "truncated": False,
+    }
+    if sum(len(event[key]) for key in ("points", "links", "deleted_points", "deleted_links")) > MAX_EVENT_IDS:
+        event.update(points=[], links=[], deleted_points=[], deleted_links=[], truncated=True)
+    return event
+
+
+def changed(db: Session, library_id: str, change: dict):
+    """事务提交后发布 change 事件；change 为 changelog 在本事务中累积的变更（提交前仍可追加）"""
+    def notify():
+        if subscriber_count(library_id):
+            publish(library_id, "change", _change_event(change), change["revision"])
+    after_commit(db, notify)
+
+
+def library_deleted(db: Session, library_id: str):
+    """事务提交后通知订阅者知识库已删除，并断开连接"""
+    after_commit(db, lambda: publish(library_id, "deleted", {"library_id": library_id}, close=True))
+
+
+async def stream(library_id: str, current_revision: Callable[[], Optional[int]]) -> AsyncIterator[str]:
+    """SSE 响应体：先发送 hello（当前修订号），再转发订阅到的事件；连接结束时退订
+
+    先订阅再读取修订号，两者之间提交的事件不会丢失（修订号不大于 hello 的事件客户端忽略即可）。
+    订阅放在生成器内部，响应未开始发送就断开的连接不会留下订阅者。
+    """
+    subscriber = subscribe(library_id)
+    try:
+        revision = await asyncio.to_thread(current_revision)
+        if revision is None:
+            yield encode("deleted", {"library_id": library_id})
+            return
+        yield f"retry: {RETRY_MS}\n" + encode("hello", {"revision": revision}, revision)
+        async for frame in subscriber.frames():
+            yield frame
+    finally:
+        unsubscribe(subscriber)
@@ -0,0 +1,392 @@
+"""
+导出 - 流式生成 JSON / Markdown / CSV
+
+知识点按批（yield_per）从游标读取，每批一次性查询标签，
+边查询边输出，峰值内存与知识库大小无关。
+"""
+import csv
+import io
+import json
+import zipfile
+from typing import Iterable, Iterator, Optional
+from urllib.parse import quote
+
+from sqlalchemy import Select, exists, func, select
+from sqlalchemy.orm import Session, aliased, selectinload
+
+from . import snapshot_store
+from .database import ReadSessionLocal
+from .models import Library, Point, Link, Snapshot, Tag, point_tag_table
+
+EXPORT_BATCH = 1000
+# 流式输出时累积到该大小再发送，避免每个知识点一个 HTTP 分块
+FLUSH_SIZE = 64 * 1024
+NDJSON_FORMAT = "knowledge-ndjson"
+
+MEDIA_TYPES = {
+    "json": "application/json",
+    "markdown": "text/markdown",
+    "csv": "text/csv",
+    "zip": "application/zip",
+}
+EXTENSIONS = {"json": "json", "markdown": "md", "csv": "csv"}
+
+
+def attachment_headers(filename: str) -> dict:
+    """Content-Disposition 头：ASCII 兜底文件名 + RFC 5987 编码的原始文件名"""
+    fallback = filename.encode("ascii", "replace").decode("ascii").replace("?", "_").replace('"', "_")
+    return {"Content-Disposition": f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename)}"}
+
+
+# ==================== 查询 ====================
+
+def library_points_query(library_id: str, tag_names: Optional[list[str]] = None) -> Select:
+    """知识库知识点查询（标签筛选在 SQL 中完成）"""
+    stmt = select(
+        Point.id, Point.title, Point.content, Point.source, Point.page, Point.x, Point.y
+    ).where(Point.library_id == library_id)
+    if tag_names:
+        stmt = stmt.where(exists(
+            select(1)
+            .select_from(point_tag_table)
+            .join(Tag, Tag.id == point_tag_table.c.tag_id)
+            .where(point_tag_table.c.point_id == Point.id, Tag.name.in_(tag_names))
+        ))
+    return stmt
+
+
+def library_links_query(library_id: str) -> Select:
+    """知识库内部链接查询（两端都属于该库）
+
+    用两次 JOIN 而不是两个 IN 子查询：后者会让 SQLite 对两个列表的笛卡尔积逐一探测索引。
+    """
+    from_point = aliased(Point)
+    to_point = aliased(Point)
+    return (
+        select(Link.id, Link.from_id, Link.to_id, Link.type)
+        .join(from_point, from_point.id == Link.from_id)
+        .join(to_point, to_point.id == Link.to_id)
+        .where(from_point.library_id == library_id, to_point.library_id == library_id)
+    )
+
+
+def _id_list(point_ids: list[str]):
+    """把 ID 列表作为一个 JSON 参数传给 json_each，避免逐个绑定参数（key 为列表下标）"""
+    return func.json_each(json.dumps(point_ids)).table_valued("key", "value")
+
+
+def points_by_ids_query(point_ids: list[str]) -> Select:
+    """按给定顺序读取一组知识点"""
+    ids = _id_list(point_ids)
+    return (
+        select(Point.id, Point.title, Point.content, Point.source, Point.page, Point.x, Point.y)
+        .join(ids, ids.c.value == Point.id)
+        .order_by(ids.c.key)
+    )
+
+
+def links_among_query(point_ids: list[str]) -> Select:
+    """两端都在给定知识点集合内的链接"""
+    return select(Link.id, Link.from_id, Link.to_id, Link.type).where(
+        Link.from_id.in_(select(_id_list(point_ids).c.value)),
+        Link.to_id.in_(select(_id_list(point_ids).c.value)),
+    )
+
+
+def _tags_for(db: Session, point_ids: list[str]) -> dict[str, list[str]]:
+    tags: dict[str, list[str]] = {}
+    rows = db.execute(
+        select(point_tag_table.c.point_id, Tag.name)
+        .join(Tag, Tag.id == point_tag_table.c.tag_id)
+        .where(point_tag_table.c.point_id.in_(point_ids))
+    )
+    for point_id, name in rows:
+        tags.setdefault(point_id, []).append(name)
+    return tags
+
+
+def iter_point_batches(db: Session, stmt: Select) -> Iterator[list[tuple]]:
+    """分批读取知识点，产出 [(row, 标签名列表), ...]"""
+    result = db.execute(stmt.execution_options(yield_per=EXPORT_BATCH))
+    for rows in result.partitions():
+        tags = _tags_for(db, [row.id for row in rows])
+        yield [(row, tags.get(row.id, [])) for row in rows]
+
+
+def iter_links(db: Session, stmt: Select) -> Iterator:
+    yield from db.execute(stmt.execution_options(yield_per=EXPORT_BATCH))
+
+
+def iter_libraries(db: Session, library_ids: list[str]) -> Iterator[Library]:
+    """逐个加载知识库（含标签、出处）；空列表表示全部知识库"""
+    if not library_ids:
+        library_ids = list(db.scalars(select(Library.id).order_by(Library.created_at.desc())))
+    for library_id in library_ids:
+        library = db.scalar(
+            select(Library)
+            .options(selectinload(Library.tags), selectinload(Library.sources))
+            .where(Library.id == library_id)
+        )
+        if library:
+            yield library
+        db.expunge_all()
+
+
+def library_snapshots_query(library_id: str) -> Select:
+    """同一知识点的快照按时间顺序相邻输出（导入时依次编码为关键帧 / 差异）"""
+    return (
+        select(Snapshot.id, Snapshot.point_id, Snapshot.title, Snapshot.timestamp,
+               Snapshot.kind, Snapshot.base_id, Snapshot.payload)
+        .join(Point, Point.id == Snapshot.point_id)
+        .where(Point.library_id == library_id)
+        .order_by(Snapshot.point_id, Snapshot.timestamp)
+    )
+
+
+def library_meta(library: Library) -> dict:
+    """批量导出 / 导入使用的知识库元数据"""
+    return {
+        "id": library.id,
+        "name": library.name,
+        "description": library.description,
+        "tags": [{"name": t.name, "color": t.color, "id": t.id} for t in library.tags],
+        "sources": [{"name": s.name, "id": s.id} for s in library.sources],
+        "created_at": library.created_at.isoformat() if library.created_at else None,
+        "updated_at": library.updated_at.isoformat() if library.updated_at else None,
+    }
+
+
+# ==================== 格式 ====================
+
+def _dump(obj, level: int) -> str:
+    """与 json.dumps(indent=2) 嵌套在第 level 层时的输出一致（首行不缩进）"""
+    text = json.dumps(obj, ensure_ascii=False, indent=2)
+    return text.replace("\n", "\n" + "  " * level)
+
+
+def _stream_array(items: Iterable, level: int) -> Iterator[str]:
+    """流式输出 JSON 数组，格式与 json.dumps(indent=2) 一致"""
+    pad = "\n" + "  " * (level + 1)
+    first = True
+    for item in items:
+        yield ("[" if first else ",") + pad + _dump(item, level + 1)
+        first = False
+    yield "[]" if first else "\n" + "  " * level + "]"
+
+
+def _point_records(point_batches: Iterable[list[tuple]], with_position: bool = False) -> Iterator[dict]:
+    for batch in point_batches:
+        for row, tags in batch:
+            record = {
+                "id": row.id,
+                "title": row.title,
+                "content": row.content,
+                "source": row.source,
+                "page": row.page,
+                "tags": tags,
+            }
+            if with_position:
+                record["x"] = row.x
+                record["y"] = row.y
+            yield record
+
+
+def write_json(library: dict, point_batches: Iterable[list[tuple]], links: Iterable) -> Iterator[str]:
+    """与原有导出结构一致：{"library": {...}, "points": [...], "links": [...]}"""
+    yield '{\n  "library": ' + _dump(library, 1) + ',\n  "points": '
+    yield from _stream_array(_point_records(point_batches), 1)
+    yield ',\n  "links": '
+    yield from _stream_array(
+        ({"fromId": link.from_id, "toId": link.to_id, "type": link.type} for link in links), 1
+    )
+    yield "\n}"
+
+
+def write_markdown(library: dict, point_batches: Iterable[list[tuple]]) -> Iterator[str]:
+    yield f"# {library['name']}\n\n"
+    if library.get("description"):
+        yield f"{library['description']}\n\n"
+    yield "\n## 知识点\n\n"
+    for batch in point_batches:
+        parts = []
+        for row, tags in batch:
+            parts.append(
+                f"### {row.title}\n\n"
+                f"**标签**: {', '.join(tags)}\n\n"
+                f"**出处**: {row.source or '无'} (页码: {row.page or '无'})\n\n\n"
+                f"{row.content}\n\n---\n\n"
+            )
+        yield "".join(parts)
+
+
+def write_csv(point_batches: Iterable[list[tuple]]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["ID", "标题", "内容", "标签", "出处", "页码"])
+    yield buffer.getvalue()
+    for batch in point_batches:
+        buffer.seek(0)
+        buffer.truncate()
+        for row, tags in batch:
+            writer.writerow([row.id, row.title, row.content, ",".join(tags), row.source or "", row.page or ""])
+        yield buffer.getvalue()
+
+
+def write_batch_json(db: Session, library_ids: list[str]) -> Iterator[str]:
+    """批量导出 JSON：[{"meta": {...}, "points": [...], "links": [...]}, ...]"""
+    first = True
+    for library in iter_libraries(db, library_ids):
+        yield ("[" if first else ",") + '\n  {\n    "meta": ' + _dump(library_meta(library), 2)
+        yield ',\n    "points": '
+        batches = iter_point_batches(db, library_points_query(library.id))
+        yield from _stream_array(_point_records(batches, with_position=True), 2)
+        yield ',\n    "links": '
+        yield from _stream_array(
+            (
+                {"id": link.id, "fromId": link.from_id, "toId": link.to_id, "type": link.type}
+                for link in iter_links(db, library_links_query(library.id))
+            ),
+            2
+        )
+        yield "\n  }"
+        first = False
+    yield "[]" if first else "\n]"
+
+
+def _ndjson(record: dict) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def write_library_ndjson(db: Session, library: Library, include_snapshots: bool = False,
+                         stats: Optional[dict] = None) -> Iterator[str]:
+    """单个知识库的 NDJSON 行记录：meta → point* → link* → snapshot*"""
+    stats = stats if stats is not None else {}
+    stats.update(points=0, links=0, snapshots=0)
+    yield _ndjson({"record": "meta", **library_meta(library)})
+    for batch in iter_point_batches(db, library_points_query(library.id)):
+        stats["points"] += len(batch)
+        yield "".join(
+            _ndjson({"record": "point", **record})
+            for record in _point_records([batch], with_position=True)
+        )
+    for link in iter_links(db, library_links_query(library.id)):
+        stats["links"] += 1
+        yield _ndjson({"record": "link", "id": link.id, "fromId": link.from_id,
+                       "toId": link.to_id, "type": link.type})
+    if include_snapshots:
+        result = db.execute(library_snapshots_query(library.id).execution_options(yield_per=EXPORT_BATCH))
+        for batch in result.partitions():
+            docs = snapshot_store.documents(db, batch)
+            stats["snapshots"] += len(batch)
+            yield "".join(
+                _ndjson({
+                    "record": "snapshot",
+                    "id": snapshot.id,
+                    "point_id": snapshot.point_id,
+                    "title": snapshot.title,
+                    **docs[snapshot.id],
+                    "timestamp": snapshot.timestamp.isoformat() if snapshot.timestamp else None,
+                })
+                for snapshot in batch
+            )
+
+
+class _ZipSink(io.RawIOBase):
+    """只追加的输出缓冲：zipfile 在不可 seek 的流上会改用数据描述符写入"""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self._size = 0
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._size += len(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def pending(self) -> int:
+        return self._size
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        self._size = 0
+        return data
+
+
+# ==================== 入口 ====================
+
+def _buffered(chunks: Iterable[str]) -> Iterator[bytes]:
+    """把零碎的文本块合并成约 FLUSH_SIZE 大小的字节块"""
+    parts: list[str] = []
+    size = 0
+    for chunk in chunks:
+        parts.append(chunk)
+        size += len(chunk)
+        if size >= FLUSH_SIZE:
+            yield "".join(parts).encode("utf-8")
+            parts.clear()
+            size = 0
+    if parts:
+        yield "".join(parts).encode("utf-8")
+
+
+def stream_library(library: dict, format: str, tag_names: Optional[list[str]] = None) -> Iterator[bytes]:
+    """流式导出单个知识库；使用独立的只读会话，响应结束后关闭"""
+    with ReadSessionLocal() as db:
+        batches = iter_point_batches(db, library_points_query(library["id"], tag_names))
+        if format == "json":
+            chunks = write_json(library, batches, iter_links(db, library_links_query(library["id"])))
+        elif format == "markdown":
+            chunks = write_markdown(library, batches)
+        else:
+            chunks = write_csv(batches)
+        yield from _buffered(chunks)
+
+
+def stream_points(header: dict, point_ids: list[str], format: str) -> Iterator[bytes]:
+    """流式导出指定的一组知识点（如相关知识点子图），header 充当 library 字段 / 标题"""
+    with ReadSessionLocal() as db:
+        batches = iter_point_batches(db, points_by_ids_query(point_ids))
+        if format == "json":
+            chunks = write_json(header, batches, iter_links(db, links_among_query(point_ids)))
+        elif format == "markdown":
+            chunks = write_markdown(header, batches)
+        else:
+            chunks = write_csv(batches)
+        yield from _buffered(chunks)
+
+
+def stream_batch_json(library_ids: list[str]) -> Iterator[bytes]:
+    """流式批量导出（原有 JSON 结构，适合小规模导出）"""
+    with ReadSessionLocal() as db:
+        yield from _buffered(write_batch_json(db, library_ids))
+
+
+def stream_batch_zip(library_ids: list[str], include_snapshots: bool = False) -> Iterator[bytes]:
+    """流式批量导出 ZIP：每个知识库一个 NDJSON 成员，最后写入 manifest.json"""
+    sink = _ZipSink()
+    manifest = {"format": NDJSON_FORMAT, "version": 1, "libraries": []}
+    with ReadSessionLocal() as db:
+        archive = zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED)
+        for library in iter_libraries(db, library_ids):
+            member_name = f"libraries/{library.id}.ndjson"
+            stats: dict = {}
+            with archive.open(member_name, "w", force_zip64=True) as member:
+                for chunk in write_library_ndjson(db, library, include_snapshots, stats):
+                    member.write(chunk.encode("utf-8"))
+                    if sink.pending() >= FLUSH_SIZE:
+                        yield sink.drain()
+            manifest["libraries"].append({"id": library.id, "name": library.name, "file": member_name, **stats})
+            yield sink.drain()
+        archive.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2))
+        archive.close()
+    yield sink.drain()
@@ -0,0 +1,483 @@
+"""
+图缓存 - 进程内按知识库缓存的邻接结构（CSR）
+
+每个知识库的图首次被查询时从数据库整体载入（miss），之后的链接列表、
+图遍历和统计都直接在内存中完成（hit）。写操作通过 database.after_commit
+在事务提交后增量修补缓存，而不是整库失效：
+
+- 节点：id ↔ 序号的映射，删除的节点只做标记；
+- 边：按列存放的 NumPy 数组（起点序号、终点序号、类型码），删除同样只做标记；
+- 邻接：出边 / 入边两份 CSR（indptr + 邻居序号 + 类型码），首次查询时按需构建，
+  之后任何修补都会让它失效，下次查询再重建（rebuild）。标记删除的垃圾过半时顺带压缩。
+
+缓存只在本进程内有效，多进程部署时各自维护。KNOWLEDGE_GRAPH_CACHE_SIZE=0 可关闭缓存，
+此时相关查询退回 SQL（递归 CTE）实现。
+"""
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Iterable, Optional, Union
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from .database import after_commit, read_engine
+
+# 最多缓存的知识库数量（按最近使用淘汰）
+MAX_LIBRARIES = int(os.environ.get("KNOWLEDGE_GRAPH_CACHE_SIZE") or 8)
+
+# 链接类型码；未知类型在首次出现时追加
+TYPE_NAMES = ["related", "parent", "child"]
+_TYPE_CODES = {name: code for code, name in enumerate(TYPE_NAMES)}
+RELATED, PARENT, CHILD = 0, 1, 2
+
+# 遍历方向：[(使用出边还是入边, 限定的类型码)]；向下 = parent 正向 + child 反向
+_DIRECTIONS = {
+    "down": [("out", PARENT), ("in", CHILD)],
+    "up": [("in", PARENT), ("out", CHILD)],
+    "any": [("out", None), ("in", None)],
+}
+
+# 起点在本库的链接；终点是否在本库由 LibraryGraph 用节点映射过滤（比再连接一次 points 快）
+_LOAD_POINTS_SQL = "SELECT id FROM points WHERE library_id = ?"
+_LOAD_LINKS_SQL = (
+    "SELECT l.id, l.from_id, l.to_id, l.type, l.created_at FROM points a "
+    "JOIN links l ON l.from_id = a.id WHERE a.library_id = ?"
+)
+
+_MIN_CAPACITY = 64
+_MIN_GARBAGE = 1024
+
+
+def _type_code(name: str) -> int:
+    code = _TYPE_CODES.get(name)
+    if code is None:
+        code = _TYPE_CODES[name] = len(TYPE_NAMES)
+        TYPE_NAMES.append(name)
+    return code
+
+
+def _stored_datetime(value: Union[datetime, str, None]) -> Optional[datetime]:
+    """与 ORM 从 SQLite 读出的值一致：载入的原始字符串解析为 datetime，带时区的值去掉时区（存储时即如此）"""
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    if value is not None and value.tzinfo is not None:
+        return value.replace(tzinfo=None)
+    return value
+
+
+def _reserve(array: np.ndarray, size: int) -> np.ndarray:
+    """保证数组容量不小于 size（容量翻倍增长，均摊 O(1) 追加）"""
+    if size <= len(array):
+        return array
+    grown = np.zeros(max(size, 2 * len(array), _MIN_CAPACITY), dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+def _gather(indptr: np.ndarray, frontier: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """CSR 中 frontier 各行的所有元素位置，以及每个位置所属的行"""
+    starts = indptr[frontier]
+    counts = indptr[frontier + 1] - starts
+    total = int(counts.sum())
+    if not total:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return offsets + np.arange(total), np.repeat(frontier, counts)
+
+
+class LibraryGraph:
+    """单个知识库的图：节点映射 + 列式边表 + 按需构建的 CSR 邻接"""
+
+    def __init__(self, library_id: str, point_ids: Iterable[str], links: list[tuple]):
+        self.library_id = library_id
+        self.lock = threading.RLock()
+        self.node_ids: list[Optional[str]] = list(point_ids)
+        self.node_index = {point_id: i for i, point_id in enumerate(self.node_ids)}
+        self.node_alive = np.ones(len(self.node_ids), dtype=bool)
+        self.dead_nodes = 0
+
+        # 只保留两端都在本库的链接（与 crud.get_links 的语义一致）
+        index = self.node_index
+        links = [link for link in links if link[1] in index and link[2] in index]
+        link_ids, from_ids, to_ids, link_types, created = (list(column) for column in zip(*links)) if links else ([],) * 5
+        for link_type in set(link_types):
+            _type_code(link_type)
+        self.link_ids: list[Optional[str]] = link_ids
+        self.link_created: list[Optional[datetime]] = [_stored_datetime(value) for value in created]
+        self.link_slot = {link_id: slot for slot, link_id in enumerate(link_ids)}
+        self.src = np.fromiter(map(self.node_index.__getitem__, from_ids), dtype=np.int32, count=len(link_ids))
+        self.dst = np.fromiter(map(self.node_index.__getitem__, to_ids), dtype=np.int32, count=len(link_ids))
+        self.types = np.fromiter(map(_TYPE_CODES.__getitem__, link_types), dtype=np.int16, count=len(link_ids))
+        self.edge_alive = np.ones(len(link_ids), dtype=bool)
+        self.dead_edges = 0
+        self._csr: Optional[dict] = None
+
+    # ---------- 统计 ----------
+
+    @property
+    def node_count(self) -> int:
+        return len(self.node_ids) - self.dead_nodes
+
+    @property
+    def link_count(self) -> int:
+        return len(self.link_ids) - self.dead_edges
+
+    # ---------- 修补 ----------
+
+    def add_point(self, point_id: str):
+        if point_id in self.node_index:
+            return
+        index = len(self.node_ids)
+        self.node_ids.append(point_id)
+        self.node_index[point_id] = index
+        self.node_alive = _reserve(self.node_alive, index + 1)
+        self.node_alive[index] = True
+        self._csr = None
+
+    def remove_points(self, point_ids: Iterable[str]):
+        """删除节点及其所有关联的边"""
+        indexes = [self.node_index.pop(point_id) for point_id in point_ids if point_id in self.node_index]
+        if not indexes:
+            return
+        for index in indexes:
+            self.node_ids[index] = None
+        self.node_alive[indexes] = False
+        self.dead_nodes += len(indexes)
+        size = len(self.link_ids)
+        removed = np.zeros(len(self.node_ids), dtype=bool)
+        removed[indexes] = True
+        self._kill_edges(np.flatnonzero(
+            self.edge_alive[:size] & (removed[self.src[:size]] | removed[self.dst[:size]])
+        ))
+
+    def add_link(self, link_id: str, from_id: str, to_id: str, link_type: str,
+                 created_at: Union[datetime, str, None] = None):
+        """添加一条边；端点不在本库时忽略（跨库链接不属于任何一个库的图）"""
+        if link_id in self.link_slot:
+            return
+        source, target = self.node_index.get(from_id), self.node_index.get(to_id)
+        if source is None or target is None:
+            return
+        slot = len(self.link_ids)
+        self.link_ids.append(link_id)
+        self.link_created.append(_stored_datetime(created_at))
+        self.link_slot[link_id] = slot
+        self.src = _reserve(self.src, slot + 1)
+        self.dst = _reserve(self.dst, slot + 1)
+        self.types = _reserve(self.types, slot + 1)
+        self.edge_alive = _reserve(self.edge_alive, slot + 1)
+        self.src[slot], self.dst[slot] = source, target
+        self.types[slot] = _type_code(link_type)
+        self.edge_alive[slot] = True
+        self._csr = None
+
+    def remove_link(self, link_id: str):
+        slot = self.link_slot.get(link_id)
+        if slot is not None:
+            self._kill_edges(np.array([slot]))
+
+    def remove_links_between(self, a: str, b: str):
+        """删除两点之间任意方向的所有边"""
+        source, target = self.node_index.get(a), self.node_index.get(b)
+        if source is None or target is None:
+            return
+        size = len(self.link_ids)
+        src, dst = self.src[:size], self.dst[:size]
+        self._kill_edges(np.flatnonzero(self.edge_alive[:size] & (
+            ((src == source) & (dst == target)) | ((src == target) & (dst == source))
+        )))
+
+    def _kill_edges(self, slots: np.ndarray):
+        if not len(slots):
+            return
+        self.edge_alive[slots] = False
+        for slot in slots.tolist():
+            del self.link_slot[self.link_ids[slot]]
+            self.link_ids[slot] = None
+            self.link_created[slot] = None
+        self.dead_edges += len(slots)
+        self._csr = None
+
+    # ---------- 邻接 ----------
+
+    def _compact(self):
+        """丢弃标记删除的节点和边，重新编号"""
+        alive_nodes = np.flatnonzero(self.node_alive[:len(self.node_ids)])
+        remap = np.full(len(self.node_ids), -1, dtype=np.int32)
+        remap[alive_nodes] = np.arange(len(alive_nodes), dtype=np.int32)
+        self.node_ids = [self.node_ids[i] for i in alive_nodes.tolist()]
+        self.node_index = {point_id: i for i, point_id in enumerate(self.node_ids)}
+        self.node_alive = np.ones(len(self.node_ids), dtype=bool)
+        self.dead_nodes = 0
+
+        live = np.flatnonzero(self.edge_alive[:len(self.link_ids)])
+        slots = live.tolist()
+        self.link_ids = [self.link_ids[slot] for slot in slots]
+        self.link_created = [self.link_created[slot] for slot in slots]
+        self.link_slot = {link_id: i for i, link_id in enumerate(self.link_ids)}
+        self.src = remap[self.src[live]]
+        self.dst = remap[self.dst[live]]
+        self.types = self.types[live]
+        self.edge_alive = np.ones(len(live), dtype=bool)
+        self.dead_edges = 0
+
+    def adjacency(self) -> dict:
+        """出边 / 入边 CSR：{out: (indptr, 邻居, 类型码, 边槽位), in: (...)}，调用方需持有 lock"""
+        if self._csr is not None:
+            return self._csr
+        garbage = self.dead_nodes + self.dead_edges
+        if garbage > _MIN_GARBAGE and garbage > self.node_count + self.link_count:
+            self._compact()
+        size = len(self.link_ids)
+        live = np.flatnonzero(self.edge_alive[:size])
+        n = len(self.node_ids)
+        csr = {}
+        for name, rows, cols in (("out", self.src, self.dst), ("in", self.dst, self.src)):
+            order = live[np.argsort(rows[live], kind="stable")]
+            indptr = np.zeros(n + 1, dtype=np.int64)
+            np.cumsum(np.bincount(rows[live], minlength=n), out=indptr[1:])
+            csr[name] = (indptr, cols[order], self.types[order], order)
+        self._csr = csr
+        _stats["rebuilds"] += 1
+        return csr
+
+    # ---------- 查询 ----------
+
+    def links(self, slots: Optional[np.ndarray] = None) -> list[dict]:
+        """链接记录（默认全部），字段与 Link 模型一致"""
+        with self.lock:
+            if slots is None:
+                slots = np.flatnonzero(self.edge_alive[:len(self.link_ids)])
+            node_ids, link_ids, created = self.node_ids, self.link_ids, self.link_created
+            src, dst, types = self.src[slots].tolist(), self.dst[slots].tolist(), self.types[slots].tolist()
+            return [
+                {"id": link_ids[slot], "from_id": node_ids[s], "to_id": node_ids[d],
+                 "type": TYPE_NAMES[t], "created_at": created[slot]}
+                for slot, s, d, t in zip(slots.tolist(), src, dst, types)
+            ]
+
+    def links_among(self, point_ids: Iterable[str]) -> list[dict]:
+        """两端都在给定节点集合内的链接"""
+        with self.lock:
+            indptr, neighbors, _, slots = self.adjacency()["out"]
+            members = np.unique(np.array(
+                [self.node_index[p] for p in point_ids if p in self.node_index], dtype=np.int64
+            ))
+            member = np.zeros(len(self.node_ids), dtype=bool)
+            member[members] = True
+            # 只看集合内节点的出边，开销与集合大小成正比而不是与全库边数成正比
+            positions, _ = _gather(indptr, members)
+            return self.links(slots[positions[member[neighbors[positions]]]])
+
+    def _step(self, frontier: np.ndarray, direction: str,
+              allowed: Optional[np.ndarray] = None) -> tuple[np.ndarray, np.ndarray]:
+        """扩展一层：返回 (到达的节点, 对应的来源节点)，可能有重复；allowed 限定可走的类型码"""
+        csr = self.adjacency()
+        reached, sources = [], []
+        for side, code in _DIRECTIONS[direction]:
+            indptr, neighbors, codes, _ = csr[side]
+            positions, rows = _gather(indptr, frontier)
+            if code is not None or allowed is not None:
+                keep = codes[positions] == code if code is not None else np.isin(codes[positions], allowed)
+                positions, rows = positions[keep], rows[keep]
+            reached.append(neighbors[positions])
+            sources.append(rows)
+        return np.concatenate(reached), np.concatenate(sources)
+
+    def _visit(self, depth: np.ndarray, previous: np.ndarray, frontier: np.ndarray,
+               level: int, direction: str, allowed: Optional[np.ndarray] = None) -> np.ndarray:
+        """广度优先的一层：标记新到达节点的层级和前驱，返回新的前沿"""
+        reached, sources = self._step(frontier, direction, allowed)
+        fresh = depth[reached] < 0
+        reached, first = np.unique(reached[fresh], return_index=True)
+        depth[reached] = level
+        previous[reached] = sources[fresh][first]
+        return reached
+
+    def _search_arrays(self, origin: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        n = len(self.node_ids)
+        depth = np.full(n, -1, dtype=np.int32)
+        depth[origin] = 0
+        return depth, np.full(n, -1, dtype=np.int32), np.array([origin], dtype=np.int64)
+
+    def reachable(self, start: str, max_depth: int, direction: str,
+                  types: Optional[list[str]] = None) -> list[tuple[str, int]]:
+        """从 start 出发 max_depth 步内可达的节点（不含起点）：[(id, 最少步数)]
+
+        types 仅用于无向遍历（direction="any"），只沿这些类型的链接扩展。
+        """
+        allowed = None
+        if types is not None:
+            allowed = np.array([_TYPE_CODES[t] for t in types if t in _TYPE_CODES], dtype=np.int16)
+        with self.lock:
+            self.adjacency()  # 先构建（可能压缩重新编号），再取序号
+            depth, previous, frontier = self._search_arrays(self.node_index[start])
+            for level in range(1, max_depth + 1):
+                frontier = self._visit(depth, previous, frontier, level, direction, allowed)
+                if not len(frontier):
+                    break
+            found = np.flatnonzero(depth > 0)
+            return [(self.node_ids[i], d) for i, d in zip(found.tolist(), depth[found].tolist())]
+
+    def shortest_path(self, start: str, end: str, max_depth: int) -> Optional[list[str]]:
+        """无向最短路径上的节点 id，max_depth 步内不可达时返回 None
+
+        双向广度优先：每轮扩展前沿较小的一侧，两侧相遇时在交点中取两侧层级之和最小者。
+        """
+        with self.lock:
+            self.adjacency()
+            if end not in self.node_index:
+                return None
+            origins = (self.node_index[start], self.node_index[end])
+            if origins[0] == origins[1]:
+                return [start]
+            searches = [self._search_arrays(origin) for origin in origins]
+            radius = [0, 0]
+            while radius[0] + radius[1] < max_depth:
+                side = 0 if len(searches[0][2]) <= len(searches[1][2]) else 1
+                depth, previous, frontier = searches[side]
+                radius[side] += 1
+                frontier = self._visit(depth, previous, frontier, radius[side], "any")
+                if not len(frontier):
+                    return None  # 该侧所在连通分量已搜索完毕
+                searches[side] = (depth, previous, frontier)
+                other = searches[1 - side][0]
+                meet = frontier[other[frontier] >= 0]
+                if len(meet):
+                    middle = int(meet[np.argmin(other[meet])])
+                    break
+            else:
+                return None
+
+            path = [middle]
+            while path[-1] != origins[0]:
+                path.append(int(searches[0][1][path[-1]]))
+            path.reverse()
+            while path[-1] != origins[1]:
+                path.append(int(searches[1][1][path[-1]]))
+            return [self.node_ids[i] for i in path]
+
+
+# ==================== 缓存 ====================
+
+_graphs: "OrderedDict[str, LibraryGraph]" = OrderedDict()
+_lock = threading.Lock()
+# 每次提交修补都加一；载入期间若有变化，载入结果可能已过期，只用于本次请求而不放入缓存
+_generation = 0
+_stats = {"hits": 0, "misses": 0, "rebuilds": 0, "patches": 0, "invalidations": 0, "evictions": 0}
+
+
+def _load(library_id: str) -> LibraryGraph:
+    # 使用独立的新连接：读事务晚于读取 _generation 开始，不会读到更早的快照
+    with read_engine.connect() as conn:
+        point_ids = conn.exec_driver_sql(_LOAD_POINTS_SQL, (library_id,)).scalars().all()
+        links = conn.exec_driver_sql(_LOAD_LINKS_SQL, (library_id,)).all()
+    graph = LibraryGraph(library_id, point_ids, links)
+    with graph.lock:
+        graph.adjacency()
+    return graph
+
+
+def get(library_id: str) -> Optional[LibraryGraph]:
+    """获取知识库的图（未缓存时从数据库载入）；缓存关闭时返回 None"""
+    if MAX_LIBRARIES <= 0:
+        return None
+    with _lock:
+        graph = _graphs.get(library_id)
+        if graph is not None:
+            _graphs.move_to_end(library_id)
+            _stats["hits"] += 1
+            return graph
+        _stats["misses"] += 1
+        generation = _generation
+
+    graph = _load(library_id)
+    with _lock:
+        if generation == _generation and library_id not in _graphs:
+            _graphs[library_id] = graph
+            while len(_graphs) > MAX_LIBRARIES:
+                _graphs.popitem(last=False)
+                _stats["evictions"] += 1
+        return _graphs.get(library_id, graph)
+
+
+def peek(library_id: str) -> Optional[LibraryGraph]:
+    """仅在已缓存时返回图，不触发载入"""
+    with _lock:
+        return _graphs.get(library_id)
+
+
+def stats() -> dict:
+    """缓存命中 / 载入 / 重建等计数"""
+    with _lock:
+        graphs = list(_graphs.values())
+        result = dict(_stats)
+    result.update({
+        "libraries": len(graphs),
+        "max_libraries": MAX_LIBRARIES,
+        "nodes": sum(graph.node_count for graph in graphs),
+        "links": sum(graph.link_count for graph in graphs),
+    })
+    return result
+
+
+def clear():
+    """清空缓存（计数保留）"""
+    global _generation
+    with _lock:
+        _generation += 1
+        _graphs.clear()
+
+
+def _patch(apply, library_id: Optional[str] = None):
+    """提交后修补：library_id 为空时作用于所有已缓存的图"""
+    global _generation
+    with _lock:
+        _generation += 1
+        graphs = [_graphs[library_id]] if library_id in _graphs else (
+            [] if library_id else list(_graphs.values())
+        )
+        if graphs:
+            _stats["patches"] += 1
+    for graph in graphs:
+        with graph.lock:
+            apply(graph)
+
+
+# ---------- 写操作钩子（在事务内调用，提交后生效） ----------
+
+def point_added(db: Session, library_id: str, point_id: str):
+    after_commit(db, lambda: _patch(lambda graph: graph.add_point(point_id), library_id))
+
+
+def points_removed(db: Session, point_ids: list[str]):
+    point_ids = list(point_ids)
+    after_commit(db, lambda: _patch(lambda graph: graph.remove_points(point_ids)))
+
+
+def link_added(db: Session, link_id: str, from_id: str, to_id: str, link_type: str,
+               created_at: Optional[datetime] = None, replace: bool = False):
+    """新增链接；replace=True 时先移除两点之间已有的所有链接（create_link 的互斥规则）"""
+    def apply(graph: LibraryGraph):
+        if replace:
+            graph.remove_links_between(from_id, to_id)
+        graph.add_link(link_id, from_id, to_id, link_type, created_at)
+    after_commit(db, lambda: _patch(apply))
+
+
+def link_removed(db: Session, link_id: str):
+    after_commit(db, lambda: _patch(lambda graph: graph.remove_link(link_id)))
+
+
+def invalidate(db: Session, library_id: str):
+    """整库失效（删除知识库、导入等大范围变更）"""
+    def apply():
+        global _generation
+        with _lock:
+            _generation += 1
+            _stats["invalidations"] += 1
+            _graphs.pop(library_id, None)
+    after_commit(db, apply)
@@ -0,0 +1,176 @@
+"""
+画布图数据 - 列式 / 二进制编码（GET /api/libraries/{id}/graph）
+
+知识点列表中每个知识点都重复完整的标签对象，链接列表中每条链接都重复两端的字符串 ID。
+画布只需要 id、title、坐标、标签和链接端点，这里按列输出：
+
+- 知识点：ids / titles / x / y 平行数组；标签是指向 tags 表的下标，按 CSR 存放
+  （第 i 个知识点的标签为 tag_indexes[tag_offsets[i]:tag_offsets[i + 1]]）；
+- 链接：ids 与 source / target（知识点下标）、types（link_types 中的类型码）。
+
+format=binary 时数值列按小端 Float32 / Uint32 / Uint16 数组连续存放，浏览器用
+TypedArray 直接读取，不逐个解析对象（解码见 frontend/js/network/graphPayload.js）：
+
+    0    4 字节    魔数 b"KNG1"
+    4    uint32    头部长度 H（4 的倍数）
+    8    H 字节    UTF-8 JSON 头部：revision、tag_ref_count（m）、tags、link_types
+                   与字符串列 point_ids、titles、link_ids，末尾以空格补齐
+    之后依次为 x: float32[n]、y: float32[n]、tag_offsets: uint32[n + 1]、
+    tag_indexes: uint32[m]、source: uint32[e]、target: uint32[e]、types: uint16[e]
+
+坐标为空的知识点按 0 输出（画布把 0, 0 视为尚未布局）。
+"""
+import json
+import struct
+from typing import Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from . import graph_cache
+
+BINARY_MAGIC = b"KNG1"
+BINARY_MEDIA_TYPE = "application/octet-stream"
+
+_POINTS_SQL = "SELECT id, title, x, y FROM points WHERE library_id = ?"
+_TAGS_SQL = "SELECT id, name, color FROM tags WHERE library_id = ? ORDER BY rowid"
+# 按写入顺序，与知识点标签列表的顺序一致（画布用第一个标签的颜色）
+_POINT_TAGS_SQL = (
+    "SELECT pt.point_id, pt.tag_id FROM tags t JOIN point_tags pt ON pt.tag_id = t.id "
+    "WHERE t.library_id = ? ORDER BY pt.rowid"
+)
+_LINKS_SQL = (
+    "SELECT l.id, l.from_id, l.to_id, l.type FROM points a "
+    "JOIN links l ON l.from_id = a.id WHERE a.library_id = ?"
+)
+
+# (链接 ID, 起点下标, 终点下标, 类型码, 类型名表)
+_Links = tuple[list, np.ndarray, np.ndarray, np.ndarray, list]
+
+
+def _csr(rows: np.ndarray, values: np.ndarray, n: int) -> tuple[np.ndarray, np.ndarray]:
+    order = np.argsort(rows, kind="stable")
+    offsets = np.zeros(n + 1, dtype=np.uint32)
+    np.cumsum(np.bincount(rows, minlength=n), out=offsets[1:])
+    return offsets, values[order].astype(np.uint32)
+
+
+def _links_from_cache(graph: graph_cache.LibraryGraph, index: dict[str, int]) -> _Links:
+    with graph.lock:
+        live = np.flatnonzero(graph.edge_alive[:len(graph.link_ids)])
+        # 图缓存的节点序号 -> 本次输出的下标；缓存与本次查询之间新增 / 删除的节点为 -1
+        remap = np.fromiter((index.get(point_id, -1) for point_id in graph.node_ids),
+                            dtype=np.int64, count=len(graph.node_ids))
+        source, target = remap[graph.src[live]], remap[graph.dst[live]]
+        keep = (source >= 0) & (target >= 0)
+        link_ids = [graph.link_ids[slot] for slot in live[keep].tolist()]
+        types = graph.types[live][keep]
+        link_types = list(graph_cache.TYPE_NAMES)
+    return link_ids, source[keep], target[keep], types, link_types
+
+
+def _links_from_sql(conn, library_id: str, index: dict[str, int]) -> _Links:
+    link_ids, source, target, types = [], [], [], []
+    codes: dict[str, int] = {}
+    for link_id, from_id, to_id, link_type in conn.exec_driver_sql(_LINKS_SQL, (library_id,)):
+        s, t = index.get(from_id), index.get(to_id)
+        if s is None or t is None:
+            continue
+        link_ids.append(link_id)
+        source.append(s)
+        target.append(t)
+        types.append(codes.setdefault(link_type, len(codes)))
+    return (link_ids, np.array(source, dtype=np.int64), np.array(target, dtype=np.int64),
+            np.array(types, dtype=np.int64), list(codes))
+
+
+def build(db: Session, library_id: str) -> Optional[dict]:
+    """整库图数据（数值列为 NumPy 数组）；知识库不存在时返回 None"""
+    conn = db.connection()
+    revision = conn.exec_driver_sql("SELECT revision FROM libraries WHERE id = ?", (library_id,)).scalar()
+    if revision is None:
+        return None
+
+    rows = conn.exec_driver_sql(_POINTS_SQL, (library_id,)).all()
+    point_ids, titles, xs, ys = (list(column) for column in zip(*rows)) if rows else ([],) * 4
+    n = len(point_ids)
+    index = {point_id: i for i, point_id in enumerate(point_ids)}
+    x = np.array([value or 0.0 for value in xs], dtype=np.float64)
+    y = np.array([value or 0.0 for value in ys], dtype=np.float64)
+
+    tags = [{"id": tag_id, "name": name, "color": color}
+            for tag_id, name, color in conn.exec_driver_sql(_TAGS_SQL, (library_id,))]
+    tag_index = {tag["id"]: i for i, tag in enumerate(tags)}
+    pairs = [(index[point_id], tag_index[tag_id])
+             for point_id, tag_id in conn.exec_driver_sql(_POINT_TAGS_SQL, (library_id,))
+             if point_id in index]
+    pair_array = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+    tag_offsets, tag_indexes = _csr(pair_array[:, 0], pair_array[:, 1], n)
+
+    graph = graph_cache.get(library_id)
+    if graph is not None:
+        link_ids, source, target, types, link_types = _links_from_cache(graph, index)
+    else:
+        link_ids, source, target, types, link_types = _links_from_sql(conn, library_id, index)
+
+    return {
+        "revision": revision,
+        "tags": tags,
+        "link_types": link_types,
+        "point_ids": point_ids,
+        "titles": titles,
+        "x": x,
+        "y": y,
+        "tag_offsets": tag_offsets,
+        "tag_indexes": tag_indexes,
+        "link_ids": link_ids,
+        "source": source.astype(np.uint32),
+        "target": target.astype(np.uint32),
+        "types": types.astype(np.uint16),
+    }
+
+
+def _dumps(data) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def to_json(payload: dict) -> bytes:
+    """列式 JSON：{revision, tags, link_types, points: {...}, links: {...}}"""
+    return _dumps({
+        "revision": payload["revision"],
+        "tags": payload["tags"],
+        "link_types": payload["link_types"],
+        "points": {
+            "ids": payload["point_ids"],
+            "titles": payload["titles"],
+            "x": payload["x"].tolist(),
+            "y": payload["y"].tolist(),
+            "tag_offsets": payload["tag_offsets"].tolist(),
+            "tag_indexes": payload["tag_indexes"].tolist(),
+        },
+        "links": {
+            "ids": payload["link_ids"],
+            "source": payload["source"].tolist(),
+            "target": payload["target"].tolist(),
+            "types": payload["types"].tolist(),
+        },
+    })
+
+
+def to_binary(payload: dict) -> bytes:
+    """小端二进制编码，布局见模块文档"""
+    header = _dumps({
+        "revision": payload["revision"],
+        "tags": payload["tags"],
+        "link_types": payload["link_types"],
+        "point_ids": payload["point_ids"],
+        "titles": payload["titles"],
+        "link_ids": payload["link_ids"],
+        "tag_ref_count": len(payload["tag_indexes"]),
+    })
+    header += b" " * (-len(header) % 4)  # 之后的 Float32 / Uint32 数组按 4 字节对齐
+    parts = [BINARY_MAGIC, struct.pack("<I", len(header)), header]
+    for key, dtype in (("x", "<f4"), ("y", "<f4"), ("tag_offsets", "<u4"), ("tag_indexes", "<u4"),
+                       ("source", "<u4"), ("target", "<u4"), ("types", "<u2")):
+        parts.append(payload[key].astype(dtype, copy=False).tobytes())
+    return b"".join(parts)
@@ -0,0 +1,52 @@
+"""
+HTTP 条件请求 - 基于修订号的强 ETag
+
+单个知识库的读接口（详情、知识点、链接、词频）以 libraries.revision 为版本戳，
+知识库列表与全局统计以 global_state 中的全局修订号为版本戳（见 changelog）。
+版本戳用 Core 连接直接查一行，不经过 ORM 会话；If-None-Match 匹配时返回 304，
+不再查询和序列化数据。
+
+Cache-Control: no-cache 允许浏览器保存响应，但每次使用前都要带 If-None-Match
+重新验证，数据一变化就能看到。先读版本戳再读数据：两者之间有写入时 ETag 比内容旧，
+下次验证必然不匹配，不会把旧内容当作最新的返回。
+响应格式变化时递增 ETAG_VERSION，使浏览器中旧格式的缓存失效。
+"""
+from typing import Optional
+
+from .database import read_engine
+
+CACHE_CONTROL = "no-cache"
+ETAG_VERSION = 1
+
+
+def library_etag(library_id: str) -> Optional[str]:
+    """知识库当前的 ETag；不存在时返回 None"""
+    with read_engine.connect() as conn:
+        revision = conn.exec_driver_sql("SELECT revision FROM libraries WHERE id = ?", (library_id,)).scalar()
+    if revision is None:
+        return None
+    return f'"{ETAG_VERSION}-{library_id}-{revision}"'
+
+
+def global_etag() -> str:
+    """全局数据（知识库列表、全局统计）当前的 ETag"""
+    with read_engine.connect() as conn:
+        instance, revision = conn.exec_driver_sql(
+            "SELECT instance, revision FROM global_state WHERE id = 1"
+        ).one()
+    return f'"{ETAG_VERSION}-{instance}-{revision}"'
+
+
+def matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 中是否包含 etag（按 RFC 9110 用弱比较，忽略 W/ 前缀）"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def headers(etag: str) -> dict[str, str]:
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL}
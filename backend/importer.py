@@ -0,0 +1,485 @@
+"""
+导入 - 增量解析上传文件，按知识库单事务批量写入
+
+支持的输入格式（format=auto 时按文件头和扩展名识别）：
+    json    批量导出的 [{"meta", "points", "links"}, ...] 或单个对象，逐个数组元素解析
+    ndjson  每行一条 {"record": "meta"|"point"|"link"|"snapshot", ...}，meta 开始一个新知识库
+    zip     批量导出的 ZIP（manifest.json + libraries/*.ndjson）
+
+ID 在 Python 中预先生成，points / point_tags / links / snapshots 用 executemany 批量插入，
+每个知识库一个事务。某个库失败时只回滚该库；on_error=abort 时停止并在报告的 next 中
+给出断点，带 start=next 重新上传同一文件即可续传，on_error=skip 则跳过继续。
+"""
+import codecs
+import json
+import re
+import time
+import zipfile
+from datetime import datetime
+from types import SimpleNamespace
+from typing import BinaryIO, Iterator, Optional
+
+from sqlalchemy import insert, text
+from sqlalchemy.orm import Session
+
+from . import changelog, graph_cache, search_index, snapshot_store, term_index
+from .models import Library, Point, Link, Tag, Source, point_tag_table, generate_ids, utc_now
+
+FORMATS = ("json", "ndjson", "zip")
+# 每累计这么多知识点写入一次（同一事务内），并同步更新全文与词频索引
+IMPORT_BATCH = 2000
+READ_SIZE = 64 * 1024
+_WHITESPACE = " \t\r\n"
+_NDJSON_HEAD = re.compile(rb'^(\xef\xbb\xbf)?\s*\{\s*"record"\s*:')
+# 初始快照的链接字段与 crud._create_snapshot 在导入时的结果一致（链接在知识点之后写入）
+_EMPTY_LINKS = {"outgoing": [], "incoming": []}
+
+
+class ImportFormatError(ValueError):
+    """上传文件无法解析"""
+
+
+# ==================== 解析 ====================
+
+def _read_text(fp: BinaryIO) -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    while True:
+        chunk = fp.read(READ_SIZE)
+        if not chunk:
+            tail = decoder.decode(b"", final=True)
+            if tail:
+                yield tail
+            return
+        data = decoder.decode(chunk)
+        if data:
+            yield data
+
+
+class _TextBuffer:
+    """顶层 JSON 数组的滑动缓冲区：只保留尚未解析的部分"""
+
+    def __init__(self, fp: BinaryIO):
+        self._chunks = _read_text(fp)
+        self.text = ""
+        self.pos = 0
+        self.eof = False
+
+    def more(self) -> bool:
+        """追加读取，追加量不少于未解析部分的长度，大元素反复尝试解析的总耗时保持线性"""
+        if self.eof:
+            return False
+        parts = [self.text[self.pos:]]
+        target = max(len(parts[0]), READ_SIZE)
+        added = 0
+        while added < target:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self.eof = True
+                break
+            parts.append(chunk)
+            added += len(chunk)
+        self.text = "".join(parts)
+        self.pos = 0
+        return added > 0
+
+    def peek(self) -> str:
+        """跳过空白，返回下一个字符；数据结束时返回空串"""
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.more():
+                return ""
+
+    def decode_object(self, decoder: json.JSONDecoder) -> dict:
+        if self.peek() != "{":
+            raise ImportFormatError("JSON 数组元素必须是对象")
+        while True:
+            try:
+                value, self.pos = decoder.raw_decode(self.text, self.pos)
+                return value
+            except json.JSONDecodeError as e:
+                if not self.more():
+                    raise ImportFormatError(f"Invalid JSON file: {e}") from e
+
+
+def iter_json_items(fp: BinaryIO) -> Iterator[dict]:
+    """增量解析顶层 JSON 数组，逐个产出元素（顶层为对象时产出该对象）"""
+    buffer = _TextBuffer(fp)
+    decoder = json.JSONDecoder()
+    first = buffer.peek()
+    if first == "{":
+        yield buffer.decode_object(decoder)
+        if buffer.peek():
+            raise ImportFormatError("Invalid JSON file: trailing data")
+        return
+    if first != "[":
+        raise ImportFormatError("Invalid JSON format: expected list or dict")
+    buffer.pos += 1
+    if buffer.peek() == "]":
+        return
+    while True:
+        yield buffer.decode_object(decoder)
+        separator = buffer.peek()
+        buffer.pos += 1
+        if separator == "]":
+            return
+        if separator != ",":
+            raise ImportFormatError("Invalid JSON file: expected ',' or ']'")
+
+
+def _ndjson_records(lines) -> Iterator[dict]:
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ImportFormatError(f"NDJSON 第 {number} 行无法解析: {e}") from e
+        if not isinstance(record, dict):
+            raise ImportFormatError(f"NDJSON 第 {number} 行不是对象")
+        yield record
+
+
+def _group_records(records: Iterator[dict]) -> Iterator[tuple[dict, Iterator[tuple[str, dict]]]]:
+    """按 meta 记录把 NDJSON 记录流切分为 (meta, 记录迭代器)"""
+    head = next(records, None)
+    while head is not None:
+        if head.get("record") != "meta":
+            raise ImportFormatError(f"NDJSON 记录 {head.get('record')!r} 之前缺少 meta")
+        following: dict = {}
+
+        def body(following=following):
+            for record in records:
+                kind = record.get("record")
+                if kind == "meta":
+                    following["meta"] = record
+                    return
+                yield kind, record
+
+        items = body()
+        yield head, items
+        # 调用方跳过或中途失败时，丢弃该库剩余的记录
+        for _ in items:
+            pass
+        head = following.get("meta")
+
+
+def _json_sources(fp: BinaryIO):
+    for item in iter_json_items(fp):
+        yield item.get("meta"), _json_items(item)
+
+
+def _json_items(item: dict) -> Iterator[tuple[str, dict]]:
+    for point in item.get("points") or []:
+        yield "point", point
+    for link in item.get("links") or []:
+        yield "link", link
+    for snapshot in item.get("snapshots") or []:
+        yield "snapshot", snapshot
+
+
+def _zip_sources(fp: BinaryIO):
+    try:
+        archive = zipfile.ZipFile(fp)
+    except zipfile.BadZipFile as e:
+        raise ImportFormatError(f"Invalid ZIP file: {e}") from e
+    with archive:
+        names = archive.namelist()
+        if "manifest.json" in names:
+            manifest = json.loads(archive.read("manifest.json"))
+            members = [entry["file"] for entry in manifest.get("libraries", [])]
+        else:
+            members = sorted(name for name in names if name.endswith(".ndjson"))
+        for name in members:
+            with archive.open(name) as member:
+                yield from _group_records(_ndjson_records(member))
+
+
+def detect_format(fp: BinaryIO, filename: Optional[str] = None) -> str:
+    """根据文件头（ZIP 魔数 / 首条 NDJSON 记录）和扩展名判断格式"""
+    head = fp.read(4096)
+    fp.seek(0)
+    if head.startswith(b"PK\x03\x04"):
+        return "zip"
+    name = (filename or "").lower()
+    if name.endswith((".ndjson", ".jsonl")) or _NDJSON_HEAD.match(head):
+        return "ndjson"
+    return "json"
+
+
+def open_sources(fp: BinaryIO, filename: Optional[str] = None, format: str = "auto"):
+    """打开上传文件，返回 (meta, 记录迭代器) 序列；记录为 (类型, 数据)"""
+    if format == "auto":
+        format = detect_format(fp, filename)
+    if format == "zip":
+        return _zip_sources(fp)
+    if format == "ndjson":
+        return _group_records(_ndjson_records(fp))
+    if format == "json":
+        return _json_sources(fp)
+    raise ImportFormatError(f"Unsupported import format: {format}")
+
+
+def data_sources(data: list[dict]):
+    """已解析的批量导出数据（list[dict]）"""
+    for item in data:
+        yield item.get("meta"), _json_items(item)
+
+
+# ==================== 写入 ====================
+
+def _parse_timestamp(value) -> datetime:
+    if not value:
+        return utc_now()
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return utc_now()
+
+
+class _LibraryImport:
+    """单个知识库的批量写入；事务由调用方提交或回滚"""
+
+    def __init__(self, db: Session, meta: dict):
+        self.db = db
+        self.now = utc_now()
+        self.stats = {"points": 0, "links": 0, "snapshots": 0, "rows": 0}
+        self.id_map: dict[str, str] = {}  # 旧知识点 ID -> 新 ID
+        self.tag_map: dict[str, str] = {}  # 标签名 -> 新标签 ID
+        self._points: list[dict] = []
+        self._point_tags: list[dict] = []
+        self._links: list[dict] = []
+        self._unresolved_links: list[dict] = []
+        self._snapshots: list[dict] = []
+        self._has_snapshot: set[str] = set()
+        self._ids: Iterator[str] = iter(())
+
+        tags = meta.get("tags") or []
+        sources = meta.get("sources") or []
+        ids = generate_ids(1 + len(tags) + len(sources))
+        self.library_id = ids[0]
+        library = {
+            "id": self.library_id,
+            "name": meta["name"],
+            "description": meta.get("description"),
+            "created_at": self.now,
+            "updated_at": self.now,
+        }
+        self._insert(Library, [library])
+        search_index.index_library(db, SimpleNamespace(**library))
+
+        tag_rows = []
+        for tag_id, t in zip(ids[1:], tags):
+            tag_rows.append({"id": tag_id, "library_id": self.library_id,
+                             "name": t["name"], "color": t.get("color", "#3F51B5")})
+            self.tag_map[t["name"]] = tag_id
+        self._insert(Tag, tag_rows)
+        self._insert(Source, [
+            {"id": source_id, "library_id": self.library_id, "name": s["name"]}
+            for source_id, s in zip(ids[1 + len(tags):], sources)
+        ])
+
+    def _insert(self, model, rows: list[dict]):
+        if rows:
+            table = getattr(model, "__table__", model)
+            self.db.execute(insert(table), rows)
+            self.stats["rows"] += len(rows)
+
+    def add(self, kind: str, data: dict):
+        if kind == "point":
+            self._add_point(data)
+        elif kind == "link":
+            self._add_link(data)
+        elif kind == "snapshot":
+            self._snapshots.append(data)
+        if len(self._points) >= IMPORT_BATCH:
+            self._flush_points()
+        if len(self._links) >= IMPORT_BATCH:
+            self._flush_links()
+
+    def _next_id(self) -> str:
+        """按批预生成 ID，避免每行调用一次 generate_ids"""
+        new_id = next(self._ids, None)
+        if new_id is None:
+            self._ids = iter(generate_ids(IMPORT_BATCH))
+            new_id = next(self._ids)
+        return new_id
+
+    def _add_point(self, p: dict):
+        old_id = p.get("id")
+        point_id = self._next_id()
+        if old_id is not None:
+            if old_id in self.id_map:
+                raise ImportFormatError(f"知识点 ID 重复: {old_id}")
+            self.id_map[old_id] = point_id
+        self._points.append({
+            "id": point_id,
+            "library_id": self.library_id,
+            "title": p["title"],
+            "content": p["content"],
+            "source": p.get("source"),
+            "page": p.get("page"),
+            "x": p.get("x", 0.0),
+            "y": p.get("y", 0.0),
+            "created_at": self.now,
+            "updated_at": self.now,
+        })
+        # meta 中未定义的标签忽略（与旧版导入一致）
+        for tag_name in p.get("tags") or []:
+            tag_id = self.tag_map.get(tag_name)
+            if tag_id:
+                self._point_tags.append({"point_id": point_id, "tag_id": tag_id})
+
+    def _add_link(self, l: dict):
+        from_id, to_id = self.id_map.get(l.get("fromId")), self.id_map.get(l.get("toId"))
+        if from_id and to_id:
+            self._links.append({"from_id": from_id, "to_id": to_id, "type": l.get("type", "related")})
+        else:
+            # 终点可能出现在后面的记录中，收尾时再解析
+            self._unresolved_links.append(l)
+
+    def _flush_points(self):
+        points, self._points = self._points, []
+        if not points:
+            return
+        self._insert(Point, points)
+        self._insert(point_tag_table, self._point_tags)
+        self._point_tags = []
+        rows = [SimpleNamespace(**p) for p in points]
+        search_index.index_points(self.db, rows)
+        term_index.index_points(self.db, rows)
+        self.stats["points"] += len(points)
+
+    def _flush_links(self):
+        links, self._links = self._links, []
+        if not links:
+            return
+        self._flush_points()
+        for link in links:
+            link["id"] = self._next_id()
+            link["created_at"] = self.now
+        self._insert(Link, links)
+        self.stats["links"] += len(links)
+
+    def _flush_snapshots(self):
+        """写入导入文件自带的快照，再为其余知识点生成初始快照"""
+        rows = []
+        for s in self._snapshots:
+            point_id = self.id_map.get(s.get("point_id"))
+            if not point_id:
+                continue
+            links = s.get("links") or {}
+            rows.append({
+                "point_id": point_id,
+                "library_id": self.library_id,
+                "title": s["title"],
+                "content": s["content"],
+                "source": s.get("source"),
+                "page": s.get("page"),
+                "links": {
+                    direction: [self.id_map[i] for i in links.get(direction) or [] if i in self.id_map]
+                    for direction in ("outgoing", "incoming")
+                },
+                "timestamp": _parse_timestamp(s.get("timestamp")),
+            })
+            self._has_snapshot.add(point_id)
+        self._snapshots = []
+        for row in rows:
+            row["id"] = self._next_id()
+        # 同一知识点的快照按文件中的顺序（导出时即写入顺序）依次编码为关键帧 / 差异
+        rows.sort(key=lambda row: row["point_id"])
+        snapshot_store.add(self.db, rows)
+        self.stats["rows"] += len(rows)
+
+        # 初始快照从刚写入的 points 分批读取，不必在内存中保留全部知识点内容
+        point_ids = [i for i in self.id_map.values() if i not in self._has_snapshot]
+        for start in range(0, len(point_ids), IMPORT_BATCH):
+            chunk = point_ids[start:start + IMPORT_BATCH]
+            initial = [
+                {"id": self._next_id(), "point_id": point_id, "library_id": self.library_id,
+                 "title": title, "content": content,
+                 "source": source, "page": page, "links": _EMPTY_LINKS, "timestamp": self.now}
+                for point_id, title, content, source, page in self.db.execute(
+                    text("SELECT id, title, content, source, page FROM points "
+                         "WHERE id IN (SELECT value FROM json_each(:ids))"),
+                    {"ids": json.dumps(chunk)}
+                )
+            ]
+            snapshot_store.add(self.db, initial)
+            self.stats["rows"] += len(initial)
+        self.stats["snapshots"] = len(rows) + len(point_ids)
+
+    def finish(self) -> dict:
+        self._flush_points()
+        for l in self._unresolved_links:
+            # 只有起点和终点都在本次导入的知识库中才创建链接
+            from_id, to_id = self.id_map.get(l.get("fromId")), self.id_map.get(l.get("toId"))
+            if from_id and to_id:
+                self._links.append({"from_id": from_id, "to_id": to_id, "type": l.get("type", "related")})
+        self._unresolved_links = []
+        self._flush_links()
+        self._flush_snapshots()
+        return self.stats
+
+
+def import_sources(db: Session, sources, start: int = 0, on_error: str = "abort") -> dict:
+    """逐个导入知识库，每个库一个事务
+
+    start 跳过前 start 个知识库（续传）；on_error 为 abort（遇错停止）或 skip（跳过出错的库）。
+    返回报告：count 为成功导入的库数，next 为下次续传应使用的 start。
+    """
+    report = {"success": True, "count": 0, "rows": 0, "elapsed": 0.0, "rows_per_sec": 0.0,
+              "libraries": [], "errors": [], "next": start}
+    began = time.perf_counter()
+    index = start - 1
+    try:
+        for index, (meta, items) in enumerate(sources):
+            if index < start:
+                continue
+            if not meta:
+                # 没有 meta 的元素（如单库导出格式）与旧版一样忽略
+                report["libraries"].append({"index": index, "status": "skipped"})
+                report["next"] = index + 1
+                continue
+
+            library_began = time.perf_counter()
+            try:
+                job = _LibraryImport(db, meta)
+                for kind, data in items:
+                    job.add(kind, data)
+                stats = job.finish()
+                graph_cache.invalidate(db, job.library_id)
+                changelog.touch(db)
+                db.commit()
+            except (KeyError, TypeError, ValueError) as e:
+                db.rollback()
+                message = f"缺少字段 {e}" if isinstance(e, KeyError) else str(e)
+                report["errors"].append({"index": index, "name": meta.get("name"), "error": message})
+                if on_error == "abort":
+                    report["next"] = index
+                    break
+                report["next"] = index + 1
+                continue
+
+            report["libraries"].append({
+                "index": index,
+                "status": "imported",
+                "id": job.library_id,
+                "name": meta.get("name"),
+                **stats,
+                "elapsed": round(time.perf_counter() - library_began, 3),
+            })
+            report["count"] += 1
+            report["rows"] += stats["rows"]
+            report["next"] = index + 1
+    except ImportFormatError as e:
+        db.rollback()
+        report["errors"].append({"index": index + 1, "name": None, "error": str(e)})
+
+    report["success"] = not report["errors"]
+    report["elapsed"] = round(time.perf_counter() - began, 3)
+    if report["elapsed"]:
+        report["rows_per_sec"] = round(report["rows"] / report["elapsed"], 1)
+    return report
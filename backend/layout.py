@@ -0,0 +1,269 @@
+"""
+力导向布局 - NumPy 向量化的 Barnes–Hut 斥力 + 链接弹簧（Fruchterman–Reingold）
+
+斥力用多层四叉树网格近似：第 L 层把包围正方形划成 2^L × 2^L 个格子，
+对每个节点，父格子相邻而本层不相邻的格子（交互列表，最多 27 个）按质心计算，
+相邻格子留到下一层细分；最细一层的 3×3 相邻格子内逐对精确计算。
+每对节点恰好计算一次，单次迭代复杂度约 O(n log n)。
+
+增量模式只移动尚未布局的节点（坐标为 0, 0）及其邻居，其余节点固定但参与受力计算。
+"""
+import time
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# 理想边长，与前端 engine.js 的 springLength 一致
+IDEAL_LENGTH = 150.0
+# 最细一层每个格子的目标平均节点数
+LEAF_SIZE = 4
+MAX_DEPTH = 16
+# 最细一层近场点对数超过 节点数 × 该值 时继续细分（节点扎堆时）
+NEAR_FIELD_LIMIT = 32
+# 全量布局时指向质心的引力系数：防止不连通的分量越飘越远，
+# 与斥力平衡后布局边长约为 2 × IDEAL_LENGTH × sqrt(n)
+GRAVITY = 1.0
+_CHUNK = 8192
+_EPS = 1e-9
+
+# 网格边长不超过该值时用稠密数组查找格子，否则二分查找
+DENSE_SIDE = 2048
+
+
+def _interaction_offsets() -> np.ndarray:
+    """按本格子坐标奇偶性 (x & 1, y & 1) 给出交互列表的 27 个相对偏移，形状 (4, 27, 2)"""
+    table = []
+    for px in (0, 1):
+        for py in (0, 1):
+            table.append([
+                (dx - px, dy - py)
+                for dx in range(-2, 4) for dy in range(-2, 4)
+                if abs(dx - px) > 1 or abs(dy - py) > 1
+            ])
+    return np.array(table, dtype=np.int64)
+
+
+_FAR_OFFSETS = _interaction_offsets()
+_NEAR_OFFSETS = np.array([(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)], dtype=np.int64)
+
+
+# ==================== 受力计算 ====================
+
+def _grid(unit: np.ndarray, level: int) -> tuple[np.ndarray, np.ndarray]:
+    side = 1 << level
+    cells = np.minimum((unit * side).astype(np.int64), side - 1)
+    return cells, cells[:, 0] * side + cells[:, 1]
+
+
+def _choose_depth(unit: np.ndarray) -> int:
+    n = len(unit)
+    depth = int(np.clip(np.ceil(0.5 * np.log2(max(n / LEAF_SIZE, 1))), 2, MAX_DEPTH))
+    while depth < MAX_DEPTH:
+        _, keys = _grid(unit, depth)
+        counts = np.unique(keys, return_counts=True)[1]
+        # 近场点对数的粗略上界：每个格子的节点与 9 个格子的节点两两计算
+        if 9 * int((counts.astype(np.int64) ** 2).sum()) <= NEAR_FIELD_LIMIT * n:
+            break
+        depth += 1
+    return depth
+
+
+class _CellIndex:
+    """某一层已占用格子的查找：格子坐标 -> 格子序号（不存在为 -1）"""
+
+    def __init__(self, keys: np.ndarray, side: int):
+        self.side = side
+        self.uniq = np.unique(keys)
+        if side <= DENSE_SIDE:
+            # 四周各留 2 格，越界的候选格子直接查到 -1
+            self.table = np.full((side + 4) * (side + 4), -1, dtype=np.int64)
+            cx, cy = self.uniq // side, self.uniq % side
+            self.table[(cx + 2) * (side + 4) + (cy + 2)] = np.arange(len(self.uniq))
+
+    def lookup(self, cx: np.ndarray, cy: np.ndarray) -> np.ndarray:
+        side = self.side
+        if side <= DENSE_SIDE:
+            return self.table[(cx + 2) * (side + 4) + (cy + 2)]
+        inside = (cx >= 0) & (cx < side) & (cy >= 0) & (cy < side)
+        keys = cx * side + cy
+        index = np.minimum(np.searchsorted(self.uniq, keys), len(self.uniq) - 1)
+        return np.where(inside & (self.uniq[index] == keys), index, -1)
+
+
+def _repulsion(pos: np.ndarray, targets: np.ndarray, k: float) -> np.ndarray:
+    """targets 各节点受到的全部节点的斥力（k² / d）"""
+    force = np.zeros((len(targets), 2))
+    if len(pos) < 2:
+        return force
+    lo = pos.min(axis=0)
+    extent = float((pos.max(axis=0) - lo).max()) or 1.0
+    unit = (pos - lo) / (extent * (1 + 1e-9))
+    depth = _choose_depth(unit)
+    k2 = k * k
+
+    # 远场：第 2 层到最细层的交互列表，按格子质心近似
+    for level in range(2, depth + 1):
+        cells, keys = _grid(unit, level)
+        cell_index = _CellIndex(keys, 1 << level)
+        inverse = np.searchsorted(cell_index.uniq, keys)
+        mass = np.bincount(inverse).astype(float)
+        com = np.stack([np.bincount(inverse, pos[:, 0]), np.bincount(inverse, pos[:, 1])], axis=1) / mass[:, None]
+        mass = np.append(mass, 0.0)  # 序号 -1 指向质量为 0 的哑格子
+        com = np.vstack([com, np.zeros(2)])
+        for start in range(0, len(targets), _CHUNK):
+            t = targets[start:start + _CHUNK]
+            own = cells[t]
+            offsets = _FAR_OFFSETS[(own[:, 0] & 1) * 2 + (own[:, 1] & 1)]
+            index = cell_index.lookup(own[:, :1] + offsets[:, :, 0], own[:, 1:] + offsets[:, :, 1])
+            dx = pos[t, :1] - com[index, 0]
+            dy = pos[t, 1:] - com[index, 1]
+            weight = mass[index] / (dx * dx + dy * dy + _EPS)
+            force[start:start + len(t), 0] += k2 * (dx * weight).sum(axis=1)
+            force[start:start + len(t), 1] += k2 * (dy * weight).sum(axis=1)
+
+    # 近场：最细一层 3×3 相邻格子内逐对精确计算
+    cells, keys = _grid(unit, depth)
+    order = np.argsort(keys, kind="stable")
+    cell_index = _CellIndex(keys, 1 << depth)
+    starts = np.searchsorted(keys[order], cell_index.uniq)
+    counts = np.diff(np.append(starts, len(keys)))
+    starts, counts = np.append(starts, 0), np.append(counts, 0)
+    for start in range(0, len(targets), _CHUNK):
+        t = targets[start:start + _CHUNK]
+        own = cells[t]
+        index = cell_index.lookup(own[:, :1] + _NEAR_OFFSETS[:, 0], own[:, 1:] + _NEAR_OFFSETS[:, 1])
+        count = counts[index].ravel()
+        first = np.repeat(starts[index].ravel(), count)
+        offset = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+        other = order[first + offset]
+        local = np.repeat(np.repeat(np.arange(len(t)), 9), count)
+        keep = other != t[local]
+        local, other = local[keep], other[keep]
+        delta = pos[t[local]] - pos[other]
+        weight = k2 / ((delta ** 2).sum(axis=1) + _EPS)
+        force[start:start + len(t), 0] += np.bincount(local, delta[:, 0] * weight, minlength=len(t))
+        force[start:start + len(t), 1] += np.bincount(local, delta[:, 1] * weight, minlength=len(t))
+    return force
+
+
+def _attraction(pos: np.ndarray, edges: np.ndarray, k: float) -> np.ndarray:
+    """链接弹簧引力（d² / k），返回所有节点的合力"""
+    force = np.zeros_like(pos)
+    if len(edges) == 0:
+        return force
+    source, target = edges[:, 0], edges[:, 1]
+    delta = pos[target] - pos[source]
+    pull = delta * (np.sqrt((delta ** 2).sum(axis=1)) / k)[:, None]
+    for axis in (0, 1):
+        force[:, axis] += np.bincount(source, pull[:, axis], minlength=len(pos))
+        force[:, axis] -= np.bincount(target, pull[:, axis], minlength=len(pos))
+    return force
+
+
+def force_directed(pos: np.ndarray, edges: np.ndarray, movable: np.ndarray,
+                   iterations: int, temperature: float, k: float = IDEAL_LENGTH,
+                   gravity: float = GRAVITY) -> np.ndarray:
+    """迭代布局，只移动 movable 中的节点；每步位移不超过当前温度，温度线性冷却"""
+    pos = pos.astype(float, copy=True)
+    if len(movable) == 0:
+        return pos
+    for step in range(iterations):
+        force = _repulsion(pos, movable, k) + _attraction(pos, edges, k)[movable]
+        if gravity:
+            force -= gravity * (pos[movable] - pos.mean(axis=0))
+        limit = temperature * (1 - step / iterations)
+        length = np.sqrt((force ** 2).sum(axis=1)) + _EPS
+        pos[movable] += force * (np.minimum(length, limit) / length)[:, None]
+    return pos
+
+
+def place_new_nodes(pos: np.ndarray, placed: np.ndarray, edges: np.ndarray,
+                    k: float = IDEAL_LENGTH, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """未布局的节点放到已布局邻居的质心附近，没有邻居的随机放在已有范围内"""
+    rng = rng or np.random.default_rng()
+    pos = pos.astype(float, copy=True)
+    n = len(pos)
+    new = ~placed
+    if not new.any():
+        return pos
+
+    sums = np.zeros((n, 2))
+    counts = np.zeros(n)
+    for a, b in ((0, 1), (1, 0)):
+        mask = placed[edges[:, b]] & new[edges[:, a]] if len(edges) else np.zeros(0, dtype=bool)
+        for axis in (0, 1):
+            sums[:, axis] += np.bincount(edges[mask, a], pos[edges[mask, b], axis], minlength=n)
+        counts += np.bincount(edges[mask, a], minlength=n)
+
+    center = pos[placed].mean(axis=0) if placed.any() else np.zeros(2)
+    radius = k * np.sqrt(n) / 2
+    angle = rng.uniform(0, 2 * np.pi, n)
+    distance = radius * np.sqrt(rng.uniform(0, 1, n))
+    scatter = center + np.stack([np.cos(angle), np.sin(angle)], axis=1) * distance[:, None]
+    jitter = rng.normal(scale=k / 4, size=(n, 2))
+
+    near = new & (counts > 0)
+    pos[near] = sums[near] / counts[near, None] + jitter[near]
+    far = new & (counts == 0)
+    pos[far] = scatter[far]
+    return pos
+
+
+# ==================== 知识库布局 ====================
+
+def compute_library_layout(db: Session, library_id: str, iterations: int = 100,
+                           temperature: Optional[float] = None, incremental: bool = False) -> dict:
+    """计算知识库布局，返回 {"positions": [[id, x, y], ...], "moved", "iterations", "elapsed"}
+
+    positions 只包含被移动的节点，由调用方写回数据库。
+    """
+    started = time.perf_counter()
+    rows = db.execute(
+        text("SELECT id, x, y FROM points WHERE library_id = :library_id ORDER BY id"),
+        {"library_id": library_id}
+    ).all()
+    ids = [row.id for row in rows]
+    index = {point_id: i for i, point_id in enumerate(ids)}
+    link_rows = db.execute(
+        text(
+            "SELECT l.from_id, l.to_id FROM links l "
+            "JOIN points a ON a.id = l.from_id JOIN points b ON b.id = l.to_id "
+            "WHERE a.library_id = :library_id AND b.library_id = :library_id AND l.from_id != l.to_id"
+        ),
+        {"library_id": library_id}
+    ).all()
+    edges = np.array([(index[a], index[b]) for a, b in link_rows], dtype=np.int64).reshape(-1, 2)
+
+    pos = np.array([(row.x or 0.0, row.y or 0.0) for row in rows], dtype=float).reshape(-1, 2)
+    placed = (pos != 0).any(axis=1)
+    rng = np.random.default_rng()
+    pos = place_new_nodes(pos, placed, edges, rng=rng)
+
+    if incremental:
+        moving = ~placed
+        if len(edges):
+            # 新节点的邻居一起松弛
+            neighbors = np.zeros(len(pos), dtype=bool)
+            neighbors[edges[moving[edges[:, 0]], 1]] = True
+            neighbors[edges[moving[edges[:, 1]], 0]] = True
+            moving |= neighbors
+        movable = np.flatnonzero(moving)
+        temperature = temperature or IDEAL_LENGTH * 2
+        gravity = 0.0
+    else:
+        movable = np.arange(len(pos))
+        # 初始位置重合时加一点扰动，避免零距离
+        pos += rng.normal(scale=IDEAL_LENGTH * 1e-3, size=pos.shape)
+        temperature = temperature or IDEAL_LENGTH * max(np.sqrt(len(pos)), 1) / 10
+        gravity = GRAVITY
+
+    pos = force_directed(pos, edges, movable, iterations, temperature, gravity=gravity)
+    positions = [[ids[i], round(float(pos[i, 0]), 1), round(float(pos[i, 1]), 1)] for i in movable]
+    return {
+        "positions": positions,
+        "moved": len(positions),
+        "iterations": iterations if len(movable) else 0,
+        "elapsed": round(time.perf_counter() - started, 3),
+    }
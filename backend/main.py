@@ -1,19 +1,23 @@
 """
 知识图谱应用 - FastAPI 后端入口
 """
-import json
+import math
+from datetime import datetime
 from pathlib import Path
 from typing import Optional
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, Depends, HTTPException, Query, UploadFile, File
+from fastapi import FastAPI, Body, Depends, Header, HTTPException, Query, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, Response, RedirectResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, JSONResponse, Response, RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
-from .database import get_db, init_db
-from . import crud, schemas
+from .database import ReadSessionLocal, get_db, get_read_db, init_db
+from . import (crud, events, exporters, graph_payload, http_cache, importer, maintenance, models, pagination,
+               schemas, tokenizer)
 
 # 前端目录
 FRONTEND_DIR = Path(__file__).parent.parent / "frontend"
@@ -22,10 +26,14 @@ FRONTEND_DIR = Path(__file__).parent.parent / "frontend"
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
-    # 启动时初始化数据库
+    # 启动时预热分词词典并初始化数据库
+    tokenizer.warm_up()
     init_db()
+    maintenance.start()
     yield
-    # 关闭时清理（如果需要）
+    # 关闭时清理
+    await maintenance.stop()
+    tokenizer.shutdown()
 
 
 app = FastAPI(
@@ -42,15 +50,50 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[pagination.NEXT_CURSOR_HEADER, "X-Point-Count"],
 )
 
 # 注意：静态文件服务在文件末尾挂载到根路径，确保 API 路由优先
 
 
+def _page_response(items: list[dict], next_cursor: Optional[str], etag: Optional[str] = None) -> JSONResponse:
+    """分页 / 投影列表的响应：下一页游标放在响应头中"""
+    headers = http_cache.headers(etag) if etag else {}
+    if next_cursor:
+        headers[pagination.NEXT_CURSOR_HEADER] = next_cursor
+    return JSONResponse(jsonable_encoder(items), headers=headers)
+
+
+# ==================== 条件请求 ====================
+# 以下依赖项须声明在数据库会话依赖之前：返回 304 时不会再打开会话
+
+def _check_etag(etag: str, if_none_match: Optional[str], response: Response):
+    if http_cache.matches(if_none_match, etag):
+        raise HTTPException(status_code=304, headers=http_cache.headers(etag))
+    response.headers.update(http_cache.headers(etag))
+
+
+def library_etag(library_id: str, response: Response,
+                 if_none_match: Optional[str] = Header(None)) -> Optional[str]:
+    """依赖项：知识库的 ETag，与 If-None-Match 匹配时直接返回 304；知识库不存在时为 None"""
+    etag = http_cache.library_etag(library_id)
+    if etag is not None:
+        _check_etag(etag, if_none_match, response)
+    return etag
+
+
+def global_etag(response: Response, if_none_match: Optional[str] = Header(None)) -> str:
+    """依赖项：全局数据的 ETag，与 If-None-Match 匹配时直接返回 304"""
+    etag = http_cache.global_etag()
+    _check_etag(etag, if_none_match, response)
+    return etag
+
+
 # ==================== 知识库 API ====================
 
-@app.get("/api/libraries", response_model=list[schemas.LibraryListResponse])
-def list_libraries(db: Session = Depends(get_db)):
+@app.get("/api/libraries", response_model=list[schemas.LibraryListResponse],
+         dependencies=[Depends(global_etag)])
+def list_libraries(db: Session = Depends(get_read_db)):
     """获取所有知识库列表"""
     return crud.get_libraries(db)
 
@@ -60,11 +103,12 @@ def create_library(data: schemas.LibraryCreate, db: Session = Depends(get_db)):
     """创建新知识库"""
     tags = [t.model_dump() for t in data.tags]
     sources = [s.model_dump() for s in data.sources]
-    return crud.create_library(db, data.name, data.description, tags, sources)
+    return crud.create_library(db, data.name, data.description, tags, sources, data.snapshot_retention_days)
 
 
-@app.get("/api/libraries/{library_id}", response_model=schemas.LibraryResponse)
-def get_library(library_id: str, db: Session = Depends(get_db)):
+@app.get("/api/libraries/{library_id}", response_model=schemas.LibraryResponse,
+         dependencies=[Depends(library_etag)])
+def get_library(library_id: str, db: Session = Depends(get_read_db)):
     """获取单个知识库"""
     library = crud.get_library(db, library_id)
     if not library:
@@ -77,7 +121,10 @@ def update_library(library_id: str, data: schemas.LibraryUpdate, db: Session = D
     """更新知识库"""
     tags = [t.model_dump() for t in data.tags] if data.tags is not None else None
     sources = [s.model_dump() for s in data.sources] if data.sources is not None else None
-    library = crud.update_library(db, library_id, data.name, data.description, tags, sources)
+    # 显式传入 null 时清除保留期（使用全局默认值），未传时保持不变
+    library = crud.update_library(db, library_id, data.name, data.description, tags, sources,
+                                  data.snapshot_retention_days,
+                                  "snapshot_retention_days" in data.model_fields_set)
     if not library:
         raise HTTPException(status_code=404, detail="Library not found")
     return library
@@ -91,12 +138,103 @@ def delete_library(library_id: str, db: Session = Depends(get_db)):
     return {"success": True}
 
 
+@app.get("/api/libraries/{library_id}/changes", response_model=schemas.LibraryChangesResponse)
+def get_library_changes(
+    library_id: str,
+    since: int = Query(..., ge=0),
+    db: Session = Depends(get_read_db)
+):
+    """since 修订号之后的增量变更（新增 / 修改的知识点与链接、删除的 ID），供客户端同步"""
+    changes = crud.get_library_changes(db, library_id, since)
+    if changes is None:
+        raise HTTPException(status_code=404, detail="Library not found")
+    return changes
+
+
+@app.get("/api/libraries/{library_id}/graph")
+def get_library_graph(
+    library_id: str,
+    format: str = Query("columnar", regex="^(columnar|binary)$"),
+    etag: Optional[str] = Depends(library_etag),
+    db: Session = Depends(get_read_db)
+):
+    """画布用的整库图数据：列式 JSON（columnar）或小端二进制（binary），格式见 graph_payload"""
+    payload = crud.get_library_graph(db, library_id)
+    if payload is None:
+        raise HTTPException(status_code=404, detail="Library not found")
+    headers = http_cache.headers(etag) if etag else None
+    if format == "binary":
+        return Response(graph_payload.to_binary(payload), media_type=graph_payload.BINARY_MEDIA_TYPE, headers=headers)
+    return Response(graph_payload.to_json(payload), media_type="application/json", headers=headers)
+
+
+def _library_revision(library_id: str) -> Optional[int]:
+    # 不用 get_read_db 依赖：SSE 连接持续很久，不应一直占用只读连接
+    with ReadSessionLocal() as db:
+        return crud.get_library_revision(db, library_id)
+
+
+@app.get("/api/libraries/{library_id}/events")
+async def library_events(library_id: str):
+    """SSE 事件流：hello（当前修订号）、change（提交后的变更 ID）、reset（需重新同步）、deleted"""
+    if await run_in_threadpool(_library_revision, library_id) is None:
+        raise HTTPException(status_code=404, detail="Library not found")
+    return StreamingResponse(
+        events.stream(library_id, lambda: _library_revision(library_id)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.patch("/api/libraries/{library_id}/layout", response_model=schemas.LayoutUpdateResponse)
+def update_layout(
+    library_id: str,
+    positions: schemas.LayoutPositions = Body(...),
+    db: Session = Depends(get_db)
+):
+    """批量保存节点坐标（[[id, x, y], ...]），供力导向布局稳定后或拖拽后回写"""
+    updated = crud.update_layout(db, library_id, positions)
+    if updated is None:
+        raise HTTPException(status_code=404, detail="Library not found")
+    return {"updated": updated}
+
+
+@app.post("/api/libraries/{library_id}/layout/compute", response_model=schemas.LayoutComputeResponse)
+def compute_layout(
+    library_id: str,
+    data: Optional[schemas.LayoutComputeRequest] = None,
+    read_db: Session = Depends(get_read_db),
+    db: Session = Depends(get_db)
+):
+    """服务端计算力导向布局（Barnes–Hut），结果写回知识点坐标"""
+    data = data or schemas.LayoutComputeRequest()
+    result = crud.compute_layout(read_db, db, library_id, data.iterations, data.temperature, data.incremental)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Library not found")
+    return result
+
+
 # ==================== 知识点 API ====================
 
 @app.get("/api/libraries/{library_id}/points", response_model=list[schemas.PointResponse])
-def list_points(library_id: str, db: Session = Depends(get_db)):
-    """获取知识库中的所有知识点"""
-    return crud.get_points(db, library_id)
+def list_points(
+    library_id: str,
+    limit: Optional[int] = Query(None, ge=1, le=pagination.MAX_LIMIT),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="只返回这些字段（逗号分隔），如 id,title,x,y,tags"),
+    etag: Optional[str] = Depends(library_etag),
+    db: Session = Depends(get_read_db)
+):
+    """获取知识库中的知识点（limit / cursor 游标分页，fields 字段投影；都不传时返回全部）"""
+    if limit is None and cursor is None and fields is None:
+        return crud.get_points(db, library_id)
+    try:
+        items, next_cursor = crud.get_points_page(
+            db, library_id, limit, cursor, pagination.parse_fields(fields, crud.POINT_FIELDS)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _page_response(items, next_cursor, etag)
 
 
 @app.post("/api/points", response_model=schemas.PointResponse, status_code=201)
@@ -109,7 +247,7 @@ def create_point(data: schemas.PointCreate, db: Session = Depends(get_db)):
 
 
 @app.get("/api/points/{point_id}", response_model=schemas.PointResponse)
-def get_point(point_id: str, db: Session = Depends(get_db)):
+def get_point(point_id: str, db: Session = Depends(get_read_db)):
     """获取单个知识点"""
     point = crud.get_point(db, point_id)
     if not point:
@@ -139,11 +277,36 @@ def delete_point(point_id: str, db: Session = Depends(get_db)):
 
 # ==================== 批量操作 API ====================
 
+@app.post("/api/points:batch", response_model=schemas.PointBatchResponse)
+def batch_points(data: schemas.PointBatchRequest, db: Session = Depends(get_db)):
+    """批量创建 / 更新 / 删除知识点（一个事务，逐项返回结果）"""
+    return crud.batch_points(db, [op.model_dump() for op in data.operations])
+
+
+@app.get("/api/libraries/{library_id}/points/in-bbox", response_model=schemas.ViewportResponse)
+def get_points_in_bbox(
+    library_id: str,
+    minx: float,
+    miny: float,
+    maxx: float,
+    maxy: float,
+    zoom: float = Query(1.0, gt=0, le=10),
+    db: Session = Depends(get_read_db)
+):
+    """视口内的知识点与链接；缩放比例较小时返回网格聚合（数量、主要标签颜色）"""
+    if not all(math.isfinite(v) for v in (minx, miny, maxx, maxy)) or minx > maxx or miny > maxy:
+        raise HTTPException(status_code=400, detail="Invalid bounding box")
+    result = crud.get_points_in_bbox(db, library_id, minx, miny, maxx, maxy, zoom)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Library not found")
+    return result
+
+
 @app.get("/api/libraries/{library_id}/points/count-by-tag")
 def count_points_by_tag(
     library_id: str,
     tag_name: str = Query(..., alias="tagName"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """统计某标签下的知识点数量"""
     count = crud.count_points_by_tag(db, library_id, tag_name)
@@ -164,9 +327,24 @@ def delete_points_by_tag(
 # ==================== 链接 API ====================
 
 @app.get("/api/libraries/{library_id}/links", response_model=list[schemas.LinkResponse])
-def list_links(library_id: str, db: Session = Depends(get_db)):
-    """获取知识库中的所有链接"""
-    return crud.get_links(db, library_id)
+def list_links(
+    library_id: str,
+    limit: Optional[int] = Query(None, ge=1, le=pagination.MAX_LIMIT),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="只返回这些字段（逗号分隔），如 id,fromId,toId,type"),
+    etag: Optional[str] = Depends(library_etag),
+    db: Session = Depends(get_read_db)
+):
+    """获取知识库中的链接（limit / cursor 游标分页，fields 字段投影；都不传时返回全部）"""
+    if limit is None and cursor is None and fields is None:
+        return crud.get_links(db, library_id)
+    try:
+        items, next_cursor = crud.get_links_page(
+            db, library_id, limit, cursor, pagination.parse_fields(fields, tuple(crud.LINK_FIELDS))
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _page_response(items, next_cursor, etag)
 
 
 @app.post("/api/links", response_model=schemas.LinkResponse, status_code=201)
@@ -184,12 +362,107 @@ def delete_link(link_id: str, db: Session = Depends(get_db)):
     return {"success": True}
 
 
+# ==================== 图遍历 API ====================
+
+@app.get("/api/points/{point_id}/descendants", response_model=schemas.TraversalResponse)
+def get_descendants(
+    point_id: str,
+    max_depth: int = Query(10, ge=1, le=64),
+    db: Session = Depends(get_read_db)
+):
+    """获取子孙节点（沿父子关系向下）"""
+    nodes = crud.get_descendants(db, point_id, max_depth)
+    if nodes is None:
+        raise HTTPException(status_code=404, detail="Point not found")
+    return {"point_id": point_id, "nodes": nodes}
+
+
+@app.get("/api/points/{point_id}/ancestors", response_model=schemas.TraversalResponse)
+def get_ancestors(
+    point_id: str,
+    max_depth: int = Query(10, ge=1, le=64),
+    db: Session = Depends(get_read_db)
+):
+    """获取祖先节点（沿父子关系向上）"""
+    nodes = crud.get_ancestors(db, point_id, max_depth)
+    if nodes is None:
+        raise HTTPException(status_code=404, detail="Point not found")
+    return {"point_id": point_id, "nodes": nodes}
+
+
+@app.get("/api/points/{point_id}/neighborhood", response_model=schemas.NeighborhoodResponse)
+def get_neighborhood(
+    point_id: str,
+    hops: int = Query(1, ge=1, le=6),
+    db: Session = Depends(get_read_db)
+):
+    """获取 k 跳邻域（忽略链接方向与类型）"""
+    result = crud.get_neighborhood(db, point_id, hops)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Point not found")
+    return {"point_id": point_id, **result}
+
+
+@app.get("/api/points/{point_id}/path/{target_id}", response_model=schemas.PathResponse)
+def get_shortest_path(
+    point_id: str,
+    target_id: str,
+    max_depth: int = Query(12, ge=1, le=32),
+    db: Session = Depends(get_read_db)
+):
+    """获取两点间的最短路径（忽略链接方向与类型）"""
+    result = crud.get_shortest_path(db, point_id, target_id, max_depth)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Point not found")
+    return result
+
+
 # ==================== 版本快照 API ====================
 
 @app.get("/api/points/{point_id}/snapshots", response_model=list[schemas.SnapshotResponse])
-def list_snapshots(point_id: str, days: int = 300, db: Session = Depends(get_db)):
-    """获取知识点的版本历史"""
-    return crud.get_snapshots(db, point_id, days)
+def list_snapshots(
+    point_id: str,
+    days: int = 300,
+    limit: Optional[int] = Query(None, ge=1, le=pagination.MAX_LIMIT),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="只返回这些字段（逗号分隔），如 id,title,timestamp"),
+    db: Session = Depends(get_read_db)
+):
+    """获取知识点的版本历史（新的在前；limit / cursor 游标分页，fields 字段投影）"""
+    if limit is None and cursor is None and fields is None:
+        return crud.get_snapshots(db, point_id, days)
+    try:
+        items, next_cursor = crud.get_snapshots_page(
+            db, point_id, days, limit, cursor, pagination.parse_fields(fields, crud.SNAPSHOT_FIELDS)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _page_response(items, next_cursor)
+
+
+@app.get("/api/libraries/{library_id}/snapshots", response_model=list[schemas.LibrarySnapshotResponse])
+def list_library_snapshots(
+    library_id: str,
+    limit: int = Query(50, ge=1, le=pagination.MAX_LIMIT),
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = Query(None, description="只返回此时间及之后的快照"),
+    until: Optional[datetime] = Query(None, description="只返回此时间之前的快照"),
+    point_id: Optional[str] = None,
+    tag: Optional[str] = Query(None, description="只返回带此标签（名称）的知识点的快照"),
+    fields: Optional[str] = Query(None, description="只返回这些字段（逗号分隔），如 id,point_title,timestamp"),
+    db: Session = Depends(get_read_db)
+):
+    """整库版本历史（所有知识点按时间合并，新的在前；limit / cursor 游标分页）"""
+    if not db.get(models.Library, library_id):
+        raise HTTPException(status_code=404, detail="Library not found")
+    try:
+        items, next_cursor = crud.get_library_snapshots(
+            db, library_id, limit, cursor, since, until, point_id, tag,
+            pagination.parse_fields(fields, crud.LIBRARY_SNAPSHOT_FIELDS)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _page_response(items, next_cursor)
 
 
 @app.post("/api/points/{point_id}/restore", response_model=schemas.PointResponse)
@@ -201,13 +474,28 @@ def restore_snapshot(point_id: str, data: schemas.RestoreRequest, db: Session =
     return point
 
 
+@app.post("/api/libraries/{library_id}/restore", response_model=schemas.LibraryRestoreResponse)
+def restore_library(
+    library_id: str,
+    at: datetime = Query(..., description="恢复到此时刻（不带时区时按 UTC）的状态"),
+    dry_run: bool = Query(False, description="只返回差异，不写入"),
+    db: Session = Depends(get_db)
+):
+    """整库按时间点恢复：知识点内容与链接回到 at 时刻的状态"""
+    result = crud.restore_library(db, library_id, at, dry_run)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Library not found")
+    return result
+
+
 # ==================== 词频统计 API ====================
 
-@app.get("/api/libraries/{library_id}/word-frequency", response_model=schemas.WordFrequencyResponse)
+@app.get("/api/libraries/{library_id}/word-frequency", response_model=schemas.WordFrequencyResponse,
+         dependencies=[Depends(library_etag)])
 def get_word_frequency(
     library_id: str,
     mode: str = Query("content", regex="^(content|tag)$"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """获取词频统计"""
     data = crud.get_word_frequency(db, library_id, mode)
@@ -217,6 +505,14 @@ def get_word_frequency(
     }
 
 
+@app.post("/api/libraries/{library_id}/reindex")
+def reindex_library(library_id: str, db: Session = Depends(get_db)):
+    """重建知识库的全文索引与词频统计"""
+    if not crud.reindex_library(db, library_id):
+        raise HTTPException(status_code=404, detail="Library not found")
+    return {"success": True}
+
+
 # ==================== 导出 API ====================
 
 @app.get("/api/libraries/{library_id}/export")
@@ -224,191 +520,148 @@ def export_library(
     library_id: str,
     format: str = Query("json", regex="^(json|markdown|csv)$"),
     tag_filter: Optional[str] = Query(None, alias="tagFilter"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
-    """导出知识库数据"""
-    library = crud.get_library(db, library_id)
+    """导出知识库数据（流式输出，内存占用与知识库大小无关）"""
+    library = db.get(models.Library, library_id)
     if not library:
         raise HTTPException(status_code=404, detail="Library not found")
 
-    points = crud.get_points(db, library_id)
-    links = crud.get_links(db, library_id)
-
-    # 标签筛选
-    if tag_filter:
-        tag_names = tag_filter.split(",")
-        points = [p for p in points if any(t.name in tag_names for t in p.tags)]
-
-    if format == "json":
-        data = {
-            "library": {
-                "id": library.id,
-                "name": library.name,
-                "description": library.description,
-            },
-            "points": [
-                {
-                    "id": p.id,
-                    "title": p.title,
-                    "content": p.content,
-                    "source": p.source,
-                    "page": p.page,
-                    "tags": [t.name for t in p.tags],
-                }
-                for p in points
-            ],
-            "links": [
-                {"fromId": l.from_id, "toId": l.to_id, "type": l.type}
-                for l in links
-            ]
-        }
-        return Response(
-            content=json.dumps(data, ensure_ascii=False, indent=2),
-            media_type="application/json",
-            headers={"Content-Disposition": f'attachment; filename="{library.name}.json"'}
-        )
+    library_data = {
+        "id": library.id,
+        "name": library.name,
+        "description": library.description,
+    }
+    tag_names = tag_filter.split(",") if tag_filter else None
 
-    elif format == "markdown":
-        lines = [f"# {library.name}\n"]
-        if library.description:
-            lines.append(f"{library.description}\n")
-        lines.append("\n## 知识点\n")
-        for p in points:
-            tags = ", ".join(t.name for t in p.tags)
-            lines.append(f"### {p.title}\n")
-            lines.append(f"**标签**: {tags}\n")
-            lines.append(f"**出处**: {p.source or '无'} (页码: {p.page or '无'})\n\n")
-            lines.append(f"{p.content}\n\n---\n")
-
-        content = "\n".join(lines)
-        return Response(
-            content=content,
-            media_type="text/markdown",
-            headers={"Content-Disposition": f'attachment; filename="{library.name}.md"'}
-        )
+    return StreamingResponse(
+        exporters.stream_library(library_data, format, tag_names),
+        media_type=exporters.MEDIA_TYPES[format],
+        headers=exporters.attachment_headers(f"{library.name}.{exporters.EXTENSIONS[format]}")
+    )
 
-    elif format == "csv":
-        import csv
-        import io
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(["ID", "标题", "内容", "标签", "出处", "页码"])
-        for p in points:
-            writer.writerow([
-                p.id,
-                p.title,
-                p.content,
-                ",".join(t.name for t in p.tags),
-                p.source or "",
-                p.page or ""
-            ])
-        return Response(
-            content=output.getvalue(),
-            media_type="text/csv",
-            headers={"Content-Disposition": f'attachment; filename="{library.name}.csv"'}
-        )
+
+@app.get("/api/points/{point_id}/related/export")
+def export_related_points(
+    point_id: str,
+    depth: int = Query(1, ge=1, le=5),
+    types: Optional[str] = Query(None, description="只沿这些类型的链接扩展（逗号分隔），默认全部"),
+    format: str = Query("json", regex="^(json|markdown|csv)$"),
+    db: Session = Depends(get_read_db)
+):
+    """导出知识点及其 depth 跳内的相关知识点（不区分链接方向，流式输出）"""
+    point = db.get(models.Point, point_id)
+    if not point:
+        raise HTTPException(status_code=404, detail="Point not found")
+    library = db.get(models.Library, point.library_id)
+
+    type_list = [t for t in types.split(",") if t] if types else None
+    point_ids = crud.get_related_point_ids(db, point_id, depth, type_list)
+    header = {
+        "id": library.id,
+        "name": f"{point.title} 及其相关知识点",
+        "description": f"知识库: {library.name}（{depth} 跳内共 {len(point_ids)} 个知识点）",
+    }
+
+    return StreamingResponse(
+        exporters.stream_points(header, point_ids, format),
+        media_type=exporters.MEDIA_TYPES[format],
+        headers={
+            **exporters.attachment_headers(f"{point.title}_相关知识点.{exporters.EXTENSIONS[format]}"),
+            "X-Point-Count": str(len(point_ids)),
+        }
+    )
 
 
 @app.post("/api/export/batch")
-def export_libraries_batch(
-    data: schemas.BatchExportRequest,
-    db: Session = Depends(get_db)
-):
-    """批量导出知识库"""
+def export_libraries_batch(data: schemas.BatchExportRequest):
+    """批量导出知识库（流式）
+
+    json: 原有的单个 JSON 文档；zip: 每个知识库一个 NDJSON 成员的 ZIP 归档，适合导出全部。
+    """
     from datetime import datetime
-    
-    if not data.library_ids:
-        # Export all
-        libraries = crud.get_libraries(db)
-    else:
-        # Export selected
-        libraries = []
-        for lid in data.library_ids:
-            lib = crud.get_library(db, lid)
-            if lib:
-                libraries.append(lib)
-
-    export_data = []
-    for lib_summary in libraries:
-        # Re-fetch full library data to ensure eager loading of relations
-        full_lib = crud.get_library(db, lib_summary.id)
-        if not full_lib:
-            continue
-            
-        points = crud.get_points(db, full_lib.id)
-        links = crud.get_links(db, full_lib.id)
-
-        lib_data = {
-            "meta": {
-                "id": full_lib.id,
-                "name": full_lib.name,
-                "description": full_lib.description,
-                "tags": [{"name": t.name, "color": t.color, "id": t.id} for t in full_lib.tags],
-                "sources": [{"name": s.name, "id": s.id} for s in full_lib.sources],
-                "created_at": full_lib.created_at.isoformat() if full_lib.created_at else None,
-                "updated_at": full_lib.updated_at.isoformat() if full_lib.updated_at else None,
-            },
-            "points": [
-                {
-                    "id": p.id,
-                    "title": p.title,
-                    "content": p.content,
-                    "source": p.source,
-                    "page": p.page,
-                    "tags": [t.name for t in p.tags],
-                    "x": p.x,
-                    "y": p.y
-                }
-                for p in points
-            ],
-            "links": [
-                {"id": l.id, "fromId": l.from_id, "toId": l.to_id, "type": l.type}
-                for l in links
-            ]
-        }
-        export_data.append(lib_data)
 
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    filename = f"knowledge_export_batch_{timestamp}.json"
-    
-    return Response(
-        content=json.dumps(export_data, ensure_ascii=False, indent=2),
-        media_type="application/json",
-        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    if data.format == "zip":
+        return StreamingResponse(
+            exporters.stream_batch_zip(data.library_ids, data.include_snapshots),
+            media_type=exporters.MEDIA_TYPES["zip"],
+            headers=exporters.attachment_headers(f"knowledge_export_batch_{timestamp}.zip")
+        )
+
+    return StreamingResponse(
+        exporters.stream_batch_json(data.library_ids),
+        media_type=exporters.MEDIA_TYPES["json"],
+        headers=exporters.attachment_headers(f"knowledge_export_batch_{timestamp}.json")
     )
-@app.get("/api/stats/global", response_model=schemas.GlobalStatsResponse)
-def get_global_stats(db: Session = Depends(get_db)):
+
+
+@app.get("/api/stats/global", response_model=schemas.GlobalStatsResponse,
+         dependencies=[Depends(global_etag)])
+def get_global_stats(db: Session = Depends(get_read_db)):
     """获取全局统计数据"""
     return crud.get_global_stats(db)
 
 
+@app.get("/api/stats/graph-cache", response_model=schemas.GraphCacheStatsResponse)
+def get_graph_cache_stats():
+    """图缓存计数（命中 / 未命中 / 重建 / 修补等）"""
+    return crud.get_graph_cache_stats()
+
+
 @app.get("/api/search/global", response_model=schemas.GlobalSearchResponse)
 def search_global(
     query: str = Query(..., min_length=1),
-    db: Session = Depends(get_db)
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    library_id: Optional[str] = Query(None, description="只搜索该知识库（知识库内搜索）"),
+    db: Session = Depends(get_read_db)
 ):
-    """全局跨库搜索"""
-    return crud.search_global(db, query)
+    """全局跨库搜索（BM25 排序、高亮、分页）"""
+    return crud.search_global(db, query, limit, offset, library_id)
 @app.post("/api/import")
-async def import_libraries_endpoint(
+def import_libraries_endpoint(
     file: UploadFile = File(...),
+    format: str = Query("auto", regex="^(auto|json|ndjson|zip)$"),
+    start: int = Query(0, ge=0, description="从第几个知识库开始（续传）"),
+    on_error: str = Query("abort", regex="^(abort|skip)$"),
     db: Session = Depends(get_db)
 ):
-    """导入知识库 (JSON)"""
-    content = await file.read()
+    """导入知识库（JSON / NDJSON / ZIP，增量解析，每个库一个事务批量写入）
+
+    返回导入报告：count、rows_per_sec、各库结果、errors，以及续传用的 next。
+    """
     try:
-        data = json.loads(content)
-        if isinstance(data, dict):
-            data = [data]
-        elif not isinstance(data, list):
-            raise HTTPException(status_code=400, detail="Invalid JSON format: expected list or dict")
-            
-        count = crud.import_libraries_from_data(db, data)
-        return {"success": True, "count": count}
-    except json.JSONDecodeError:
-        raise HTTPException(status_code=400, detail="Invalid JSON file")
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Import failed: {str(e)}")
+        sources = importer.open_sources(file.file, file.filename, format)
+    except importer.ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    report = importer.import_sources(db, sources, start=start, on_error=on_error)
+    if report["errors"] and not report["count"]:
+        raise HTTPException(status_code=400, detail=f"Import failed: {report['errors'][0]['error']}")
+    return report
+
+
+# ==================== 维护 API ====================
+
+@app.post("/api/maintenance/run", response_model=schemas.MaintenanceRunResponse)
+def run_maintenance(full_vacuum: bool = Query(False, description="完整 VACUUM（重写整个文件，耗时较长）")):
+    """立即执行一次维护：清理过期快照、归还空闲页、optimize 与 WAL 检查点"""
+    try:
+        return maintenance.run("manual", full_vacuum)
+    except maintenance.MaintenanceBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.post("/api/maintenance/recount", response_model=schemas.CounterRepairResponse)
+def recount(db: Session = Depends(get_db)):
+    """重新统计知识库与全局计数（知识点 / 链接 / 快照数）并修正偏差"""
+    return crud.repair_counters(db)
+
+
+@app.get("/api/maintenance/runs", response_model=list[schemas.MaintenanceRunResponse])
+def list_maintenance_runs(limit: int = Query(20, ge=1, le=200)):
+    """最近的维护记录（新的在前）"""
+    return maintenance.recent_runs(limit)
 
 
 # ==================== 健康检查 ====================
@@ -0,0 +1,259 @@
+"""
+后台维护 - 快照保留期清理与数据库文件整理
+
+每次维护依次执行：
+1. 删除超过保留期的快照（每个知识库可单独设置 snapshot_retention_days，为空时使用
+   RETENTION_DAYS，0 表示永久保留）。每个知识点最新的快照始终保留；每批 PRUNE_BATCH 行
+   一个事务，批与批之间让出写连接，前台写操作最多等待一批；
+2. PRAGMA incremental_vacuum 分步归还空闲页（数据库为 auto_vacuum=INCREMENTAL 时；
+   旧数据库需要手动触发一次 full_vacuum 完成切换）；
+3. PRAGMA optimize 与 PRAGMA wal_checkpoint(TRUNCATE)。
+
+每次运行的耗时、删除的快照数和释放的页数记录在 maintenance_runs 表中（保留最近 KEEP_RUNS 条）。
+
+start() 在应用启动时创建调度任务：距上次运行超过 INTERVAL_SECONDS，且最近 IDLE_SECONDS
+秒内没有写操作（全局修订号未变化）时在线程中运行；设置 HOURS（如 "1-6"，本地时间）后
+只在该时段内运行。也可以通过 POST /api/maintenance/run 手动触发。
+"""
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import exists, select
+from sqlalchemy.orm import aliased
+
+from . import changelog, snapshot_store
+from .database import SessionLocal, engine
+from .models import Library, Snapshot, utc_now
+
+RETENTION_DAYS = int(os.environ.get("KNOWLEDGE_SNAPSHOT_RETENTION_DAYS", 300))
+INTERVAL_SECONDS = float(os.environ.get("KNOWLEDGE_MAINTENANCE_INTERVAL", 6 * 3600))
+IDLE_SECONDS = float(os.environ.get("KNOWLEDGE_MAINTENANCE_IDLE", 300))
+HOURS = os.environ.get("KNOWLEDGE_MAINTENANCE_HOURS", "")
+# 调度任务检查条件的间隔（秒）
+CHECK_SECONDS = 60.0
+# 每批删除的快照数 / 每步归还的空闲页数，以及批与批之间的停顿（秒）
+PRUNE_BATCH = 500
+VACUUM_STEP = 2000
+BATCH_PAUSE = 0.05
+KEEP_RUNS = 200
+
+CREATE_STATEMENTS = [
+    "CREATE TABLE IF NOT EXISTS maintenance_runs ("
+    " id INTEGER PRIMARY KEY,"
+    " trigger TEXT NOT NULL,"
+    " started_at TEXT NOT NULL,"
+    " elapsed_ms REAL NOT NULL,"
+    " snapshots_deleted INTEGER NOT NULL DEFAULT 0,"
+    " pages_before INTEGER NOT NULL DEFAULT 0,"
+    " pages_after INTEGER NOT NULL DEFAULT 0,"
+    " freelist_after INTEGER NOT NULL DEFAULT 0,"
+    " wal_pages INTEGER NOT NULL DEFAULT 0,"
+    " vacuum TEXT NOT NULL,"
+    " error TEXT)",
+]
+_RUN_FIELDS = ("id", "trigger", "started_at", "elapsed_ms", "snapshots_deleted", "pages_before", "pages_after",
+               "freelist_after", "wal_pages", "vacuum", "error")
+
+_run_lock = threading.Lock()
+_task: Optional[asyncio.Task] = None
+
+
+class MaintenanceBusy(RuntimeError):
+    """已有一次维护正在运行"""
+
+
+# ==================== 快照清理 ====================
+
+def _expired_batch(db, library_id: str, cutoff: datetime) -> list[str]:
+    newer = aliased(Snapshot)
+    return list(db.scalars(
+        select(Snapshot.id)
+        .where(
+            Snapshot.library_id == library_id,
+            Snapshot.timestamp < cutoff,
+            # 每个知识点最新的快照不删除
+            exists().where(newer.point_id == Snapshot.point_id, newer.timestamp > Snapshot.timestamp),
+        )
+        .limit(PRUNE_BATCH)
+    ))
+
+
+def prune_snapshots(now: Optional[datetime] = None) -> int:
+    """按各知识库的保留期分批删除过期快照，返回删除的行数"""
+    now = now or utc_now()
+    with SessionLocal() as db:
+        libraries = db.execute(select(Library.id, Library.snapshot_retention_days)).all()
+
+    deleted = 0
+    for library_id, days in libraries:
+        days = RETENTION_DAYS if days is None else days
+        if days <= 0:
+            continue
+        cutoff = now - timedelta(days=days)
+        pruned = 0
+        while True:
+            with SessionLocal() as db:
+                batch = _expired_batch(db, library_id, cutoff)
+                if not batch:
+                    break
+                pruned += snapshot_store.remove(db, batch)
+                db.commit()
+            time.sleep(BATCH_PAUSE)
+        if pruned:
+            # 快照数变化：使知识库与首页列表的 ETag 失效
+            with SessionLocal() as db:
+                changelog.record(db, library_id)
+                db.commit()
+        deleted += pruned
+    return deleted
+
+
+# ==================== 数据库文件 ====================
+
+def _pragma(conn, name: str) -> int:
+    return conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+
+
+def _compact_file(full_vacuum: bool) -> dict:
+    """归还空闲页、更新统计信息并截断 WAL；返回页数统计"""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        pages_before = _pragma(conn, "page_count")
+        if full_vacuum:
+            # 完整 VACUUM 会重写整个文件，同时让旧数据库切换到 auto_vacuum=INCREMENTAL
+            conn.exec_driver_sql("VACUUM")
+            vacuum = "full"
+        elif _pragma(conn, "auto_vacuum") == 2:
+            vacuum = "incremental"
+        else:
+            vacuum = "none"
+
+    # 分步执行，每步之间归还写连接。execute 只执行一步（归还一页），用 executescript 执行到底
+    remaining = None
+    while vacuum == "incremental":
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            free = _pragma(conn, "freelist_count")
+            if free == 0 or free == remaining:
+                break
+            remaining = free
+            conn.connection.driver_connection.executescript(f"PRAGMA incremental_vacuum({VACUUM_STEP})")
+        time.sleep(BATCH_PAUSE)
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("PRAGMA optimize")
+        # TRUNCATE 完成后报告的帧数为 0，先用 PASSIVE 取得 WAL 中的帧数
+        _, wal_pages, _ = conn.exec_driver_sql("PRAGMA wal_checkpoint(PASSIVE)").one()
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)").all()
+        return {
+            "pages_before": pages_before,
+            "pages_after": _pragma(conn, "page_count"),
+            "freelist_after": _pragma(conn, "freelist_count"),
+            "wal_pages": max(wal_pages, 0),
+            "vacuum": vacuum,
+        }
+
+
+# ==================== 运行与记录 ====================
+
+def _record(run: dict) -> dict:
+    with engine.begin() as conn:
+        run["id"] = conn.exec_driver_sql(
+            "INSERT INTO maintenance_runs (trigger, started_at, elapsed_ms, snapshots_deleted, pages_before,"
+            " pages_after, freelist_after, wal_pages, vacuum, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+            " RETURNING id",
+            tuple(run[name] for name in _RUN_FIELDS[1:])
+        ).scalar()
+        conn.exec_driver_sql(
+            "DELETE FROM maintenance_runs WHERE id <= (SELECT id FROM maintenance_runs ORDER BY id DESC"
+            " LIMIT 1 OFFSET ?)", (KEEP_RUNS,)
+        )
+    run["pages_freed"] = max(run["pages_before"] - run["pages_after"], 0)
+    return run
+
+
+def run(trigger: str = "manual", full_vacuum: bool = False) -> dict:
+    """执行一次维护并记录结果；已有维护在运行时抛出 MaintenanceBusy"""
+    if not _run_lock.acquire(blocking=False):
+        raise MaintenanceBusy("Maintenance is already running")
+    try:
+        started_at, start = utc_now(), time.perf_counter()
+        result = {"trigger": trigger, "started_at": started_at.isoformat(), "snapshots_deleted": 0,
+                  "pages_before": 0, "pages_after": 0, "freelist_after": 0, "wal_pages": 0,
+                  "vacuum": "none", "error": None}
+        try:
+            result["snapshots_deleted"] = prune_snapshots(started_at)
+            result.update(_compact_file(full_vacuum))
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+        result["elapsed_ms"] = (time.perf_counter() - start) * 1000
+        return _record(result)
+    finally:
+        _run_lock.release()
+
+
+def recent_runs(limit: int = 20) -> list[dict]:
+    """最近的维护记录（新的在前）"""
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(
+            f"SELECT {', '.join(_RUN_FIELDS)} FROM maintenance_runs ORDER BY id DESC LIMIT ?", (limit,)
+        ).all()
+    runs = [dict(zip(_RUN_FIELDS, row)) for row in rows]
+    for item in runs:
+        item["pages_freed"] = max(item["pages_before"] - item["pages_after"], 0)
+    return runs
+
+
+# ==================== 调度 ====================
+
+def _in_hours(now: datetime) -> bool:
+    if not HOURS:
+        return True
+    first, last = (int(part) for part in HOURS.split("-"))
+    hour = now.hour
+    return first <= hour < last if first <= last else hour >= first or hour < last
+
+
+def _global_revision() -> int:
+    with engine.connect() as conn:
+        return conn.exec_driver_sql("SELECT revision FROM global_state WHERE id = 1").scalar() or 0
+
+
+async def _schedule():
+    last_run = time.monotonic()
+    revision, quiet_since = None, time.monotonic()
+    while True:
+        await asyncio.sleep(CHECK_SECONDS)
+        current = await asyncio.to_thread(_global_revision)
+        if current != revision:
+            revision, quiet_since = current, time.monotonic()
+        now = time.monotonic()
+        if (now - last_run < INTERVAL_SECONDS or now - quiet_since < IDLE_SECONDS
+                or not _in_hours(datetime.now())):
+            continue
+        try:
+            await asyncio.to_thread(run, "schedule")
+        except MaintenanceBusy:
+            continue
+        last_run = time.monotonic()
+
+
+def start():
+    """启动调度任务（应用启动时调用）；INTERVAL_SECONDS <= 0 时不启动"""
+    global _task
+    if INTERVAL_SECONDS > 0 and _task is None:
+        _task = asyncio.get_running_loop().create_task(_schedule())
+
+
+async def stop():
+    """停止调度任务；正在线程中执行的维护会运行到结束"""
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
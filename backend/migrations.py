@@ -0,0 +1,185 @@
+"""
+数据库迁移 - 基于 schema_version 表的版本化升级
+
+新建数据库由 Base.metadata.create_all 直接建出最新结构，
+已有的 knowledge.db 则依次执行尚未应用的迁移步骤。
+每个步骤都必须是幂等的（IF NOT EXISTS / 先检查列是否存在），
+这样对新库重复执行也不会出错。
+"""
+from datetime import datetime, timezone
+from typing import Callable
+
+from sqlalchemy import Engine, Connection
+
+# (版本号, 描述, 升级函数)
+MIGRATIONS: list[tuple[int, str, Callable[[Connection], None]]] = []
+
+
+def migration(version: int, description: str):
+    """注册一个迁移步骤"""
+    def decorator(func: Callable[[Connection], None]):
+        MIGRATIONS.append((version, description, func))
+        return func
+    return decorator
+
+
+def has_column(conn: Connection, table: str, column: str) -> bool:
+    """检查表中是否已存在某列"""
+    rows = conn.exec_driver_sql(f"PRAGMA table_info({table})").all()
+    return any(row[1] == column for row in rows)
+
+
+# ==================== 迁移步骤 ====================
+
+@migration(1, "热点查询索引：points.library_id、links 双向、snapshots(point_id, timestamp)、point_tags.tag_id")
+def _add_hot_path_indexes(conn: Connection):
+    statements = [
+        "CREATE INDEX IF NOT EXISTS ix_points_library_id ON points (library_id)",
+        "CREATE INDEX IF NOT EXISTS ix_links_from_id ON links (from_id, to_id)",
+        "CREATE INDEX IF NOT EXISTS ix_links_to_id ON links (to_id, from_id)",
+        "CREATE INDEX IF NOT EXISTS ix_snapshots_point_timestamp ON snapshots (point_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS ix_point_tags_tag_id ON point_tags (tag_id, point_id)",
+        "CREATE INDEX IF NOT EXISTS ix_tags_library_name ON tags (library_id, name)",
+        "CREATE INDEX IF NOT EXISTS ix_sources_library_id ON sources (library_id)",
+    ]
+    for statement in statements:
+        conn.exec_driver_sql(statement)
+    # 更新统计信息，让查询规划器选中新索引
+    conn.exec_driver_sql("ANALYZE")
+
+
+@migration(2, "全文检索索引 search_docs / search_fts（jieba 预分词）并回填")
+def _add_search_index(conn: Connection):
+    from . import search_index
+    for statement in search_index.CREATE_STATEMENTS:
+        conn.exec_driver_sql(statement)
+    search_index.rebuild(conn)
+
+
+@migration(3, "词频索引 point_terms / library_terms 回填")
+def _backfill_term_index(conn: Connection):
+    # 表结构由 create_all 建立，这里只负责回填已有数据
+    from . import term_index
+    term_index.rebuild(conn)
+
+
+@migration(4, "键集分页索引：points(library_id, created_at, id)、links(created_at, id)")
+def _add_keyset_indexes(conn: Connection):
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_points_library_created ON points (library_id, created_at, id)"
+    )
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_links_created ON links (created_at, id)")
+    # 新索引以 library_id 开头，可以替代原来的单列索引
+    conn.exec_driver_sql("DROP INDEX IF EXISTS ix_points_library_id")
+    conn.exec_driver_sql("ANALYZE")
+
+
+@migration(5, "空间索引 point_rtree（R*Tree）及触发器并回填")
+def _add_spatial_index(conn: Connection):
+    from . import spatial_index
+    for statement in spatial_index.CREATE_STATEMENTS:
+        conn.exec_driver_sql(statement)
+    spatial_index.rebuild(conn)
+
+
+@migration(6, "知识库修订号 libraries.revision / changes_floor 与变更日志 library_changes")
+def _add_change_log(conn: Connection):
+    from . import changelog
+    for column in ("revision", "changes_floor"):
+        if not has_column(conn, "libraries", column):
+            conn.exec_driver_sql(f"ALTER TABLE libraries ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+    for statement in changelog.CREATE_STATEMENTS:
+        conn.exec_driver_sql(statement)
+
+
+
+@migration(7, "全局修订号 global_state（知识库列表与全局统计的 ETag）")
+def _add_global_state(conn: Connection):
+    from . import changelog
+    for statement in changelog.GLOBAL_STATEMENTS:
+        conn.exec_driver_sql(statement)
+
+
+@migration(8, "快照改为关键帧 + 差异压缩存储，按内容哈希去重")
+def _compact_snapshots(conn: Connection):
+    from . import snapshot_store
+    if not has_column(conn, "snapshots", "payload"):
+        snapshot_store.convert_legacy(conn)
+
+
+@migration(9, "快照保留期 libraries.snapshot_retention_days 与维护记录 maintenance_runs")
+def _add_maintenance(conn: Connection):
+    from . import maintenance
+    if not has_column(conn, "libraries", "snapshot_retention_days"):
+        conn.exec_driver_sql("ALTER TABLE libraries ADD COLUMN snapshot_retention_days INTEGER")
+    for statement in maintenance.CREATE_STATEMENTS:
+        conn.exec_driver_sql(statement)
+
+
+@migration(10, "快照冗余 library_id 列与整库历史索引 snapshots(library_id, timestamp, id)")
+def _add_snapshot_library(conn: Connection):
+    if not has_column(conn, "snapshots", "library_id"):
+        conn.exec_driver_sql(
+            "ALTER TABLE snapshots ADD COLUMN library_id VARCHAR(32) REFERENCES libraries (id) ON DELETE CASCADE"
+        )
+    conn.exec_driver_sql(
+        "UPDATE snapshots SET library_id = (SELECT library_id FROM points WHERE points.id = snapshots.point_id)"
+        " WHERE library_id IS NULL"
+    )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_snapshots_library_timestamp ON snapshots (library_id, timestamp, id)"
+    )
+
+
+@migration(11, "计数冗余 libraries.point_count / link_count / snapshot_count 与全局计数（触发器维护）并回填")
+def _add_counters(conn: Connection):
+    from . import counters
+    for column in counters.LIBRARY_COLUMNS:
+        if not has_column(conn, "libraries", column):
+            conn.exec_driver_sql(f"ALTER TABLE libraries ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+    for column in counters.GLOBAL_COLUMNS:
+        if not has_column(conn, "global_state", column):
+            conn.exec_driver_sql(f"ALTER TABLE global_state ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+    for statement in counters.CREATE_STATEMENTS:
+        conn.exec_driver_sql(statement)
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_libraries_created ON libraries (created_at)")
+    counters.rebuild(conn)
+
+
+# ==================== 执行器 ====================
+
+def _ensure_version_table(conn: Connection):
+    conn.exec_driver_sql(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        " version INTEGER PRIMARY KEY,"
+        " description TEXT NOT NULL,"
+        " applied_at TEXT NOT NULL)"
+    )
+
+
+def get_schema_version(conn: Connection) -> int:
+    """获取当前数据库的结构版本号"""
+    _ensure_version_table(conn)
+    return conn.exec_driver_sql("SELECT COALESCE(MAX(version), 0) FROM schema_version").scalar()
+
+
+def run_migrations(engine: Engine) -> list[int]:
+    """执行所有尚未应用的迁移，返回本次应用的版本号列表
+
+    每个步骤在独立事务中执行，失败时只回滚该步骤，已完成的步骤保持生效。
+    """
+    with engine.begin() as conn:
+        current = get_schema_version(conn)
+
+    applied = []
+    for version, description, upgrade in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version <= current:
+            continue
+        with engine.begin() as conn:
+            upgrade(conn)
+            conn.exec_driver_sql(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (version, description, datetime.now(timezone.utc).isoformat())
+            )
+        applied.append(version)
+    return applied
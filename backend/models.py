@@ -1,9 +1,10 @@
 """
 SQLAlchemy 数据模型 - 知识图谱应用
 """
+import threading
 from datetime import datetime, timezone
 from typing import Optional
-from sqlalchemy import String, Text, Float, ForeignKey, DateTime, JSON, Table, Column
+from sqlalchemy import String, Text, Float, Integer, ForeignKey, DateTime, LargeBinary, Table, Column, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .database import Base
@@ -14,6 +15,10 @@ def utc_now() -> datetime:
     return datetime.now(timezone.utc)
 
 
+_batch_lock = threading.Lock()
+_last_batch_ms = 0
+
+
 def generate_id() -> str:
     """生成唯一 ID"""
     import time
@@ -21,6 +26,28 @@ def generate_id() -> str:
     return f"{int(time.time() * 1000):x}{random.randint(0, 0xFFFFFF):06x}"
 
 
+def generate_ids(count: int) -> list[str]:
+    """批量生成 ID（与 generate_id 格式相同）
+
+    逐个调用 generate_id 时同一毫秒内可能撞上相同的随机后缀，
+    这里每个毫秒前缀只用于一次调用，并在前缀内无放回抽样，保证互不重复。
+    """
+    import time
+    import random
+    global _last_batch_ms
+    ids: list[str] = []
+    with _batch_lock:
+        while len(ids) < count:
+            ms = int(time.time() * 1000)
+            if ms <= _last_batch_ms:
+                time.sleep(0.001)
+                continue
+            _last_batch_ms = ms
+            take = min(count - len(ids), 0x1000000)
+            ids.extend(f"{ms:x}{n:06x}" for n in random.sample(range(0x1000000), take))
+    return ids
+
+
 # ==================== 关联表 ====================
 
 # 知识点与标签的多对多关系
@@ -29,6 +56,7 @@ point_tag_table = Table(
     Base.metadata,
     Column("point_id", String(32), ForeignKey("points.id", ondelete="CASCADE"), primary_key=True),
     Column("tag_id", String(32), ForeignKey("tags.id", ondelete="CASCADE"), primary_key=True),
+    Index("ix_point_tags_tag_id", "tag_id", "point_id"),
 )
 
 
@@ -37,12 +65,22 @@ point_tag_table = Table(
 class Library(Base):
     """知识点网络库"""
     __tablename__ = "libraries"
+    __table_args__ = (Index("ix_libraries_created", "created_at"),)
 
     id: Mapped[str] = mapped_column(String(32), primary_key=True, default=generate_id)
     name: Mapped[str] = mapped_column(String(128), nullable=False)
     description: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utc_now)
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utc_now, onupdate=utc_now)
+    # 修订号：每次写操作加一；changes_floor 之前的删除记录已被压缩（见 changelog）
+    revision: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    changes_floor: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    # 快照保留天数：为空时使用全局默认值，0 表示永久保留（见 maintenance）
+    snapshot_retention_days: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    # 知识点 / 链接（按起点）/ 快照数，由触发器维护（见 counters）
+    point_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    link_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    snapshot_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
 
     # 关系
     tags: Mapped[list["Tag"]] = relationship("Tag", back_populates="library", cascade="all, delete-orphan")
@@ -53,6 +91,7 @@ class Library(Base):
 class Tag(Base):
     """标签"""
     __tablename__ = "tags"
+    __table_args__ = (Index("ix_tags_library_name", "library_id", "name"),)
 
     id: Mapped[str] = mapped_column(String(32), primary_key=True, default=generate_id)
     library_id: Mapped[str] = mapped_column(String(32), ForeignKey("libraries.id", ondelete="CASCADE"), nullable=False)
@@ -67,6 +106,7 @@ class Tag(Base):
 class Source(Base):
     """出处"""
     __tablename__ = "sources"
+    __table_args__ = (Index("ix_sources_library_id", "library_id"),)
 
     id: Mapped[str] = mapped_column(String(32), primary_key=True, default=generate_id)
     library_id: Mapped[str] = mapped_column(String(32), ForeignKey("libraries.id", ondelete="CASCADE"), nullable=False)
@@ -79,6 +119,7 @@ class Source(Base):
 class Point(Base):
     """知识点"""
     __tablename__ = "points"
+    __table_args__ = (Index("ix_points_library_created", "library_id", "created_at", "id"),)
 
     id: Mapped[str] = mapped_column(String(32), primary_key=True, default=generate_id)
     library_id: Mapped[str] = mapped_column(String(32), ForeignKey("libraries.id", ondelete="CASCADE"), nullable=False)
@@ -109,6 +150,11 @@ class Point(Base):
 class Link(Base):
     """知识点之间的链接"""
     __tablename__ = "links"
+    __table_args__ = (
+        Index("ix_links_from_id", "from_id", "to_id"),
+        Index("ix_links_to_id", "to_id", "from_id"),
+        Index("ix_links_created", "created_at", "id"),
+    )
 
     id: Mapped[str] = mapped_column(String(32), primary_key=True, default=generate_id)
     from_id: Mapped[str] = mapped_column(String(32), ForeignKey("points.id", ondelete="CASCADE"), nullable=False)
@@ -121,18 +167,47 @@ class Link(Base):
     to_point: Mapped["Point"] = relationship("Point", foreign_keys=[to_id], back_populates="incoming_links")
 
 
+class PointTerm(Base):
+    """知识点内容分词计数（词频统计的增量索引）"""
+    __tablename__ = "point_terms"
+    __table_args__ = (Index("ix_point_terms_library_id", "library_id"),)
+
+    point_id: Mapped[str] = mapped_column(String(32), ForeignKey("points.id", ondelete="CASCADE"), primary_key=True)
+    term: Mapped[str] = mapped_column(String(64), primary_key=True)
+    library_id: Mapped[str] = mapped_column(String(32), nullable=False)
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class LibraryTerm(Base):
+    """知识库词频汇总（由 point_terms 增量维护）"""
+    __tablename__ = "library_terms"
+    __table_args__ = (Index("ix_library_terms_count", "library_id", "count"),)
+
+    library_id: Mapped[str] = mapped_column(String(32), ForeignKey("libraries.id", ondelete="CASCADE"), primary_key=True)
+    term: Mapped[str] = mapped_column(String(64), primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
 class Snapshot(Base):
-    """知识点版本快照"""
+    """知识点版本快照（content / source / page / links 按关键帧 + 差异压缩存储，见 snapshot_store）"""
     __tablename__ = "snapshots"
+    __table_args__ = (
+        Index("ix_snapshots_point_timestamp", "point_id", "timestamp"),
+        Index("ix_snapshots_point_hash", "point_id", "doc_hash"),
+        Index("ix_snapshots_library_timestamp", "library_id", "timestamp", "id"),
+    )
 
     id: Mapped[str] = mapped_column(String(32), primary_key=True, default=generate_id)
     point_id: Mapped[str] = mapped_column(String(32), ForeignKey("points.id", ondelete="CASCADE"), nullable=False)
-    title: Mapped[str] = mapped_column(String(256), nullable=False)
-    content: Mapped[str] = mapped_column(Text, nullable=False)
-    source: Mapped[Optional[str]] = mapped_column(String(256), nullable=True)
-    page: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)
-    links: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)  # 存储链接 ID 列表
+    # 冗余自 points.library_id（知识点不会移动到其他库），整库历史按索引顺序读取
+    library_id: Mapped[str] = mapped_column(String(32), ForeignKey("libraries.id", ondelete="CASCADE"), nullable=False)
+    title: Mapped[str] = mapped_column(String(256), nullable=False)  # 明文，历史列表不必解码
     timestamp: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utc_now)
+    kind: Mapped[int] = mapped_column(Integer, nullable=False, default=0)  # 0 关键帧 / 1 差异 / 2 引用
+    base_id: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)  # 差异的基准 / 引用的目标
+    depth: Mapped[int] = mapped_column(Integer, nullable=False, default=0)  # 重建需应用的差异个数
+    doc_hash: Mapped[str] = mapped_column(String(32), nullable=False)
+    payload: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)  # zlib 压缩的 JSON
 
     # 关系
     point: Mapped["Point"] = relationship("Point", back_populates="snapshots")
@@ -0,0 +1,69 @@
+"""
+列表分页与字段投影
+
+游标分页按 (created_at, id) 排序（快照按 (timestamp, id) 倒序），下一页从上一页
+最后一行之后继续，不用 OFFSET，翻到多深都只扫描 limit 行。游标对客户端不透明，
+是最后一行排序键的 base64url 编码，放在响应头 X-Next-Cursor 中，没有下一页时不返回。
+
+fields 为逗号分隔的输出字段名，只查询需要的列（例如画布只取 id,title,x,y,tags，
+content 由 GET /api/points/{id} 按需加载）。
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import tuple_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+MAX_LIMIT = 5000
+
+
+def encode_cursor(key: datetime, row_id: str) -> str:
+    raw = json.dumps([key.isoformat(), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    """解析游标，格式不对时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        key, row_id = json.loads(raw)
+        return datetime.fromisoformat(key), str(row_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def parse_fields(fields: Optional[str], allowed: tuple[str, ...]) -> Optional[list[str]]:
+    """解析 fields 参数（id 总是包含在内）；None 表示全部字段，未知字段抛出 ValueError"""
+    if fields is None:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)} (allowed: {', '.join(allowed)})")
+    return ["id"] + [name for name in allowed if name in names and name != "id"]
+
+
+def paginate(stmt, key_column, id_column, limit: Optional[int], cursor: Optional[str], descending: bool = False):
+    """给查询加上键集条件、排序与 limit（多取一行用于判断是否还有下一页）"""
+    if cursor:
+        after = decode_cursor(cursor)
+        keys = tuple_(key_column, id_column)
+        stmt = stmt.where(keys < after if descending else keys > after)
+    if descending:
+        stmt = stmt.order_by(key_column.desc(), id_column.desc())
+    else:
+        stmt = stmt.order_by(key_column, id_column)
+    if limit is not None:
+        stmt = stmt.limit(limit + 1)
+    return stmt
+
+
+def split_page(rows: list, limit: Optional[int], key_name: str) -> tuple[list, Optional[str]]:
+    """截取一页并生成下一页游标"""
+    if limit is None or len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, key_name), last.id)
@@ -2,7 +2,7 @@
 Pydantic 模式定义 - API 请求/响应验证
 """
 from datetime import datetime
-from typing import Optional
+from typing import Annotated, Optional
 from pydantic import BaseModel, Field
 
 
@@ -51,6 +51,7 @@ class LibraryBase(BaseModel):
 class LibraryCreate(LibraryBase):
     tags: list[TagCreate] = Field(default_factory=list)
     sources: list[SourceCreate] = Field(default_factory=list)
+    snapshot_retention_days: Optional[int] = Field(None, ge=0)  # 为空时使用全局默认值，0 表示永久保留
 
 
 class LibraryUpdate(BaseModel):
@@ -58,6 +59,7 @@ class LibraryUpdate(BaseModel):
     description: Optional[str] = None
     tags: Optional[list[TagCreate]] = None
     sources: Optional[list[SourceCreate]] = None
+    snapshot_retention_days: Optional[int] = Field(None, ge=0)  # 未传时不修改，显式传 null 恢复使用全局默认值
 
 
 class LibraryResponse(LibraryBase):
@@ -68,6 +70,9 @@ class LibraryResponse(LibraryBase):
     updated_at: datetime
     point_count: int = 0
     link_count: int = 0
+    snapshot_count: int = 0
+    revision: int = 0
+    snapshot_retention_days: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -81,6 +86,8 @@ class LibraryListResponse(BaseModel):
     updated_at: datetime
     point_count: int = 0
     link_count: int = 0
+    snapshot_count: int = 0
+    revision: int = 0
 
     class Config:
         from_attributes = True
@@ -123,6 +130,65 @@ class PointResponse(PointBase):
         from_attributes = True
 
 
+class PointBatchOperation(BaseModel):
+    """批量操作中的一项：create 需要 library_id/title/content，update/delete 需要 id"""
+    op: str = Field(..., pattern="^(create|update|delete)$")
+    id: Optional[str] = None
+    library_id: Optional[str] = None
+    title: Optional[str] = Field(None, max_length=256)
+    content: Optional[str] = None
+    source: Optional[str] = Field(None, max_length=256)
+    page: Optional[str] = Field(None, max_length=32)
+    x: Optional[float] = None
+    y: Optional[float] = None
+    tags: Optional[list[str]] = None  # 标签名称列表
+
+
+class PointBatchRequest(BaseModel):
+    operations: list[PointBatchOperation] = Field(..., max_length=10000)
+
+
+class PointBatchResult(BaseModel):
+    index: int
+    op: str
+    id: Optional[str] = None
+    ok: bool
+    error: Optional[str] = None
+    point: Optional[PointResponse] = None  # create / update 成功时返回最新数据
+
+
+class PointBatchResponse(BaseModel):
+    results: list[PointBatchResult]
+    created: int = 0
+    updated: int = 0
+    deleted: int = 0
+
+
+# ==================== 布局 ====================
+
+Coordinate = Annotated[float, Field(allow_inf_nan=False)]
+# 紧凑的坐标列表：[[id, x, y], ...]
+LayoutPositions = list[tuple[str, Coordinate, Coordinate]]
+
+
+class LayoutUpdateResponse(BaseModel):
+    updated: int
+
+
+class LayoutComputeRequest(BaseModel):
+    iterations: int = Field(default=100, ge=1, le=1000)
+    temperature: Optional[float] = Field(default=None, gt=0)  # 初始最大步长，默认按节点数估算
+    incremental: bool = False  # 只移动未布局的节点（坐标为 0, 0）及其邻居
+
+
+class LayoutComputeResponse(BaseModel):
+    updated: int
+    moved: int
+    iterations: int
+    elapsed: float
+    positions: LayoutPositions  # 被移动节点的新坐标
+
+
 # ==================== 链接 ====================
 
 class LinkBase(BaseModel):
@@ -153,6 +219,30 @@ class LinkResponse(BaseModel):
         populate_by_name = True
 
 
+# ==================== 图遍历 ====================
+
+class TraversalNode(BaseModel):
+    id: str
+    title: str
+    depth: int  # 到起点的最少步数
+
+
+class TraversalResponse(BaseModel):
+    point_id: str
+    nodes: list[TraversalNode]  # 不含起点，按层级排序
+
+
+class NeighborhoodResponse(TraversalResponse):
+    links: list[LinkResponse]  # 邻域内（含起点）的全部链接
+
+
+class PathResponse(BaseModel):
+    found: bool
+    length: Optional[int] = None  # 路径步数
+    nodes: list[TraversalNode]  # 从起点到终点依次排列，depth 即序号
+    links: list[LinkResponse]
+
+
 # ==================== 快照 ====================
 
 class SnapshotResponse(BaseModel):
@@ -169,10 +259,45 @@ class SnapshotResponse(BaseModel):
         from_attributes = True
 
 
+class LibrarySnapshotResponse(SnapshotResponse):
+    point_title: str  # 知识点当前的标题（快照的 title 为当时的标题）
+
+
 class RestoreRequest(BaseModel):
     snapshot_id: str
 
 
+class LibraryRestorePoint(BaseModel):
+    id: str
+    title: str  # 恢复后的标题
+    fields: list[str]  # 有变化的字段：title / content / source / page
+    snapshot_id: str  # 恢复所依据的快照
+
+
+class LibraryRestoreDeleted(BaseModel):
+    id: str
+    title: str  # 删除前的当前标题
+
+
+class LibraryRestoreLink(BaseModel):
+    id: Optional[str] = None  # 新建的链接在写入前没有 ID
+    from_id: str
+    to_id: str
+    type: str
+
+
+class LibraryRestoreResponse(BaseModel):
+    at: datetime
+    dry_run: bool
+    revision: Optional[int] = None  # 写入后的知识库修订号（预览或没有变化时为空）
+    updated: list[LibraryRestorePoint]
+    deleted: list[LibraryRestoreDeleted]  # at 之后创建的知识点
+    unchanged: int
+    untracked: int  # at 之前已存在、但没有更早快照（已被清理）的知识点，保持不变
+    links_added: list[LibraryRestoreLink]
+    links_removed: list[LibraryRestoreLink]
+
+
 # ==================== 词频统计 ====================
 
 class WordFrequency(BaseModel):
@@ -194,20 +319,82 @@ class ExportRequest(BaseModel):
 
 class BatchExportRequest(BaseModel):
     library_ids: list[str] = Field(default_factory=list)  # 空列表表示导出所有知识库
+    format: str = Field(default="json", pattern="^(json|zip)$")  # json: 单个 JSON 文档; zip: 每库一个 NDJSON
+    include_snapshots: bool = False  # 仅 zip 格式：附带版本快照
+
+
+# ==================== 视口查询 ====================
+
+class ViewportPoint(BaseModel):
+    id: str
+    title: str
+    x: float
+    y: float
+    tags: list[TagResponse] = []
+
+
+class PointCluster(BaseModel):
+    """网格聚合：质心、数量、范围以及出现最多的标签"""
+    x: float
+    y: float
+    count: int
+    tag: Optional[str] = None
+    color: Optional[str] = None
+    min_x: float
+    min_y: float
+    max_x: float
+    max_y: float
+
+
+class ViewportResponse(BaseModel):
+    mode: str  # points: 单个节点；clusters: 网格聚合
+    points: list[ViewportPoint] = []
+    links: list[LinkResponse] = []
+    clusters: list[PointCluster] = []
+
+
+# ==================== 增量同步 ====================
+
+class LibraryChangesResponse(BaseModel):
+    """since 修订号之后的变更；reset 为 true 时无法提供增量，需要整库重新加载"""
+    revision: int
+    since: int
+    reset: bool = False
+    library: bool = False  # 知识库名称、标签或出处有变化
+    points: list[PointResponse] = []
+    links: list[LinkResponse] = []
+    deleted_points: list[str] = []
+    deleted_links: list[str] = []
 
 
 # ==================== 全局统计与搜索 ====================
 
+class GraphCacheStatsResponse(BaseModel):
+    libraries: int  # 当前缓存的知识库数
+    max_libraries: int
+    nodes: int
+    links: int
+    hits: int
+    misses: int  # 未命中（从数据库载入）次数
+    rebuilds: int  # 构建 CSR 邻接的次数（载入时一次，之后每次修补后的首次查询一次）
+    patches: int  # 提交后修补已缓存图的次数
+    invalidations: int
+    evictions: int
+
+
 class GlobalStatsResponse(BaseModel):
     total_libraries: int
     total_points: int
     total_links: int
+    total_snapshots: int = 0
 
 
 class SearchResultLibrary(BaseModel):
     id: str
     name: str
     description: Optional[str] = None
+    highlight: Optional[str] = None  # 名称高亮（HTML 已转义，命中词以 <mark> 包裹）
+    score: Optional[float] = None  # BM25 分数，越小越相关
 
 
 class SearchResultPoint(BaseModel):
@@ -215,8 +402,48 @@ class SearchResultPoint(BaseModel):
     title: str
     library_id: str
     library_name: str
+    highlight: Optional[str] = None  # 标题高亮
+    snippet: Optional[str] = None  # 内容摘要高亮
+    score: Optional[float] = None
 
 
 class GlobalSearchResponse(BaseModel):
     libraries: list[SearchResultLibrary]
     points: list[SearchResultPoint]
+    has_more: bool = False  # 知识点结果是否还有下一页
+
+
+# ==================== 维护 ====================
+
+class MaintenanceRunResponse(BaseModel):
+    id: int
+    trigger: str  # schedule / manual
+    started_at: datetime
+    elapsed_ms: float
+    snapshots_deleted: int
+    pages_before: int
+    pages_after: int
+    pages_freed: int
+    freelist_after: int  # 仍未归还的空闲页（auto_vacuum 未切换为 INCREMENTAL 时不会减少）
+    wal_pages: int  # 检查点前 WAL 中的页数
+    vacuum: str  # none / incremental / full
+    error: Optional[str] = None
+
+
+class LibraryCounts(BaseModel):
+    id: str
+    point_count: int
+    link_count: int
+    snapshot_count: int
+
+
+class GlobalCounts(BaseModel):
+    library_count: int
+    point_count: int
+    link_count: int
+    snapshot_count: int
+
+
+class CounterRepairResponse(BaseModel):
+    libraries: list[LibraryCounts] = []  # 计数有偏差并已修正的知识库（修正后的值）
+    global_counts: Optional[GlobalCounts] = None  # 全局计数有偏差时为修正后的值
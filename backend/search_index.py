@@ -0,0 +1,297 @@
+"""
+全文检索索引 - SQLite FTS5 + jieba 预分词
+
+FTS5 自带的 unicode61 分词器无法切分中文，因此写入前先用 jieba 分词，
+词与词之间以不可见分隔符 U+2063 连接（unicode61 将其视为分隔符），
+读取高亮结果时再去掉分隔符即可还原原文。
+
+search_docs 记录每个被索引对象（知识库 / 知识点）与 FTS 行号的对应关系，
+search_fts 的三列分别是：标题、正文（精确分词）、检索词（搜索引擎模式分词，
+包含“人工智能”中的“人工”“智能”等子词，提高前缀输入时的召回率）。
+"""
+import html
+from typing import Iterable, Optional, Union
+
+from sqlalchemy import Connection, bindparam, text
+from sqlalchemy.orm import Session
+
+from . import tokenizer
+
+SEPARATOR = "\u2063"
+# 高亮标记先用私有区字符占位，转义 HTML 后再替换为 <mark>
+_MARK_OPEN = "\ue000"
+_MARK_CLOSE = "\ue001"
+_CHUNK = 500
+
+Executor = Union[Session, Connection]
+
+CREATE_STATEMENTS = [
+    "CREATE TABLE IF NOT EXISTS search_docs ("
+    " doc_id INTEGER PRIMARY KEY,"
+    " kind TEXT NOT NULL,"
+    " ref_id TEXT NOT NULL,"
+    " library_id TEXT NOT NULL,"
+    " UNIQUE (kind, ref_id))",
+    "CREATE INDEX IF NOT EXISTS ix_search_docs_library_id ON search_docs (library_id, kind)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5("
+    "title, body, terms, tokenize = 'unicode61 remove_diacritics 2')",
+]
+
+
+# ==================== 分词 ====================
+
+def _segment_docs(values: list[Optional[str]]) -> tuple[list[str], list[str]]:
+    """批量分词：返回（精确分词并以分隔符连接的文本, 搜索引擎模式检索词）"""
+    exact = tokenizer.segment_many(values, mode="exact")
+    return (
+        [SEPARATOR.join(tokens) for tokens in exact],
+        [" ".join(tokenizer.expand_for_search(tokens)) for tokens in exact],
+    )
+
+
+def _unsegment(value: Optional[str]) -> str:
+    return (value or "").replace(SEPARATOR, "")
+
+
+def _render_highlight(value: Optional[str]) -> str:
+    """去除分隔符、转义 HTML，再把占位符替换为 <mark>"""
+    escaped = html.escape(_unsegment(value))
+    return escaped.replace(_MARK_OPEN, "<mark>").replace(_MARK_CLOSE, "</mark>")
+
+
+def build_match_query(query: str) -> Optional[str]:
+    """把用户输入转换为 FTS5 MATCH 表达式：各词 AND，最后一个词按前缀匹配"""
+    tokens = [t.strip() for t in tokenizer.segment(query)]
+    tokens = [t for t in tokens if any(ch.isalnum() for ch in t)]
+    if not tokens:
+        return None
+    phrases = ['"' + t.replace('"', '""') + '"' for t in tokens]
+    phrases[-1] += "*"
+    return " ".join(phrases)
+
+
+# ==================== 写入 ====================
+
+def _upsert_docs(db: Executor, kind: str, docs: list[dict]):
+    """docs: [{"ref_id", "library_id", "title", "body"}]"""
+    if not docs:
+        return
+    db.execute(
+        text(
+            "INSERT INTO search_docs (kind, ref_id, library_id) VALUES (:kind, :ref_id, :library_id) "
+            "ON CONFLICT (kind, ref_id) DO UPDATE SET library_id = excluded.library_id"
+        ),
+        [{"kind": kind, "ref_id": d["ref_id"], "library_id": d["library_id"]} for d in docs]
+    )
+    # 标题和正文一起批量分词，大批量（导入、重建）时由进程池并行处理
+    segmented, terms = _segment_docs(
+        [d["title"] for d in docs] + [d["body"] for d in docs]
+    )
+    for i, d in enumerate(docs):
+        d["title_seg"], d["body_seg"] = segmented[i], segmented[len(docs) + i]
+        d["terms"] = f"{terms[i]} {terms[len(docs) + i]}"
+
+    for start in range(0, len(docs), _CHUNK):
+        chunk = docs[start:start + _CHUNK]
+        doc_ids = dict(db.execute(
+            text(
+                "SELECT ref_id, doc_id FROM search_docs WHERE kind = :kind AND ref_id IN :ref_ids"
+            ).bindparams(bindparam("ref_ids", expanding=True)),
+            {"kind": kind, "ref_ids": [d["ref_id"] for d in chunk]}
+        ).all())
+        db.execute(
+            text("DELETE FROM search_fts WHERE rowid = :doc_id"),
+            [{"doc_id": doc_ids[d["ref_id"]]} for d in chunk]
+        )
+        db.execute(
+            text("INSERT INTO search_fts (rowid, title, body, terms) VALUES (:doc_id, :title, :body, :terms)"),
+            [
+                {
+                    "doc_id": doc_ids[d["ref_id"]],
+                    "title": d["title_seg"],
+                    "body": d["body_seg"],
+                    "terms": d["terms"],
+                }
+                for d in chunk
+            ]
+        )
+
+
+def index_points(db: Executor, points: Iterable):
+    """索引（或重新索引）知识点；points 可以是 Point 对象或含相同字段的行"""
+    _upsert_docs(db, "point", [
+        {"ref_id": p.id, "library_id": p.library_id, "title": p.title, "body": p.content}
+        for p in points
+    ])
+
+
+def index_library(db: Executor, library):
+    """索引（或重新索引）知识库名称与描述"""
+    _upsert_docs(db, "library", [
+        {"ref_id": library.id, "library_id": library.id,
+         "title": library.name, "body": library.description}
+    ])
+
+
+def _delete_docs(db: Executor, where: str, params: dict, *expanding: str):
+    binds = [bindparam(name, expanding=True) for name in expanding]
+    db.execute(
+        text(f"DELETE FROM search_fts WHERE rowid IN (SELECT doc_id FROM search_docs WHERE {where})")
+        .bindparams(*binds),
+        params
+    )
+    db.execute(text(f"DELETE FROM search_docs WHERE {where}").bindparams(*binds), params)
+
+
+def remove_points(db: Executor, point_ids: list[str]):
+    """从索引中移除知识点"""
+    for start in range(0, len(point_ids), _CHUNK):
+        _delete_docs(
+            db, "kind = 'point' AND ref_id IN :ref_ids",
+            {"ref_ids": point_ids[start:start + _CHUNK]}, "ref_ids"
+        )
+
+
+def remove_library(db: Executor, library_id: str):
+    """从索引中移除知识库及其全部知识点"""
+    _delete_docs(db, "library_id = :library_id", {"library_id": library_id})
+
+
+def rebuild(conn: Executor, library_id: Optional[str] = None):
+    """清空并重建索引（全部或单个知识库）"""
+    if library_id:
+        remove_library(conn, library_id)
+        libraries = conn.execute(
+            text("SELECT id, name, description FROM libraries WHERE id = :library_id"),
+            {"library_id": library_id}
+        ).all()
+    else:
+        conn.execute(text("DELETE FROM search_fts"))
+        conn.execute(text("DELETE FROM search_docs"))
+        libraries = conn.execute(text("SELECT id, name, description FROM libraries")).all()
+    for library in libraries:
+        index_library(conn, library)
+
+    where = "AND library_id = :library_id" if library_id else ""
+    last_id = ""
+    while True:
+        rows = conn.execute(
+            text(
+                f"SELECT id, library_id, title, content FROM points WHERE id > :last_id {where} "
+                "ORDER BY id LIMIT :limit"
+            ),
+            {"last_id": last_id, "limit": tokenizer.REBUILD_BATCH, "library_id": library_id}
+        ).all()
+        if not rows:
+            break
+        index_points(conn, rows)
+        last_id = rows[-1].id
+
+
+# ==================== 查询 ====================
+
+def _substring_points(db: Executor, query: str, library_id: str, exclude: list[str], limit: int) -> list[dict]:
+    """单个知识库内按子串匹配标题 / 正文（FTS 按词匹配，“同”查不到“合同”），排在 BM25 结果之后"""
+    needle = query.lower()
+    rows = db.execute(
+        text(
+            "SELECT p.id, p.title, p.content, l.name AS library_name FROM points p"
+            " LEFT JOIN libraries l ON l.id = p.library_id"
+            " WHERE p.library_id = :library_id AND p.id NOT IN :exclude"
+            " AND (instr(lower(p.title), :needle) > 0 OR instr(lower(COALESCE(p.content, '')), :needle) > 0)"
+            " ORDER BY p.created_at, p.id LIMIT :limit"
+        ).bindparams(bindparam("exclude", expanding=True)),
+        {"library_id": library_id, "exclude": exclude, "needle": needle, "limit": limit}
+    ).all()
+    points = []
+    for row in rows:
+        content = row.content or ""
+        at = content.lower().find(needle)
+        snippet = None
+        if at >= 0:
+            end = at + len(needle)
+            snippet = _render_highlight(
+                content[max(at - 24, 0):at] + _MARK_OPEN + content[at:end] + _MARK_CLOSE + content[end:end + 24]
+            )
+        points.append({
+            "id": row.id,
+            "title": row.title,
+            "library_id": library_id,
+            "library_name": row.library_name or "Unknown",
+            "highlight": html.escape(row.title),
+            "snippet": snippet,
+            "score": None,
+        })
+    return points
+
+
+def search(db: Executor, query: str, limit: int = 20, offset: int = 0,
+           library_limit: int = 10, library_id: Optional[str] = None) -> dict:
+    """BM25 排序的全局检索，返回带高亮的知识库与知识点结果
+
+    指定 library_id 时只在该知识库内检索（在 search_docs.library_id 上过滤），
+    第一页结果不足 limit 条时再补充子串匹配的知识点。
+    """
+    match = build_match_query(query)
+    if match is None and not library_id:
+        return {"libraries": [], "points": [], "has_more": False}
+
+    libraries, points, has_more = [], [], False
+    if match is not None:
+        libraries, points, has_more = _search_fts(db, match, limit, offset, library_limit, library_id)
+    if library_id and offset == 0 and not has_more:
+        # 多取一条用于判断是否还有下一页
+        extra = _substring_points(db, query.strip(), library_id, [p["id"] for p in points],
+                                  limit - len(points) + 1)
+        has_more = len(points) + len(extra) > limit
+        points += extra[:limit - len(points)]
+    return {"libraries": libraries, "points": points, "has_more": has_more}
+
+
+def _search_fts(db: Executor, match: str, limit: int, offset: int, library_limit: int,
+                library_id: Optional[str]) -> tuple[list, list, bool]:
+    """FTS5 检索，返回（知识库结果, 知识点结果, 知识点是否还有下一页）"""
+    scope = " AND d.library_id = :library_id" if library_id else ""
+    sql = text(
+        "SELECT d.ref_id, d.library_id, l.name AS library_name, l.description AS library_description,"
+        " search_fts.title AS title,"
+        " highlight(search_fts, 0, :open, :close) AS title_highlight,"
+        " snippet(search_fts, 1, :open, :close, '…', 24) AS snippet,"
+        " bm25(search_fts, 10.0, 1.0, 0.5) AS score"
+        " FROM search_fts"
+        " JOIN search_docs d ON d.doc_id = search_fts.rowid"
+        " LEFT JOIN libraries l ON l.id = d.library_id"
+        f" WHERE search_fts MATCH :match AND d.kind = :kind{scope}"
+        " ORDER BY score LIMIT :limit OFFSET :offset"
+    )
+    params = {"open": _MARK_OPEN, "close": _MARK_CLOSE, "match": match, "library_id": library_id}
+
+    libraries = []
+    if offset == 0:
+        rows = db.execute(sql, {**params, "kind": "library", "limit": library_limit, "offset": 0}).all()
+        libraries = [
+            {
+                "id": row.ref_id,
+                "name": row.library_name or _unsegment(row.title),
+                "description": row.library_description,
+                "highlight": _render_highlight(row.title_highlight),
+                "score": row.score,
+            }
+            for row in rows
+        ]
+
+    # 多取一条用于判断是否还有下一页
+    rows = db.execute(sql, {**params, "kind": "point", "limit": limit + 1, "offset": offset}).all()
+    points = [
+        {
+            "id": row.ref_id,
+            "title": _unsegment(row.title),
+            "library_id": row.library_id,
+            "library_name": row.library_name or "Unknown",
+            "highlight": _render_highlight(row.title_highlight),
+            "snippet": _render_highlight(row.snippet),
+            "score": row.score,
+        }
+        for row in rows[:limit]
+    ]
+    return libraries, points, len(rows) > limit
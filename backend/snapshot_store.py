@@ -0,0 +1,318 @@
+"""
+快照存储 - 关键帧 + 差异，zlib 压缩，按内容哈希去重
+
+快照行中 title 以明文保存（历史列表直接显示），其余部分组成“文档”
+{content, source, page, links}，按以下三种方式之一保存：
+
+- FULL（关键帧）：整个文档的 JSON，zlib 压缩；
+- DELTA：相对基准快照（同一知识点最近写入的版本）的差异，同样压缩。content 只记录
+  与基准的公共前缀长度、公共后缀长度和中间被替换成的文本，其余字段变化时记录新值；
+- REF：文档与本知识点某个已有快照完全相同（doc_hash 相同），不存数据，base_id 指向它。
+
+depth 是重建该版本要应用的差异个数：DELTA 为基准的 depth + 1，达到 KEYFRAME_INTERVAL
+或差异不比全文小多少时改存关键帧，所以任意版本最多经过 KEYFRAME_INTERVAL - 1 个差异
+即可重建；链上的行用一个递归 CTE 读出。
+
+基准和引用目标都是同一知识点的快照，删除知识点时整条链一起删除；
+单独删除快照（remove，如保留期清理）时，以它为基准的版本改存为关键帧，
+其后版本的 depth 仍按原链计算，只会偏大（提前写入下一个关键帧）。
+"""
+import hashlib
+import json
+import zlib
+from typing import Iterable, Optional, Union
+
+from sqlalchemy import Connection, insert, text
+from sqlalchemy.orm import Session
+
+from .models import Snapshot
+
+Executor = Union[Session, Connection]
+
+FULL, DELTA, REF = 0, 1, 2
+DOC_FIELDS = ("content", "source", "page", "links")
+
+# 每隔多少个版本存一个关键帧（重建任意版本最多应用 KEYFRAME_INTERVAL - 1 个差异）
+KEYFRAME_INTERVAL = 16
+# 差异超过全文的这个比例时直接存关键帧
+DELTA_RATIO = 0.5
+COMPRESS_LEVEL = 6
+
+_CHAIN_SQL = text(
+    "WITH RECURSIVE chain(id, kind, base_id, payload) AS ("
+    " SELECT id, kind, base_id, payload FROM snapshots WHERE id IN (SELECT value FROM json_each(:ids))"
+    " UNION"
+    " SELECT s.id, s.kind, s.base_id, s.payload FROM snapshots s JOIN chain c ON s.id = c.base_id"
+    " WHERE c.kind != 0"
+    ") SELECT id, kind, base_id, payload FROM chain"
+)
+# 各知识点最近写入的快照（rowid 最大）
+_LATEST_SQL = text(
+    "SELECT point_id, id, kind, base_id, depth, payload FROM snapshots WHERE rowid IN ("
+    " SELECT MAX(rowid) FROM snapshots WHERE point_id IN (SELECT value FROM json_each(:ids)) GROUP BY point_id)"
+)
+_SAME_DOC_SQL = text(
+    "SELECT s.point_id, s.doc_hash, s.id, s.kind, s.base_id, s.depth FROM json_each(:pairs) j"
+    " JOIN snapshots s ON s.point_id = json_extract(j.value, '$[0]') AND s.doc_hash = json_extract(j.value, '$[1]')"
+)
+
+
+def _dumps(data) -> bytes:
+    return json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def document(row) -> dict:
+    """从快照字段（dict）中取出文档部分"""
+    return {name: row.get(name) for name in DOC_FIELDS}
+
+
+def doc_hash(doc: dict) -> str:
+    return hashlib.blake2b(_dumps(doc), digest_size=16).hexdigest()
+
+
+# ==================== 差异 ====================
+
+def _common_prefix(a: str, b: str, limit: int) -> int:
+    # 二分比较切片（C 实现的比较），不逐字符循环
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _common_suffix(a: str, b: str, limit: int) -> int:
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[len(a) - mid:] == b[len(b) - mid:]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def diff(base: dict, doc: dict) -> dict:
+    """doc 相对 base 的差异：{"content": [前缀长度, 后缀长度, 中间文本], "fields": {变化的其他字段}}"""
+    delta = {}
+    old, new = base["content"], doc["content"]
+    if old != new:
+        if isinstance(old, str) and isinstance(new, str):
+            prefix = _common_prefix(old, new, min(len(old), len(new)))
+            suffix = _common_suffix(old, new, min(len(old), len(new)) - prefix)
+            delta["content"] = [prefix, suffix, new[prefix:len(new) - suffix]]
+        else:
+            delta["fields"] = {"content": new}
+    changed = {name: doc[name] for name in DOC_FIELDS[1:] if doc[name] != base[name]}
+    if changed:
+        delta.setdefault("fields", {}).update(changed)
+    return delta
+
+
+def apply(base: dict, delta: dict) -> dict:
+    doc = dict(base)
+    if "content" in delta:
+        prefix, suffix, middle = delta["content"]
+        old = base["content"]
+        doc["content"] = old[:prefix] + middle + old[len(old) - suffix:]
+    doc.update(delta.get("fields", {}))
+    return doc
+
+
+# ==================== 编码 ====================
+
+class Encoder:
+    """按写入顺序为快照选择存储方式；记住每个知识点最近的版本和已有的文档哈希"""
+
+    def __init__(self):
+        self.latest: dict[str, tuple[str, int, dict]] = {}  # point_id -> (基准 ID, depth, 文档)
+        self.seen: dict[tuple[str, str], tuple[str, int]] = {}  # (point_id, 哈希) -> (快照 ID, depth)
+
+    def encode(self, row: dict) -> dict:
+        """row 含 id / point_id / library_id / title / timestamp 与文档字段，返回要插入 snapshots 的行"""
+        point_id, doc = row["point_id"], document(row)
+        digest = doc_hash(doc)
+        stored = {"id": row["id"], "point_id": point_id, "library_id": row["library_id"], "title": row["title"],
+                  "timestamp": row["timestamp"], "doc_hash": digest}
+
+        same = self.seen.get((point_id, digest))
+        if same is not None:
+            target, depth = same
+            stored.update(kind=REF, base_id=target, depth=depth, payload=None)
+            self.latest[point_id] = (target, depth, doc)
+            return stored
+
+        full = _dumps(doc)
+        base = self.latest.get(point_id)
+        if base is not None and base[1] + 1 < KEYFRAME_INTERVAL:
+            delta = _dumps(diff(base[2], doc))
+            if len(delta) < len(full) * DELTA_RATIO:
+                stored.update(kind=DELTA, base_id=base[0], depth=base[1] + 1,
+                              payload=zlib.compress(delta, COMPRESS_LEVEL))
+        if "kind" not in stored:
+            stored.update(kind=FULL, base_id=None, depth=0, payload=zlib.compress(full, COMPRESS_LEVEL))
+        self.latest[point_id] = (row["id"], stored["depth"], doc)
+        self.seen[(point_id, digest)] = (row["id"], stored["depth"])
+        return stored
+
+    def forget(self, point_id: str):
+        """丢弃某个知识点的状态（按知识点顺序批量转换时控制内存）"""
+        self.latest.pop(point_id, None)
+        self.seen = {key: value for key, value in self.seen.items() if key[0] != point_id}
+
+
+def add(db: Executor, rows: list[dict]):
+    """写入快照：rows 含 id / point_id / library_id / title / timestamp 与 content / source / page / links，
+    按顺序作为各知识点最新的版本（同一知识点可有多行）"""
+    if not rows:
+        return
+    encoder = Encoder()
+    point_ids = list(dict.fromkeys(row["point_id"] for row in rows))
+    latest = db.execute(_LATEST_SQL, {"ids": json.dumps(point_ids)}).all()
+    if latest:
+        # 已有历史的知识点：载入最近版本作为差异基准，并查出文档相同的已有快照
+        docs = documents(db, latest)
+        for point_id, snapshot_id, kind, base_id, depth, _ in latest:
+            encoder.latest[point_id] = (base_id if kind == REF else snapshot_id, depth, docs[snapshot_id])
+        pairs = [[row["point_id"], doc_hash(document(row))] for row in rows if row["point_id"] in encoder.latest]
+        for point_id, digest, snapshot_id, kind, base_id, depth in db.execute(
+            _SAME_DOC_SQL, {"pairs": json.dumps(pairs)}
+        ):
+            encoder.seen.setdefault((point_id, digest), (base_id if kind == REF else snapshot_id, depth))
+    db.execute(insert(Snapshot.__table__), [encoder.encode(row) for row in rows])
+
+
+def keyframe(doc: dict) -> tuple[str, bytes]:
+    """单独编码一个关键帧，返回 (doc_hash, payload)，供原生 SQL 批量写入使用"""
+    return doc_hash(doc), zlib.compress(_dumps(doc), COMPRESS_LEVEL)
+
+
+# ==================== 解码 ====================
+
+def documents(db: Executor, rows: Iterable) -> dict[str, dict]:
+    """解码快照文档：rows 为带 id / kind / base_id / payload 属性的行，返回 {id: 文档}
+
+    rows 之外的基准用一个递归 CTE 补齐；同一条链上的版本只解码一次。
+    """
+    rows = list(rows)
+    known = {row.id: (row.kind, row.base_id, row.payload) for row in rows}
+    missing = {base for kind, base, _ in known.values() if kind != FULL and base not in known}
+    if missing:
+        for row in db.execute(_CHAIN_SQL, {"ids": json.dumps(sorted(missing))}):
+            known.setdefault(row.id, (row.kind, row.base_id, row.payload))
+
+    docs: dict[str, dict] = {}
+
+    def resolve(snapshot_id: str) -> dict:
+        # 沿 base_id 找到已解码的版本或关键帧，再依次向回应用差异
+        stack, current = [], snapshot_id
+        while current not in docs:
+            kind, base_id, payload = known[current]
+            if kind == FULL:
+                docs[current] = json.loads(zlib.decompress(payload))
+                break
+            stack.append(current)
+            current = base_id
+        for pending in reversed(stack):
+            kind, base_id, payload = known[pending]
+            base = docs[base_id]
+            docs[pending] = base if kind == REF else apply(base, json.loads(zlib.decompress(payload)))
+        return docs[snapshot_id]
+
+    return {row.id: resolve(row.id) for row in rows}
+
+
+def load(db: Executor, snapshot_id: str) -> Optional[dict]:
+    """读取单个快照的全部字段（含文档）；不存在时返回 None"""
+    row = db.execute(
+        text("SELECT id, point_id, title, timestamp, kind, base_id, payload FROM snapshots WHERE id = :id"),
+        {"id": snapshot_id}
+    ).first()
+    if row is None:
+        return None
+    return {"id": row.id, "point_id": row.point_id, "title": row.title, **documents(db, [row])[row.id]}
+
+
+# ==================== 删除 ====================
+
+def remove(db: Executor, snapshot_ids: list[str]) -> int:
+    """删除快照，返回删除的行数
+
+    以被删快照为基准的其余快照改存为关键帧；引用同一被删快照的多个 REF
+    只有第一个改存关键帧，其余改为引用它。
+    """
+    if not snapshot_ids:
+        return 0
+    ids = json.dumps(snapshot_ids)
+    dependents = db.execute(text(
+        "SELECT id, kind, base_id, payload FROM snapshots"
+        " WHERE base_id IN (SELECT value FROM json_each(:ids)) AND id NOT IN (SELECT value FROM json_each(:ids))"
+        " ORDER BY rowid"
+    ), {"ids": ids}).all()
+    docs = documents(db, dependents)
+    promoted: dict[str, str] = {}  # 被删快照 -> 接替它的关键帧
+    updates = []
+    for row in dependents:
+        if row.kind == REF and row.base_id in promoted:
+            updates.append({"id": row.id, "kind": REF, "base_id": promoted[row.base_id], "payload": None})
+            continue
+        updates.append({"id": row.id, "kind": FULL, "base_id": None,
+                        "payload": zlib.compress(_dumps(docs[row.id]), COMPRESS_LEVEL)})
+        if row.kind == REF:
+            promoted[row.base_id] = row.id
+    if updates:
+        db.execute(
+            text("UPDATE snapshots SET kind = :kind, base_id = :base_id, depth = 0, payload = :payload WHERE id = :id"),
+            updates
+        )
+    return db.execute(
+        text("DELETE FROM snapshots WHERE id IN (SELECT value FROM json_each(:ids))"), {"ids": ids}
+    ).rowcount
+
+
+# ==================== 迁移 ====================
+
+def convert_legacy(conn: Connection, batch: int = 1000) -> int:
+    """把旧结构（每行完整保存 content / source / page / links）的 snapshots 表转换为新结构，返回行数"""
+    conn.exec_driver_sql("ALTER TABLE snapshots RENAME TO snapshots_legacy")
+    conn.exec_driver_sql("DROP INDEX IF EXISTS ix_snapshots_point_timestamp")
+    Snapshot.__table__.create(conn)
+
+    encoder, current, pending, count = Encoder(), None, [], 0
+    # 知识点已不存在的孤立快照（未开启外键约束时删除知识点遗留的）不再转换
+    result = conn.exec_driver_sql(
+        "SELECT s.id, s.point_id, p.library_id, s.title, s.content, s.source, s.page, s.links, s.timestamp"
+        " FROM snapshots_legacy s JOIN points p ON p.id = s.point_id"
+        " ORDER BY s.point_id, s.timestamp, s.rowid"
+    )
+    for snapshot_id, point_id, library_id, title, content, source, page, links, timestamp in result:
+        if point_id != current:
+            if current is not None:
+                encoder.forget(current)
+            current = point_id
+        pending.append(encoder.encode({
+            "id": snapshot_id, "point_id": point_id, "library_id": library_id, "title": title, "timestamp": timestamp,
+            "content": content, "source": source, "page": page,
+            "links": json.loads(links) if links else None,
+        }))
+        if len(pending) >= batch:
+            count += _insert_raw(conn, pending)
+            pending = []
+    count += _insert_raw(conn, pending)
+    conn.exec_driver_sql("DROP TABLE snapshots_legacy")
+    return count
+
+
+def _insert_raw(conn: Connection, rows: list[dict]) -> int:
+    # 时间戳保持旧表中的原始字符串，不经过 DateTime 类型转换
+    if rows:
+        conn.exec_driver_sql(
+            "INSERT INTO snapshots (id, point_id, library_id, title, timestamp, kind, base_id, depth, doc_hash,"
+            " payload) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(r["id"], r["point_id"], r["library_id"], r["title"], r["timestamp"], r["kind"], r["base_id"],
+              r["depth"], r["doc_hash"], r["payload"]) for r in rows]
+        )
+    return len(rows)
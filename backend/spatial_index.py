@@ -0,0 +1,281 @@
+"""
+空间索引 - SQLite R*Tree 镜像知识点坐标，外加增量维护的网格聚合，供视口查询使用
+
+R*Tree 只接受整数主键，而知识点 ID 是字符串（points 的隐式 rowid 在 VACUUM 后
+可能变化，不能直接使用），因此用 spatial_points 为每个知识点分配稳定的整数 rid，
+spatial_libraries 同样为知识库分配整数编号。point_rtree 是三维的：
+(知识库编号, x, y)，知识库维度上 min = max = 编号，这样视口查询只会命中
+当前库的节点，多个库的坐标范围重叠也互不影响。
+
+缩小视图时需要的是聚合而不是节点。现场对视口内几十万个点分组要秒级时间，
+所以另外维护边长 BASE_CELL 的基础网格：spatial_cells 记录每格的点数与坐标和，
+spatial_cell_tags 记录每格各标签的点数。查询时只读取视口内的基础格，
+再在 Python 中合并为边长 BASE_CELL × 2^k 的粗网格，开销与格子数而不是点数成正比。
+
+所有表都由 points / point_tags / libraries 上的触发器维护，ORM、Core 批量写入、
+导入、布局回写等写入路径都会自动同步。删除知识点时，points 与 point_tags 的
+触发器无论谁先执行，标签计数都只会扣减一次（后执行的一方找不到对应行）。
+R*Tree 以 32 位浮点保存坐标（向外取整），作为视口过滤足够精确。
+"""
+import json
+import math
+from typing import Optional, Union
+
+from sqlalchemy import Connection, text
+from sqlalchemy.orm import Session
+
+Executor = Union[Session, Connection]
+
+# 基础网格边长（世界坐标）
+BASE_CELL = 256
+# 缩放比例低于该值时返回网格聚合而不是单个节点
+CLUSTER_ZOOM = 0.35
+# 聚合网格在屏幕上的目标边长（像素），实际边长取最接近的 BASE_CELL × 2^k
+CLUSTER_CELL_PIXELS = 80
+# 视口内节点数超过该值时即使放大也改为返回聚合
+MAX_VIEWPORT_POINTS = 3000
+# 格子编号的上限（远小于 SQLite INTEGER 的 2^63，超出的坐标按边界处理）
+_MAX_CELL = 2 ** 53
+_MAX_COORD = float(_MAX_CELL * BASE_CELL)
+
+# 触发器中按 new / old 行查找 rid 与知识库编号
+_RID = "(SELECT rid FROM spatial_points WHERE point_id = {row}.id)"
+_LIB = "(SELECT num FROM spatial_libraries WHERE library_id = {row}.library_id)"
+_NEW_X, _NEW_Y = "COALESCE(new.x, 0)", "COALESCE(new.y, 0)"
+
+
+def _floor(value: str) -> str:
+    """SQL 中的 floor(value / BASE_CELL)：CAST 向零取整，负数需要再减一"""
+    quotient = f"({value}) / {BASE_CELL}.0"
+    return f"(CAST({quotient} AS INTEGER) - ({quotient} < CAST({quotient} AS INTEGER)))"
+
+
+def _cell_delta(row: str, sign: str) -> list[str]:
+    """row（new / old）所在基础格的点数与坐标和加减一，以及该点各标签计数加减一"""
+    x, y = f"COALESCE({row}.x, 0)", f"COALESCE({row}.y, 0)"
+    cell = f"{_LIB.format(row=row)}, {_floor(x)}, {_floor(y)}"
+    where = f"lib = {_LIB.format(row=row)} AND gx = {_floor(x)} AND gy = {_floor(y)}"
+    if sign == "+":
+        return [
+            f"INSERT INTO spatial_cells (lib, gx, gy, count, sum_x, sum_y) VALUES ({cell}, 1, {x}, {y})"
+            f" ON CONFLICT (lib, gx, gy) DO UPDATE SET count = count + 1,"
+            f" sum_x = sum_x + excluded.sum_x, sum_y = sum_y + excluded.sum_y;",
+            f"INSERT INTO spatial_cell_tags (lib, gx, gy, tag_id, count)"
+            f" SELECT {cell}, tag_id, 1 FROM point_tags WHERE point_id = {row}.id AND true"
+            f" ON CONFLICT (lib, gx, gy, tag_id) DO UPDATE SET count = count + 1;",
+        ]
+    return [
+        f"UPDATE spatial_cells SET count = count - 1, sum_x = sum_x - {x}, sum_y = sum_y - {y} WHERE {where};",
+        f"DELETE FROM spatial_cells WHERE {where} AND count <= 0;",
+        f"UPDATE spatial_cell_tags SET count = count - 1 WHERE {where}"
+        f" AND tag_id IN (SELECT tag_id FROM point_tags WHERE point_id = {row}.id);",
+        f"DELETE FROM spatial_cell_tags WHERE {where} AND count <= 0;",
+    ]
+
+
+def _tag_delta(row: str, sign: str) -> list[str]:
+    """point_tags 行增删时，该知识点所在基础格的标签计数加减一（知识点已删除时跳过）"""
+    cell = f"SELECT s.lib, s.gx, s.gy FROM spatial_points s WHERE s.point_id = {row}.point_id"
+    if sign == "+":
+        return [
+            f"INSERT INTO spatial_cell_tags (lib, gx, gy, tag_id, count)"
+            f" SELECT s.lib, s.gx, s.gy, {row}.tag_id, 1 FROM spatial_points s WHERE s.point_id = {row}.point_id"
+            f" ON CONFLICT (lib, gx, gy, tag_id) DO UPDATE SET count = count + 1;",
+        ]
+    return [
+        f"UPDATE spatial_cell_tags SET count = count - 1"
+        f" WHERE (lib, gx, gy) IN ({cell}) AND tag_id = {row}.tag_id;",
+        f"DELETE FROM spatial_cell_tags WHERE (lib, gx, gy) IN ({cell}) AND tag_id = {row}.tag_id AND count <= 0;",
+    ]
+
+
+def _trigger(name: str, event: str, statements: list[str]) -> str:
+    return f"CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} BEGIN " + " ".join(statements) + " END"
+
+
+CREATE_STATEMENTS = [
+    "CREATE TABLE IF NOT EXISTS spatial_libraries ("
+    " num INTEGER PRIMARY KEY,"
+    " library_id TEXT NOT NULL UNIQUE)",
+    # gx / gy 为知识点当前所在的基础格，删除标签时据此定位
+    "CREATE TABLE IF NOT EXISTS spatial_points ("
+    " rid INTEGER PRIMARY KEY,"
+    " point_id TEXT NOT NULL UNIQUE,"
+    " lib INTEGER NOT NULL,"
+    " gx INTEGER NOT NULL,"
+    " gy INTEGER NOT NULL)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS point_rtree USING rtree("
+    "rid, min_lib, max_lib, min_x, max_x, min_y, max_y)",
+    "CREATE TABLE IF NOT EXISTS spatial_cells ("
+    " lib INTEGER NOT NULL, gx INTEGER NOT NULL, gy INTEGER NOT NULL,"
+    " count INTEGER NOT NULL, sum_x REAL NOT NULL, sum_y REAL NOT NULL,"
+    " PRIMARY KEY (lib, gx, gy)) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS spatial_cell_tags ("
+    " lib INTEGER NOT NULL, gx INTEGER NOT NULL, gy INTEGER NOT NULL, tag_id TEXT NOT NULL,"
+    " count INTEGER NOT NULL,"
+    " PRIMARY KEY (lib, gx, gy, tag_id)) WITHOUT ROWID",
+    _trigger("trg_points_spatial_insert", "INSERT ON points", [
+        "INSERT OR IGNORE INTO spatial_libraries (library_id) VALUES (new.library_id);",
+        f"INSERT OR REPLACE INTO spatial_points (point_id, lib, gx, gy)"
+        f" VALUES (new.id, {_LIB.format(row='new')}, {_floor(_NEW_X)}, {_floor(_NEW_Y)});",
+        f"INSERT OR REPLACE INTO point_rtree VALUES ({_RID.format(row='new')},"
+        f" {_LIB.format(row='new')}, {_LIB.format(row='new')}, {_NEW_X}, {_NEW_X}, {_NEW_Y}, {_NEW_Y});",
+        *_cell_delta("new", "+"),
+    ]),
+    _trigger("trg_points_spatial_move", "UPDATE OF x, y ON points", [
+        f"UPDATE point_rtree SET min_x = {_NEW_X}, max_x = {_NEW_X}, min_y = {_NEW_Y}, max_y = {_NEW_Y}"
+        f" WHERE rid = {_RID.format(row='new')};",
+        f"UPDATE spatial_points SET gx = {_floor(_NEW_X)}, gy = {_floor(_NEW_Y)} WHERE point_id = new.id;",
+        *_cell_delta("old", "-"),
+        *_cell_delta("new", "+"),
+    ]),
+    _trigger("trg_points_spatial_delete", "DELETE ON points", [
+        *_cell_delta("old", "-"),
+        f"DELETE FROM point_rtree WHERE rid = {_RID.format(row='old')};",
+        "DELETE FROM spatial_points WHERE point_id = old.id;",
+    ]),
+    _trigger("trg_point_tags_spatial_insert", "INSERT ON point_tags", _tag_delta("new", "+")),
+    _trigger("trg_point_tags_spatial_delete", "DELETE ON point_tags", _tag_delta("old", "-")),
+    _trigger("trg_libraries_spatial_delete", "DELETE ON libraries", [
+        "DELETE FROM spatial_cells WHERE lib = (SELECT num FROM spatial_libraries WHERE library_id = old.id);",
+        "DELETE FROM spatial_cell_tags WHERE lib = (SELECT num FROM spatial_libraries WHERE library_id = old.id);",
+        "DELETE FROM spatial_libraries WHERE library_id = old.id;",
+    ]),
+]
+
+# 视口条件：:lib 为知识库编号
+_IN_BBOX = (
+    "r.min_lib <= :lib AND r.max_lib >= :lib"
+    " AND r.max_x >= :min_x AND r.min_x <= :max_x AND r.max_y >= :min_y AND r.min_y <= :max_y"
+)
+_POINTS_SQL = text(
+    "SELECT p.id, p.title, p.x, p.y FROM point_rtree r"
+    " JOIN spatial_points s ON s.rid = r.rid"
+    " JOIN points p ON p.id = s.point_id"
+    f" WHERE {_IN_BBOX} LIMIT :limit"
+)
+_POINTS_BY_IDS_SQL = text(
+    "SELECT id, title, x, y FROM points WHERE id IN (SELECT value FROM json_each(:ids))"
+)
+_INCIDENT_LINKS_SQL = text(
+    "SELECT id, from_id, to_id, type, created_at FROM links"
+    " WHERE from_id IN (SELECT value FROM json_each(:ids))"
+    " UNION"
+    " SELECT id, from_id, to_id, type, created_at FROM links"
+    " WHERE to_id IN (SELECT value FROM json_each(:ids))"
+)
+_CELL_RANGE = "c.lib = :lib AND c.gx BETWEEN :min_gx AND :max_gx AND c.gy BETWEEN :min_gy AND :max_gy"
+_CELLS_SQL = text(f"SELECT c.gx, c.gy, c.count, c.sum_x, c.sum_y FROM spatial_cells c WHERE {_CELL_RANGE}")
+_CELL_TAGS_SQL = text(
+    "SELECT c.gx, c.gy, c.count, t.name, t.color FROM spatial_cell_tags c JOIN tags t ON t.id = c.tag_id"
+    f" WHERE {_CELL_RANGE}"
+)
+
+
+def rebuild(conn: Executor):
+    """清空并按 points / point_tags 表重建空间索引与网格聚合"""
+    for table in ("point_rtree", "spatial_points", "spatial_libraries", "spatial_cells", "spatial_cell_tags"):
+        conn.execute(text(f"DELETE FROM {table}"))
+    x, y = "COALESCE(p.x, 0)", "COALESCE(p.y, 0)"
+    conn.execute(text("INSERT INTO spatial_libraries (library_id) SELECT id FROM libraries"))
+    conn.execute(text(
+        f"INSERT INTO spatial_points (point_id, lib, gx, gy) SELECT p.id, l.num, {_floor(x)}, {_floor(y)}"
+        " FROM points p JOIN spatial_libraries l ON l.library_id = p.library_id"
+    ))
+    conn.execute(text(
+        f"INSERT INTO point_rtree SELECT s.rid, s.lib, s.lib, {x}, {x}, {y}, {y}"
+        " FROM points p JOIN spatial_points s ON s.point_id = p.id"
+    ))
+    conn.execute(text(
+        f"INSERT INTO spatial_cells SELECT s.lib, s.gx, s.gy, COUNT(*), SUM({x}), SUM({y})"
+        " FROM points p JOIN spatial_points s ON s.point_id = p.id GROUP BY s.lib, s.gx, s.gy"
+    ))
+    conn.execute(text(
+        "INSERT INTO spatial_cell_tags SELECT s.lib, s.gx, s.gy, pt.tag_id, COUNT(*)"
+        " FROM point_tags pt JOIN spatial_points s ON s.point_id = pt.point_id"
+        " GROUP BY s.lib, s.gx, s.gy, pt.tag_id"
+    ))
+
+
+def _cell_index(value: float) -> int:
+    """坐标所在的基础格编号，限制在 SQLite INTEGER 范围内（视口边界可能极大）"""
+    if value >= _MAX_COORD:
+        return _MAX_CELL
+    if value <= -_MAX_COORD:
+        return -_MAX_CELL
+    return math.floor(value / BASE_CELL)
+
+
+def _library_number(db: Executor, library_id: str) -> Optional[int]:
+    return db.execute(
+        text("SELECT num FROM spatial_libraries WHERE library_id = :library_id"), {"library_id": library_id}
+    ).scalar()
+
+
+def points_in_bbox(db: Executor, library_id: str, bbox: tuple[float, float, float, float],
+                   limit: int) -> list:
+    """视口内的知识点 (id, title, x, y)，最多 limit 个"""
+    lib = _library_number(db, library_id)
+    if lib is None:
+        return []  # 知识库还没有任何知识点
+    min_x, min_y, max_x, max_y = bbox
+    return db.execute(_POINTS_SQL, {
+        "lib": lib, "min_x": min_x, "min_y": min_y, "max_x": max_x, "max_y": max_y, "limit": limit
+    }).all()
+
+
+def points_by_ids(db: Executor, point_ids: list[str]) -> list:
+    if not point_ids:
+        return []
+    return db.execute(_POINTS_BY_IDS_SQL, {"ids": json.dumps(point_ids)}).all()
+
+
+def incident_links(db: Executor, point_ids: list[str]) -> list:
+    """至少一端在给定节点集合内的链接"""
+    if not point_ids:
+        return []
+    return db.execute(_INCIDENT_LINKS_SQL, {"ids": json.dumps(point_ids)}).all()
+
+
+def cluster_cell(zoom: float) -> int:
+    """缩放比例对应的聚合网格边长：最接近 CLUSTER_CELL_PIXELS / zoom 的 BASE_CELL × 2^k"""
+    factor = max(0, round(math.log2(CLUSTER_CELL_PIXELS / zoom / BASE_CELL)))
+    return BASE_CELL << factor
+
+
+def clusters(db: Executor, library_id: str, bbox: tuple[float, float, float, float], cell: int) -> list[dict]:
+    """视口内按 cell × cell 网格聚合：数量、质心、格子范围以及出现最多的标签及其颜色
+
+    cell 必须是 BASE_CELL 的 2^k 倍；网格与原点对齐，平移视口时聚合结果保持稳定。
+    """
+    lib = _library_number(db, library_id)
+    if lib is None:
+        return []
+    min_x, min_y, max_x, max_y = bbox
+    params = {
+        "lib": lib,
+        "min_gx": _cell_index(min_x), "max_gx": _cell_index(max_x),
+        "min_gy": _cell_index(min_y), "max_gy": _cell_index(max_y),
+    }
+    factor = cell // BASE_CELL
+
+    merged: dict[tuple[int, int], list] = {}
+    for gx, gy, count, sum_x, sum_y in db.execute(_CELLS_SQL, params):
+        entry = merged.setdefault((gx // factor, gy // factor), [0, 0.0, 0.0])
+        entry[0] += count
+        entry[1] += sum_x
+        entry[2] += sum_y
+    tag_counts: dict[tuple[int, int], dict[tuple[str, str], int]] = {}
+    for gx, gy, count, name, color in db.execute(_CELL_TAGS_SQL, params):
+        counts = tag_counts.setdefault((gx // factor, gy // factor), {})
+        counts[(name, color)] = counts.get((name, color), 0) + count
+
+    result = []
+    for (gx, gy), (count, sum_x, sum_y) in merged.items():
+        counts = tag_counts.get((gx, gy))
+        tag, color = max(counts, key=counts.get) if counts else (None, None)
+        result.append({
+            "x": sum_x / count, "y": sum_y / count, "count": count, "tag": tag, "color": color,
+            "min_x": gx * cell, "min_y": gy * cell, "max_x": (gx + 1) * cell, "max_y": (gy + 1) * cell,
+        })
+    return result
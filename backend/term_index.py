@@ -0,0 +1,145 @@
+"""
+词频索引 - 按知识点记录分词计数，并增量维护知识库汇总
+
+point_terms 保存每个知识点内容的 (词, 次数)，library_terms 是其按知识库的汇总。
+知识点写入时只计算该知识点的增量，词频接口只需一次带索引的 ORDER BY ... LIMIT。
+"""
+from collections import Counter
+from typing import Iterable, Optional, Union
+
+from sqlalchemy import Connection, bindparam, text
+from sqlalchemy.orm import Session
+
+from . import tokenizer
+
+Executor = Union[Session, Connection]
+
+_CHUNK = 500
+
+
+def _old_counts(db: Executor, point_ids: list[str]) -> list:
+    rows = []
+    for start in range(0, len(point_ids), _CHUNK):
+        rows.extend(db.execute(
+            text("SELECT library_id, term, count FROM point_terms WHERE point_id IN :point_ids")
+            .bindparams(bindparam("point_ids", expanding=True)),
+            {"point_ids": point_ids[start:start + _CHUNK]}
+        ).all())
+    return rows
+
+
+def _delete_point_rows(db: Executor, point_ids: list[str]):
+    for start in range(0, len(point_ids), _CHUNK):
+        db.execute(
+            text("DELETE FROM point_terms WHERE point_id IN :point_ids")
+            .bindparams(bindparam("point_ids", expanding=True)),
+            {"point_ids": point_ids[start:start + _CHUNK]}
+        )
+
+
+def _apply_deltas(db: Executor, deltas: Counter):
+    """把 (library_id, term) -> 增量 合并进 library_terms"""
+    deltas = {key: value for key, value in deltas.items() if value}
+    if not deltas:
+        return
+    db.execute(
+        text(
+            "INSERT INTO library_terms (library_id, term, count) VALUES (:library_id, :term, :delta) "
+            "ON CONFLICT (library_id, term) DO UPDATE SET count = count + excluded.count"
+        ),
+        [{"library_id": lib, "term": term, "delta": delta} for (lib, term), delta in deltas.items()]
+    )
+    library_ids = sorted({lib for lib, _ in deltas})
+    db.execute(
+        text("DELETE FROM library_terms WHERE library_id IN :library_ids AND count <= 0")
+        .bindparams(bindparam("library_ids", expanding=True)),
+        {"library_ids": library_ids}
+    )
+
+
+def index_points(db: Executor, points: Iterable):
+    """重新计算知识点的分词计数；points 可以是 Point 对象或含 id/library_id/content 的行"""
+    points = list(points)
+    if not points:
+        return
+    point_ids = [p.id for p in points]
+
+    deltas: Counter = Counter()
+    for row in _old_counts(db, point_ids):
+        deltas[(row.library_id, row.term)] -= row.count
+    _delete_point_rows(db, point_ids)
+
+    # 按知识库分组分词，以便使用各自的用户词典和停用词
+    by_library: dict[str, list] = {}
+    for p in points:
+        by_library.setdefault(p.library_id, []).append(p)
+
+    new_rows = []
+    for library_id, group in by_library.items():
+        token_lists = tokenizer.segment_many([p.content for p in group], library_id)
+        for p, tokens in zip(group, token_lists):
+            for term, count in tokenizer.count_terms(tokens, library_id).items():
+                new_rows.append({"point_id": p.id, "term": term, "library_id": library_id, "count": count})
+                deltas[(library_id, term)] += count
+    if new_rows:
+        db.execute(
+            text(
+                "INSERT INTO point_terms (point_id, term, library_id, count) "
+                "VALUES (:point_id, :term, :library_id, :count)"
+            ),
+            new_rows
+        )
+    _apply_deltas(db, deltas)
+
+
+def remove_points(db: Executor, point_ids: list[str]):
+    """移除知识点的分词计数并从汇总中扣减"""
+    if not point_ids:
+        return
+    deltas: Counter = Counter()
+    for row in _old_counts(db, point_ids):
+        deltas[(row.library_id, row.term)] -= row.count
+    _delete_point_rows(db, point_ids)
+    _apply_deltas(db, deltas)
+
+
+def remove_library(db: Executor, library_id: str):
+    """删除知识库的全部词频数据"""
+    params = {"library_id": library_id}
+    db.execute(text("DELETE FROM point_terms WHERE library_id = :library_id"), params)
+    db.execute(text("DELETE FROM library_terms WHERE library_id = :library_id"), params)
+
+
+def rebuild(conn: Executor, library_id: Optional[str] = None):
+    """清空并重新统计（全部或单个知识库）"""
+    if library_id:
+        remove_library(conn, library_id)
+    else:
+        conn.execute(text("DELETE FROM point_terms"))
+        conn.execute(text("DELETE FROM library_terms"))
+    where = "AND library_id = :library_id" if library_id else ""
+    last_id = ""
+    while True:
+        rows = conn.execute(
+            text(
+                f"SELECT id, library_id, content FROM points WHERE id > :last_id {where} "
+                "ORDER BY id LIMIT :limit"
+            ),
+            {"last_id": last_id, "limit": tokenizer.REBUILD_BATCH, "library_id": library_id}
+        ).all()
+        if not rows:
+            break
+        index_points(conn, rows)
+        last_id = rows[-1].id
+
+
+def top_terms(db: Executor, library_id: str, limit: int = 100) -> list[tuple[str, int]]:
+    """按次数从高到低返回知识库词频"""
+    rows = db.execute(
+        text(
+            "SELECT term, count FROM library_terms WHERE library_id = :library_id "
+            "ORDER BY count DESC LIMIT :limit"
+        ),
+        {"library_id": library_id, "limit": limit}
+    ).all()
+    return [(row.term, row.count) for row in rows]
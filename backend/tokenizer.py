@@ -0,0 +1,172 @@
+"""
+分词服务 - 预热 jieba 词典、按知识库加载用户词典与停用词、进程池批量分词
+
+词典目录（可通过环境变量 KNOWLEDGE_DICT_DIR 覆盖）：
+    dicts/stopwords.txt                 全局停用词，每行一个
+    dicts/<library_id>/userdict.txt     知识库用户词典（jieba 格式：词 [词频] [词性]）
+    dicts/<library_id>/stopwords.txt    知识库停用词
+修改词典后调用 POST /api/libraries/{id}/reindex 重新统计。
+"""
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Optional
+
+DICT_DIR = Path(os.environ.get("KNOWLEDGE_DICT_DIR", Path(__file__).parent / "dicts"))
+
+# 批量文本数达到该值才使用进程池，小批量在当前线程分词更快
+POOL_MIN_BATCH = int(os.environ.get("KNOWLEDGE_TOKENIZER_POOL_MIN_BATCH", 256))
+POOL_WORKERS = int(os.environ.get("KNOWLEDGE_TOKENIZER_WORKERS", os.cpu_count() or 1))
+_POOL_CHUNK = 128
+# 重建索引时每批读取的知识点数
+REBUILD_BATCH = 4096
+
+_lock = threading.Lock()
+_tokenizers: dict = {}  # library_id -> (userdict mtime, jieba.Tokenizer)
+_stopwords: dict = {}  # path -> (mtime, frozenset)
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+# ==================== 词典 ====================
+
+def _mtime(path: Path) -> Optional[float]:
+    try:
+        return path.stat().st_mtime
+    except OSError:
+        return None
+
+
+def get_tokenizer(library_id: Optional[str] = None):
+    """获取分词器：有用户词典的知识库使用独立实例，否则使用 jieba 默认实例"""
+    import jieba
+
+    userdict = DICT_DIR / library_id / "userdict.txt" if library_id else None
+    mtime = _mtime(userdict) if userdict else None
+    if mtime is None:
+        jieba.dt.check_initialized()
+        return jieba.dt
+
+    with _lock:
+        cached = _tokenizers.get(library_id)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        tokenizer = jieba.Tokenizer()
+        tokenizer.initialize()
+        tokenizer.load_userdict(str(userdict))
+        _tokenizers[library_id] = (mtime, tokenizer)
+        return tokenizer
+
+
+def _load_stopwords(path: Path) -> frozenset:
+    mtime = _mtime(path)
+    if mtime is None:
+        return frozenset()
+    cached = _stopwords.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    words = frozenset(
+        line.strip() for line in path.read_text(encoding="utf-8").splitlines() if line.strip()
+    )
+    _stopwords[path] = (mtime, words)
+    return words
+
+
+def get_stopwords(library_id: Optional[str] = None) -> frozenset:
+    """全局停用词与知识库停用词的并集"""
+    words = _load_stopwords(DICT_DIR / "stopwords.txt")
+    if library_id:
+        words = words | _load_stopwords(DICT_DIR / library_id / "stopwords.txt")
+    return words
+
+
+# ==================== 分词 ====================
+
+def segment(text: Optional[str], library_id: Optional[str] = None, mode: str = "exact") -> list[str]:
+    """对单段文本分词；mode 为 exact（精确模式）或 search（搜索引擎模式）"""
+    if not text:
+        return []
+    tokenizer = get_tokenizer(library_id)
+    if mode == "search":
+        return list(tokenizer.cut_for_search(text))
+    return list(tokenizer.cut(text))
+
+
+def _segment_chunk(texts: list, library_id: Optional[str], mode: str) -> list[list[str]]:
+    """进程池任务：在子进程中分词一批文本"""
+    return [segment(text, library_id, mode) for text in texts]
+
+
+def _worker_init():
+    # 子进程启动时即加载词典，避免首个任务承担加载耗时
+    get_tokenizer(None)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=POOL_WORKERS,
+                mp_context=get_context("spawn"),
+                initializer=_worker_init,
+            )
+        return _pool
+
+
+def segment_many(texts: list, library_id: Optional[str] = None, mode: str = "exact") -> list[list[str]]:
+    """批量分词，返回与输入一一对应的词列表；大批量时分发到进程池并行执行"""
+    texts = list(texts)
+    if len(texts) < POOL_MIN_BATCH or POOL_WORKERS <= 1:
+        return _segment_chunk(texts, library_id, mode)
+
+    pool = _get_pool()
+    chunks = [texts[i:i + _POOL_CHUNK] for i in range(0, len(texts), _POOL_CHUNK)]
+    futures = [pool.submit(_segment_chunk, chunk, library_id, mode) for chunk in chunks]
+    results: list[list[str]] = []
+    for future in futures:
+        results.extend(future.result())
+    return results
+
+
+def expand_for_search(tokens: list[str], library_id: Optional[str] = None) -> list[str]:
+    """由精确模式结果推出搜索引擎模式结果（与 jieba cut_for_search 一致），省去第二次分词"""
+    freq = get_tokenizer(library_id).FREQ
+    result = []
+    for word in tokens:
+        if len(word) > 2:
+            result.extend(gram for gram in (word[i:i + 2] for i in range(len(word) - 1)) if freq.get(gram))
+        if len(word) > 3:
+            result.extend(gram for gram in (word[i:i + 3] for i in range(len(word) - 2)) if freq.get(gram))
+        result.append(word)
+    return result
+
+
+def count_terms(tokens: list[str], library_id: Optional[str] = None) -> Counter:
+    """统计词频：去除空白、单字和停用词"""
+    stopwords = get_stopwords(library_id)
+    counter: Counter = Counter()
+    for word in tokens:
+        word = word.strip()
+        if len(word) > 1 and word not in stopwords:
+            counter[word] += 1
+    return counter
+
+
+# ==================== 生命周期 ====================
+
+def warm_up():
+    """启动时预热：加载默认词典与全局停用词"""
+    get_tokenizer(None)
+    get_stopwords(None)
+
+
+def shutdown():
+    """关闭进程池"""
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
@@ -0,0 +1,165 @@
+"""
+图遍历 - 基于 links 表的递归 CTE 查询
+
+父子关系的方向约定（与前端绘制一致）：
+    type='parent' 的 A→B 表示 A 是 B 的父节点；
+    type='child'  的 A→B 表示 A 是 B 的子节点。
+因此“向下”一步是沿 parent 链接正向、或沿 child 链接反向，“向上”则相反。
+
+每一步都通过 ix_links_from_id / ix_links_to_id 按端点查找。连接条件写成
+l.from_id IN (w.id) 而不是等号：ANALYZE 之后规划器会为等值连接加上
+Bloom 过滤器，而构建它要整表扫描 links，小范围遍历也会慢几十倍。
+递归部分用 UNION（而非 UNION ALL）去重，同一节点在同一层只展开一次；
+再加上深度上限，即使数据中存在环也一定会终止。
+"""
+import json
+from typing import Optional
+
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from .models import Link
+
+# 一步扩展：(起点列, 终点列, 类型条件)
+_DOWN = (("from_id", "to_id", "l.type = 'parent'"), ("to_id", "from_id", "l.type = 'child'"))
+_UP = (("to_id", "from_id", "l.type = 'parent'"), ("from_id", "to_id", "l.type = 'child'"))
+# 无向遍历不区分类型；via 用于禁止立刻走回上一个节点
+_ANY = (("from_id", "to_id", "l.to_id IS NOT w.via"), ("to_id", "from_id", "l.from_id IS NOT w.via"))
+# 只沿 :types（JSON 数组）中的类型扩展的无向遍历
+_ANY_TYPED = tuple(
+    (near, far, condition + " AND l.type IN (SELECT value FROM json_each(:types))")
+    for near, far, condition in _ANY
+)
+
+
+def _walk_cte(steps: tuple) -> str:
+    """生成 walk(id, depth, via) 递归 CTE：从 :point_id 出发，至多 :max_depth 步"""
+    parts = ["SELECT :point_id, 0, NULL"]
+    for near, far, condition in steps:
+        parts.append(
+            f"SELECT l.{far}, w.depth + 1, w.id FROM walk w "
+            f"JOIN links l ON l.{near} IN (w.id) "
+            f"WHERE {condition} AND w.depth < :max_depth"
+        )
+    return "WITH RECURSIVE walk(id, depth, via) AS (" + " UNION ".join(parts) + ")"
+
+
+def _reachable_sql(steps: tuple) -> str:
+    # 同一节点取最小层级；起点本身不计入结果
+    return (
+        _walk_cte(steps) +
+        " SELECT r.id, p.title, r.depth FROM ("
+        " SELECT id, MIN(depth) AS depth FROM walk WHERE id != :point_id GROUP BY id"
+        ") r JOIN points p ON p.id = r.id ORDER BY r.depth, p.title"
+    )
+
+
+_DESCENDANTS_SQL = text(_reachable_sql(_DOWN))
+_ANCESTORS_SQL = text(_reachable_sql(_UP))
+_NEIGHBORHOOD_SQL = text(_reachable_sql(_ANY))
+_NEIGHBORHOOD_TYPED_SQL = text(_reachable_sql(_ANY_TYPED))
+# 同一节点保留最小层级那一行的前驱（SQLite 中 MIN() 聚合的裸列取自最小值所在行）
+_BALL_SQL = text(_walk_cte(_ANY) + " SELECT id, MIN(depth), via FROM walk GROUP BY id")
+_TITLES_SQL = text("SELECT id, title FROM points WHERE id IN (SELECT value FROM json_each(:ids))")
+_LINKS_AMONG_SQL = text(
+    "SELECT links.* FROM links "
+    "WHERE from_id IN (SELECT value FROM json_each(:ids)) "
+    "AND to_id IN (SELECT value FROM json_each(:ids))"
+)
+
+
+def _nodes(db: Session, sql, point_id: str, max_depth: int, **params) -> list[dict]:
+    rows = db.execute(sql, {"point_id": point_id, "max_depth": max_depth, **params}).all()
+    return [{"id": row.id, "title": row.title, "depth": row.depth} for row in rows]
+
+
+def with_titles(db: Session, found: list[tuple[str, int]]) -> list[dict]:
+    """(id, depth) 列表补上标题，按层级、标题排序（与 SQL 实现的输出一致）"""
+    titles = dict(db.execute(_TITLES_SQL, {"ids": json.dumps([node_id for node_id, _ in found])}).all())
+    nodes = [{"id": node_id, "title": titles.get(node_id, ""), "depth": depth} for node_id, depth in found]
+    nodes.sort(key=lambda node: (node["depth"], node["title"]))
+    return nodes
+
+
+def path_result(db: Session, path: list[str], links: list) -> dict:
+    """路径结果：节点按顺序编号，只保留路径上相邻节点之间的链接"""
+    pairs = set(zip(path, path[1:])) | set(zip(path[1:], path))
+    return {
+        "nodes": with_titles(db, [(node_id, depth) for depth, node_id in enumerate(path)]),
+        "links": [link for link in links if (_field(link, "from_id"), _field(link, "to_id")) in pairs],
+    }
+
+
+def _field(link, name: str):
+    return link[name] if isinstance(link, dict) else getattr(link, name)
+
+
+def _links_among(db: Session, ids: list[str]) -> list[Link]:
+    """两端都在给定节点集合内的链接"""
+    if len(ids) < 2:
+        return []
+    return list(db.scalars(
+        select(Link).from_statement(_LINKS_AMONG_SQL).params(ids=json.dumps(ids))
+    ).all())
+
+
+def descendants(db: Session, point_id: str, max_depth: int) -> list[dict]:
+    """子孙节点：[{id, title, depth}]，depth 为到起点的最少层数"""
+    return _nodes(db, _DESCENDANTS_SQL, point_id, max_depth)
+
+
+def ancestors(db: Session, point_id: str, max_depth: int) -> list[dict]:
+    """祖先节点：[{id, title, depth}]"""
+    return _nodes(db, _ANCESTORS_SQL, point_id, max_depth)
+
+
+def neighborhood_nodes(db: Session, point_id: str, hops: int, types: Optional[list[str]] = None) -> list[dict]:
+    """无向 k 跳邻域内的节点（不含起点）；types 限定只沿这些类型的链接扩展"""
+    if types is None:
+        return _nodes(db, _NEIGHBORHOOD_SQL, point_id, hops)
+    return _nodes(db, _NEIGHBORHOOD_TYPED_SQL, point_id, hops, types=json.dumps(types))
+
+
+def neighborhood(db: Session, point_id: str, hops: int) -> dict:
+    """无向 k 跳邻域：返回节点（不含起点）以及邻域内（含起点）的全部链接"""
+    nodes = neighborhood_nodes(db, point_id, hops)
+    links = _links_among(db, [point_id] + [node["id"] for node in nodes])
+    return {"nodes": nodes, "links": links}
+
+
+def _ball(db: Session, point_id: str, radius: int) -> dict[str, tuple[int, Optional[str]]]:
+    """无向半径 radius 内的节点：{id: (最少步数, 该步数下的前驱)}"""
+    rows = db.execute(_BALL_SQL, {"point_id": point_id, "max_depth": radius})
+    return {node_id: (depth, via) for node_id, depth, via in rows}
+
+
+def shortest_path(db: Session, from_id: str, to_id: str, max_depth: int) -> Optional[dict]:
+    """无向最短路径，超过 max_depth 步仍未到达时返回 None
+
+    双向搜索：每轮把较小的一侧半径加一，两侧范围一旦相交，交点中两侧步数之和
+    最小者即在最短路径上，再分别沿前驱回溯拼接。两侧各只需搜索约一半深度，
+    展开的节点数远少于单侧广度优先。
+    """
+    sides = [{from_id: (0, None)}, {to_id: (0, None)}]
+    radius = [0, 0]
+    meet = sides[0].keys() & sides[1].keys()
+    while not meet:
+        if radius[0] + radius[1] >= max_depth:
+            return None
+        side = 0 if len(sides[0]) <= len(sides[1]) else 1
+        radius[side] += 1
+        ball = _ball(db, (from_id, to_id)[side], radius[side])
+        if len(ball) == len(sides[side]):
+            return None  # 该侧所在连通分量已搜索完毕
+        sides[side] = ball
+        meet = sides[0].keys() & sides[1].keys()
+
+    middle = min(meet, key=lambda node_id: sides[0][node_id][0] + sides[1][node_id][0])
+    path = [middle]
+    while path[-1] != from_id:
+        path.append(sides[0][path[-1]][1])
+    path.reverse()
+    while path[-1] != to_id:
+        path.append(sides[1][path[-1]][1])
+
+    return path_result(db, path, _links_among(db, path))
@@ -0,0 +1,3 @@
+"""
+性能基准脚本（在仓库根目录以 python -m benchmarks.<name> 运行）
+"""
@@ -0,0 +1,78 @@
+"""
+基准脚本公共工具
+"""
+import os
+import random
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# 与 SQLAlchemy 在 SQLite 中存储 DateTime 的格式一致（含微秒），键集分页按字符串比较
+BENCH_TIMESTAMP = "2024-01-01 00:00:00.000000"
+
+
+def use_temp_database() -> Path:
+    """将 backend 指向一个临时数据库文件（必须在导入 backend 之前调用）"""
+    path = Path(tempfile.mkdtemp(prefix="knowledge_bench_")) / "bench.db"
+    os.environ["KNOWLEDGE_DB_PATH"] = str(path)
+    return path
+
+
+@contextmanager
+def timer(label: str):
+    """打印代码块耗时"""
+    start = time.perf_counter()
+    yield
+    print(f"{label}: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+def populate_library(conn, library_id: str, points: int, links_per_point: int = 2,
+                     snapshots_per_point: int = 1, tags: int = 8, content_size: int = 200) -> list[str]:
+    """用原生 SQL 批量写入一个测试知识库，返回知识点 ID 列表
+
+    conn 为 SQLAlchemy Connection；只写入基础表，不维护全文 / 词频等派生索引。
+    """
+    now = BENCH_TIMESTAMP
+    conn.exec_driver_sql(
+        "INSERT INTO libraries (id, name, description, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+        (library_id, f"bench {library_id}", "benchmark library", now, now)
+    )
+    tag_ids = [f"{library_id}t{i}" for i in range(tags)]
+    conn.exec_driver_sql(
+        "INSERT INTO tags (id, library_id, name, color) VALUES (?, ?, ?, ?)",
+        [(tag_id, library_id, f"tag{i}", "#3F51B5") for i, tag_id in enumerate(tag_ids)]
+    )
+    point_ids = [f"{library_id}p{i:07d}" for i in range(points)]
+    content = "知识点内容 " * (content_size // 6)
+    conn.exec_driver_sql(
+        "INSERT INTO points (id, library_id, title, content, source, page, x, y, created_at, updated_at) "
+        "VALUES (?, ?, ?, ?, 'bench', '1', ?, ?, ?, ?)",
+        [(pid, library_id, f"知识点 {i}", content, random.uniform(-5000, 5000), random.uniform(-5000, 5000), now, now)
+         for i, pid in enumerate(point_ids)]
+    )
+    if tag_ids:
+        conn.exec_driver_sql(
+            "INSERT INTO point_tags (point_id, tag_id) VALUES (?, ?)",
+            [(pid, random.choice(tag_ids)) for pid in point_ids]
+        )
+    if links_per_point and points > 1:
+        conn.exec_driver_sql(
+            "INSERT OR IGNORE INTO links (id, from_id, to_id, type, created_at) VALUES (?, ?, ?, ?, ?)",
+            [(f"{pid}l{k}", pid, random.choice(point_ids), random.choice(("related", "parent", "child")), now)
+             for pid in point_ids for k in range(links_per_point)]
+        )
+    if snapshots_per_point:
+        # 各版本内容相同：第一个存关键帧，其余为指向它的引用（与 snapshot_store 的去重结果一致）
+        from backend import snapshot_store
+        digest, payload = snapshot_store.keyframe(
+            {"content": content, "source": "bench", "page": "1", "links": None}
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO snapshots (id, point_id, library_id, title, timestamp, kind, base_id, depth, doc_hash,"
+            " payload) VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?, ?)",
+            [(f"{pid}s{k}", pid, library_id, pid, now, snapshot_store.REF if k else snapshot_store.FULL,
+              f"{pid}s0" if k else None, digest, None if k else payload)
+             for pid in point_ids for k in range(snapshots_per_point)]
+        )
+    return point_ids
@@ -0,0 +1,79 @@
+"""
+批量导出基准：流式 JSON 与 ZIP/NDJSON 的耗时、输出大小和内存峰值
+
+用法：python -m benchmarks.bench_batch_export [--libraries 100] [--points 10000] [--legacy]
+--legacy 额外测量旧实现（整体加载后 json.dumps），数据量大时内存占用很高。
+"""
+import argparse
+import json
+import resource
+import time
+
+from benchmarks._common import populate_library, use_temp_database
+
+use_temp_database()
+
+from backend import crud, exporters  # noqa: E402
+from backend.database import ReadSessionLocal, engine, init_db  # noqa: E402
+
+
+def _max_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _consume(label: str, chunks):
+    start = time.perf_counter()
+    total = 0
+    first_byte = None
+    for chunk in chunks:
+        if first_byte is None:
+            first_byte = time.perf_counter() - start
+        total += len(chunk)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<14} {elapsed:8.2f} s  first byte {first_byte * 1000:7.1f} ms  "
+          f"{total / 1024 / 1024:9.1f} MiB  max RSS {_max_rss_mb():8.1f} MiB")
+
+
+def _legacy_batch_json():
+    """旧实现：把所有知识库完整加载到内存再一次性序列化"""
+    with ReadSessionLocal() as db:
+        export_data = []
+        for library in db.scalars(exporters.select(exporters.Library)):
+            points = crud.get_points(db, library.id)
+            links = crud.get_links(db, library.id)
+            export_data.append({
+                "meta": {"id": library.id, "name": library.name},
+                "points": [
+                    {"id": p.id, "title": p.title, "content": p.content, "source": p.source,
+                     "page": p.page, "tags": [t.name for t in p.tags], "x": p.x, "y": p.y}
+                    for p in points
+                ],
+                "links": [{"id": l.id, "fromId": l.from_id, "toId": l.to_id, "type": l.type} for l in links],
+            })
+        yield json.dumps(export_data, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--libraries", type=int, default=100)
+    parser.add_argument("--points", type=int, default=10000)
+    parser.add_argument("--legacy", action="store_true")
+    args = parser.parse_args()
+
+    init_db()
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        for i in range(args.libraries):
+            populate_library(conn, f"lib{i:04d}", args.points)
+    print(f"Populated {args.libraries} x {args.points} points in {time.perf_counter() - start:.1f} s "
+          f"(max RSS {_max_rss_mb():.1f} MiB)")
+
+    _consume("batch json", exporters.stream_batch_json([]))
+    _consume("batch zip", exporters.stream_batch_zip([]))
+    _consume("zip+snapshots", exporters.stream_batch_zip([], include_snapshots=True))
+    if args.legacy:
+        _consume("legacy json", _legacy_batch_json())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+计数冗余基准：首页知识库列表与全局统计的相关子查询 COUNT 与触发器维护的计数列，以及触发器的写入开销
+
+用法：python -m benchmarks.bench_counters [--libraries 20] [--points 20000] [--links 2] [--snapshots 3]
+原来的 get_libraries 对每个知识库执行两个相关子查询（链接数需要 links JOIN points），
+get_global_stats 再对三张表做 COUNT(*)；现在两者都只读取计数列。
+写入开销对比同样的批量写入在删除计数触发器前后的耗时。
+"""
+import argparse
+import time
+
+from benchmarks._common import populate_library, use_temp_database
+
+use_temp_database()
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import func, select  # noqa: E402
+
+from backend import counters  # noqa: E402
+from backend.database import SessionLocal, engine, init_db  # noqa: E402
+from backend.main import app  # noqa: E402
+from backend.models import Library, Link, Point  # noqa: E402
+
+
+def _legacy_home(db):
+    """原来的首页查询：每个知识库两个相关子查询 + 全局三个 COUNT(*)"""
+    point_count = select(func.count(Point.id)).where(Point.library_id == Library.id).correlate(Library)
+    link_count = (
+        select(func.count(Link.id)).join(Point, Link.from_id == Point.id)
+        .where(Point.library_id == Library.id).correlate(Library)
+    )
+    rows = db.execute(
+        select(Library, point_count.scalar_subquery(), link_count.scalar_subquery())
+        .order_by(Library.created_at.desc())
+    ).all()
+    totals = [db.scalar(select(func.count(model.id))) for model in (Library, Point, Link)]
+    return rows, totals
+
+
+def _median(run, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - start) * 1000)
+    return sorted(timings)[len(timings) // 2]
+
+
+def _populate(libraries: int, offset: int, args) -> float:
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        for i in range(libraries):
+            populate_library(conn, f"lib{offset + i:04d}", args.points, links_per_point=args.links,
+                             snapshots_per_point=args.snapshots)
+    return (time.perf_counter() - start) * 1000 / libraries
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--libraries", type=int, default=20)
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--links", type=int, default=2)
+    parser.add_argument("--snapshots", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    init_db()
+    with_triggers = _populate(args.libraries, 0, args)
+    print(f"{args.libraries} libraries x {args.points} points, {args.links} links and "
+          f"{args.snapshots} snapshots per point")
+
+    with SessionLocal() as db:
+        legacy = _median(lambda: _legacy_home(db), args.repeat)
+    with TestClient(app) as client:
+        def home():
+            assert len(client.get("/api/libraries").json()) == args.libraries
+            client.get("/api/stats/global")
+        home()
+        counted = _median(home, args.repeat)
+    with engine.connect() as conn:
+        assert counters.rebuild(conn) == {"libraries": [], "global_counts": None}
+
+    # 写入开销：删除计数触发器后写入同样规模的一个知识库
+    one_library = _populate(1, args.libraries, args)
+    with engine.begin() as conn:
+        for name in conn.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_%_count_%'"
+        ).scalars().all():
+            conn.exec_driver_sql(f"DROP TRIGGER {name}")
+    without_triggers = _populate(1, args.libraries + 1, args)
+
+    print(f"  home queries, correlated COUNT subqueries   {legacy:10.1f} ms")
+    print(f"  GET /api/libraries + /api/stats/global      {counted:10.1f} ms")
+    print(f"  populate one library with counter triggers  {one_library:10.1f} ms "
+          f"(first {args.libraries}: {with_triggers:.1f} ms each)")
+    print(f"  populate one library without triggers       {without_triggers:10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
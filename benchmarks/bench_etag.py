@@ -0,0 +1,103 @@
+"""
+条件 GET 基准：带 ETag 的读接口首次请求（200）与 If-None-Match 命中（304）的耗时，并校验 304 路径不访问 ORM
+
+用法：python -m benchmarks.bench_etag [--points 20000] [--repeat 20]
+命中时只读取一次修订号（http_cache，直接走 read_engine），不创建只读会话、不执行 ORM 查询。
+脚本统计 If-None-Match 请求期间 ReadSessionLocal 创建的会话数与 do_orm_execute 事件数，
+两者都必须为 0；写入之后 ETag 必须变化、同一个 If-None-Match 重新返回 200。
+"""
+import argparse
+import time
+
+from benchmarks._common import populate_library, use_temp_database
+
+use_temp_database()
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from backend.database import ReadSessionLocal, engine, init_db  # noqa: E402
+from backend.main import app  # noqa: E402
+
+LIBRARY_ID = "lib0000"
+URLS = [
+    "/api/libraries",
+    "/api/stats/global",
+    f"/api/libraries/{LIBRARY_ID}",
+    f"/api/libraries/{LIBRARY_ID}/graph",
+    f"/api/libraries/{LIBRARY_ID}/points?fields=id,title,x,y",
+    f"/api/libraries/{LIBRARY_ID}/links",
+    f"/api/libraries/{LIBRARY_ID}/word-frequency",
+]
+
+_counts = {"sessions": 0, "orm_executes": 0}
+
+
+class _CountingSession(ReadSessionLocal.class_):
+    def __init__(self, *args, **kwargs):
+        _counts["sessions"] += 1
+        super().__init__(*args, **kwargs)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _count_execute(orm_execute_state):
+    _counts["orm_executes"] += 1
+
+
+def _median(timings: list[float]) -> float:
+    return sorted(timings)[len(timings) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    init_db()
+    with engine.begin() as conn:
+        populate_library(conn, LIBRARY_ID, args.points, links_per_point=2)
+    ReadSessionLocal.class_ = _CountingSession
+    print(f"{args.points} points, {args.repeat} requests per endpoint")
+
+    with TestClient(app) as client:
+        etags, full, cached = {}, {}, {}
+        for url in URLS:
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                response = client.get(url)
+                timings.append((time.perf_counter() - start) * 1000)
+                assert response.status_code == 200, (url, response.status_code)
+            etags[url] = response.headers["ETag"]
+            full[url] = _median(timings)
+
+        # 计数本身有效：完整请求会创建只读会话并执行 ORM 查询
+        assert _counts["sessions"] > 0 and _counts["orm_executes"] > 0, _counts
+        _counts.update(sessions=0, orm_executes=0)
+        for url in URLS:
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                response = client.get(url, headers={"If-None-Match": etags[url]})
+                timings.append((time.perf_counter() - start) * 1000)
+                assert response.status_code == 304, (url, response.status_code)
+            cached[url] = _median(timings)
+        assert _counts == {"sessions": 0, "orm_executes": 0}, f"304 path touched the ORM: {_counts}"
+
+        # 写入后所有 ETag 都应失效
+        point = client.post("/api/points", json={"library_id": LIBRARY_ID, "title": "new", "content": "new"})
+        assert point.status_code == 201
+        for url in URLS:
+            response = client.get(url, headers={"If-None-Match": etags[url]})
+            assert response.status_code == 200 and response.headers["ETag"] != etags[url], url
+
+    print("  304 path: 0 read sessions, 0 ORM executes")
+    print(f"  {'endpoint':<52} {'200 (ms)':>10} {'304 (ms)':>10}")
+    for url in URLS:
+        print(f"  {url:<52} {full[url]:10.2f} {cached[url]:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+SSE 事件推送基准：大量空闲订阅者的开销与写入后推送到全部订阅者的延迟
+
+用法：python -m benchmarks.bench_events [--subscribers 500] [--writes 50] [--idle 5]
+在子进程中启动 uvicorn（临时数据库），另一个子进程建立 subscribers 个 SSE 连接
+（原始套接字，客户端开销不影响写入方的测量），报告：
+    每个连接的服务端内存增量、空闲期间服务端 CPU 占用；
+    写入（POST /api/points）的延迟与服务端 CPU（有 / 无订阅者对比），
+    以及从发起写入到最后一个订阅者收到 change 事件的延迟。
+time.perf_counter 在 Linux 上是系统级单调时钟，可以跨进程比较。
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks._common import use_temp_database
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _rss_kb(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def _cpu_seconds(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def _percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+# ==================== 订阅者进程 ====================
+
+async def _listen(port: int, path: str, count: int, conn):
+    """建立 count 个 SSE 连接；全部收到 hello 后发送 "ready"，
+    每个修订号的 change 事件被所有连接收到时发送 (修订号, 时间)"""
+    received: dict[int, int] = {}
+    hello = 0
+
+    async def run():
+        nonlocal hello
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nAccept: text/event-stream\r\n\r\n".encode())
+        event = None
+        # 每个事件是一个独立的分块，行不会被拆开；分块长度行直接跳过
+        while line := await reader.readline():
+            if line.startswith(b"event: "):
+                event = line[7:].strip()
+            elif line.startswith(b"data: "):
+                if event == b"hello":
+                    hello += 1
+                    if hello == count:
+                        conn.send("ready")
+                elif event == b"change":
+                    revision = json.loads(line[6:])["revision"]
+                    received[revision] = received.get(revision, 0) + 1
+                    if received[revision] == count:
+                        conn.send((revision, time.perf_counter()))
+
+    await asyncio.gather(*(run() for _ in range(count)))
+
+
+def _listener_process(port: int, path: str, count: int, conn):
+    asyncio.run(_listen(port, path, count, conn))
+
+
+# ==================== 写入方 ====================
+
+def _write(client: httpx.Client, library_id: str, title: str) -> float:
+    start = time.perf_counter()
+    client.post("/api/points", json={
+        "library_id": library_id, "title": title, "content": "内容", "tags": []
+    }).raise_for_status()
+    return start
+
+
+def _bench(base: str, port: int, pid: int, args):
+    with httpx.Client(base_url=base, timeout=None) as client:
+        library_id = client.post("/api/libraries", json={"name": "bench"}).json()["id"]
+        for i in range(5):
+            _write(client, library_id, f"预热 {i}")
+
+        cpu_before = _cpu_seconds(pid)
+        baseline = []
+        for i in range(args.writes):
+            start = _write(client, library_id, f"知识点 {i}")
+            baseline.append((time.perf_counter() - start) * 1000)
+        write_cpu = (_cpu_seconds(pid) - cpu_before) / args.writes
+        print(f"write without subscribers: p50 {_percentile(baseline, 0.5):6.1f} ms  "
+              f"p95 {_percentile(baseline, 0.95):6.1f} ms  server CPU {write_cpu * 1000:.1f} ms")
+
+        rss_before = _rss_kb(pid)
+        parent, child = multiprocessing.Pipe()
+        listener = multiprocessing.Process(
+            target=_listener_process,
+            args=(port, f"/api/libraries/{library_id}/events", args.subscribers, child),
+            daemon=True,
+        )
+        start = time.perf_counter()
+        listener.start()
+        try:
+            assert parent.recv() == "ready"
+            print(f"{args.subscribers} subscribers connected in {time.perf_counter() - start:.2f} s, "
+                  f"server RSS +{(_rss_kb(pid) - rss_before) / args.subscribers:.1f} KB per connection")
+
+            cpu_before = _cpu_seconds(pid)
+            time.sleep(args.idle)
+            idle_cpu = _cpu_seconds(pid) - cpu_before
+            print(f"idle {args.idle:.0f} s: server CPU {idle_cpu * 1000:.0f} ms "
+                  f"({idle_cpu / args.idle * 100:.2f} %)")
+
+            # 每次创建知识点是一个事务，修订号加一
+            revision = client.get(f"/api/libraries/{library_id}").json()["revision"]
+            timings, fanout = [], []
+            cpu_before = _cpu_seconds(pid)
+            for i in range(args.writes):
+                start = _write(client, library_id, f"推送 {i}")
+                timings.append((time.perf_counter() - start) * 1000)
+                revision += 1
+                received, arrived = parent.recv()
+                assert received == revision, (received, revision)
+                fanout.append((arrived - start) * 1000)
+            push_cpu = (_cpu_seconds(pid) - cpu_before) / args.writes - write_cpu
+        finally:
+            listener.terminate()
+        print(f"write with subscribers:    p50 {_percentile(timings, 0.5):6.1f} ms  "
+              f"p95 {_percentile(timings, 0.95):6.1f} ms  "
+              f"push CPU {push_cpu / args.subscribers * 1e6:.0f} us per subscriber")
+        print(f"delivered to all {args.subscribers}: p50 {_percentile(fanout, 0.5):6.1f} ms  "
+              f"p95 {_percentile(fanout, 0.95):6.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--subscribers", type=int, default=500)
+    parser.add_argument("--writes", type=int, default=50)
+    parser.add_argument("--idle", type=float, default=5.0)
+    args = parser.parse_args()
+    if args.subscribers < 1:
+        parser.error("--subscribers must be at least 1")
+
+    use_temp_database()
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--log-level", "warning"],
+        env=os.environ.copy(),
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(300):
+            try:
+                httpx.get(f"{base}/api/libraries").raise_for_status()
+                break
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        _bench(base, port, server.pid, args)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+画布图数据基准：列式 JSON / 二进制（GET /graph）与现有 points + links 列表的体积、服务端耗时与解码耗时
+
+用法：python -m benchmarks.bench_graph_payload [--points 50000] [--repeat 5]
+现有方式为画布原来的取数：points?fields=id,title,x,y,tags 按 2000 条分页 + links 整库，
+另列出不带投影的完整 points 列表作参考。服务端耗时经 TestClient 测量（含序列化）。
+解码耗时用 node 运行：对象格式为 JSON.parse 后按 ID 建立节点和边，
+列式格式为 JSON.parse / decodeGraph 后按下标建立节点和边（与 NetworkEngine.loadGraph 相同）；
+没有 node 时跳过。
+"""
+import argparse
+import gzip
+import json
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks._common import populate_library, use_temp_database
+
+use_temp_database()
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from backend.database import engine, init_db  # noqa: E402
+from backend.main import app  # noqa: E402
+
+LIBRARY_ID = "lib0000"
+PAGE_SIZE = 2000
+DECODER = Path(__file__).parent.parent / "frontend" / "js" / "network" / "graphPayload.js"
+
+# 读取 argv 中的文件并按格式建立画布节点 / 边，输出 [格式, 中位耗时 ms]
+NODE_SCRIPT = r"""
+import { readFileSync } from 'node:fs';
+import { decodeGraph } from './graphPayload.mjs';
+const [objectsFile, columnarFile, binaryFile, repeat] = process.argv.slice(2);
+
+function fromObjects(text) {
+    const { points, links } = JSON.parse(text);
+    const nodes = points.map(p => ({ ...p, radius: 30, vx: 0, vy: 0, visible: true }));
+    const byId = new Map(nodes.map(n => [n.id, n]));
+    const edges = links.map(l => ({ ...l, source: byId.get(l.fromId), target: byId.get(l.toId) }));
+    return nodes.length + edges.length;
+}
+
+function fromColumns({ tags, linkTypes, ids, titles, x, y, tagOffsets, tagIndexes, linkIds, source, target, types }) {
+    const nodes = new Array(ids.length);
+    for (let i = 0; i < ids.length; i++) {
+        const nodeTags = [];
+        for (let k = tagOffsets[i]; k < tagOffsets[i + 1]; k++) nodeTags.push(tags[tagIndexes[k]]);
+        nodes[i] = { id: ids[i], title: titles[i], tags: nodeTags, x: x[i], y: y[i], radius: 30, vx: 0, vy: 0, visible: true };
+    }
+    const edges = new Array(linkIds.length);
+    for (let i = 0; i < linkIds.length; i++) {
+        const from = nodes[source[i]], to = nodes[target[i]];
+        edges[i] = { id: linkIds[i], fromId: from.id, toId: to.id, type: linkTypes[types[i]], source: from, target: to };
+    }
+    return nodes.length + edges.length;
+}
+
+function fromColumnarJson(text) {
+    const { tags, link_types, points, links } = JSON.parse(text);
+    return fromColumns({
+        tags, linkTypes: link_types, ids: points.ids, titles: points.titles, x: points.x, y: points.y,
+        tagOffsets: points.tag_offsets, tagIndexes: points.tag_indexes,
+        linkIds: links.ids, source: links.source, target: links.target, types: links.types
+    });
+}
+
+function median(run) {
+    const times = [];
+    for (let i = 0; i < Number(repeat); i++) {
+        const start = performance.now();
+        run();
+        times.push(performance.now() - start);
+    }
+    times.sort((a, b) => a - b);
+    return times[times.length >> 1];
+}
+
+const objects = readFileSync(objectsFile, 'utf8');
+const columnar = readFileSync(columnarFile, 'utf8');
+const binary = readFileSync(binaryFile);
+const buffer = binary.buffer.slice(binary.byteOffset, binary.byteOffset + binary.byteLength);
+console.log(JSON.stringify([
+    ['objects', median(() => fromObjects(objects))],
+    ['columnar', median(() => fromColumnarJson(columnar))],
+    ['binary', median(() => fromColumns(decodeGraph(buffer)))],
+]));
+"""
+
+
+def _timed(client: TestClient, url: str, repeat: int, **params) -> tuple[float, bytes]:
+    timings, body = [], b""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(url, params=params)
+        response.raise_for_status()
+        timings.append((time.perf_counter() - start) * 1000)
+        body = response.content
+    return sorted(timings)[len(timings) // 2], body
+
+
+def _paged(client: TestClient, url: str, repeat: int, **params) -> tuple[float, list]:
+    """按页拉取全部记录，返回 (中位总耗时, 记录)"""
+    timings, items = [], []
+    for _ in range(repeat):
+        items, cursor = [], None
+        start = time.perf_counter()
+        while True:
+            query = {**params, "limit": PAGE_SIZE, **({"cursor": cursor} if cursor else {})}
+            response = client.get(url, params=query)
+            response.raise_for_status()
+            items.extend(response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        timings.append((time.perf_counter() - start) * 1000)
+    return sorted(timings)[len(timings) // 2], items
+
+
+def _report(label: str, elapsed: float, body: bytes):
+    print(f"  {label:<34} {len(body) / 1024:9.0f} KB  gzip {len(gzip.compress(body, 6)) / 1024:7.0f} KB  "
+          f"server {elapsed:8.1f} ms")
+
+
+def _node_decode(objects: bytes, columnar: bytes, binary: bytes, repeat: int):
+    node = shutil.which("node")
+    if node is None:
+        print("node not found, decode timings skipped")
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        shutil.copy(DECODER, tmp / "graphPayload.mjs")
+        (tmp / "bench.mjs").write_text(NODE_SCRIPT, encoding="utf-8")
+        files = []
+        for name, data in (("objects.json", objects), ("columnar.json", columnar), ("graph.bin", binary)):
+            (tmp / name).write_bytes(data)
+            files.append(str(tmp / name))
+        output = subprocess.run([node, str(tmp / "bench.mjs"), *files, str(repeat)],
+                                check=True, capture_output=True, text=True).stdout
+    print("decode + build nodes/edges (node, median):")
+    for label, elapsed in json.loads(output):
+        print(f"  {label:<10} {elapsed:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    init_db()
+    with engine.begin() as conn:
+        populate_library(conn, LIBRARY_ID, args.points, links_per_point=2, snapshots_per_point=0)
+
+    with TestClient(app) as client:
+        base = f"/api/libraries/{LIBRARY_ID}"
+        client.get(f"{base}/links").raise_for_status()  # 预热图缓存
+        print(f"{args.points} points, tags 8, ~{2 * args.points} links")
+
+        points_ms, points = _paged(client, f"{base}/points", args.repeat, fields="id,title,x,y,tags")
+        links_ms, links_body = _timed(client, f"{base}/links", args.repeat)
+        objects = json.dumps({"points": points, "links": json.loads(links_body)},
+                             ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        full_ms, full_body = _timed(client, f"{base}/points", args.repeat)
+        columnar_ms, columnar = _timed(client, f"{base}/graph", args.repeat, format="columnar")
+        binary_ms, binary = _timed(client, f"{base}/graph", args.repeat, format="binary")
+
+    _report("points (projected, paged) + links", points_ms + links_ms, objects)
+    _report("points (full PointResponse)", full_ms, full_body)
+    _report("graph?format=columnar", columnar_ms, columnar)
+    _report("graph?format=binary", binary_ms, binary)
+    _node_decode(objects, columnar, binary, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+导入基准：批量单事务导入（JSON / NDJSON / ZIP）的耗时与行/秒
+
+用法：python -m benchmarks.bench_import [--libraries 5] [--points 10000] [--legacy]
+先用 populate_library 造数据并导出，再清空数据库逐个格式导入。
+--legacy 额外测量旧实现（逐点 flush + 逐点快照提交），数据量大时很慢。
+"""
+import argparse
+import io
+import json
+import time
+
+from benchmarks._common import populate_library, use_temp_database
+
+use_temp_database()
+
+from backend import crud, exporters, importer  # noqa: E402
+from backend.database import SessionLocal, engine, init_db  # noqa: E402
+from backend.models import Library, Point, Link, Tag  # noqa: E402
+
+
+def _clear():
+    with engine.begin() as conn:
+        for table in ("snapshots", "links", "point_tags", "point_terms", "library_terms",
+                      "search_docs", "search_fts", "points", "tags", "sources", "libraries"):
+            conn.exec_driver_sql(f"DELETE FROM {table}")
+
+
+def _legacy_import(db, data: list[dict]) -> int:
+    """旧实现：每个知识点 flush 一次，并通过 _create_snapshot 各自提交"""
+    count = 0
+    for lib_data in data:
+        meta = lib_data["meta"]
+        new_lib = Library(name=meta["name"], description=meta.get("description"))
+        db.add(new_lib)
+        db.flush()
+        tag_map = {}
+        for t in meta.get("tags", []):
+            tag_map[t["name"]] = Tag(library_id=new_lib.id, name=t["name"], color=t.get("color", "#3F51B5"))
+            db.add(tag_map[t["name"]])
+        db.flush()
+        id_map = {}
+        for p in lib_data.get("points", []):
+            point = Point(library_id=new_lib.id, title=p["title"], content=p["content"],
+                          source=p.get("source"), page=p.get("page"), x=p.get("x", 0.0), y=p.get("y", 0.0))
+            point.tags = [tag_map[name] for name in p.get("tags", []) if name in tag_map]
+            db.add(point)
+            db.flush()
+            id_map[p["id"]] = point.id
+            crud._create_snapshot(db, point)
+        for l in lib_data.get("links", []):
+            if l["fromId"] in id_map and l["toId"] in id_map:
+                db.add(Link(from_id=id_map[l["fromId"]], to_id=id_map[l["toId"]], type=l.get("type", "related")))
+        count += 1
+    db.commit()
+    return count
+
+
+def _run(label: str, payload: bytes, filename: str):
+    _clear()
+    with SessionLocal() as db:
+        start = time.perf_counter()
+        report = importer.import_sources(db, importer.open_sources(io.BytesIO(payload), filename))
+        elapsed = time.perf_counter() - start
+    assert report["success"], report["errors"]
+    print(f"{label:<8} {elapsed:8.2f} s  {report['rows']:>9} rows  {report['rows_per_sec']:>10.0f} rows/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--libraries", type=int, default=5)
+    parser.add_argument("--points", type=int, default=10000)
+    parser.add_argument("--legacy", action="store_true")
+    args = parser.parse_args()
+
+    init_db()
+    with engine.begin() as conn:
+        for i in range(args.libraries):
+            populate_library(conn, f"lib{i:04d}", args.points, snapshots_per_point=0)
+    payload_json = b"".join(exporters.stream_batch_json([]))
+    payload_zip = b"".join(exporters.stream_batch_zip([]))
+    print(f"{args.libraries} libraries x {args.points} points, "
+          f"json {len(payload_json) / 1024 / 1024:.1f} MiB, zip {len(payload_zip) / 1024 / 1024:.1f} MiB")
+
+    _run("json", payload_json, "bench.json")
+    _run("zip", payload_zip, "bench.zip")
+
+    if args.legacy:
+        _clear()
+        data = json.loads(payload_json)
+        with SessionLocal() as db:
+            start = time.perf_counter()
+            _legacy_import(db, data)
+            print(f"{'legacy':<8} {time.perf_counter() - start:8.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+热点查询索引基准：对比迁移前后的查询计划（SCAN → SEARCH）与耗时
+
+用法：python -m benchmarks.bench_indexes [--libraries 20] [--points 2000]
+"""
+import argparse
+import time
+
+from benchmarks._common import populate_library, use_temp_database
+
+use_temp_database()
+
+from backend.database import engine, init_db  # noqa: E402
+from backend.migrations import run_migrations  # noqa: E402
+
+QUERIES = {
+    "get_points": (
+        "SELECT * FROM points WHERE library_id = :library_id",
+    ),
+    "_create_snapshot links": (
+        "SELECT * FROM links WHERE from_id = :point_id OR to_id = :point_id",
+    ),
+    "get_snapshots": (
+        "SELECT * FROM snapshots WHERE point_id = :point_id AND timestamp >= '2000-01-01' "
+        "ORDER BY timestamp DESC",
+    ),
+    "count_points_by_tag": (
+        "SELECT count(points.id) FROM points "
+        "JOIN point_tags ON points.id = point_tags.point_id "
+        "JOIN tags ON tags.id = point_tags.tag_id "
+        "WHERE points.library_id = :library_id AND tags.name = :tag_name",
+    ),
+    "links by endpoint": (
+        "SELECT * FROM links WHERE to_id = :point_id",
+    ),
+}
+
+
+def _populate(conn, libraries: int, points: int):
+    sample = None
+    for i in range(libraries):
+        library_id = f"lib{i:04d}"
+        point_ids = populate_library(conn, library_id, points, snapshots_per_point=3)
+        sample = {"library_id": library_id, "point_id": point_ids[len(point_ids) // 2], "tag_name": "tag3"}
+    return sample
+
+
+def _report(conn, params: dict, repeat: int = 20):
+    for name, (sql,) in QUERIES.items():
+        plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}", params).all()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            conn.exec_driver_sql(sql, params).all()
+        elapsed = (time.perf_counter() - start) * 1000 / repeat
+        print(f"  {name:<24} {elapsed:8.2f} ms")
+        for row in plan:
+            print(f"      {row[-1]}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--libraries", type=int, default=20)
+    parser.add_argument("--points", type=int, default=2000)
+    args = parser.parse_args()
+
+    # 先建出最新结构，再删掉索引和版本记录，模拟旧版 knowledge.db
+    init_db()
+    with engine.begin() as conn:
+        for (index_name,) in conn.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'ix_%'"
+        ).all():
+            conn.exec_driver_sql(f"DROP INDEX {index_name}")
+        conn.exec_driver_sql("DELETE FROM schema_version")
+        params = _populate(conn, args.libraries, args.points)
+
+    print(f"{args.libraries} libraries x {args.points} points")
+    print("Before migration:")
+    with engine.connect() as conn:
+        _report(conn, params)
+
+    start = time.perf_counter()
+    applied = run_migrations(engine)
+    print(f"Applied migrations {applied} in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    print("After migration:")
+    with engine.connect() as conn:
+        _report(conn, params)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+整库版本历史基准：逐个知识点请求 /points/{id}/snapshots 与 GET /api/libraries/{id}/snapshots
+
+用法：python -m benchmarks.bench_library_history [--points 5000] [--snapshots 3]
+原来的全局历史对话框对每个知识点顺序请求一次快照列表再在前端合并排序；
+新接口一次请求返回按时间合并的一页（默认 50 条）。耗时经 TestClient 测量（含序列化）。
+"""
+import argparse
+import time
+
+from benchmarks._common import populate_library, use_temp_database
+
+use_temp_database()
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from backend.database import engine, init_db  # noqa: E402
+from backend.main import app  # noqa: E402
+
+LIBRARY_ID = "lib0000"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=5000)
+    parser.add_argument("--snapshots", type=int, default=3)
+    parser.add_argument("--page", type=int, default=50)
+    args = parser.parse_args()
+
+    init_db()
+    with engine.begin() as conn:
+        point_ids = populate_library(conn, LIBRARY_ID, args.points, links_per_point=0,
+                                     snapshots_per_point=args.snapshots)
+    total = args.points * args.snapshots
+    print(f"{args.points} points x {args.snapshots} snapshots")
+
+    with TestClient(app) as client:
+        # 测试数据的时间戳早于默认的 300 天窗口，逐个请求时放宽窗口
+        start = time.perf_counter()
+        merged = []
+        for point_id in point_ids:
+            merged.extend(client.get(f"/api/points/{point_id}/snapshots", params={"days": 100000}).json())
+        merged.sort(key=lambda s: s["timestamp"], reverse=True)
+        per_point = (time.perf_counter() - start) * 1000
+        assert len(merged) == total
+
+        url = f"/api/libraries/{LIBRARY_ID}/snapshots"
+        params = {"limit": args.page, "fields": "id,point_id,point_title,content,timestamp"}
+        start = time.perf_counter()
+        first = client.get(url, params=params)
+        first_page = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        count, cursor = 0, None
+        while True:
+            response = client.get(url, params={"limit": 2000, **({"cursor": cursor} if cursor else {})})
+            count += len(response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        all_pages = (time.perf_counter() - start) * 1000
+        assert count == total and len(first.json()) == min(args.page, total)
+
+    print(f"  per-point requests ({args.points} round trips)  {per_point:10.1f} ms")
+    print(f"  library history, first page ({args.page})      {first_page:10.1f} ms")
+    print(f"  library history, all {total} (limit 2000)  {all_pages:10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+整库按时间点恢复基准：逐个知识点查找并恢复快照与 POST /api/libraries/{id}/restore 一次完成
+
+用法：python -m benchmarks.bench_library_restore [--points 5000] [--versions 20]
+每个知识点写入 versions 个版本（每分钟一个，关键帧 + 差异存储），恢复到中间的时刻。
+原来只能对每个知识点查询 at 之前最新的快照再调用 restore_snapshot（每个知识点一个事务）；
+新接口用一个窗口查询取出全部目标快照，分批解码后在一个事务中写回。
+"""
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+
+from benchmarks._common import populate_library, use_temp_database
+
+use_temp_database()
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import select  # noqa: E402
+
+from backend import crud, snapshot_store  # noqa: E402
+from backend.database import SessionLocal, engine, init_db  # noqa: E402
+from backend.main import app  # noqa: E402
+from backend.models import Snapshot, generate_ids  # noqa: E402
+
+LIBRARY_ID = "lib0000"
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _write_histories(point_ids: list[str], versions: int):
+    """每个知识点 versions 个版本：每次在正文末尾追加一句，约三分之一的版本同时改标题"""
+    content = {point_id: "知识点内容 " * 30 for point_id in point_ids}
+    for v in range(versions):
+        rows = []
+        for point_id, snapshot_id in zip(point_ids, generate_ids(len(point_ids))):
+            content[point_id] += f"第 {v} 次修改。"
+            rows.append({"id": snapshot_id, "point_id": point_id, "library_id": LIBRARY_ID,
+                         "title": f"{point_id} r{v // 3}", "content": content[point_id], "source": "bench",
+                         "page": str(v), "links": {"outgoing": [], "incoming": []},
+                         "timestamp": START + timedelta(minutes=v)})
+        with SessionLocal() as db:
+            snapshot_store.add(db, rows)
+            db.commit()
+    # 知识点当前数据与最新版本一致
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "UPDATE points SET title = ?, content = ?, page = ? WHERE id = ?",
+            [(f"{pid} r{(versions - 1) // 3}", text, str(versions - 1), pid) for pid, text in content.items()]
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=5000)
+    parser.add_argument("--versions", type=int, default=20)
+    args = parser.parse_args()
+
+    init_db()
+    with engine.begin() as conn:
+        point_ids = populate_library(conn, LIBRARY_ID, args.points, links_per_point=0, snapshots_per_point=0)
+    _write_histories(point_ids, args.versions)
+    at = START + timedelta(minutes=args.versions // 2, seconds=30)
+    latest = START + timedelta(days=1)
+    print(f"{args.points} points x {args.versions} versions = {args.points * args.versions} snapshots")
+
+    with TestClient(app) as client:
+        url = f"/api/libraries/{LIBRARY_ID}/restore"
+        start = time.perf_counter()
+        preview = client.post(url, params={"at": at.isoformat(), "dry_run": True}).json()
+        dry_run = (time.perf_counter() - start) * 1000
+        assert len(preview["updated"]) == args.points
+
+        start = time.perf_counter()
+        result = client.post(url, params={"at": at.isoformat()}).json()
+        bulk = (time.perf_counter() - start) * 1000
+        assert len(result["updated"]) == args.points
+        # 恢复回最新版本，再用逐个知识点的方式做同样的恢复
+        client.post(url, params={"at": latest.isoformat()})
+
+    start = time.perf_counter()
+    with SessionLocal() as db:
+        for point_id in point_ids:
+            snapshot_id = db.scalar(
+                select(Snapshot.id)
+                .where(Snapshot.point_id == point_id, Snapshot.timestamp <= at)
+                .order_by(Snapshot.timestamp.desc(), Snapshot.id.desc())
+                .limit(1)
+            )
+            crud.restore_snapshot(db, point_id, snapshot_id)
+    per_point = (time.perf_counter() - start) * 1000
+
+    print(f"  per-point lookup + restore_snapshot   {per_point:10.1f} ms")
+    print(f"  library restore, dry run             {dry_run:10.1f} ms")
+    print(f"  library restore                      {bulk:10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+相关知识点导出基准：在带有稠密枢纽节点的知识库上测量 k 跳展开与流式导出的耗时
+
+用法：python -m benchmarks.bench_related_export [--points 20000] [--hubs 20] [--hub-degree 500] [--depth 3]
+在随机图之上额外加入若干枢纽节点，每个枢纽连向 hub-degree 个随机知识点，
+从枢纽出发的 3 跳展开会覆盖库中相当大的一部分；分别测量递归 CTE（关闭图缓存）
+与图缓存两种展开方式，以及 json / markdown / csv 三种格式的完整导出。
+"""
+import argparse
+import random
+import time
+
+from benchmarks._common import BENCH_TIMESTAMP, populate_library, use_temp_database
+
+use_temp_database()
+
+from backend import crud, exporters, graph_cache  # noqa: E402
+from backend.database import ReadSessionLocal, engine, init_db  # noqa: E402
+
+
+def _add_hubs(conn, point_ids: list[str], hubs: int, degree: int) -> list[str]:
+    """前 hubs 个知识点作为枢纽，各自连向 degree 个随机知识点"""
+    hub_ids = point_ids[:hubs]
+    conn.exec_driver_sql(
+        "INSERT OR IGNORE INTO links (id, from_id, to_id, type, created_at) VALUES (?, ?, ?, ?, ?)",
+        [(f"{hub}h{k}", hub, random.choice(point_ids), random.choice(("related", "parent")), BENCH_TIMESTAMP)
+         for hub in hub_ids for k in range(degree)]
+    )
+    return hub_ids
+
+
+def _best_of(call, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        best = min(best, (time.perf_counter() - start) * 1000)
+    return best
+
+
+def _drain(stream) -> int:
+    return sum(len(chunk) for chunk in stream)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--links-per-point", type=int, default=1)
+    parser.add_argument("--hubs", type=int, default=20)
+    parser.add_argument("--hub-degree", type=int, default=500)
+    parser.add_argument("--depth", type=int, default=3)
+    args = parser.parse_args()
+
+    random.seed(0)
+    init_db()
+    with engine.begin() as conn:
+        point_ids = populate_library(conn, "lib0000", args.points, links_per_point=args.links_per_point,
+                                     snapshots_per_point=0)
+        hub_ids = _add_hubs(conn, point_ids, args.hubs, args.hub_degree)
+        conn.exec_driver_sql("ANALYZE")
+        edges = conn.exec_driver_sql("SELECT COUNT(*) FROM links").scalar()
+    print(f"{args.points} points, {edges} links, {args.hubs} hubs x {args.hub_degree} links, depth {args.depth}")
+
+    starts = hub_ids[:5]
+    cache_size = graph_cache.MAX_LIBRARIES
+    with ReadSessionLocal() as db:
+        for label, size in (("recursive CTE", 0), ("graph cache", cache_size)):
+            graph_cache.MAX_LIBRARIES = size
+            if size:
+                graph_cache.get("lib0000")
+            print(f"{label}:")
+            for hub in starts:
+                ids = crud.get_related_point_ids(db, hub, args.depth)
+                elapsed = _best_of(lambda: crud.get_related_point_ids(db, hub, args.depth))
+                print(f"  expand {hub}: {len(ids):6d} points  {elapsed:8.1f} ms")
+
+        ids = crud.get_related_point_ids(db, starts[0], args.depth)
+        header = {"id": "lib0000", "name": "bench", "description": ""}
+        print(f"stream {len(ids)} points:")
+        for format in exporters.EXTENSIONS:
+            size = _drain(exporters.stream_points(header, ids, format))
+            elapsed = _best_of(lambda: _drain(exporters.stream_points(header, ids, format)))
+            print(f"  {format:<10} {size / 1e6:7.1f} MB  {elapsed:8.1f} ms")
+    print(graph_cache.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+快照存储基准：旧结构（每个版本保存完整内容）与关键帧 + 差异压缩存储的库体积、读取与写入耗时
+
+用法：python -m benchmarks.bench_snapshots [--points 200] [--versions 60] [--content-size 4000]
+每个知识点生成 versions 个版本：每次修改正文中一小段或在末尾追加一句，约 10% 的版本
+撤销回之前的某个版本（内容完全相同，可去重）。先按旧结构写入并测量，再执行迁移 8
+转换为新结构后测量同样的操作。库体积为 VACUUM 后的文件大小减去不含快照时的大小。
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from benchmarks._common import populate_library, use_temp_database
+
+use_temp_database()
+
+from backend import crud, snapshot_store  # noqa: E402
+from backend.database import SessionLocal, engine, init_db  # noqa: E402
+from backend.migrations import run_migrations  # noqa: E402
+from backend.models import generate_ids  # noqa: E402
+
+LIBRARY_ID = "lib0000"
+# 迁移 8 之前的 snapshots 表
+LEGACY_DDL = (
+    "CREATE TABLE snapshots ("
+    " id VARCHAR(32) NOT NULL PRIMARY KEY,"
+    " point_id VARCHAR(32) NOT NULL REFERENCES points (id) ON DELETE CASCADE,"
+    " title VARCHAR(256) NOT NULL,"
+    " content TEXT NOT NULL,"
+    " source VARCHAR(256),"
+    " page VARCHAR(32),"
+    " links JSON,"
+    " timestamp DATETIME)",
+    "CREATE INDEX ix_snapshots_point_timestamp ON snapshots (point_id, timestamp)",
+)
+LEGACY_INSERT = (
+    "INSERT INTO snapshots (id, point_id, title, content, source, page, links, timestamp) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+WORDS = ["知识", "图谱", "笔记", "条款", "合同", "责任", "民法典", "the", "graph", "note", "，", "。"]
+START = datetime(2024, 1, 1)
+
+
+def _text(rng: random.Random, size: int) -> str:
+    return "".join(rng.choice(WORDS) for _ in range(size // 2))[:size]
+
+
+def _histories(points: list[str], versions: int, content_size: int, seed: int = 7) -> dict[str, list[dict]]:
+    """每个知识点的版本序列（旧到新）"""
+    rng = random.Random(seed)
+    histories = {}
+    for point_id in points:
+        content = _text(rng, content_size)
+        links = {"outgoing": [], "incoming": []}
+        history = []
+        for v in range(versions):
+            if history and rng.random() < 0.1:
+                previous = rng.choice(history)
+                content, links = previous["content"], previous["links"]
+            elif rng.random() < 0.7:
+                at = rng.randrange(len(content))
+                content = content[:at] + _text(rng, 40) + content[at + rng.randrange(40):]
+            else:
+                content += _text(rng, 60)
+            if rng.random() < 0.05:
+                links = {"outgoing": links["outgoing"] + [rng.choice(points)], "incoming": links["incoming"]}
+            history.append({"point_id": point_id, "title": f"{point_id} v{v}", "content": content,
+                            "source": "bench", "page": str(v // 20), "links": links,
+                            "timestamp": (START + timedelta(minutes=v)).strftime("%Y-%m-%d %H:%M:%S.%f")})
+        histories[point_id] = history
+    return histories
+
+
+def _db_size(conn) -> int:
+    conn.exec_driver_sql("VACUUM")
+    return conn.exec_driver_sql("PRAGMA page_count").scalar() * conn.exec_driver_sql("PRAGMA page_size").scalar()
+
+
+def _median(run, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - start) * 1000)
+    return sorted(timings)[len(timings) // 2]
+
+
+def _legacy_reads(conn, point_id: str, snapshot_id: str, repeat: int) -> tuple[float, float]:
+    def history():
+        rows = conn.exec_driver_sql(
+            "SELECT * FROM snapshots WHERE point_id = ? ORDER BY timestamp DESC", (point_id,)
+        ).all()
+        return [json.loads(row.links) for row in rows]
+
+    def restore():
+        return conn.exec_driver_sql("SELECT * FROM snapshots WHERE id = ?", (snapshot_id,)).one()
+
+    return _median(history, repeat), _median(restore, repeat)
+
+
+def _new_reads(point_id: str, snapshot_id: str, repeat: int) -> tuple[float, float]:
+    with SessionLocal() as db:
+        history = _median(lambda: crud.get_snapshots(db, point_id, days=100000), repeat)
+        restore = _median(lambda: snapshot_store.load(db, snapshot_id), repeat)
+    return history, restore
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=200)
+    parser.add_argument("--versions", type=int, default=60)
+    parser.add_argument("--content-size", type=int, default=4000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    init_db()
+    with engine.begin() as conn:
+        point_ids = populate_library(conn, LIBRARY_ID, args.points, links_per_point=0, snapshots_per_point=0)
+        # 退回迁移 8 之前的结构
+        conn.exec_driver_sql("DROP TABLE snapshots")
+        for statement in LEGACY_DDL:
+            conn.exec_driver_sql(statement)
+        conn.exec_driver_sql("DELETE FROM schema_version WHERE version >= 8")
+    with engine.connect() as conn:
+        base_size = _db_size(conn)
+
+    histories = _histories(point_ids, args.versions, args.content_size)
+    total = args.points * args.versions
+    print(f"{args.points} points x {args.versions} versions, content ~{args.content_size} chars")
+
+    # 旧结构：每个版本一行完整内容（与原 _create_snapshot 相同，每行单独提交）
+    start = time.perf_counter()
+    for history in zip(*histories.values()):
+        for row, snapshot_id in zip(history, generate_ids(len(history))):
+            row["id"] = snapshot_id
+            with engine.begin() as conn:
+                conn.exec_driver_sql(LEGACY_INSERT, (
+                    snapshot_id, row["point_id"], row["title"], row["content"], row["source"],
+                    row["page"], json.dumps(row["links"], ensure_ascii=False), row["timestamp"]
+                ))
+    legacy_write = (time.perf_counter() - start) * 1000 / total
+    with engine.connect() as conn:
+        legacy_size = _db_size(conn) - base_size
+
+    # 旧结构读取单个版本按主键取一行，与版本先后无关
+    sample = point_ids[len(point_ids) // 2]
+    with engine.connect() as conn:
+        legacy_history, legacy_restore = _legacy_reads(conn, sample, histories[sample][-1]["id"], args.repeat)
+
+    start = time.perf_counter()
+    applied = run_migrations(engine)
+    migrate_ms = (time.perf_counter() - start) * 1000
+    with engine.connect() as conn:
+        new_size = _db_size(conn) - base_size
+        kinds = dict(conn.exec_driver_sql("SELECT kind, COUNT(*) FROM snapshots GROUP BY kind").all())
+        # 新结构恢复的最坏情况：离关键帧最远的版本
+        deepest = conn.exec_driver_sql(
+            "SELECT id FROM snapshots WHERE point_id = ? ORDER BY depth DESC LIMIT 1", (sample,)
+        ).scalar()
+    new_history, new_restore = _new_reads(sample, deepest, args.repeat)
+
+    # 新结构写入：每个新版本单独调用 add 并提交（与 _create_snapshot 相同）
+    extra = _histories(point_ids[:50], 10, args.content_size, seed=11)
+    rows = [row for history in zip(*extra.values()) for row in history]
+    start = time.perf_counter()
+    with SessionLocal() as db:
+        for row, snapshot_id in zip(rows, generate_ids(len(rows))):
+            snapshot_store.add(db, [{**row, "id": snapshot_id, "library_id": LIBRARY_ID, "timestamp": START}])
+            db.commit()
+    new_write = (time.perf_counter() - start) * 1000 / len(rows)
+
+    print(f"Migration {applied}: {migrate_ms:.0f} ms "
+          f"(keyframes {kinds.get(snapshot_store.FULL, 0)}, deltas {kinds.get(snapshot_store.DELTA, 0)}, "
+          f"refs {kinds.get(snapshot_store.REF, 0)})")
+    print(f"  {'':<28} {'legacy':>10} {'keyframe+delta':>15}")
+    print(f"  {'snapshot storage (KB)':<28} {legacy_size / 1024:10.0f} {new_size / 1024:15.0f}")
+    print(f"  {'history of one point (ms)':<28} {legacy_history:10.2f} {new_history:15.2f}")
+    print(f"  {'restore deepest version (ms)':<28} {legacy_restore:10.3f} {new_restore:15.3f}")
+    print(f"  {'write one snapshot (ms)':<28} {legacy_write:10.3f} {new_write:15.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+图遍历基准：在 10 万条链接的知识库上测量遍历查询的延迟（p50 / p95）
+
+用法：python -m benchmarks.bench_traversal [--points 50000] [--links-per-point 2] [--samples 200]
+分别测量递归 CTE（关闭图缓存）与进程内图缓存两种实现，以及 get_links 整库链接列表；
+随机图的平均度约为 4，最短路径一般为 8~11 步；p95 超过目标延迟时标记 SLOW。
+"""
+import argparse
+import random
+import time
+
+from benchmarks._common import populate_library, use_temp_database
+
+use_temp_database()
+
+from backend import crud, graph_cache  # noqa: E402
+from backend.database import ReadSessionLocal, engine, init_db  # noqa: E402
+
+# (名称, 调用, 目标 p95 毫秒)
+CASES = [
+    ("descendants depth=10", lambda db, a, b: crud.get_descendants(db, a, 10), 20),
+    ("ancestors depth=10", lambda db, a, b: crud.get_ancestors(db, a, 10), 20),
+    ("neighborhood hops=1", lambda db, a, b: crud.get_neighborhood(db, a, 1), 10),
+    ("neighborhood hops=2", lambda db, a, b: crud.get_neighborhood(db, a, 2), 20),
+    ("neighborhood hops=3", lambda db, a, b: crud.get_neighborhood(db, a, 3), 50),
+    ("shortest_path max=16", lambda db, a, b: crud.get_shortest_path(db, a, b, 16), 50),
+]
+
+
+def _percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def _measure(db, call, pairs) -> list[float]:
+    timings = []
+    for a, b in pairs:
+        start = time.perf_counter()
+        call(db, a, b)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def _legacy_get_links(db, library_id: str):
+    """旧实现：先取全部知识点 ID，再用两个 IN 列表筛选链接"""
+    from sqlalchemy import select
+    from backend.models import Link, Point
+    point_ids = db.scalars(select(Point.id).where(Point.library_id == library_id)).all()
+    return db.scalars(select(Link).where(Link.from_id.in_(point_ids), Link.to_id.in_(point_ids))).all()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=50000)
+    parser.add_argument("--links-per-point", type=int, default=2)
+    parser.add_argument("--samples", type=int, default=200)
+    args = parser.parse_args()
+
+    init_db()
+    with engine.begin() as conn:
+        point_ids = populate_library(conn, "lib0000", args.points, links_per_point=args.links_per_point,
+                                     snapshots_per_point=0)
+        conn.exec_driver_sql("ANALYZE")
+        edges = conn.exec_driver_sql("SELECT COUNT(*) FROM links").scalar()
+    print(f"{args.points} points, {edges} links, {args.samples} samples per query")
+
+    random.seed(0)
+    pairs = [(random.choice(point_ids), random.choice(point_ids)) for _ in range(args.samples)]
+    cache_size = graph_cache.MAX_LIBRARIES
+    with ReadSessionLocal() as db:
+        for label, size in (("recursive CTE", 0), ("graph cache", cache_size)):
+            graph_cache.MAX_LIBRARIES = size
+            if size:
+                start = time.perf_counter()
+                graph_cache.get("lib0000")
+                print(f"{label} (load {(time.perf_counter() - start) * 1000:.0f} ms):")
+            else:
+                print(f"{label}:")
+            for name, call, target in CASES:
+                timings = _measure(db, call, pairs)
+                p95 = _percentile(timings, 0.95)
+                status = "ok" if p95 <= target else "SLOW"
+                print(f"  {name:<22} p50 {_percentile(timings, 0.5):7.2f} ms  p95 {p95:7.2f} ms  "
+                      f"(target {target} ms) {status}")
+
+        print("get_links (whole library):")
+        for label, call in (
+            ("IN lists (old)", lambda: _legacy_get_links(db, "lib0000")),
+            ("join", lambda: (setattr(graph_cache, "MAX_LIBRARIES", 0), crud.get_links(db, "lib0000"))),
+            ("graph cache", lambda: (setattr(graph_cache, "MAX_LIBRARIES", cache_size),
+                                     crud.get_links(db, "lib0000"))),
+        ):
+            start = time.perf_counter()
+            for _ in range(3):
+                call()
+            print(f"  {label:<22} {(time.perf_counter() - start) * 1000 / 3:8.1f} ms")
+    print(graph_cache.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+视口查询基准：在大知识库上测量 in-bbox 查询（单个节点 / 网格聚合）的延迟
+
+用法：python -m benchmarks.bench_viewport [--points 500000] [--samples 50]
+坐标在 ±5000 内均匀分布；按画布 1600×1000 像素、不同缩放比例随机取视口，
+同时报告写入时触发器维护 R*Tree 的开销（批量写入耗时）。
+"""
+import argparse
+import random
+import time
+
+from benchmarks._common import populate_library, use_temp_database
+
+use_temp_database()
+
+from backend import crud  # noqa: E402
+from backend.database import ReadSessionLocal, engine, init_db  # noqa: E402
+
+VIEW_WIDTH, VIEW_HEIGHT = 1600, 1000
+ZOOMS = (2.0, 1.0, 0.5, 0.35, 0.2, 0.1)
+
+
+def _percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=500000)
+    parser.add_argument("--samples", type=int, default=50)
+    args = parser.parse_args()
+
+    init_db()
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        populate_library(conn, "lib0000", args.points, links_per_point=1, snapshots_per_point=0)
+        populate_library(conn, "lib0001", args.points // 10, links_per_point=1, snapshots_per_point=0)
+        conn.exec_driver_sql("ANALYZE")
+    print(f"populated {args.points} + {args.points // 10} points in {time.perf_counter() - start:.1f} s "
+          f"(includes R*Tree triggers)")
+
+    random.seed(0)
+    with ReadSessionLocal() as db:
+        for zoom in ZOOMS:
+            width, height = VIEW_WIDTH / zoom, VIEW_HEIGHT / zoom
+            timings, sizes, mode = [], [], None
+            for _ in range(args.samples):
+                cx, cy = random.uniform(-5000, 5000), random.uniform(-5000, 5000)
+                begin = time.perf_counter()
+                result = crud.get_points_in_bbox(db, "lib0000", cx - width / 2, cy - height / 2,
+                                                 cx + width / 2, cy + height / 2, zoom)
+                timings.append((time.perf_counter() - begin) * 1000)
+                mode = result["mode"]
+                sizes.append(len(result["points"]) if mode == "points" else len(result["clusters"]))
+            print(f"  zoom {zoom:<5} {mode:<9} ~{sum(sizes) / len(sizes):7.0f} items  "
+                  f"p50 {_percentile(timings, 0.5):7.1f} ms  p95 {_percentile(timings, 0.95):7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,45 @@
+// 节点数超过该值时不在浏览器里跑 O(n²) 的实时物理模拟，布局改由服务端计算
+export const MAX_LIVE_PHYSICS = 1500;
+// 视口模式下按可见范围外扩该比例加载，平移一小段时不必重新请求
+const VIEWPORT_MARGIN = 0.5;
+
 export class NetworkEngine {
-    constructor(canvas, { libraryId, points, edges = [], libraryConfig, onContextMenu, onLink }) {
+    /**
+     * loadViewport: 可选，传入时进入视口模式——不一次性加载全部节点，而是在平移 / 缩放后
+     * 以 ({ minX, minY, maxX, maxY, zoom }) 调用它，按返回的 { mode, points, links, clusters }
+     * 替换当前节点，缩小时显示网格聚合
+     * graph: 可选，列式图数据（见 graphPayload.js），传入时代替 points / edges
+     */
+    constructor(canvas, { libraryId, points = [], edges = [], graph = null, libraryConfig, onContextMenu, onLink, onLayoutChange, loadViewport }) {
         this.canvas = canvas;
         this.ctx = canvas.getContext('2d');
         this.libraryId = libraryId;
         this.libraryConfig = libraryConfig;
         this.onContextMenu = onContextMenu;
         this.onLink = onLink; // Callback for link creation
+        this.onLayoutChange = onLayoutChange; // 保存坐标回调：([[id, x, y], ...]) => Promise
 
         // Data
-        this.nodes = points.map(p => ({
-            ...p,
-            x: p.x || (Math.random() - 0.5) * 800,
-            y: p.y || (Math.random() - 0.5) * 600,
-            radius: 30,
-            vx: 0,
-            vy: 0,
-            visible: true
-        }));
-
-        // Edges need reference to node objects
-        this.edges = [];
-        this.loadEdges(edges);
+        // 布局持久化：记录已保存的坐标，拖拽结束或模拟稳定后只回写变化的节点
+        this.savedPositions = new Map();
+        if (graph) {
+            this.loadGraph(graph);
+        } else {
+            this.nodes = points.map(p => ({
+                ...p,
+                x: p.x || (Math.random() - 0.5) * 800,
+                y: p.y || (Math.random() - 0.5) * 600,
+                radius: 30,
+                vx: 0,
+                vy: 0,
+                visible: true
+            }));
+            points.filter(p => p.x || p.y).forEach(p => this.savedPositions.set(p.id, { x: p.x, y: p.y }));
+
+            // Edges need reference to node objects
+            this.edges = [];
+            this.loadEdges(edges);
+        }
 
         // Camera / Viewport
         this.camera = { x: 0, y: 0, k: 1 };
@@ -45,6 +64,18 @@ export class NetworkEngine {
         this.relatedNodes = new Set(); // Nodes connected to selected
         this.highlightedIds = null; // Set of IDs from search matches
 
+        this.layoutTimer = null;
+        this.settled = false;
+
+        // 视口模式
+        this.loadViewport = loadViewport || null;
+        this.viewportMode = Boolean(loadViewport);
+        this.clusters = [];
+        this.loadedBounds = null;  // 当前数据覆盖的世界坐标范围及缩放
+        this.viewportTimer = null;
+        this.viewportRequest = 0;
+        this.filter = null;  // { tagIds, mode }，视口数据替换后重新应用
+
         this.bindEvents();
         this.resize();
     }
@@ -58,6 +89,35 @@ export class NetworkEngine {
         }).filter(e => e);
     }
 
+    /**
+     * 从列式图数据建立节点和边：按下标取值，边的端点直接按下标对应节点，不按 ID 查找
+     */
+    loadGraph({ tags, linkTypes, ids, titles, x, y, tagOffsets, tagIndexes, linkIds, source, target, types }) {
+        this.nodes = new Array(ids.length);
+        for (let i = 0; i < ids.length; i++) {
+            const nodeTags = [];
+            for (let k = tagOffsets[i]; k < tagOffsets[i + 1]; k++) nodeTags.push(tags[tagIndexes[k]]);
+            this.nodes[i] = {
+                id: ids[i],
+                title: titles[i],
+                tags: nodeTags,
+                x: x[i] || (Math.random() - 0.5) * 800,
+                y: y[i] || (Math.random() - 0.5) * 600,
+                radius: 30,
+                vx: 0,
+                vy: 0,
+                visible: true
+            };
+            if (x[i] || y[i]) this.savedPositions.set(ids[i], { x: x[i], y: y[i] });
+        }
+        this.edges = new Array(linkIds.length);
+        for (let i = 0; i < linkIds.length; i++) {
+            const from = this.nodes[source[i]];
+            const to = this.nodes[target[i]];
+            this.edges[i] = { id: linkIds[i], fromId: from.id, toId: to.id, type: linkTypes[types[i]], source: from, target: to };
+        }
+    }
+
     addNode(point) {
         const node = {
             ...point,
@@ -77,6 +137,7 @@ export class NetworkEngine {
     }
 
     removeNode(id) {
+        this.savedPositions.delete(id);
         this.nodes = this.nodes.filter(n => n.id !== id);
         this.edges = this.edges.filter(e => e.source.id !== id && e.target.id !== id);
     }
@@ -102,6 +163,7 @@ export class NetworkEngine {
     stop() {
         this.running = false;
         cancelAnimationFrame(this.animationId);
+        clearTimeout(this.viewportTimer);
     }
 
     loop() {
@@ -113,6 +175,7 @@ export class NetworkEngine {
 
     update() {
         if (!this.running) return;
+        if (this.viewportMode || this.nodes.length > MAX_LIVE_PHYSICS) return;
 
         const repulsion = 2000;
         const springLength = 150;
@@ -166,6 +229,7 @@ export class NetworkEngine {
         });
 
         // 3. Center Gravity
+        let energy = 0;
         this.nodes.forEach(node => {
             if (this.isDraggingNode && this.draggedNode === node) return;
 
@@ -179,12 +243,210 @@ export class NetworkEngine {
 
             node.x += node.vx;
             node.y += node.vy;
+            energy += node.vx * node.vx + node.vy * node.vy;
+        });
+
+        // 4. 稳定检测：平均速度足够小时保存一次布局
+        const settled = energy < 0.01 * this.nodes.length;
+        if (settled && !this.settled) this.scheduleLayoutSave();
+        this.settled = settled;
+    }
+
+    scheduleLayoutSave(delay = 800) {
+        clearTimeout(this.layoutTimer);
+        this.layoutTimer = setTimeout(() => this.flushLayout(), delay);
+    }
+
+    flushLayout() {
+        clearTimeout(this.layoutTimer);
+        this.layoutTimer = null;
+        if (!this.onLayoutChange) return;
+
+        const changed = [];
+        this.nodes.forEach(node => {
+            if (!Number.isFinite(node.x) || !Number.isFinite(node.y)) return;
+            const saved = this.savedPositions.get(node.id);
+            if (saved && Math.abs(saved.x - node.x) < 0.5 && Math.abs(saved.y - node.y) < 0.5) return;
+            const x = Math.round(node.x * 10) / 10;
+            const y = Math.round(node.y * 10) / 10;
+            changed.push([node.id, x, y]);
+            this.savedPositions.set(node.id, { x, y });
+        });
+        if (changed.length === 0) return;
+
+        Promise.resolve(this.onLayoutChange(changed)).catch(err => {
+            // 保存失败时下次重新提交这些节点
+            console.error('Failed to save layout', err);
+            changed.forEach(([id]) => this.savedPositions.delete(id));
         });
     }
 
+    // ================= Viewport Mode =================
+
+    /**
+     * 当前画布对应的世界坐标范围
+     */
+    getViewBounds() {
+        const { width, height } = this.canvas;
+        const k = this.camera.k;
+        return {
+            minX: (-width / 2 - this.camera.x) / k,
+            minY: (-height / 2 - this.camera.y) / k,
+            maxX: (width / 2 - this.camera.x) / k,
+            maxY: (height / 2 - this.camera.y) / k,
+            zoom: k
+        };
+    }
+
+    /**
+     * 平移 / 缩放后延迟加载视口数据；可见范围仍在已加载范围内且缩放未变时不请求
+     */
+    scheduleViewportLoad(delay = 150) {
+        if (!this.viewportMode) return;
+        const view = this.getViewBounds();
+        const loaded = this.loadedBounds;
+        if (loaded && loaded.zoom === view.zoom &&
+            view.minX >= loaded.minX && view.maxX <= loaded.maxX &&
+            view.minY >= loaded.minY && view.maxY <= loaded.maxY) {
+            return;
+        }
+        clearTimeout(this.viewportTimer);
+        this.viewportTimer = setTimeout(() => this.refreshViewport(), delay);
+    }
+
+    async refreshViewport() {
+        if (!this.viewportMode) return;
+        const view = this.getViewBounds();
+        const padX = (view.maxX - view.minX) * VIEWPORT_MARGIN;
+        const padY = (view.maxY - view.minY) * VIEWPORT_MARGIN;
+        const bounds = {
+            minX: view.minX - padX, minY: view.minY - padY,
+            maxX: view.maxX + padX, maxY: view.maxY + padY,
+            zoom: view.zoom
+        };
+
+        // 只采用最后一次请求的结果
+        const request = ++this.viewportRequest;
+        try {
+            const result = await this.loadViewport(bounds);
+            if (request !== this.viewportRequest) return;
+            this.applyViewport(result);
+            this.loadedBounds = bounds;
+        } catch (err) {
+            console.error('Failed to load viewport', err);
+        }
+    }
+
+    applyViewport({ mode, points = [], links = [], clusters = [] }) {
+        this.flushLayout();  // 被替换前保存已拖动的节点
+        if (mode === 'clusters') {
+            this.nodes = [];
+            this.edges = [];
+            this.clusters = clusters;
+        } else {
+            // 已加载的节点沿用原对象，保留选中 / 拖动状态
+            const existing = new Map(this.nodes.map(n => [n.id, n]));
+            this.nodes = points.map(p => {
+                const node = existing.get(p.id);
+                if (node) return node;
+                this.savedPositions.set(p.id, { x: p.x, y: p.y });
+                return { ...p, radius: 30, vx: 0, vy: 0, visible: true };
+            });
+            const byId = new Map(this.nodes.map(n => [n.id, n]));
+            this.edges = links.map(l => {
+                const source = byId.get(l.fromId);
+                const target = byId.get(l.toId);
+                return source && target ? { ...l, source, target } : null;
+            }).filter(e => e);
+            this.clusters = [];
+        }
+        if (this.selectedNode && !this.nodes.includes(this.selectedNode)) this.selectNode(null);
+        if (this.filter) this.updateFilter(this.filter.tagIds, this.filter.mode);
+        this.draw();
+    }
+
+    /**
+     * 应用增量变更（GET /changes 的结果）：已有节点原地更新，保留选中 / 拖动状态
+     */
+    applyChanges({ points = [], links = [], deleted_points = [], deleted_links = [] }) {
+        const removedLinks = new Set([...deleted_links, ...links.map(l => l.id)]);
+        this.edges = this.edges.filter(e => !removedLinks.has(e.id));
+        deleted_points.forEach(id => this.removeNode(id));
+
+        const byId = new Map(this.nodes.map(n => [n.id, n]));
+        for (const point of points) {
+            this.savedPositions.set(point.id, { x: point.x, y: point.y });
+            const node = byId.get(point.id);
+            if (node) {
+                // 正在拖拽的节点保留当前位置
+                if (node === this.draggedNode) {
+                    const { x, y, ...rest } = point;
+                    Object.assign(node, rest);
+                } else {
+                    Object.assign(node, point);
+                }
+            } else {
+                const added = { ...point, radius: 30, vx: 0, vy: 0, visible: true };
+                this.nodes.push(added);
+                byId.set(added.id, added);
+            }
+        }
+        for (const link of links) {
+            const source = byId.get(link.fromId);
+            const target = byId.get(link.toId);
+            if (source && target) this.edges.push({ ...link, source, target });
+        }
+        if (this.selectedNode && !this.nodes.includes(this.selectedNode)) this.selectNode(null);
+        if (this.filter) this.updateFilter(this.filter.tagIds, this.filter.mode);
+        this.draw();
+    }
+
+    /**
+     * 将镜头移到世界坐标 (x, y)（视口模式下目标节点可能尚未加载）
+     */
+    focusPosition(x, y, zoom = this.camera.k) {
+        this.camera.k = zoom;
+        this.camera.x = -x * zoom;
+        this.camera.y = -y * zoom;
+        this.draw();
+        this.scheduleViewportLoad(0);
+    }
+
+    drawCluster(ctx, cluster) {
+        // 半径按屏幕像素计算，与缩放无关
+        const k = this.camera.k;
+        const radius = (12 + 6 * Math.log10(cluster.count)) / k;
+        const color = cluster.color || '#3F51B5';
+
+        ctx.beginPath();
+        ctx.arc(cluster.x, cluster.y, radius, 0, Math.PI * 2);
+        ctx.globalAlpha = 0.35;
+        ctx.fillStyle = color;
+        ctx.fill();
+        ctx.globalAlpha = 1;
+        ctx.lineWidth = 2 / k;
+        ctx.strokeStyle = color;
+        ctx.stroke();
+
+        ctx.fillStyle = '#ffffff';
+        ctx.font = `${12 / k}px Inter, sans-serif`;
+        ctx.textAlign = 'center';
+        ctx.textBaseline = 'middle';
+        ctx.fillText(String(cluster.count), cluster.x, cluster.y);
+    }
+
+    clusterHitTest(pos) {
+        const k = this.camera.k;
+        return this.clusters.find(c => {
+            const radius = (12 + 6 * Math.log10(c.count)) / k;
+            return (c.x - pos.x) ** 2 + (c.y - pos.y) ** 2 < radius * radius;
+        }) || null;
+    }
+
     updateFilter(tagIds, mode) {
         // tagIds: null/empty means all visible
         // mode: 'AND' or 'OR'
+        this.filter = { tagIds, mode };
 
         this.nodes.forEach(node => {
             if (!tagIds || tagIds.length === 0) {
@@ -249,6 +511,9 @@ export class NetworkEngine {
         ctx.translate(width / 2 + this.camera.x, height / 2 + this.camera.y);
         ctx.scale(this.camera.k, this.camera.k);
 
+        // 视口模式缩小时只画网格聚合
+        this.clusters.forEach(cluster => this.drawCluster(ctx, cluster));
+
         // Draw Links
         this.edges.forEach(edge => {
             if (edge.source.visible !== false && edge.target.visible !== false) {
@@ -423,6 +688,15 @@ export class NetworkEngine {
         const pos = this.getMouseWorldPos(e);
         const clickedNode = this.hitTest(pos);
 
+        // 双击聚合：放大到该网格
+        const cluster = clickedNode ? null : this.clusterHitTest(pos);
+        if (cluster) {
+            const { width, height } = this.canvas;
+            const zoom = Math.min(5, 0.8 * Math.min(width / (cluster.max_x - cluster.min_x), height / (cluster.max_y - cluster.min_y)));
+            this.focusPosition((cluster.min_x + cluster.max_x) / 2, (cluster.min_y + cluster.max_y) / 2, zoom);
+            return;
+        }
+
         if (clickedNode) {
             // 显示节点 ID，方便复制
             const idDisplay = document.createElement('div');
@@ -461,6 +735,7 @@ export class NetworkEngine {
         this.canvas.width = window.innerWidth;
         this.canvas.height = window.innerHeight;
         this.draw();
+        this.scheduleViewportLoad();
     }
 
     getMouseWorldPos(e) {
@@ -541,6 +816,9 @@ export class NetworkEngine {
             this.linkingNode = null;
         }
 
+        if (this.draggedNode) this.scheduleLayoutSave();
+        if (this.isDraggingCanvas) this.scheduleViewportLoad();
+
         this.isDraggingCanvas = false;
         this.isDraggingNode = false;
         this.draggedNode = null;
@@ -554,6 +832,7 @@ export class NetworkEngine {
         const zoom = Math.exp(wheel * zoomIntensity);
         this.camera.k = Math.max(0.1, Math.min(5, this.camera.k * zoom));
         this.draw();
+        this.scheduleViewportLoad();
     }
 
     onContextMenuEvent(e) {
@@ -0,0 +1,44 @@
+/**
+ * 画布图数据的二进制解码（GET /api/libraries/{id}/graph?format=binary）
+ * 布局见 backend/graph_payload.py：魔数 + 头部长度 + JSON 头部（字符串列）+ 小端数值列。
+ * 数值列直接作为 TypedArray 视图返回，不复制、不逐个解析对象
+ * （TypedArray 按本机字节序读取，浏览器运行的平台都是小端）。
+ */
+const MAGIC = 'KNG1';
+
+/**
+ * @param {ArrayBuffer} buffer
+ * @returns {Object} { revision, tags, linkTypes, ids, titles, x, y, tagOffsets, tagIndexes,
+ *                     linkIds, source, target, types }；第 i 个知识点的标签为
+ *                     tags[tagIndexes[k]]，k ∈ [tagOffsets[i], tagOffsets[i + 1])
+ */
+export function decodeGraph(buffer) {
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+    if (magic !== MAGIC) throw new Error('Unsupported graph payload');
+    const headerLength = new DataView(buffer).getUint32(4, true);
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 8, headerLength)));
+
+    let offset = 8 + headerLength;
+    const take = (Type, count) => {
+        const array = new Type(buffer, offset, count);
+        offset += array.byteLength;
+        return array;
+    };
+    const n = header.point_ids.length;
+    const e = header.link_ids.length;
+    return {
+        revision: header.revision,
+        tags: header.tags,
+        linkTypes: header.link_types,
+        ids: header.point_ids,
+        titles: header.titles,
+        linkIds: header.link_ids,
+        x: take(Float32Array, n),
+        y: take(Float32Array, n),
+        tagOffsets: take(Uint32Array, n + 1),
+        tagIndexes: take(Uint32Array, header.tag_ref_count),
+        source: take(Uint32Array, e),
+        target: take(Uint32Array, e),
+        types: take(Uint16Array, e)
+    };
+}
@@ -4,8 +4,12 @@
  * All methods return Promises for async operations.
  */
 
+import { decodeGraph } from './network/graphPayload.js';
+
 // 使用相对路径，前端由后端静态文件服务提供
 const API_BASE = '/api';
+// 分页列表每页条数（后端上限 5000）
+const PAGE_SIZE = 2000;
 
 // Helper: Fetch with error handling
 async function apiFetch(url, options = {}) {
@@ -30,6 +34,32 @@ async function apiFetch(url, options = {}) {
     return response.json();
 }
 
+// Helper: Parse download filename from Content-Disposition (prefers RFC 5987 filename*)
+function filenameFromResponse(response, fallback) {
+    const disposition = response.headers.get('Content-Disposition') || '';
+    const encoded = disposition.match(/filename\*=UTF-8''([^;]+)/)?.[1];
+    if (encoded) return decodeURIComponent(encoded);
+    return disposition.match(/filename="(.+?)"/)?.[1] || fallback;
+}
+
+// Helper: Fetch every page of a keyset-paginated list (follows X-Next-Cursor)
+async function fetchAllPages(url, params = {}) {
+    const items = [];
+    let cursor = null;
+    do {
+        const query = new URLSearchParams({ ...params, limit: PAGE_SIZE });
+        if (cursor) query.set('cursor', cursor);
+        const response = await fetch(`${url}?${query}`);
+        if (!response.ok) {
+            const error = await response.json().catch(() => ({ detail: 'Unknown error' }));
+            throw new Error(error.detail || `HTTP ${response.status}`);
+        }
+        items.push(...await response.json());
+        cursor = response.headers.get('X-Next-Cursor');
+    } while (cursor);
+    return items;
+}
+
 class Store {
     constructor() {
         // No local cache needed, all data from server
@@ -75,10 +105,34 @@ class Store {
                 description: updates.notes || updates.description,  // 兼容前端 notes 字段
                 tags: updates.tags,
                 sources: updates.sources,
+                snapshot_retention_days: updates.snapshotRetentionDays,
             }),
         });
     }
 
+    /**
+     * 保存节点坐标
+     * @param {Array} positions - [[id, x, y], ...]
+     */
+    async saveLayout(libraryId, positions) {
+        return apiFetch(`${API_BASE}/libraries/${libraryId}/layout`, {
+            method: 'PATCH',
+            body: JSON.stringify(positions),
+        });
+    }
+
+    /**
+     * 服务端计算力导向布局
+     * @param {Object} options - { iterations, temperature, incremental }
+     * @returns {Promise<{positions: Array, moved: number}>} positions 为 [[id, x, y], ...]
+     */
+    async computeLayout(libraryId, options = {}) {
+        return apiFetch(`${API_BASE}/libraries/${libraryId}/layout/compute`, {
+            method: 'POST',
+            body: JSON.stringify(options),
+        });
+    }
+
     async deleteLibrary(id) {
         await apiFetch(`${API_BASE}/libraries/${id}`, {
             method: 'DELETE',
@@ -86,10 +140,60 @@ class Store {
         return true;
     }
 
+    /**
+     * 增量同步：修订号 since 之后的变更
+     * 返回 { revision, reset, library, points, links, deleted_points, deleted_links }，reset 时需整库重新加载
+     */
+    async getChanges(libraryId, since) {
+        return apiFetch(`${API_BASE}/libraries/${libraryId}/changes?since=${since}`);
+    }
+
+    /**
+     * 订阅知识库的实时事件（SSE，断线后浏览器自动重连）
+     * @param {Object} handlers - { hello, change, reset, deleted }，参数为事件数据
+     * @returns {EventSource} 调用 close() 取消订阅
+     */
+    subscribeEvents(libraryId, handlers) {
+        const source = new EventSource(`${API_BASE}/libraries/${libraryId}/events`);
+        for (const [type, handler] of Object.entries(handlers)) {
+            source.addEventListener(type, e => handler(JSON.parse(e.data)));
+        }
+        return source;
+    }
+
     // ================= Points =================
 
-    async getPoints(libraryId) {
-        return apiFetch(`${API_BASE}/libraries/${libraryId}/points`);
+    /**
+     * 获取知识库的全部知识点（分页拉取）
+     * @param {Object} options - { fields }，如 'id,title,x,y,tags'，不传时返回全部字段
+     */
+    async getPoints(libraryId, { fields = null } = {}) {
+        return fetchAllPages(`${API_BASE}/libraries/${libraryId}/points`, fields ? { fields } : {});
+    }
+
+    /**
+     * 画布用的整库图数据（二进制列式格式，解码见 network/graphPayload.js）
+     */
+    async getGraph(libraryId) {
+        const response = await fetch(`${API_BASE}/libraries/${libraryId}/graph?format=binary`);
+        if (!response.ok) {
+            const error = await response.json().catch(() => ({ detail: 'Unknown error' }));
+            throw new Error(error.detail || `HTTP ${response.status}`);
+        }
+        return decodeGraph(await response.arrayBuffer());
+    }
+
+    /**
+     * 视口查询：返回 { mode: 'points'|'clusters', points, links, clusters }
+     * @param {Object} bounds - { minX, minY, maxX, maxY, zoom }
+     */
+    async getPointsInBBox(libraryId, { minX, minY, maxX, maxY, zoom }) {
+        const query = new URLSearchParams({ minx: minX, miny: minY, maxx: maxX, maxy: maxY, zoom });
+        return apiFetch(`${API_BASE}/libraries/${libraryId}/points/in-bbox?${query}`);
+    }
+
+    async getPoint(id) {
+        return apiFetch(`${API_BASE}/points/${id}`);
     }
 
     async createPoint(pointData) {
@@ -145,8 +249,8 @@ class Store {
 
     // ================= Links =================
 
-    async getLinks(libraryId) {
-        return apiFetch(`${API_BASE}/libraries/${libraryId}/links`);
+    async getLinks(libraryId, { fields = null } = {}) {
+        return fetchAllPages(`${API_BASE}/libraries/${libraryId}/links`, fields ? { fields } : {});
     }
 
     async createLink(linkData) {
@@ -175,8 +279,49 @@ class Store {
         return true;
     }
 
+    // ================= Graph Traversal =================
+
+    async getDescendants(pointId, maxDepth = 10) {
+        return apiFetch(`${API_BASE}/points/${pointId}/descendants?max_depth=${maxDepth}`);
+    }
+
+    async getAncestors(pointId, maxDepth = 10) {
+        return apiFetch(`${API_BASE}/points/${pointId}/ancestors?max_depth=${maxDepth}`);
+    }
+
+    async getNeighborhood(pointId, hops = 1) {
+        return apiFetch(`${API_BASE}/points/${pointId}/neighborhood?hops=${hops}`);
+    }
+
+    async getShortestPath(fromId, toId, maxDepth = 12) {
+        return apiFetch(`${API_BASE}/points/${fromId}/path/${toId}?max_depth=${maxDepth}`);
+    }
+
     // ================= Batch Operations =================
 
+    /**
+     * 批量操作知识点（一个请求、一个事务）
+     * @param {Array} operations - [{ op: 'create'|'update'|'delete', id?, libraryId?, title?, content?, tags?, ... }]
+     * @returns {Promise<{results: Array, created: number, updated: number, deleted: number}>}
+     */
+    async batchPoints(operations) {
+        return apiFetch(`${API_BASE}/points:batch`, {
+            method: 'POST',
+            body: JSON.stringify({
+                operations: operations.map(({ libraryId, tags, ...rest }) => ({
+                    ...rest,
+                    library_id: libraryId,
+                    tags: tags === undefined ? undefined : tags.map(t => typeof t === 'string' ? t : t.name),
+                })),
+            }),
+        });
+    }
+
+    async deletePoints(ids) {
+        const result = await this.batchPoints(ids.map(id => ({ op: 'delete', id })));
+        return result.deleted;
+    }
+
     async countPointsByTag(libraryId, tagName) {
         const result = await apiFetch(
             `${API_BASE}/libraries/${libraryId}/points/count-by-tag?tagName=${encodeURIComponent(tagName)}`
@@ -198,6 +343,25 @@ class Store {
         return apiFetch(`${API_BASE}/points/${pointId}/snapshots?days=${days}`);
     }
 
+    /**
+     * 整库版本历史（所有知识点按时间合并，新的在前）的一页
+     * @param {Object} options - { limit, cursor, since, until, pointId, tag, fields }
+     * @returns {Promise<{items: Array, nextCursor: string|null}>}
+     */
+    async getLibrarySnapshots(libraryId, { limit = 50, cursor, since, until, pointId, tag, fields } = {}) {
+        const query = new URLSearchParams({ limit });
+        const params = { cursor, since, until, point_id: pointId, tag, fields };
+        for (const [key, value] of Object.entries(params)) {
+            if (value) query.set(key, value);
+        }
+        const response = await fetch(`${API_BASE}/libraries/${libraryId}/snapshots?${query}`);
+        if (!response.ok) {
+            const error = await response.json().catch(() => ({ detail: 'Unknown error' }));
+            throw new Error(error.detail || `HTTP ${response.status}`);
+        }
+        return { items: await response.json(), nextCursor: response.headers.get('X-Next-Cursor') };
+    }
+
     async restoreSnapshot(pointId, snapshotId) {
         return apiFetch(`${API_BASE}/points/${pointId}/restore`, {
             method: 'POST',
@@ -205,6 +369,12 @@ class Store {
         });
     }
 
+    // 整库恢复到 at 时刻；dryRun 时只返回差异
+    async restoreLibrary(libraryId, at, dryRun = false) {
+        const query = new URLSearchParams({ at, dry_run: dryRun });
+        return apiFetch(`${API_BASE}/libraries/${libraryId}/restore?${query}`, { method: 'POST' });
+    }
+
     // ================= Word Frequency =================
 
     async getWordFrequency(libraryId, mode = 'content') {
@@ -225,8 +395,7 @@ class Store {
         }
 
         const blob = await response.blob();
-        const filename = response.headers.get('Content-Disposition')?.match(/filename="(.+)"/)?.[1]
-            || `export.${format}`;
+        const filename = filenameFromResponse(response, `export.${format}`);
 
         // Trigger download
         const link = document.createElement('a');
@@ -238,11 +407,39 @@ class Store {
         return true;
     }
 
-    async batchExport(libraryIds = []) {
+    /**
+     * 导出知识点及其 depth 跳内的相关知识点（服务端展开）
+     * @param {Object} options - { depth, types, format }，types 为链接类型数组
+     * @returns {Promise<number>} 导出的知识点数量
+     */
+    async exportRelatedPoints(pointId, { depth = 1, types = null, format = 'markdown' } = {}) {
+        let url = `${API_BASE}/points/${pointId}/related/export?depth=${depth}&format=${format}`;
+        if (types) {
+            url += `&types=${encodeURIComponent(types.join(','))}`;
+        }
+
+        const response = await fetch(url);
+        if (!response.ok) {
+            throw new Error('Export failed');
+        }
+
+        const blob = await response.blob();
+        const filename = filenameFromResponse(response, `related.${format === 'markdown' ? 'md' : format}`);
+
+        const link = document.createElement('a');
+        link.href = URL.createObjectURL(blob);
+        link.download = filename;
+        link.click();
+        URL.revokeObjectURL(link.href);
+
+        return Number(response.headers.get('X-Point-Count'));
+    }
+
+    async batchExport(libraryIds = [], format = 'json') {
         const response = await fetch(`${API_BASE}/export/batch`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ library_ids: libraryIds })
+            body: JSON.stringify({ library_ids: libraryIds, format })
         });
 
         if (!response.ok) {
@@ -250,8 +447,7 @@ class Store {
         }
 
         const blob = await response.blob();
-        const filename = response.headers.get('Content-Disposition')?.match(/filename="(.+)"/)?.[1]
-            || `knowledge_batch_export.json`;
+        const filename = filenameFromResponse(response, `knowledge_batch_export.${format}`);
 
         const link = document.createElement('a');
         link.href = URL.createObjectURL(blob);
@@ -284,8 +480,9 @@ class Store {
         return apiFetch(`${API_BASE}/stats/global`);
     }
 
-    async searchGlobal(query) {
-        return apiFetch(`${API_BASE}/search/global?query=${encodeURIComponent(query)}`);
+    async searchGlobal(query, limit = 20, libraryId = null) {
+        const scope = libraryId ? `&library_id=${encodeURIComponent(libraryId)}` : '';
+        return apiFetch(`${API_BASE}/search/global?query=${encodeURIComponent(query)}&limit=${limit}${scope}`);
     }
 }
 
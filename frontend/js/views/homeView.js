@@ -30,7 +30,7 @@ export class HomeView {
                                 <!-- Results here -->
                              </div>
                         </div>
-                        <input type="file" id="import-input" accept=".json" style="display:none">
+                        <input type="file" id="import-input" accept=".json,.ndjson,.jsonl,.zip" style="display:none">
                         <button id="import-btn" class="btn btn-ghost" title="导入知识库" style="border: 1px solid var(--glass-border); padding: 10px;">
                             📥
                         </button>
@@ -117,6 +117,7 @@ export class HomeView {
                 <div style="display: flex; gap: 12px; font-size: 0.85rem; color: var(--text-300); border-top: 1px solid var(--glass-border); padding-top: 16px;">
                     <span>📊 ${lib.point_count || 0} 知识点</span>
                     <span>🔗 ${lib.link_count || 0} 链接</span>
+                    <span>📜 ${lib.snapshot_count || 0} 版本</span>
                 </div>
             </div>
         `).join('');
@@ -161,7 +162,12 @@ export class HomeView {
             try {
                 Toast.show('正在导入...', 'info');
                 const result = await store.importLibrary(file);
-                Toast.show(`成功导入 ${result.count} 个知识库`, 'success');
+                if (result.errors && result.errors.length) {
+                    const first = result.errors[0];
+                    Toast.show(`已导入 ${result.count} 个知识库，第 ${first.index + 1} 个失败: ${first.error}`, 'warning', 6000);
+                } else {
+                    Toast.show(`成功导入 ${result.count} 个知识库`, 'success');
+                }
                 this.loadLibraries();
             } catch (err) {
                 console.error(err);
@@ -239,7 +245,7 @@ export class HomeView {
                             <div style="font-size: 0.8rem; font-weight: bold; color: var(--primary-color); margin-bottom: 10px; border-bottom: 1px solid var(--glass-border); padding-bottom: 4px;">📂 知识库 (${results.libraries.length})</div>
                             ${results.libraries.map(lib => `
                                 <div class="search-result-item" style="padding: 8px; cursor: pointer; border-radius: 6px; transition: background 0.2s;" onclick="window.app.navigateTo('library', {id: '${lib.id}'})">
-                                    <div style="color: #fff; font-weight: 600;">${lib.name}</div>
+                                    <div style="color: #fff; font-weight: 600;">${lib.highlight || lib.name}</div>
                                     <div style="font-size: 0.8rem; color: var(--text-300);">${lib.description || '无描述'}</div>
                                 </div>
                             `).join('')}
@@ -251,7 +257,8 @@ export class HomeView {
                             <div style="font-size: 0.8rem; font-weight: bold; color: #4ECDC4; margin-bottom: 10px; border-bottom: 1px solid var(--glass-border); padding-bottom: 4px;">💡 知识点 (${results.points.length})</div>
                             ${results.points.map(p => `
                                 <div class="search-result-item" style="padding: 8px; cursor: pointer; border-radius: 6px; transition: background 0.2s;" onclick="window.app.navigateTo('library', {id: '${p.library_id}', focus: '${p.id}'})">
-                                    <div style="color: #fff; font-weight: 600;">${p.title}</div>
+                                    <div style="color: #fff; font-weight: 600;">${p.highlight || p.title}</div>
+                                    ${p.snippet ? `<div style="font-size: 0.8rem; color: var(--text-200);">${p.snippet}</div>` : ''}
                                     <div style="font-size: 0.8rem; color: var(--text-300);">所属库: ${p.library_name}</div>
                                 </div>
                             `).join('')}
@@ -278,7 +285,7 @@ export class HomeView {
 
             const content = `
                 <div style="margin-bottom: 20px;">
-                <p style="margin-bottom: 12px; color: var(--text-200);">选择要导出的知识库（JSON格式）：</p>
+                <p style="margin-bottom: 12px; color: var(--text-200);">选择要导出的知识库：</p>
                 <div style="background: var(--bg-dark-900); border: 1px solid var(--glass-border); border-radius: 8px; max-height: 300px; overflow-y: auto; padding: 12px;">
                     <label style="display: flex; align-items: center; gap: 8px; padding-bottom: 8px; border-bottom: 1px solid var(--glass-border); margin-bottom: 8px; font-weight: 600;">
                         <input type="checkbox" id="export-select-all"> 全选 / 取消全选
@@ -292,6 +299,14 @@ export class HomeView {
                         `).join('')}
                     </div>
                 </div>
+                <div style="display: flex; gap: 16px; margin-top: 12px;">
+                    <label style="display: flex; align-items: center; gap: 8px; cursor: pointer;">
+                        <input type="radio" name="batch-export-format" value="json" checked> JSON
+                    </label>
+                    <label style="display: flex; align-items: center; gap: 8px; cursor: pointer;" title="每个知识库一个 NDJSON 文件，适合大规模导出">
+                        <input type="radio" name="batch-export-format" value="zip"> ZIP (NDJSON)
+                    </label>
+                </div>
             </div>
         `;
 
@@ -309,9 +324,10 @@ export class HomeView {
                         return;
                     }
 
+                    const format = document.querySelector('input[name="batch-export-format"]:checked')?.value || 'json';
                     Toast.show('正在准备导出...', 'info');
                     try {
-                        await store.batchExport(selectedIds);
+                        await store.batchExport(selectedIds, format);
                         Toast.show('导出成功', 'success');
                         modal.hide();
                     } catch (e) {
@@ -415,6 +431,11 @@ export class HomeView {
                     <textarea id="edit-lib-sources" class="form-textarea" style="min-height: 80px;">${(library.sources || []).map(s => s.name).join('\n')}</textarea>
                 </div>
 
+                <div class="form-group">
+                    <label class="form-label">快照保留天数 (留空使用默认值，0 为永久保留)</label>
+                    <input type="number" id="edit-lib-retention" class="form-input" min="0" value="${library.snapshot_retention_days ?? ''}">
+                </div>
+
                 <div class="form-group">
                     <label class="form-label">标签配置</label>
                     <div style="border: 1px solid var(--glass-border); border-radius: var(--radius-md); padding: 12px; background: var(--bg-dark-900);">
@@ -448,12 +469,14 @@ export class HomeView {
                 const notes = document.getElementById('edit-lib-notes').value;
                 const sourcesRaw = document.getElementById('edit-lib-sources').value;
                 const sources = sourcesRaw.split('\n').filter(s => s.trim()).map(s => ({ name: s.trim() }));
+                const retention = document.getElementById('edit-lib-retention').value;
 
                 await store.updateLibrary(id, {
                     name,
                     notes,
                     sources,
-                    tags: currentTags
+                    tags: currentTags,
+                    snapshotRetentionDays: retention === '' ? null : Math.max(0, parseInt(retention, 10))
                 });
 
                 modal.hide();
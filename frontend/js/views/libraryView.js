@@ -4,6 +4,10 @@ import { Modal } from '../components/modal.js';
 import { Toast } from '../components/toast.js';
 import { undoManager } from '../undoManager.js';
 
+// 画布只需要这些字段；content / source / page 在编辑、删除等操作时按需加载
+// 知识点数超过该值时画布进入视口模式，只加载可见范围
+const VIEWPORT_MODE_THRESHOLD = 20000;
+
 export class LibraryView {
     constructor(rootElement, params) {
         this.root = rootElement;
@@ -12,14 +16,23 @@ export class LibraryView {
         this.library = null;
         this.network = null;
         this.contextMenu = new ContextMenu();
+        this.searchTimer = null;
+        this.revision = 0;  // 已加载数据对应的知识库修订号
+        this.events = null;  // SSE 订阅
+        this.syncing = false;
+        this.syncPending = false;
 
         // 绑定键盘事件
         this.handleKeyDown = this.handleKeyDown.bind(this);
         window.addEventListener('keydown', this.handleKeyDown);
+        // 切回页面时同步其他页面或脚本做出的修改
+        this.handleVisibilityChange = this.handleVisibilityChange.bind(this);
+        document.addEventListener('visibilitychange', this.handleVisibilityChange);
     }
 
     async render() {
         this.library = await store.getLibrary(this.libraryId);
+        this.revision = this.library?.revision || 0;
 
         if (!this.library) {
             this.root.innerHTML = `<div class="container flex-center"><h1>未找到该知识库</h1><button onclick="window.app.navigateTo('home')" class="btn btn-primary">返回首页</button></div>`;
@@ -75,7 +88,8 @@ export class LibraryView {
             </div>
         `;
 
-        this.initNetwork();
+        // 画布就绪后再订阅，hello 中较新的修订号才能增量应用
+        this.initNetwork().then(() => this.subscribeEvents());
         this.bindEvents();
         this.initFilterLogic();
     }
@@ -112,27 +126,42 @@ export class LibraryView {
             const query = e.target.value.trim().toLowerCase();
             if (!this.network) return;
 
+            clearTimeout(this.searchTimer);
             if (!query) {
                 this.network.highlightNodes(null);
                 return;
             }
 
-            const matchedIds = this.network.nodes
-                .filter(n => n.title.toLowerCase().includes(query) || n.content.toLowerCase().includes(query))
+            // 标题在本地匹配；内容不在画布数据中，稍后由本库的全文检索（含子串匹配）补充
+            const titleMatches = this.network.nodes
+                .filter(n => n.title.toLowerCase().includes(query))
                 .map(n => n.id);
+            this.network.highlightNodes(titleMatches);
 
-            this.network.highlightNodes(matchedIds);
+            this.searchTimer = setTimeout(async () => {
+                try {
+                    const result = await store.searchGlobal(query, 100, this.libraryId);
+                    if (searchInput.value.trim().toLowerCase() !== query || !this.network) return;
+                    const contentMatches = result.points.map(p => p.id);
+                    this.network.highlightNodes([...new Set([...titleMatches, ...contentMatches])]);
+                } catch (err) {
+                    console.error(err);
+                }
+            }, 300);
         };
-        searchInput.onkeydown = (e) => {
+        searchInput.onkeydown = async (e) => {
             if (e.key === 'Enter') {
                 const query = e.target.value.trim().toLowerCase();
                 if (!this.network || !query) return;
 
-                const firstMatch = this.network.nodes
-                    .find(n => n.title.toLowerCase().includes(query) || n.content.toLowerCase().includes(query));
+                let matchId = this.network.nodes.find(n => n.title.toLowerCase().includes(query))?.id;
+                if (!matchId) {
+                    const result = await store.searchGlobal(query, 1, this.libraryId);
+                    matchId = result.points[0]?.id;
+                }
 
-                if (firstMatch) {
-                    this.network.focusNode(firstMatch.id);
+                if (matchId) {
+                    this.focusPoint(matchId);
                 }
             }
         };
@@ -187,19 +216,61 @@ export class LibraryView {
 
     async initNetwork() {
         // Dynamic import
-        const { NetworkEngine } = await import('../network/engine.js');
+        const { NetworkEngine, MAX_LIVE_PHYSICS } = await import('../network/engine.js');
         const canvas = document.getElementById('network-canvas');
 
-        const points = await store.getPoints(this.libraryId);
-        const links = await store.getLinks(this.libraryId);
+        if (this.library.point_count > VIEWPORT_MODE_THRESHOLD) {
+            this.network = new NetworkEngine(canvas, {
+                libraryId: this.libraryId,
+                points: [],
+                libraryConfig: this.library,
+                onContextMenu: (params) => this.handleContextMenu(params),
+                onLink: (source, target) => this.handleCreateLink(source, target),
+                onLayoutChange: (positions) => store.saveLayout(this.libraryId, positions),
+                loadViewport: (bounds) => store.getPointsInBBox(this.libraryId, bounds)
+            });
+            this.network.start();
+            if (this.focusPointId) this.focusPoint(this.focusPointId);
+            return;
+        }
+
+        // 列式图数据：坐标等数值列是 TypedArray，不逐个解析知识点 / 链接对象
+        const graph = await store.getGraph(this.libraryId);
+        this.revision = graph.revision;
+        const count = graph.ids.length;
+
+        // 大图不跑浏览器端模拟：有未布局的节点时先由服务端计算（已有布局时只做增量）
+        let unplaced = 0;
+        for (let i = 0; i < count; i++) {
+            if (!graph.x[i] && !graph.y[i]) unplaced++;
+        }
+        if (count > MAX_LIVE_PHYSICS && unplaced > 0) {
+            try {
+                Toast.show('正在计算布局...', 'info');
+                const { positions } = await store.computeLayout(this.libraryId, {
+                    incremental: unplaced < count
+                });
+                const indexById = new Map(graph.ids.map((id, i) => [id, i]));
+                for (const [id, x, y] of positions) {
+                    const i = indexById.get(id);
+                    if (i !== undefined) {
+                        graph.x[i] = x;
+                        graph.y[i] = y;
+                    }
+                }
+            } catch (err) {
+                console.error(err);
+                Toast.show('布局计算失败: ' + err.message, 'error');
+            }
+        }
 
         this.network = new NetworkEngine(canvas, {
             libraryId: this.libraryId,
-            points: points,
-            edges: links,
+            graph,
             libraryConfig: this.library,
             onContextMenu: (params) => this.handleContextMenu(params),
-            onLink: (source, target) => this.handleCreateLink(source, target)
+            onLink: (source, target) => this.handleCreateLink(source, target),
+            onLayoutChange: (positions) => store.saveLayout(this.libraryId, positions)
         });
 
         this.network.start();
@@ -216,6 +287,96 @@ export class LibraryView {
         }
     }
 
+    handleVisibilityChange() {
+        if (document.visibilityState === 'visible') this.syncChanges();
+    }
+
+    /**
+     * 订阅实时事件：有比已加载数据更新的修订号时增量同步
+     */
+    subscribeEvents() {
+        const onRevision = ({ revision }) => {
+            if (revision > this.revision) this.syncChanges();
+        };
+        this.events = store.subscribeEvents(this.libraryId, {
+            hello: onRevision,
+            change: onRevision,
+            reset: () => this.syncChanges(),  // 服务端因积压断开了连接，重连前先补齐
+            deleted: () => {
+                this.events.close();
+                Toast.show('该知识库已被删除', 'error');
+                window.app.navigateTo('home');
+            }
+        });
+    }
+
+    /**
+     * 增量同步（串行执行：同步进行中又收到事件时，结束后再同步一次）
+     */
+    async syncChanges() {
+        if (this.syncing) {
+            this.syncPending = true;
+            return;
+        }
+        this.syncing = true;
+        try {
+            do {
+                this.syncPending = false;
+                await this.pullChanges();
+            } while (this.syncPending);
+        } catch (err) {
+            console.error('Failed to sync changes', err);
+        } finally {
+            this.syncing = false;
+        }
+    }
+
+    /**
+     * 拉取自上次加载以来的增量变更并应用到画布
+     */
+    async pullChanges() {
+        if (!this.network) return;
+        const changes = await store.getChanges(this.libraryId, this.revision);
+        if (changes.revision === this.revision) return;
+        if (changes.reset || changes.library) {
+            // 无法增量同步，或标签 / 出处有变化：整页重新加载
+            return window.app.navigateTo('library', { id: this.libraryId });
+        }
+        this.revision = changes.revision;
+        if (this.network.viewportMode) {
+            await this.network.refreshViewport();
+        } else {
+            this.network.applyChanges(changes);
+        }
+    }
+
+    /**
+     * 聚焦并选中知识点；视口模式下节点可能尚未加载，先移动镜头再等待加载
+     */
+    async focusPoint(id) {
+        if (!this.network) return;
+        if (!this.network.viewportMode || this.network.nodes.some(n => n.id === id)) {
+            this.network.focusNode(id);
+        } else {
+            const point = await store.getPoint(id);
+            this.network.focusPosition(point.x, point.y, 1.5);
+            await this.network.refreshViewport();
+        }
+        const node = this.network.nodes.find(n => n.id === id);
+        if (node) this.network.selectNode(node);
+    }
+
+    /**
+     * 补全节点的 content / source / page（画布只加载了 id / title / 坐标 / 标签）
+     */
+    async loadPointDetail(node) {
+        if (node.content === undefined) {
+            const { content, source, page } = await store.getPoint(node.id);
+            Object.assign(node, { content, source, page });
+        }
+        return node;
+    }
+
     // ================= Advanced Features =================
 
     async showStatsModal() {
@@ -433,6 +594,7 @@ export class LibraryView {
                 { label: '✏️ 编辑知识点', action: () => this.showEditPointModal(node) },
                 { label: '🔗 添加链接 (输入ID)', action: () => this.showLinkByIdModal(node) },
                 { label: '📜 版本历史', action: () => this.showSnapshotModal(node) },
+                { label: '🎯 高亮两跳邻域', action: () => this.highlightNeighborhood(node, 2) },
                 { label: '📤 导出相关知识点', action: () => this.exportRelatedPoints(node) },
                 { label: '🔗 删除与此节点的链接', danger: true, action: () => this.showDeleteLinksModal(node) },
                 { label: '🗑️ 删除知识点', danger: true, action: () => this.handleDeletePoint(node) }
@@ -548,55 +710,48 @@ export class LibraryView {
     // ================= 全局版本历史 =================
 
     async showGlobalHistoryModal() {
-        try {
-            // 获取所有知识点的快照
-            const allSnapshots = [];
-            for (const point of this.network.nodes) {
-                const snapshots = await store.getSnapshots(point.id);
-                if (snapshots && snapshots.length > 0) {
-                    snapshots.forEach(s => {
-                        allSnapshots.push({
-                            ...s,
-                            pointId: point.id,
-                            pointTitle: point.title
-                        });
-                    });
-                }
-            }
-
-            // 按时间排序
-            allSnapshots.sort((a, b) => new Date(b.timestamp) - new Date(a.timestamp));
+        const PAGE = 50;
+        let cursor = null;
+        let loaded = 0;
+
+        const renderItem = (s) => `
+            <div class="global-snapshot-item" data-point-id="${s.point_id}" data-snapshot-id="${s.id}" style="padding: 12px; margin-bottom: 8px; background: var(--bg-dark-900); border-radius: 8px; cursor: pointer; border: 1px solid transparent; transition: border-color 0.2s;">
+                <div style="display: flex; justify-content: space-between; align-items: center;">
+                    <span style="color: var(--primary-color); font-weight: 500;">${s.point_title}</span>
+                    <span style="font-size: 0.8rem; color: var(--text-300);">${new Date(s.timestamp).toLocaleString('zh-CN')}</span>
+                </div>
+                <p style="margin-top: 6px; font-size: 0.85rem; color: var(--text-200); max-height: 40px; overflow: hidden; text-overflow: ellipsis;">${(s.content || '').slice(0, 100)}${(s.content || '').length > 100 ? '...' : ''}</p>
+                <button class="btn btn-ghost global-snapshot-rewind" data-timestamp="${s.timestamp}" style="margin-top: 6px; font-size: 0.8rem; padding: 2px 8px;">⏪ 整库恢复到此时刻</button>
+            </div>
+        `;
 
-            if (allSnapshots.length === 0) {
-                Toast.show('暂无版本历史记录', 'info');
-                return;
-            }
+        const content = `
+            <div class="form-group">
+                <select id="global-history-tag" class="form-select">
+                    <option value="">全部标签</option>
+                    ${(this.library.tags || []).map(t => `<option value="${t.name}">${t.name}</option>`).join('')}
+                </select>
+            </div>
+            <div id="global-history-list" style="max-height: 450px; overflow-y: auto;">
+                <div id="global-history-items"></div>
+                <p id="global-history-status" style="text-align: center; color: var(--text-300);"></p>
+                <button id="global-history-more" class="btn btn-ghost" style="width: 100%; display: none;">加载更多</button>
+            </div>
+        `;
 
-            const content = `
-                <div style="max-height: 450px; overflow-y: auto;">
-                    <p style="margin-bottom: 12px; color: var(--text-200);">共 ${allSnapshots.length} 条编辑记录</p>
-                    ${allSnapshots.slice(0, 50).map(s => `
-                        <div class="global-snapshot-item" data-point-id="${s.pointId}" data-snapshot-id="${s.id}" style="padding: 12px; margin-bottom: 8px; background: var(--bg-dark-900); border-radius: 8px; cursor: pointer; border: 1px solid transparent; transition: border-color 0.2s;">
-                            <div style="display: flex; justify-content: space-between; align-items: center;">
-                                <span style="color: var(--primary-color); font-weight: 500;">${s.pointTitle}</span>
-                                <span style="font-size: 0.8rem; color: var(--text-300);">${new Date(s.timestamp).toLocaleString('zh-CN')}</span>
-                            </div>
-                            <p style="margin-top: 6px; font-size: 0.85rem; color: var(--text-200); max-height: 40px; overflow: hidden; text-overflow: ellipsis;">${(s.content || '').slice(0, 100)}${(s.content || '').length > 100 ? '...' : ''}</p>
-                        </div>
-                    `).join('')}
-                    ${allSnapshots.length > 50 ? `<p style="text-align: center; color: var(--text-300);">仅显示最近 50 条记录</p>` : ''}
-                </div>
-            `;
+        const modal = new Modal({
+            title: '📜 全局版本历史',
+            content,
+            onConfirm: () => { }
+        });
 
-            const modal = new Modal({
-                title: '📜 全局版本历史',
-                content,
-                onConfirm: () => { }
-            });
-            modal.show();
+        const itemsEl = () => modal.element.querySelector('#global-history-items');
+        const statusEl = () => modal.element.querySelector('#global-history-status');
+        const moreBtn = () => modal.element.querySelector('#global-history-more');
 
-            // 绑定点击恢复
-            modal.element.querySelectorAll('.global-snapshot-item').forEach(item => {
+        // 绑定点击恢复
+        const bindItems = (elements) => {
+            elements.forEach(item => {
                 item.onmouseenter = () => item.style.borderColor = 'var(--primary-color)';
                 item.onmouseleave = () => item.style.borderColor = 'transparent';
                 item.onclick = async () => {
@@ -612,10 +767,67 @@ export class LibraryView {
                         Toast.show('恢复失败: ' + e.message, 'error');
                     }
                 };
+                item.querySelector('.global-snapshot-rewind').onclick = async (event) => {
+                    event.stopPropagation();
+                    await rewindLibrary(event.target.dataset.timestamp);
+                };
             });
-        } catch (e) {
-            Toast.show('获取版本历史失败: ' + e.message, 'error');
-        }
+        };
+
+        // 整库恢复：先预览差异，确认后写入
+        const rewindLibrary = async (at) => {
+            try {
+                const diff = await store.restoreLibrary(this.libraryId, at, true);
+                const summary = `将恢复 ${diff.updated.length} 个知识点、删除 ${diff.deleted.length} 个之后新建的知识点，` +
+                    `新增 ${diff.links_added.length} 条、删除 ${diff.links_removed.length} 条链接。`;
+                if (!diff.updated.length && !diff.deleted.length && !diff.links_added.length && !diff.links_removed.length) {
+                    Toast.show('知识库与该时刻的状态一致', 'info');
+                    return;
+                }
+                if (!confirm(`确定要把整个知识库恢复到 ${new Date(at).toLocaleString('zh-CN')} 吗？\n${summary}`)) return;
+                await store.restoreLibrary(this.libraryId, at);
+                modal.hide();
+                Toast.show('知识库已恢复', 'success');
+                await this.render();
+            } catch (e) {
+                Toast.show('恢复失败: ' + e.message, 'error');
+            }
+        };
+
+        // 一次请求取一页（整库按时间合并），之后按游标继续加载
+        const loadPage = async () => {
+            moreBtn().disabled = true;
+            try {
+                const tag = modal.element.querySelector('#global-history-tag').value;
+                const page = await store.getLibrarySnapshots(this.libraryId, {
+                    limit: PAGE,
+                    cursor,
+                    tag: tag || null,
+                    fields: 'id,point_id,point_title,content,timestamp'
+                });
+                const start = itemsEl().children.length;
+                itemsEl().insertAdjacentHTML('beforeend', page.items.map(renderItem).join(''));
+                bindItems(Array.from(itemsEl().children).slice(start));
+                loaded += page.items.length;
+                cursor = page.nextCursor;
+                statusEl().textContent = loaded === 0 ? '暂无版本历史记录' : `已显示 ${loaded} 条编辑记录`;
+                moreBtn().style.display = cursor ? 'block' : 'none';
+            } catch (e) {
+                Toast.show('获取版本历史失败: ' + e.message, 'error');
+            } finally {
+                moreBtn().disabled = false;
+            }
+        };
+
+        modal.show();
+        moreBtn().onclick = loadPage;
+        modal.element.querySelector('#global-history-tag').onchange = () => {
+            cursor = null;
+            loaded = 0;
+            itemsEl().innerHTML = '';
+            loadPage();
+        };
+        await loadPage();
     }
 
     // ================= 添加关联知识点 =================
@@ -731,8 +943,20 @@ export class LibraryView {
     // ================= 导出知识图谱 (AI用) =================
 
     async exportKnowledgeGraph() {
-        const points = this.network.nodes;
-        const links = this.network.edges;
+        // 画布节点不含 content，导出时取完整字段（仅包含当前画布上的节点；视口模式下为整个库）
+        const allPoints = await store.getPoints(this.libraryId);
+        let points, links;
+        if (this.network.viewportMode) {
+            const byId = new Map(allPoints.map(p => [p.id, p]));
+            points = allPoints;
+            links = (await store.getLinks(this.libraryId)).map(l => ({
+                ...l, source: byId.get(l.fromId), target: byId.get(l.toId)
+            })).filter(l => l.source && l.target);
+        } else {
+            const nodeIds = new Set(this.network.nodes.map(n => n.id));
+            points = allPoints.filter(p => nodeIds.has(p.id));
+            links = this.network.edges;
+        }
 
         const graphData = {
             library: {
@@ -829,38 +1053,25 @@ export class LibraryView {
 
     // ================= 导出相关知识点 =================
 
-    async exportRelatedPoints(node) {
-        // 收集当前节点及其相邻节点
-        const relatedIds = new Set([node.id]);
-        this.network.edges.forEach(e => {
-            if (e.source.id === node.id) relatedIds.add(e.target.id);
-            if (e.target.id === node.id) relatedIds.add(e.source.id);
-        });
-
-        const relatedNodes = this.network.nodes.filter(n => relatedIds.has(n.id));
-
-        // 生成 Markdown
-        let markdown = `# ${node.title} 及其相关知识点\n\n`;
-        markdown += `导出时间: ${new Date().toLocaleString('zh-CN')}\n`;
-        markdown += `知识库: ${this.library.name}\n\n---\n\n`;
-
-        relatedNodes.forEach(n => {
-            const tagStr = (n.tags || []).map(t => typeof t === 'string' ? t : t.name).join(', ');
-            markdown += `## ${n.title}\n\n`;
-            markdown += `**标签**: ${tagStr || '无'}\n\n`;
-            markdown += `**出处**: ${n.source || '无'} (页码: ${n.page || '无'})\n\n`;
-            markdown += `${n.content}\n\n---\n\n`;
-        });
-
-        // 下载
-        const blob = new Blob([markdown], { type: 'text/markdown;charset=utf-8' });
-        const link = document.createElement('a');
-        link.href = URL.createObjectURL(blob);
-        link.download = `${node.title}_相关知识点.md`;
-        link.click();
-        URL.revokeObjectURL(link.href);
+    async highlightNeighborhood(node, hops) {
+        // 邻域由服务端图缓存计算，清空搜索框即可取消高亮
+        try {
+            const result = await store.getNeighborhood(node.id, hops);
+            this.network.highlightNodes([node.id, ...result.nodes.map(n => n.id)]);
+            Toast.show(`${hops} 跳内共 ${result.nodes.length} 个知识点`, 'info');
+        } catch (err) {
+            Toast.show('获取邻域失败: ' + err.message, 'error');
+        }
+    }
 
-        Toast.show(`已导出 ${relatedNodes.length} 个知识点`, 'success');
+    async exportRelatedPoints(node, depth = 1) {
+        // 由服务端展开 depth 跳内的相关知识点并生成 Markdown
+        try {
+            const count = await store.exportRelatedPoints(node.id, { depth, format: 'markdown' });
+            Toast.show(`已导出 ${count} 个知识点`, 'success');
+        } catch (err) {
+            Toast.show('导出失败: ' + err.message, 'error');
+        }
     }
 
     // ================= 删除链接 =================
@@ -1091,7 +1302,9 @@ export class LibraryView {
         modal.show();
     }
 
-    showEditPointModal(node) {
+    async showEditPointModal(node) {
+        await this.loadPointDetail(node);
+
         // Find existing tag/source
         const currentTag = node.tags && node.tags.length ? (typeof node.tags[0] === 'string' ? node.tags[0] : node.tags[0].name) : '';
         const currentSource = node.source || '';
@@ -1177,6 +1390,7 @@ export class LibraryView {
     async handleDeletePoint(node) {
         if (confirm(`确定要删除 "${node.title}" 吗？`)) {
             // 保存完整数据用于撤销恢复
+            await this.loadPointDetail(node);
             const nodeData = {
                 id: node.id,
                 libraryId: this.libraryId,
@@ -1307,9 +1521,15 @@ export class LibraryView {
     }
 
     destroy() {
-        if (this.network) this.network.stop();
+        if (this.network) {
+            this.network.flushLayout();  // 离开前保存尚未回写的坐标
+            this.network.stop();
+        }
+        clearTimeout(this.searchTimer);
+        if (this.events) this.events.close();
         this.contextMenu.hide();
         window.removeEventListener('keydown', this.handleKeyDown);
+        document.removeEventListener('visibilitychange', this.handleVisibilityChange);
         undoManager.clear();  // 清空撤销历史
     }
 